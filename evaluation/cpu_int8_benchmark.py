@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+CPU int8 推理基准
+在多最优解测试集上对比同一模型 float32 与 int8 动态量化（models.cpu_inference）的
+准确率、逐案例预测一致率、生成吞吐和模型大小；两种配置都用贪心解码，差异只来自量化。
+"""
+
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from multi_optimal_evaluator import MultiOptimalEvaluator
+
+
+def run_mode(args, cpu_int8: bool):
+    """加载一种配置并评估，返回 (汇总, 逐案例预测)"""
+    from models.cpu_inference import model_size_mb
+
+    label = "int8" if cpu_int8 else "float32"
+    print(f"\n{'=' * 20} {label} {'=' * 20}")
+    evaluator = MultiOptimalEvaluator(
+        model_path=args.model_path,
+        base_model_path=args.base_model_path,
+        device="cpu",
+        continuous_batch_size=args.batch_size if args.batch_size > 1 else None,
+        cpu_int8=cpu_int8,
+        cpu_threads=args.cpu_threads,
+        greedy=True
+    )
+    accuracy, detailed_results = evaluator.evaluate(args.test_set, args.num_cases)
+    if evaluator.scheduler is not None:
+        evaluator.scheduler.close()
+    summary = {"mode": label, "accuracy": accuracy, "model_size_mb": model_size_mb(evaluator.model),
+               **evaluator.throughput}
+    return summary, [result["predicted_move"] for result in detailed_results]
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="CPU float32 与 int8 动态量化推理的准确率/吞吐对比")
+    parser.add_argument("--model-path", type=str, required=True, help="模型路径（建议用小模型）")
+    parser.add_argument("--base-model-path", type=str,
+                       default="/mnt/cvda/cvda_avatar/1/textarena-selfplay-qwen/qwen",
+                       help="基础模型路径（微调模型需要）")
+    parser.add_argument("--test-set", type=str, default="data/processed/tictactoe_test_set_100_multi_optimal.json",
+                       help="测试集路径")
+    parser.add_argument("--num-cases", type=int, help="测试案例数量（可选）")
+    parser.add_argument("--batch-size", type=int, default=8, help="同时解码的案例数（连续批处理，1为逐个生成）")
+    parser.add_argument("--cpu-threads", type=int, default=None, help="CPU推理线程数（默认可用核数）")
+    parser.add_argument("--output", type=str, help="输出JSON文件路径（可选）")
+    args = parser.parse_args()
+
+    float32_summary, float32_moves = run_mode(args, cpu_int8=False)
+    int8_summary, int8_moves = run_mode(args, cpu_int8=True)
+    agreement = sum(a == b for a, b in zip(float32_moves, int8_moves)) / len(float32_moves) * 100
+
+    print("\n" + "=" * 70)
+    print(f"{'配置':<10}{'准确率':>10}{'案例/秒':>12}{'token/秒':>12}{'模型MB':>12}")
+    for summary in (float32_summary, int8_summary):
+        print(f"{summary['mode']:<10}{summary['accuracy']:>9.1f}%{summary['cases_per_second']:>12}"
+              f"{summary['tokens_per_second']:>12}{summary['model_size_mb']:>12}")
+    speedup = int8_summary["tokens_per_second"] / float32_summary["tokens_per_second"]
+    print(f"🚀 int8 吞吐为 float32 的 {speedup:.2f}x，准确率变化 "
+          f"{int8_summary['accuracy'] - float32_summary['accuracy']:+.1f} 个百分点，逐案例预测一致率 {agreement:.1f}%")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                "timestamp": datetime.now().isoformat(),
+                "model_path": args.model_path,
+                "test_set": args.test_set,
+                "batch_size": args.batch_size,
+                "results": [float32_summary, int8_summary],
+                "speedup": speedup,
+                "prediction_agreement": agreement,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
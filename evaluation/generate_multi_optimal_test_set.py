@@ -5,35 +5,41 @@
 """
 
 import json
+import os
+import sys
 import random
 import itertools
 import argparse
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+from utils.mnk import TICTACTOE, resolve_geometry
+from utils.tactics import threat_count, winning_squares
+from utils.tictactoe_oracle import enumerate_positions, sample_positions, stratified_sample
+from utils.tictactoe_oracle import find_all_optimal_moves as solve_optimal_moves
+
 class TicTacToeMultiOptimalTestSetGenerator:
-    def __init__(self):
+    def __init__(self, geometry=None):
+        """geometry: 棋盘几何（BoardGeometry或 "4x4k3"），默认3x3井字棋"""
+        self.geometry = resolve_geometry(geometry)
         self.test_cases = []
         
     def generate_board_state(self, x_positions, o_positions):
         """根据X和O的位置生成棋盘状态"""
-        board = [' '] * 9
+        board = self.geometry.empty_board()
         for pos in x_positions:
             board[pos] = 'X'
         for pos in o_positions:
             board[pos] = 'O'
         
         # 转换为显示格式
-        board_str = f"""{board[0]} | {board[1]} | {board[2]}
----------
-{board[3]} | {board[4]} | {board[5]}
----------
-{board[6]} | {board[7]} | {board[8]}"""
+        board_str = self.geometry.board_to_string(board)
         
         return board_str, board
     
     def get_available_moves(self, board):
         """获取可用的落子位置"""
-        return [f'[{i}]' for i in range(9) if board[i] == ' ']
+        return [f'[{i}]' for i in range(len(board)) if board[i] == ' ']
     
     def check_winner(self, board):
         """检查是否有获胜者"""
@@ -89,29 +95,17 @@ class TicTacToeMultiOptimalTestSetGenerator:
 
     def find_all_optimal_moves(self, board, player):
         """找到所有最优解（Minimax分数相同的所有位置）"""
+        if self.geometry != TICTACTOE:
+            return solve_optimal_moves(board, player, self.geometry)
         opponent = 'O' if player == 'X' else 'X'
         
         # 首先检查即将获胜的位置（最高优先级）
-        winning_moves = []
-        for i in range(9):
-            if board[i] == ' ':
-                board[i] = player
-                if self.check_winner(board) == player:
-                    winning_moves.append(i)
-                board[i] = ' '
-        
+        winning_moves = winning_squares(board, player)
         if winning_moves:
             return winning_moves, "winning_move", 1000  # 获胜移动有最高分数
         
         # 然后检查需要阻挡对手的位置（第二优先级）
-        blocking_moves = []
-        for i in range(9):
-            if board[i] == ' ':
-                board[i] = opponent
-                if self.check_winner(board) == opponent:
-                    blocking_moves.append(i)
-                board[i] = ' '
-        
+        blocking_moves = winning_squares(board, opponent)
         if blocking_moves:
             return blocking_moves, "blocking_move", 500  # 阻挡移动有第二高分数
         
@@ -154,6 +148,9 @@ class TicTacToeMultiOptimalTestSetGenerator:
             1: "edge", 3: "edge", 5: "edge", 7: "edge"           # 边缘
         }
         
+        if self.geometry != TICTACTOE:
+            position_values = {move: self._position_type(move) for move in optimal_moves}
+        
         for move in optimal_moves:
             analysis = {
                 "position_type": position_values.get(move, "unknown"),
@@ -181,31 +178,28 @@ class TicTacToeMultiOptimalTestSetGenerator:
             analysis["strategic_value"] = (
                 analysis["threats_created"] * 10 + 
                 analysis["threats_blocked"] * 5 +
-                (15 if move == 4 else 8 if move in [0,2,6,8] else 3)
+                {"center": 15, "corner": 8}.get(analysis["position_type"], 3)
             )
             
             move_analysis[move] = analysis
         
         return move_analysis
     
+    def _position_type(self, move):
+        """一般棋盘上的位置类型：所在线路最多的格子为center，四角为corner，其余边界格为edge，内部为inner"""
+        geometry = self.geometry
+        row, col = divmod(move, geometry.cols)
+        if geometry.cell_weights[move] == max(geometry.cell_weights):
+            return "center"
+        if row in (0, geometry.rows - 1) and col in (0, geometry.cols - 1):
+            return "corner"
+        if row in (0, geometry.rows - 1) or col in (0, geometry.cols - 1):
+            return "edge"
+        return "inner"
+    
     def count_winning_threats(self, board, player):
-        """计算玩家有多少个获胜威胁（两个己方棋子在一条线上，第三个位置为空）"""
-        win_patterns = [
-            [0, 1, 2], [3, 4, 5], [6, 7, 8],  # 行
-            [0, 3, 6], [1, 4, 7], [2, 5, 8],  # 列
-            [0, 4, 8], [2, 4, 6]              # 对角线
-        ]
-        
-        threats = 0
-        for pattern in win_patterns:
-            player_count = sum(1 for pos in pattern if board[pos] == player)
-            empty_count = sum(1 for pos in pattern if board[pos] == ' ')
-            
-            # 两个己方棋子 + 一个空位 = 一个威胁
-            if player_count == 2 and empty_count == 1:
-                threats += 1
-        
-        return threats
+        """计算玩家有多少个获胜威胁（差一子连线且该线没有对方棋子）"""
+        return threat_count(board, player, self.geometry)
     
     def generate_test_cases(self, multi_optimal=True):
         """生成测试用例"""
@@ -396,6 +390,78 @@ class TicTacToeMultiOptimalTestSetGenerator:
         print(f"难度分布: {difficulty_count}")
         print(f"移动类型分布: {move_type_count}")
     
+    def generate_exhaustive_test_cases(self, num_cases=100, seed=42, multi_optimal=True, symmetry_unique=True):
+        """从完整状态空间分层抽样生成测试用例
+
+        枚举全部合法非终局局面（精确求解并缓存），按 (阶段, 难度) 分层均匀抽样。
+        symmetry_unique=True 时每个对称等价类最多出现一次，测试集中不存在重复或对称重复局面。
+        非3x3棋盘的状态空间无法枚举，改为随机对弈采样3倍数量的互不相同局面再分层抽样（不做对称去重）。
+        """
+        if self.geometry == TICTACTOE:
+            positions = enumerate_positions(symmetry_unique=symmetry_unique)
+        else:
+            print(f"🎲 {self.geometry.name}: 随机对弈采样局面并用 MNKSolver 精确求解...")
+            positions = sample_positions(self.geometry, num_cases * 3, seed=seed)
+            symmetry_unique = False
+        if num_cases > len(positions):
+            print(f"⚠️  请求 {num_cases} 个测试用例，但只有 {len(positions)} 个"
+                  f"{'对称唯一的' if symmetry_unique else ''}合法局面，将使用全部局面")
+
+        print(f"从 {len(positions)} 个合法局面中分层抽样 (seed={seed})...")
+        for position in stratified_sample(positions, num_cases, seed=seed):
+            board = list(position["board"])
+            player = position["player"]
+            optimal_moves = position["optimal_moves"]
+            board_str, _ = self.generate_board_state(
+                [i for i, cell in enumerate(board) if cell == 'X'], [i for i, cell in enumerate(board) if cell == 'O']
+            )
+            num_moves = len(board) - board.count(' ')
+            move_analysis = self.analyze_move_equivalence(board, optimal_moves, player)
+
+            test_case = {
+                "id": len(self.test_cases) + 1,
+                "difficulty": position["difficulty"],
+                "stage": position["stage"],
+                "board_state": board_str,
+                "player": player,
+                "available_moves": self.get_available_moves(board),
+                "move_type": position["move_type"],
+                "description": f"{num_moves}步后的局面 - {position['move_type']}",
+                "minimax_verified": True,
+                "minimax_score": position["score"],
+                "canonical_board": position["canonical"]
+            }
+            if self.geometry != TICTACTOE:
+                test_case["geometry"] = self.geometry.name
+
+            if multi_optimal:
+                test_case["optimal_moves"] = [f"[{move}]" for move in optimal_moves]
+                test_case["move_analysis"] = {f"[{move}]": analysis for move, analysis in move_analysis.items()}
+                test_case["primary_optimal"] = f"[{optimal_moves[0]}]"
+                test_case["optimal_move"] = f"[{optimal_moves[0]}]"  # 向后兼容
+                test_case["total_optimal_solutions"] = len(optimal_moves)
+            else:
+                best_move = max(optimal_moves, key=lambda x: move_analysis[x]["strategic_value"])
+                test_case["optimal_move"] = f"[{best_move}]"
+
+            self.test_cases.append(test_case)
+
+        keys = [(case["board_state"], case["player"]) if not symmetry_unique else case["canonical_board"]
+                for case in self.test_cases]
+        assert len(keys) == len(set(keys)), "测试集中存在重复局面"
+
+        print(f"总共生成了 {len(self.test_cases)} 个测试用例（无重复）")
+        if multi_optimal:
+            self.analyze_multi_optimal_statistics()
+
+        difficulty_count = {"easy": 0, "medium": 0, "hard": 0}
+        stage_count = {}
+        for case in self.test_cases:
+            difficulty_count[case["difficulty"]] += 1
+            stage_count[case["stage"]] = stage_count.get(case["stage"], 0) + 1
+        print(f"难度分布: {difficulty_count}")
+        print(f"阶段分布: {stage_count}")
+
     def analyze_multi_optimal_statistics(self):
         """分析多最优解的统计信息"""
         multi_optimal_count = 0
@@ -468,6 +534,16 @@ def main():
                        help='输出文件名 (默认: 自动生成)')
     parser.add_argument('--override-original', action='store_true', default=False,
                        help='覆盖原始测试集文件 (生成兼容格式并保存为原文件名)')
+    parser.add_argument('--exhaustive', action='store_true', default=False,
+                       help='枚举完整状态空间并分层抽样 (无重复、无非法局面)')
+    parser.add_argument('--num-cases', type=int, default=100,
+                       help='--exhaustive 模式下的测试用例数量')
+    parser.add_argument('--seed', type=int, default=42,
+                       help='--exhaustive 模式下的随机种子')
+    parser.add_argument('--geometry', type=str, default=None,
+                       help='棋盘几何，例如 4x4k3 (默认3x3井字棋；非3x3时使用采样+求解器)')
+    parser.add_argument('--allow-symmetric', action='store_true', default=False,
+                       help='--exhaustive 模式下允许对称等价局面同时出现 (最多4520个局面)')
     
     args = parser.parse_args()
     
@@ -482,8 +558,13 @@ def main():
     print("要求: 不少于100题，难度均匀分布")
     print("=" * 50)
     
-    generator = TicTacToeMultiOptimalTestSetGenerator()
-    generator.generate_test_cases(multi_optimal=multi_optimal_mode)
+    generator = TicTacToeMultiOptimalTestSetGenerator(geometry=args.geometry)
+    if args.exhaustive or generator.geometry != TICTACTOE:
+        generator.generate_exhaustive_test_cases(num_cases=args.num_cases, seed=args.seed,
+                                                 multi_optimal=multi_optimal_mode,
+                                                 symmetry_unique=not args.allow_symmetric)
+    else:
+        generator.generate_test_cases(multi_optimal=multi_optimal_mode)
     
     # 确定输出格式和文件名
     if args.override_original:
@@ -500,7 +581,6 @@ def main():
         format_type = "multi_optimal"
     
     # 保存测试集
-    import os
     output_dir = os.path.dirname(output_file)
     if not os.path.exists(output_dir):
         os.makedirs(output_dir, exist_ok=True)
@@ -534,6 +614,7 @@ def main():
     print(f"  - 多最优解模式: python generate_multi_optimal_test_set.py")
     print(f"  - 兼容模式: python generate_multi_optimal_test_set.py --compatible")
     print(f"  - 覆盖原文件: python generate_multi_optimal_test_set.py --override-original")
+    print(f"  - 状态空间分层抽样: python generate_multi_optimal_test_set.py --exhaustive --num-cases 500 --seed 0")
 
 if __name__ == "__main__":
     main()
@@ -5,10 +5,15 @@
 """
 
 import json
+import os
+import sys
 import random
 import itertools
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+from utils.tactics import threat_count, winning_squares
+
 class TicTacToeTestSetGenerator:
     def __init__(self):
         self.test_cases = []
@@ -91,22 +96,14 @@ class TicTacToeTestSetGenerator:
         opponent = 'O' if player == 'X' else 'X'
         
         # 检查即将获胜的位置（快速路径）
-        for i in range(9):
-            if board[i] == ' ':
-                board[i] = player
-                if self.check_winner(board) == player:
-                    board[i] = ' '
-                    return i, "winning_move"
-                board[i] = ' '
+        winning_moves = winning_squares(board, player)
+        if winning_moves:
+            return winning_moves[0], "winning_move"
         
         # 检查需要阻挡对手的位置（快速路径）
-        for i in range(9):
-            if board[i] == ' ':
-                board[i] = opponent
-                if self.check_winner(board) == opponent:
-                    board[i] = ' '
-                    return i, "blocking_move"
-                board[i] = ' '
+        blocking_moves = winning_squares(board, opponent)
+        if blocking_moves:
+            return blocking_moves[0], "blocking_move"
         
         # 使用Minimax算法找到最优位置
         best_moves = []
@@ -187,22 +184,7 @@ class TicTacToeTestSetGenerator:
     
     def count_winning_threats(self, board, player):
         """计算玩家有多少个获胜威胁（两个己方棋子在一条线上，第三个位置为空）"""
-        win_patterns = [
-            [0, 1, 2], [3, 4, 5], [6, 7, 8],  # 行
-            [0, 3, 6], [1, 4, 7], [2, 5, 8],  # 列
-            [0, 4, 8], [2, 4, 6]              # 对角线
-        ]
-        
-        threats = 0
-        for pattern in win_patterns:
-            player_count = sum(1 for pos in pattern if board[pos] == player)
-            empty_count = sum(1 for pos in pattern if board[pos] == ' ')
-            
-            # 两个己方棋子 + 一个空位 = 一个威胁
-            if player_count == 2 and empty_count == 1:
-                threats += 1
-        
-        return threats
+        return threat_count(board, player)
     
     def generate_test_cases(self):
         """生成测试用例"""
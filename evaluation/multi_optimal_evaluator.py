@@ -5,12 +5,18 @@
 """
 
 import json
+import math
+import random
 import re
 import os
 import sys
+import time
 import argparse
+from collections import Counter
 from typing import Optional, List, Dict
 
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
 try:
     import torch
     from transformers import AutoTokenizer, AutoModelForCausalLM
@@ -23,14 +29,49 @@ except ImportError:
 class MultiOptimalEvaluator:
     """多最优解评估器"""
     
-    def __init__(self, model_path: str, base_model_path: str = None, device: str = "auto"):
+    def __init__(self, model_path: str, base_model_path: str = None, device: str = "auto",
+                 continuous_batch_size: Optional[int] = None, speculative_cot_length: Optional[str] = None,
+                 num_samples: int = 1, cpu_int8: bool = False, cpu_threads: Optional[int] = None,
+                 greedy: bool = False, batch_size: int = 16, response_cache: Optional[str] = None):
+        """
+        continuous_batch_size: 设置后全部案例提交给连续批处理调度器并发生成（同时解码的序列数上限）
+        speculative_cot_length: 设置后以规则智能体该长度的CoT为草稿做推测解码（逐案例生成时有效）
+        num_samples: 大于1时每个案例采样k次（prompt只prefill一次），额外报告多数投票准确率、pass@k和一致率；
+                     此时不使用连续批处理和推测解码
+        cpu_int8: 在CPU上以float32加载后把线性层动态量化为int8（models.cpu_inference）
+        cpu_threads: CPU推理的线程数，默认取可用核数
+        greedy: 贪心解码（对比不同推理配置的准确率时排除采样噪声）
+        batch_size: 批量生成（generate_batch，全状态空间评估使用）每次 generate 的prompt数
+        response_cache: 回复缓存文件（utils.response_cache），批量生成时已生成过的prompt直接读取
+        """
         self.model_path = model_path
         self.base_model_path = base_model_path
         self.device = device
         self.model = None
         self.tokenizer = None
         self.model_name = os.path.basename(model_path)  # 添加模型名称
+        self.continuous_batch_size = continuous_batch_size
+        self.scheduler = None
+        self.speculative_cot_length = speculative_cot_length
+        self.speculator = None
+        self.num_samples = num_samples
+        self.self_consistency = None  # 最近一次evaluate的自洽性统计（num_samples>1时）
+        self.cpu_int8 = cpu_int8
+        self.cpu_threads = cpu_threads
+        if cpu_int8:
+            self.device = "cpu"
+        if greedy and num_samples > 1:
+            raise ValueError("自洽性评估（num_samples>1）需要采样解码，不能与greedy同时使用")
+        self.sampling_kwargs = dict(do_sample=False) if greedy else dict(temperature=0.7, do_sample=True)
+        self.max_new_tokens = 512
+        self.throughput = None  # 最近一次evaluate的生成速度
+        self.batch_size = batch_size
         self.load_model()
+        self.cache = None
+        if response_cache:
+            from utils.response_cache import ResponseCache
+            self.cache = ResponseCache(response_cache, self.model_key(),
+                                       dict(self.sampling_kwargs, max_new_tokens=self.max_new_tokens))
     
     def load_model(self):
         """加载模型"""
@@ -45,6 +86,11 @@ class MultiOptimalEvaluator:
                 self.device = "cpu"
         
         print(f"🔄 加载模型到设备: {self.device}")
+        # CPU不适合float16计算，使用float32（int8量化也从float32权重开始）
+        torch_dtype = torch.float32 if self.device == "cpu" else torch.float16
+        if self.device == "cpu":
+            from models.cpu_inference import configure_cpu_threads
+            print(f"🧵 CPU推理线程数: {configure_cpu_threads(self.cpu_threads)}")
         
         # 检查设备是否可用
         if self.device.startswith("cuda"):
@@ -74,13 +120,22 @@ class MultiOptimalEvaluator:
             if not os.path.exists(self.model_path):
                 raise FileNotFoundError(f"LoRA模型路径不存在: {self.model_path}")
             
+            # 优先使用合并后的checkpoint（models/merged_cache.py export 生成）
+            from models.merged_cache import cached_merged_path, load_merged_model
+            merged_path = cached_merged_path(self.model_path, self.base_model_path)
+            if merged_path:
+                print(f"⚡ 使用合并缓存: {merged_path}")
+                self.model, self.tokenizer = load_merged_model(merged_path, device_map=self.device, torch_dtype=torch_dtype)
+                print("✅ 微调模型加载成功")
+                return self._setup_generation()
+            
             # 加载基础模型
             print("🔄 正在加载基础模型...")
             self.tokenizer = AutoTokenizer.from_pretrained(self.base_model_path, trust_remote_code=True)
             base_model = AutoModelForCausalLM.from_pretrained(
                 self.base_model_path,
                 device_map=self.device,
-                torch_dtype=torch.float16,
+                torch_dtype=torch_dtype,
                 trust_remote_code=True
             )
             
@@ -101,13 +156,31 @@ class MultiOptimalEvaluator:
             self.model = AutoModelForCausalLM.from_pretrained(
                 self.model_path,
                 device_map=self.device,
-                torch_dtype=torch.float16,
+                torch_dtype=torch_dtype,
                 trust_remote_code=True
             )
             print("✅ 基础模型加载成功")
+        
+        self._setup_generation()
     
-    def generate_response(self, prompt: str) -> str:
-        """生成模型响应"""
+    def _setup_generation(self):
+        """按配置量化模型，创建连续批处理调度器或推测解码器"""
+        if self.cpu_int8:
+            from models.cpu_inference import model_size_mb, quantize_int8
+            self.model = quantize_int8(self.model)
+            print(f"🗜️  线性层已动态量化为int8（模型 {model_size_mb(self.model)} MB）")
+        if self.continuous_batch_size:
+            from models.continuous_batching import ContinuousBatchingScheduler
+            self.scheduler = ContinuousBatchingScheduler(self.model, self.tokenizer,
+                                                         max_batch_size=self.continuous_batch_size)
+            print(f"🔀 连续批处理已启用（最多 {self.continuous_batch_size} 个序列同时解码）")
+        elif self.speculative_cot_length:
+            from models.template_speculation import TemplateDraftDecoder
+            self.speculator = TemplateDraftDecoder(self.model, self.tokenizer)
+            print(f"📝 模板草稿推测解码已启用（草稿CoT长度: {self.speculative_cot_length}）")
+    
+    def generate_response(self, prompt: str, case: Optional[Dict] = None) -> str:
+        """生成模型响应；启用推测解码且提供case时以规则CoT为草稿"""
         if not TORCH_AVAILABLE:
             raise RuntimeError("PyTorch不可用，无法进行模型推理")
         
@@ -115,15 +188,20 @@ class MultiOptimalEvaluator:
             raise RuntimeError("模型未加载，无法进行推理")
         
         try:
+            if self.speculator is not None and case is not None:
+                from models.template_drafts import render_draft
+                draft = render_draft(self.case_observation(case), self.speculative_cot_length)
+                return self.speculator.generate(prompt, draft, max_new_tokens=self.max_new_tokens, label=self.speculative_cot_length,
+                                                **self.sampling_kwargs)
+            
             # 实际模型推理
             inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
             
             with torch.no_grad():
                 outputs = self.model.generate(
                     **inputs,
-                    max_new_tokens=512,
-                    temperature=0.7,
-                    do_sample=True,
+                    max_new_tokens=self.max_new_tokens,
+                    **self.sampling_kwargs,
                     pad_token_id=self.tokenizer.eos_token_id
                 )
             
@@ -135,6 +213,95 @@ class MultiOptimalEvaluator:
         except Exception as e:
             raise RuntimeError(f"生成响应时出错: {e}")
     
+    def generate_samples(self, prompt: str, k: int) -> List[str]:
+        """同一prompt采样k个回答：prompt只prefill一次，KV缓存复制为k份后一起解码"""
+        if self.model is None:
+            raise RuntimeError("模型未加载，无法进行推理")
+        
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
+        input_ids = inputs["input_ids"]
+        generation_kwargs = dict(max_new_tokens=self.max_new_tokens, pad_token_id=self.tokenizer.eos_token_id,
+                                 **self.sampling_kwargs)
+        with torch.no_grad():
+            try:
+                from models.continuous_batching import repeat_cache
+                # 预填充除最后一个token以外的prompt，generate只需计算最后一个token
+                prefix = self.model(input_ids=input_ids[:, :-1], use_cache=True).past_key_values
+                cache = repeat_cache(prefix, k)
+                outputs = self.model.generate(input_ids=input_ids.repeat(k, 1),
+                                              attention_mask=torch.ones_like(input_ids).repeat(k, 1),
+                                              past_key_values=cache, **generation_kwargs)
+            except (TypeError, ValueError, AttributeError) as e:
+                # 不支持传入缓存的transformers版本：按k条展开后预填充
+                print(f"   ⚠️  共享prefill不可用（{e}），改用 num_return_sequences")
+                outputs = self.model.generate(**inputs, num_return_sequences=k, **generation_kwargs)
+        
+        new_tokens = outputs[:, input_ids.shape[1]:]
+        return [text.strip() for text in self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)]
+    
+    def score_samples(self, samples: List[str], case: Dict) -> Dict:
+        """k个样本的多数投票、pass@k与一致率（多数票占比）"""
+        moves = [self.extract_move(response) for response in samples]
+        correct = [self.is_move_optimal(move, case) for move in moves]
+        votes = Counter(move for move in moves if move is not None)
+        majority_move, majority_count = votes.most_common(1)[0] if votes else (None, 0)
+        return {
+            "sample_moves": moves,
+            "sample_correct": correct,
+            "majority_move": majority_move,
+            "majority_correct": self.is_move_optimal(majority_move, case),
+            "pass_at_k": any(correct),
+            "agreement_rate": majority_count / len(samples),
+            "sample_accuracy": sum(correct) / len(samples),
+        }
+    
+    def model_key(self) -> str:
+        """回复缓存使用的模型标识：路径 + 权重指纹（adapter内容/基础模型配置变化后失效）"""
+        from models.merged_cache import adapter_fingerprint
+        is_lora = os.path.exists(os.path.join(self.model_path, "adapter_config.json"))
+        fingerprint = adapter_fingerprint(self.model_path, self.base_model_path if is_lora else self.model_path)
+        return f"{os.path.abspath(self.model_path)}@{fingerprint}" + ("+int8" if self.cpu_int8 else "")
+    
+    def generate_batch(self, prompts: List[str]) -> List[str]:
+        """批量生成：有连续批处理调度器时交给调度器，否则按 batch_size 左侧padding后逐批 generate"""
+        if self.scheduler is not None:
+            return self.scheduler.generate_batch(prompts, max_new_tokens=self.max_new_tokens, **self.sampling_kwargs)
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        responses = []
+        for start in range(0, len(prompts), self.batch_size):
+            inputs = self.tokenizer(prompts[start:start + self.batch_size], return_tensors="pt", padding=True).to(self.device)
+            with torch.no_grad():
+                outputs = self.model.generate(**inputs, max_new_tokens=self.max_new_tokens, pad_token_id=self.tokenizer.pad_token_id,
+                                              **self.sampling_kwargs)
+            new_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+            responses.extend(text.strip() for text in self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True))
+        return responses
+    
+    def generate_cached(self, prompts: List[str], chunk_size: int = 256) -> List[str]:
+        """批量生成并使用回复缓存；每生成一块即写入缓存，中断后重跑只生成剩余部分"""
+        responses = self.cache.get_many(prompts) if self.cache is not None else [None] * len(prompts)
+        missing = [i for i, response in enumerate(responses) if response is None]
+        if self.cache is not None:
+            print(f"💾 回复缓存命中 {len(prompts) - len(missing)}/{len(prompts)}")
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            generated = self.generate_batch([prompts[i] for i in chunk])
+            for i, response in zip(chunk, generated):
+                responses[i] = response
+            if self.cache is not None:
+                self.cache.put_many([prompts[i] for i in chunk], generated)
+            print(f"   已生成 {min(start + chunk_size, len(missing))}/{len(missing)}")
+        return responses
+    
+    def case_observation(self, case: Dict) -> str:
+        """把测试案例转换为mock环境格式的观察（供规则智能体渲染草稿）"""
+        from utils.board_utils import parse_board_from_observation
+        from utils.mock_env import render_observation
+        board = parse_board_from_observation(f"Game Board:\n{case['board_state']}")
+        return render_observation(board, 0 if case['player'] == 'X' else 1)
+    
     def extract_move(self, response: str) -> Optional[str]:
         """从响应中提取移动"""
         if not response:
@@ -142,13 +309,13 @@ class MultiOptimalEvaluator:
         
         # 多种模式匹配
         patterns = [
-            r'答案:\s*\[(\d)\]',           # 答案: [数字]
-            r'选择:\s*\[(\d)\]',           # 选择: [数字]
-            r'最终选择:\s*\[(\d)\]',       # 最终选择: [数字]
-            r'我选择:\s*\[(\d)\]',         # 我选择: [数字]
-            r'\[(\d)\]',                   # 任何 [数字]
-            r'位置\s*(\d)',                # 位置数字
-            r'选择位置\s*(\d)',            # 选择位置数字
+            r'答案:\s*\[(\d+)\]',          # 答案: [数字]
+            r'选择:\s*\[(\d+)\]',          # 选择: [数字]
+            r'最终选择:\s*\[(\d+)\]',      # 最终选择: [数字]
+            r'我选择:\s*\[(\d+)\]',        # 我选择: [数字]
+            r'\[(\d+)\]',                  # 任何 [数字]
+            r'位置\s*(\d+)',               # 位置数字
+            r'选择位置\s*(\d+)',           # 选择位置数字
         ]
         
         for pattern in patterns:
@@ -233,6 +400,18 @@ class MultiOptimalEvaluator:
         total_count = len(test_cases)
         detailed_results = []
         
+        # 连续批处理：先把所有案例提交给调度器，短回答不必等待长回答
+        responses = None
+        consistency_totals = Counter()
+        generated_tokens = 0
+        started = time.perf_counter()
+        if self.num_samples > 1:
+            print(f"🗳️  自洽性评估: 每个案例采样 {self.num_samples} 次")
+        elif self.scheduler is not None:
+            print(f"🔮 并发生成 {total_count} 个案例的回答...")
+            responses = self.scheduler.generate_batch([self.create_prompt(case) for case in test_cases],
+                                                      max_new_tokens=self.max_new_tokens, **self.sampling_kwargs)
+        
         for i, case in enumerate(test_cases, 1):
             print(f"\n🔄 案例 {i}/{total_count} (ID: {case.get('id', i)})")
             print(f"   棋盘: {case.get('stage', 'unknown')} | 难度: {case.get('difficulty', 'unknown')} | 玩家: {case.get('player', 'unknown')}")
@@ -251,8 +430,18 @@ class MultiOptimalEvaluator:
             prompt = self.create_prompt(case)
             
             # 获取模型响应
-            print("   🔮 模型思考中...")
-            response = self.generate_response(prompt)
+            samples = None
+            if self.num_samples > 1:
+                print(f"   🔮 模型思考中（{self.num_samples} 个样本）...")
+                samples = self.generate_samples(prompt, self.num_samples)
+                response = samples[0]  # 第一个样本即单次采样的指标
+            elif responses is not None:
+                response = responses[i - 1]
+            else:
+                print("   🔮 模型思考中...")
+                response = self.generate_response(prompt, case)
+            
+            generated_tokens += sum(len(self.tokenizer(text)["input_ids"]) for text in (samples or [response]))
             
             # 提取预测移动
             predicted_move = self.extract_move(response)
@@ -276,6 +465,17 @@ class MultiOptimalEvaluator:
                 output_preview = response
             print(f"   💭 模型回答: {output_preview}")
             
+            consistency = None
+            if samples is not None:
+                consistency = self.score_samples(samples, case)
+                consistency_totals["majority_correct"] += consistency["majority_correct"]
+                consistency_totals["pass_at_k"] += consistency["pass_at_k"]
+                consistency_totals["agreement_rate"] += consistency["agreement_rate"]
+                consistency_totals["sample_accuracy"] += consistency["sample_accuracy"]
+                print(f"   🗳️  多数投票: {consistency['majority_move']} "
+                      f"({'✅' if consistency['majority_correct'] else '❌'}) | 一致率 {consistency['agreement_rate']:.0%} | "
+                      f"pass@{self.num_samples}: {'✅' if consistency['pass_at_k'] else '❌'}")
+            
             # 记录详细结果
             result_item = {
                 "case_id": case.get("id", i),
@@ -290,6 +490,9 @@ class MultiOptimalEvaluator:
                 "stage": case.get("stage", ""),
                 "move_type": case.get("move_type", "")
             }
+            if consistency is not None:
+                result_item["samples"] = samples
+                result_item.update(consistency)
             detailed_results.append(result_item)
             
             # 每10个案例显示一次统计
@@ -300,9 +503,283 @@ class MultiOptimalEvaluator:
                     print("-" * 40)
         
         accuracy = (correct_count / total_count) * 100
+        elapsed = time.perf_counter() - started
+        self.throughput = {
+            "seconds": round(elapsed, 2),
+            "cases_per_second": round(total_count / elapsed, 3),
+            "generated_tokens": generated_tokens,
+            "tokens_per_second": round(generated_tokens / elapsed, 1),
+        }
         print(f"\n🎯 最终结果: {accuracy:.2f}% ({correct_count}/{total_count})")
+        print(f"⏱️  生成耗时 {elapsed:.1f}s，{self.throughput['cases_per_second']} 案例/秒，"
+              f"{self.throughput['tokens_per_second']} token/秒")
+        self.self_consistency = None
+        if self.num_samples > 1:
+            self.self_consistency = {
+                "num_samples": self.num_samples,
+                "majority_vote_accuracy": consistency_totals["majority_correct"] / total_count * 100,
+                "pass_at_k": consistency_totals["pass_at_k"] / total_count * 100,
+                "mean_agreement_rate": consistency_totals["agreement_rate"] / total_count * 100,
+                "mean_sample_accuracy": consistency_totals["sample_accuracy"] / total_count * 100,
+            }
+            print(f"🗳️  多数投票准确率: {self.self_consistency['majority_vote_accuracy']:.2f}% | "
+                  f"pass@{self.num_samples}: {self.self_consistency['pass_at_k']:.2f}% | "
+                  f"平均一致率: {self.self_consistency['mean_agreement_rate']:.1f}% | "
+                  f"单样本平均准确率: {self.self_consistency['mean_sample_accuracy']:.2f}%")
+        if self.speculator is not None:
+            for label, stats in self.speculator.report().items():
+                print(f"📝 推测解码 {label}: 草稿接受率 {stats['acceptance_rate']:.1%}，"
+                      f"每次前向 {stats['tokens_per_forward']} token")
         return accuracy, detailed_results
 
+    def evaluate_state_space(self, symmetry_unique: bool = False) -> tuple[float, List[Dict]]:
+        """在全部合法非终局局面（或每个对称等价类的代表局面）上评估，批量生成并使用回复缓存
+
+        symmetry_unique 时每个结果带有 weight（等价类中的局面数），可据此换算全部局面上的准确率
+        """
+        cases = state_space_cases(symmetry_unique)
+        print(f"📋 全状态空间评估: {len(cases)} 个{'对称等价类' if symmetry_unique else '合法局面'}")
+        print(f"🤖 当前模型: {self.model_name}")
+        started = time.perf_counter()
+        responses = self.generate_cached([self.create_prompt(case) for case in cases])
+        elapsed = time.perf_counter() - started
+        
+        detailed_results = []
+        for case, response in zip(cases, responses):
+            predicted_move = self.extract_move(response)
+            detailed_results.append({
+                "case_id": case["id"],
+                "board_state": case["board_state"],
+                "player": case["player"],
+                "available_moves": case["available_moves"],
+                "optimal_moves": case["optimal_moves"],
+                "model_output": response,
+                "predicted_move": predicted_move,
+                "is_correct": self.is_move_optimal(predicted_move, case),
+                "difficulty": case["difficulty"],
+                "stage": case["stage"],
+                "move_type": case["move_type"],
+                "weight": case["weight"],
+            })
+        
+        correct_count = sum(result["is_correct"] for result in detailed_results)
+        accuracy = correct_count / len(detailed_results) * 100
+        self.throughput = {
+            "seconds": round(elapsed, 2),
+            "cases_per_second": round(len(cases) / elapsed, 3) if elapsed else None,
+        }
+        print(f"\n🎯 最终结果: {accuracy:.2f}% ({correct_count}/{len(detailed_results)})，生成耗时 {elapsed:.1f}s")
+        return accuracy, detailed_results
+
+    def evaluate_sequential(self, cases: List[Dict], baseline: Optional["MultiOptimalEvaluator"] = None,
+                            target_precision: float = 0.05, accuracy_threshold: Optional[float] = None,
+                            margin: float = 0.0, confidence: float = 0.95, min_cases: int = 40,
+                            look_growth: float = 1.5, max_looks: int = 15, seed: int = 42) -> tuple[Dict, List[Dict]]:
+        """序贯评估：按随机分层顺序逐块评估，置信界达到目标精度或可以下结论时提前停止
+        
+        检查点按几何级数排列（min_cases, ×look_growth, …, 案例池大小，最多 max_looks 次，见 look_schedule）；
+        总置信水平按检查次数平均分配（Bonferroni），因此在任意一次检查时停止，结论仍满足给定的置信水平。
+        检查次数随案例池大小只按对数增长，全状态空间（4520个）上约13次，单次检查的区间不会过宽。
+        
+        Args:
+            cases: 案例池（测试集或全状态空间）
+            baseline: 提供时做配对比较（同一批案例），对准确率之差（本模型 - 基线）建立置信区间
+            target_precision: 区间半宽（0-1）不超过该值时停止
+            accuracy_threshold: 单模型时，区间整体高于/低于该准确率（0-1）即停止
+            margin: 配对比较时，差值区间落在 [-margin, margin] 内判定为等价并停止
+        
+        案例带有等价类大小（state_space_cases(symmetry_unique=True) 的 weight）时，每次检查另外报告按weight加权的
+        state_weighted_accuracy（配对比较时还有基线的加权准确率与加权差值），即全部合法局面上的准确率；
+        置信区间与停止规则仍按等价类计算（interval_unit 标明口径，同 breakdown_by）。
+        """
+        from utils.stats import paired_difference_interval, wilson_interval
+        
+        if not cases:
+            raise ValueError("序贯评估的案例池为空（测试集文件不存在或没有案例？）")
+        weighted = any(case.get("weight", 1) != 1 for case in cases)
+        ordered = stratified_order(cases, seed)
+        looks = look_schedule(len(ordered), min_cases, look_growth, max_looks)
+        look_confidence = 1 - (1 - confidence) / len(looks)
+        mode = "paired" if baseline is not None else "single"
+        print(f"🧪 序贯评估（{mode}）: 案例池 {len(ordered)}，检查点 {looks}，"
+              f"单次检查置信水平 {look_confidence:.4f}")
+        
+        detailed_results, trajectory = [], []
+        correct = baseline_correct = new_only = baseline_only = 0
+        total_weight = correct_weight = baseline_correct_weight = 0
+        decision, report = "exhausted", {}
+        started = time.perf_counter()
+        for start, end in zip([0] + looks[:-1], looks):
+            chunk = ordered[start:end]
+            prompts = [self.create_prompt(case) for case in chunk]
+            responses = self.generate_cached(prompts)
+            baseline_responses = baseline.generate_cached(prompts) if baseline is not None else [None] * len(chunk)
+            for case, response, baseline_response in zip(chunk, responses, baseline_responses):
+                predicted_move = self.extract_move(response)
+                result = {
+                    "case_id": case.get("id"),
+                    "board_state": case["board_state"],
+                    "player": case["player"],
+                    "optimal_moves": case.get("optimal_moves", [case.get("optimal_move", "")]),
+                    "model_output": response,
+                    "predicted_move": predicted_move,
+                    "is_correct": self.is_move_optimal(predicted_move, case),
+                    "difficulty": case.get("difficulty", ""),
+                    "stage": case.get("stage", ""),
+                    "move_type": case.get("move_type", ""),
+                }
+                weight = case.get("weight", 1)
+                if weighted:
+                    result["weight"] = weight
+                correct += result["is_correct"]
+                total_weight += weight
+                correct_weight += weight * result["is_correct"]
+                if baseline is not None:
+                    result["baseline_predicted_move"] = baseline.extract_move(baseline_response)
+                    result["baseline_is_correct"] = baseline.is_move_optimal(result["baseline_predicted_move"], case)
+                    baseline_correct += result["baseline_is_correct"]
+                    baseline_correct_weight += weight * result["baseline_is_correct"]
+                    new_only += result["is_correct"] and not result["baseline_is_correct"]
+                    baseline_only += result["baseline_is_correct"] and not result["is_correct"]
+                detailed_results.append(result)
+            
+            n = len(detailed_results)
+            low, high = wilson_interval(correct, n, look_confidence)
+            report = {"cases": n, "accuracy": correct / n, "accuracy_ci": [low, high]}
+            if baseline is not None:
+                difference, low, high = paired_difference_interval(new_only, baseline_only, n, look_confidence)
+                report.update(baseline_accuracy=baseline_correct / n, difference=difference, difference_ci=[low, high])
+            if weighted:
+                report.update(state_weighted_accuracy=correct_weight / total_weight, interval_unit="symmetry_class")
+                if baseline is not None:
+                    report.update(baseline_state_weighted_accuracy=baseline_correct_weight / total_weight,
+                                  state_weighted_difference=(correct_weight - baseline_correct_weight) / total_weight)
+            trajectory.append(report)
+            if baseline is not None:
+                print(f"   📏 {n} 例: 差值 {report['difference']:+.3f}，区间 [{low:.3f}, {high:.3f}]")
+            else:
+                print(f"   📏 {n} 例: 准确率 {report['accuracy']:.3f}，区间 [{low:.3f}, {high:.3f}]")
+            
+            if baseline is not None and low > 0:
+                decision = "better_than_baseline"
+            elif baseline is not None and high < 0:
+                decision = "worse_than_baseline"
+            elif baseline is not None and margin > 0 and -margin <= low and high <= margin:
+                decision = "equivalent"
+            elif baseline is None and accuracy_threshold is not None and low >= accuracy_threshold:
+                decision = "above_threshold"
+            elif baseline is None and accuracy_threshold is not None and high < accuracy_threshold:
+                decision = "below_threshold"
+            elif (high - low) / 2 <= target_precision:
+                decision = "precision_reached"
+            else:
+                continue
+            break
+        
+        elapsed = time.perf_counter() - started
+        used = len(detailed_results)
+        summary = {
+            "mode": mode,
+            "decision": decision,
+            "cases_used": used,
+            "pool_size": len(ordered),
+            "fraction_used": used / len(ordered),
+            "looks": len(trajectory),
+            "planned_looks": looks,
+            "confidence": confidence,
+            "confidence_per_look": look_confidence,
+            **report,
+            "generation_seconds": round(elapsed, 2),
+            # 按已用案例的平均耗时估算跑完整个案例池还需的时间（回复缓存命中会使估计偏低）
+            "estimated_seconds_saved": round(elapsed / used * (len(ordered) - used), 2),
+            "trajectory": trajectory,
+        }
+        print(f"🏁 结论: {decision} | 使用 {used}/{len(ordered)} 个案例（{summary['fraction_used']:.0%}），"
+              f"预计节省 {summary['estimated_seconds_saved']:.0f}s 生成时间")
+        if weighted:
+            print(f"📊 按等价类大小加权（全部局面）: {summary['state_weighted_accuracy']:.3f}（区间按等价类计算）")
+        return summary, detailed_results
+
+def look_schedule(pool_size: int, min_cases: int = 40, growth: float = 1.5, max_looks: int = 15) -> List[int]:
+    """序贯评估的检查点（累计案例数）：从min_cases开始按growth倍增长，最后一个检查点为整个案例池
+
+    超过 max_looks 个时保留前面的检查点，最后一个替换为案例池大小
+    """
+    looks = []
+    n = max(1, min(min_cases, pool_size))
+    while n < pool_size:
+        looks.append(n)
+        n = max(n + 1, math.ceil(n * growth))
+    looks = looks[:max(max_looks - 1, 0)]
+    return looks + [pool_size]
+
+def stratified_order(cases: List[Dict], seed: int = 42, strata: tuple = ("stage", "difficulty")) -> List[Dict]:
+    """随机分层顺序：层内打乱后按各层占比交错排列，任意前缀的层分布都接近案例池整体"""
+    rng = random.Random(seed)
+    groups = {}
+    for case in cases:
+        groups.setdefault(tuple(case.get(field, "") for field in strata), []).append(case)
+    keyed = []
+    for key in sorted(groups):
+        group = groups[key]
+        rng.shuffle(group)
+        # 第r个案例排在该层的 (r + U) / n 分位处
+        keyed.extend(((rank + rng.random()) / len(group), case) for rank, case in enumerate(group))
+    keyed.sort(key=lambda item: item[0])
+    return [case for _, case in keyed]
+
+def state_space_cases(symmetry_unique: bool = False) -> List[Dict]:
+    """全部合法非终局局面（求解器标注）转换为测试案例格式"""
+    from utils.mock_env import board_to_string
+    from utils.tictactoe_oracle import enumerate_positions
+    
+    orbit_sizes = Counter(position["canonical"] for position in enumerate_positions())
+    cases = []
+    for position in enumerate_positions(symmetry_unique=symmetry_unique):
+        board = position["board"]
+        cases.append({
+            "id": len(cases) + 1,
+            "board_state": board_to_string(board),
+            "player": position["player"],
+            "available_moves": [f"[{i}]" for i, cell in enumerate(board) if cell == ' '],
+            "optimal_moves": [f"[{move}]" for move in position["optimal_moves"]],
+            "stage": position["stage"],
+            "difficulty": position["difficulty"],
+            "move_type": position["move_type"],
+            "canonical_board": position["canonical"],
+            "weight": orbit_sizes[position["canonical"]] if symmetry_unique else 1,
+        })
+    return cases
+
+def breakdown_by(results: List[Dict], field: str, confidence: float = 0.95, weighted: bool = False) -> Dict[str, Dict]:
+    """按某个字段（difficulty / stage / move_type）分组统计准确率
+
+    total / correct / accuracy / accuracy_ci 按评估的案例计数。对称去重评估中一个案例代表一个等价类，
+    weighted=True 时另给出按等价类大小（weight）加权的 positions / correct_positions / state_weighted_accuracy，
+    即该类别在全部合法局面上的准确率。同一等价类内的局面互为对称变换而不是独立样本，
+    所以置信区间仍按等价类计算（interval_unit 标明口径）。
+    """
+    from utils.stats import wilson_interval
+    
+    breakdown = {}
+    for result in results:
+        stats = breakdown.setdefault(result[field], {"total": 0, "correct": 0, "positions": 0, "correct_positions": 0})
+        weight = result.get("weight", 1) if weighted else 1
+        stats["total"] += 1
+        stats["positions"] += weight
+        if result["is_correct"]:
+            stats["correct"] += 1
+            stats["correct_positions"] += weight
+    for stats in breakdown.values():
+        stats["accuracy"] = (stats["correct"] / stats["total"] * 100) if stats["total"] > 0 else 0
+        stats["accuracy_ci"] = [bound * 100 for bound in wilson_interval(stats["correct"], stats["total"], confidence)]
+        if weighted:
+            stats["state_weighted_accuracy"] = stats["correct_positions"] / stats["positions"] * 100
+            stats["interval_unit"] = "symmetry_class"
+        else:
+            del stats["positions"], stats["correct_positions"]
+    return breakdown
+
 def load_test_cases(test_set_path: str, num_cases: Optional[int] = None) -> List[Dict]:
     """加载测试案例"""
     if not os.path.exists(test_set_path):
@@ -318,6 +795,51 @@ def load_test_cases(test_set_path: str, num_cases: Optional[int] = None) -> List
     print(f"✅ 加载了 {len(test_cases)} 个测试案例")
     return test_cases
 
+def run_sequential(args, evaluator: MultiOptimalEvaluator, evaluator_kwargs: Dict) -> Dict:
+    """序贯评估入口：案例池为测试集或全状态空间，可选与基线模型配对比较"""
+    from datetime import datetime
+    
+    if args.state_space:
+        cases = state_space_cases(symmetry_unique=args.state_space == "symmetry")
+    else:
+        cases = load_test_cases(args.test_set, args.num_cases)
+    if not cases:
+        raise SystemExit(f"❌ 没有可评估的案例: {args.test_set}")
+    baseline = None
+    if args.baseline_model_path:
+        print(f"📦 基线模型: {args.baseline_model_path}")
+        baseline = MultiOptimalEvaluator(model_path=args.baseline_model_path, **evaluator_kwargs)
+    
+    summary, detailed_results = evaluator.evaluate_sequential(
+        cases, baseline,
+        target_precision=args.target_precision,
+        accuracy_threshold=args.accuracy_threshold,
+        margin=args.margin,
+        confidence=args.confidence,
+        min_cases=args.min_cases,
+        look_growth=args.look_growth,
+        max_looks=args.max_looks,
+        seed=args.seed
+    )
+    evaluation_summary = {
+        "evaluation_info": {
+            "timestamp": datetime.now().isoformat(),
+            "model_path": args.model_path,
+            "baseline_model_path": args.baseline_model_path,
+            "test_set": args.test_set,
+            "device": args.device,
+            "accuracy": summary["accuracy"] * 100
+        },
+        "sequential": summary,
+        "detailed_results": detailed_results
+    }
+    output_file = args.output or (f"sequential_evaluation_{os.path.basename(args.model_path)}_"
+                                  f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(evaluation_summary, f, ensure_ascii=False, indent=2)
+    print(f"💾 序贯评估结果已保存到: {output_file}")
+    return evaluation_summary
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description="多最优解模型评估器")
@@ -325,12 +847,44 @@ def main():
     parser.add_argument("--base-model-path", type=str, 
                        default="/mnt/cvda/cvda_avatar/1/textarena-selfplay-qwen/qwen",
                        help="基础模型路径（微调模型需要）")
-    parser.add_argument("--test-set", type=str, required=True, help="测试集路径")
+    parser.add_argument("--test-set", type=str, help="测试集路径（--state-space 时不需要）")
     parser.add_argument("--num-cases", type=int, help="测试案例数量（可选）")
     parser.add_argument("--device", type=str, default="auto", help="设备（cuda:0, cpu等）")
     parser.add_argument("--output", type=str, help="输出JSON文件路径（可选）")
+    parser.add_argument("--continuous-batching", type=int, default=None, metavar="N",
+                       help="连续批处理，最多N个案例同时解码（默认逐个生成）")
+    parser.add_argument("--speculative-cot-length", type=str, default=None,
+                       choices=['tiny', 'short', 'medium', 'long', 'very_long', 'ultra_long'],
+                       help="以规则智能体该长度的CoT为草稿做推测解码（与被评估模型训练时的CoT长度一致）")
+    parser.add_argument("--num-samples", type=int, default=1,
+                       help="每个案例采样k次（共享prefill），报告多数投票准确率、pass@k和一致率")
+    parser.add_argument("--cpu-int8", action="store_true", help="在CPU上以int8动态量化的线性层推理")
+    parser.add_argument("--cpu-threads", type=int, default=None, help="CPU推理线程数（默认可用核数）")
+    parser.add_argument("--greedy", action="store_true", help="贪心解码（默认 temperature=0.7 采样）")
+    parser.add_argument("--state-space", type=str, default=None, choices=["all", "symmetry"],
+                       help="在全部合法非终局局面（all，4520个）或每个对称等价类（symmetry，627个）上评估")
+    parser.add_argument("--batch-size", type=int, default=16, help="全状态空间评估时每次generate的局面数")
+    parser.add_argument("--response-cache", type=str, default=None,
+                       help="回复缓存文件（SQLite），全状态空间评估时复用已生成的回复")
+    parser.add_argument("--confidence", type=float, default=0.95, help="准确率置信区间的置信水平")
+    parser.add_argument("--sequential", action="store_true",
+                       help="序贯评估：按随机分层顺序评估，达到目标精度或可以下结论时提前停止")
+    parser.add_argument("--baseline-model-path", type=str, default=None,
+                       help="序贯评估时与该基线模型在同一批案例上配对比较")
+    parser.add_argument("--target-precision", type=float, default=0.05, help="序贯评估的目标区间半宽（0-1）")
+    parser.add_argument("--accuracy-threshold", type=float, default=None,
+                       help="序贯评估（单模型）时，准确率区间整体高于/低于该值（0-1）即停止")
+    parser.add_argument("--margin", type=float, default=0.0, help="配对比较的等价界（0-1），差值区间落在±margin内即停止")
+    parser.add_argument("--min-cases", type=int, default=40, help="序贯评估第一次检查停止条件时的案例数")
+    parser.add_argument("--look-growth", type=float, default=1.5, help="序贯评估检查点的增长倍数")
+    parser.add_argument("--max-looks", type=int, default=15, help="序贯评估最多检查次数（置信水平按次数分配）")
+    parser.add_argument("--seed", type=int, default=42, help="序贯评估的案例顺序随机种子")
     
     args = parser.parse_args()
+    if not args.test_set and not args.state_space:
+        parser.error("需要 --test-set 或 --state-space")
+    if args.state_space:
+        args.test_set = f"state_space:{args.state_space}"
     
     print("🎯 多最优解模型评估器")
     print("=" * 50)
@@ -342,14 +896,31 @@ def main():
     print()
     
     # 初始化评估器
-    evaluator = MultiOptimalEvaluator(
-        model_path=args.model_path,
+    evaluator_kwargs = dict(
         base_model_path=args.base_model_path,
-        device=args.device
+        device=args.device,
+        continuous_batch_size=args.continuous_batching,
+        speculative_cot_length=args.speculative_cot_length,
+        num_samples=args.num_samples,
+        cpu_int8=args.cpu_int8,
+        cpu_threads=args.cpu_threads,
+        greedy=args.greedy,
+        batch_size=args.batch_size,
+        response_cache=args.response_cache
     )
+    evaluator = MultiOptimalEvaluator(model_path=args.model_path, **evaluator_kwargs)
+    
+    if args.sequential:
+        return run_sequential(args, evaluator, evaluator_kwargs)
     
     # 执行评估
-    accuracy, detailed_results = evaluator.evaluate(args.test_set, args.num_cases)
+    if args.state_space:
+        accuracy, detailed_results = evaluator.evaluate_state_space(symmetry_unique=args.state_space == "symmetry")
+    else:
+        accuracy, detailed_results = evaluator.evaluate(args.test_set, args.num_cases)
+    from utils.stats import wilson_interval
+    correct_cases = sum(1 for r in detailed_results if r["is_correct"])
+    accuracy_ci = [bound * 100 for bound in wilson_interval(correct_cases, len(detailed_results), args.confidence)]
     
     # 准备完整的评估结果
     from datetime import datetime
@@ -366,50 +937,37 @@ def main():
         },
         "summary": {
             "total_cases": len(detailed_results),
-            "correct_cases": sum(1 for r in detailed_results if r["is_correct"]),
+            "correct_cases": correct_cases,
             "accuracy_percentage": accuracy,
+            "accuracy_ci": accuracy_ci,
+            "confidence": args.confidence,
             "difficulty_breakdown": {},
             "stage_breakdown": {},
-            "move_type_breakdown": {}
+            "move_type_breakdown": {},
+            "self_consistency": evaluator.self_consistency,
+            "throughput": evaluator.throughput,
+            "response_cache": evaluator.cache.stats() if evaluator.cache is not None else None
         },
         "detailed_results": detailed_results
     }
     
-    # 统计分析
-    for result in detailed_results:
-        # 难度统计
-        difficulty = result["difficulty"]
-        if difficulty not in evaluation_summary["summary"]["difficulty_breakdown"]:
-            evaluation_summary["summary"]["difficulty_breakdown"][difficulty] = {"total": 0, "correct": 0}
-        evaluation_summary["summary"]["difficulty_breakdown"][difficulty]["total"] += 1
-        if result["is_correct"]:
-            evaluation_summary["summary"]["difficulty_breakdown"][difficulty]["correct"] += 1
-        
-        # 阶段统计
-        stage = result["stage"]
-        if stage not in evaluation_summary["summary"]["stage_breakdown"]:
-            evaluation_summary["summary"]["stage_breakdown"][stage] = {"total": 0, "correct": 0}
-        evaluation_summary["summary"]["stage_breakdown"][stage]["total"] += 1
-        if result["is_correct"]:
-            evaluation_summary["summary"]["stage_breakdown"][stage]["correct"] += 1
-        
-        # 移动类型统计
-        move_type = result["move_type"]
-        if move_type not in evaluation_summary["summary"]["move_type_breakdown"]:
-            evaluation_summary["summary"]["move_type_breakdown"][move_type] = {"total": 0, "correct": 0}
-        evaluation_summary["summary"]["move_type_breakdown"][move_type]["total"] += 1
-        if result["is_correct"]:
-            evaluation_summary["summary"]["move_type_breakdown"][move_type]["correct"] += 1
+    # 统计分析（对称去重时另给出按等价类大小加权的准确率）
+    for category, field in [("difficulty_breakdown", "difficulty"), ("stage_breakdown", "stage"),
+                            ("move_type_breakdown", "move_type")]:
+        evaluation_summary["summary"][category] = breakdown_by(detailed_results, field, args.confidence,
+                                                               weighted=args.state_space == "symmetry")
     
-    # 计算百分比
-    for category in ["difficulty_breakdown", "stage_breakdown", "move_type_breakdown"]:
-        for key in evaluation_summary["summary"][category]:
-            stats = evaluation_summary["summary"][category][key]
-            stats["accuracy"] = (stats["correct"] / stats["total"] * 100) if stats["total"] > 0 else 0
+    if args.state_space == "symmetry":
+        # 按等价类大小加权，换算为全部合法局面上的准确率
+        total_weight = sum(r["weight"] for r in detailed_results)
+        evaluation_summary["summary"]["state_weighted_accuracy"] = (
+            sum(r["weight"] for r in detailed_results if r["is_correct"]) / total_weight * 100)
     
     print("=" * 50)
     print(f"🎉 评估完成！")
-    print(f"📊 准确率: {accuracy:.2f}%")
+    print(f"📊 准确率: {accuracy:.2f}%（{args.confidence:.0%} 置信区间 {accuracy_ci[0]:.1f}%-{accuracy_ci[1]:.1f}%）")
+    if "state_weighted_accuracy" in evaluation_summary["summary"]:
+        print(f"📊 按等价类大小加权（全部局面）: {evaluation_summary['summary']['state_weighted_accuracy']:.2f}%")
     print()
     
     # 输出简要统计
@@ -418,22 +976,25 @@ def main():
     print(f"正确案例数: {evaluation_summary['summary']['correct_cases']}")
     print()
     
-    if evaluation_summary["summary"]["difficulty_breakdown"]:
-        print("按难度分类:")
-        for difficulty, stats in evaluation_summary["summary"]["difficulty_breakdown"].items():
-            print(f"  {difficulty}: {stats['correct']}/{stats['total']} ({stats['accuracy']:.1f}%)")
-    
-    if evaluation_summary["summary"]["stage_breakdown"]:
-        print("按阶段分类:")
-        for stage, stats in evaluation_summary["summary"]["stage_breakdown"].items():
-            print(f"  {stage}: {stats['correct']}/{stats['total']} ({stats['accuracy']:.1f}%)")
+    for category, title in [("difficulty_breakdown", "按难度分类"), ("stage_breakdown", "按阶段分类"),
+                            ("move_type_breakdown", "按移动类型分类")]:
+        if evaluation_summary["summary"][category]:
+            print(f"{title}" + ("（按等价类计数；加权为全部局面上的准确率）:" if args.state_space == "symmetry" else ":"))
+            for key, stats in evaluation_summary["summary"][category].items():
+                line = (f"  {key}: {stats['correct']}/{stats['total']} ({stats['accuracy']:.1f}%，"
+                        f"区间 {stats['accuracy_ci'][0]:.1f}-{stats['accuracy_ci'][1]:.1f}%)")
+                if "state_weighted_accuracy" in stats:
+                    line += (f"，加权 {stats['correct_positions']}/{stats['positions']}"
+                             f" ({stats['state_weighted_accuracy']:.1f}%)")
+                print(line)
     
     # 保存详细结果到JSON
     if args.output:
         output_file = args.output
     else:
         model_name = os.path.basename(args.model_path)
-        output_file = f"multi_optimal_evaluation_{model_name}_{timestamp}.json"
+        prefix = f"state_space_{args.state_space}_evaluation" if args.state_space else "multi_optimal_evaluation"
+        output_file = f"{prefix}_{model_name}_{timestamp}.json"
     
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(evaluation_summary, f, ensure_ascii=False, indent=2)
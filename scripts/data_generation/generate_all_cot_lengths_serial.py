@@ -12,6 +12,12 @@ import glob
 import time
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'src'))
+from utils.sft_index import IndexedSFTDataset
+
+# 长度统计抽样的记录数（通过偏移索引随机读取，无需解析整个文件）
+STAT_SAMPLE_SIZE = 500
+
 # CoT配置
 COT_CONFIGS = {
     'tiny': {'target': 100, 'range': (80, 120)},
@@ -21,6 +27,88 @@ COT_CONFIGS = {
     'ultra_long': {'target': 4000, 'range': (3000, 5000)}
 }
 
+def validate_cot_file(cot_type, latest_file):
+    """验证生成的SFT文件并统计CoT长度"""
+    try:
+        with IndexedSFTDataset(latest_file) as dataset:
+            sample_count = len(dataset)
+            # 计算CoT长度统计（随机抽样）
+            lengths = dataset.cot_lengths(dataset.sample_indices(STAT_SAMPLE_SIZE, seed=0))
+        
+        if sample_count > 0:
+            if lengths:
+                avg_length = sum(lengths) / len(lengths)
+                min_length = min(lengths)
+                max_length = max(lengths)
+                
+                target_range = COT_CONFIGS[cot_type]['range']
+                status = "✓ 符合要求" if target_range[0] <= avg_length <= target_range[1] else "⚠ 长度需要调整"
+                
+                print(f"[{cot_type}] ✓ 生成成功")
+                print(f"  - 样本数量: {sample_count}")
+                print(f"  - 平均长度: {avg_length:.1f} 字符")
+                print(f"  - 长度范围: {min_length}-{max_length} 字符")
+                print(f"  - 期望范围: {target_range[0]}-{target_range[1]} 字符")
+                print(f"  - 状态: {status}")
+                
+                return {
+                    'success': True,
+                    'cot_type': cot_type,
+                    'file_path': latest_file,
+                    'sample_count': sample_count,
+                    'avg_length': round(avg_length, 1),
+                    'length_range': f"{min_length}-{max_length}",
+                    'target_range': f"{target_range[0]}-{target_range[1]}",
+                    'status': status
+                }
+            else:
+                return {'success': False, 'cot_type': cot_type, 'error': '无法提取CoT长度信息'}
+        else:
+            return {'success': False, 'cot_type': cot_type, 'error': '生成的数据为空'}
+    
+    except json.JSONDecodeError as e:
+        return {'success': False, 'cot_type': cot_type, 'error': f'JSON解析错误: {e}'}
+    except (ValueError, OSError, KeyError) as e:
+        # 索引损坏、文件读取失败或样本缺少字段：只记该长度失败，不中断其他长度的验证
+        print(f"[{cot_type}] ✗ 验证失败: {e}")
+        return {'success': False, 'cot_type': cot_type, 'error': f'文件验证失败: {e!r}'}
+
+def generate_cot_data_fanout(cot_types, games=100):
+    """只运行一次self-play，每步复用同一次棋盘分析为所有长度渲染CoT，再逐一验证各长度的文件"""
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    tag = f"fanout_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    print(f"[fanout] 一次生成 {', '.join(cot_types)} ...")
+    
+    cmd = [
+        sys.executable,
+        os.path.join(project_root, 'src', 'main.py'),
+        '--num-games', str(games),
+        '--fanout-cot-lengths', ','.join(cot_types),
+        '--output-suffix', tag,
+        '--sft-format', 'jsonl'
+    ]
+    env = os.environ.copy()
+    env['PYTHONPATH'] = project_root
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, cwd=project_root, env=env, timeout=300)
+    except subprocess.TimeoutExpired:
+        return [{'success': False, 'cot_type': cot_type, 'error': '生成超时（5分钟）'} for cot_type in cot_types]
+    
+    if result.returncode != 0:
+        error_msg = result.stderr if result.stderr else "未知错误"
+        print(f"[fanout] ✗ 生成失败: {error_msg}")
+        return [{'success': False, 'cot_type': cot_type, 'error': error_msg} for cot_type in cot_types]
+    
+    data_dir = os.path.join(project_root, "data", "processed")
+    results = []
+    for cot_type in cot_types:
+        output_file = os.path.join(data_dir, f"long_cot_sft_data_{cot_type}_{tag}.jsonl")
+        if os.path.exists(output_file):
+            results.append(validate_cot_file(cot_type, output_file))
+        else:
+            results.append({'success': False, 'cot_type': cot_type, 'error': '未找到生成的文件'})
+    return results
+
 def generate_cot_data_safe(cot_type, games=100):
     """安全地生成单个CoT类型的数据"""
     try:
@@ -33,7 +121,8 @@ def generate_cot_data_safe(cot_type, games=100):
             sys.executable, 
             os.path.join(project_root, 'src', 'main.py'),
             '--num-games', str(games),
-            '--cot-length', cot_type
+            '--cot-length', cot_type,
+            '--sft-format', 'jsonl'
         ]
         
         # 设置环境变量
@@ -53,61 +142,13 @@ def generate_cot_data_safe(cot_type, games=100):
         if result.returncode == 0:
             # 查找生成的文件
             data_dir = os.path.join(project_root, "data", "processed")
-            pattern = f"long_cot_sft_data_{cot_type}_*.json"
+            pattern = f"long_cot_sft_data_{cot_type}_*.jsonl"
             files = glob.glob(os.path.join(data_dir, pattern))
             
             if files:
                 # 找到最新的文件
                 latest_file = max(files, key=os.path.getctime)
-                
-                # 验证文件
-                try:
-                    with open(latest_file, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    
-                    sample_count = len(data)
-                    if sample_count > 0:
-                        # 计算CoT长度统计
-                        lengths = []
-                        for sample in data:
-                            if 'conversations' in sample:
-                                for conv in sample['conversations']:
-                                    if conv.get('from') == 'gpt':
-                                        length = len(conv.get('value', ''))
-                                        lengths.append(length)
-                        
-                        if lengths:
-                            avg_length = sum(lengths) / len(lengths)
-                            min_length = min(lengths)
-                            max_length = max(lengths)
-                            
-                            target_range = COT_CONFIGS[cot_type]['range']
-                            status = "✓ 符合要求" if target_range[0] <= avg_length <= target_range[1] else "⚠ 长度需要调整"
-                            
-                            print(f"[{cot_type}] ✓ 生成成功")
-                            print(f"  - 样本数量: {sample_count}")
-                            print(f"  - 平均长度: {avg_length:.1f} 字符")
-                            print(f"  - 长度范围: {min_length}-{max_length} 字符")
-                            print(f"  - 期望范围: {target_range[0]}-{target_range[1]} 字符")
-                            print(f"  - 状态: {status}")
-                            
-                            return {
-                                'success': True,
-                                'cot_type': cot_type,
-                                'file_path': latest_file,
-                                'sample_count': sample_count,
-                                'avg_length': round(avg_length, 1),
-                                'length_range': f"{min_length}-{max_length}",
-                                'target_range': f"{target_range[0]}-{target_range[1]}",
-                                'status': status
-                            }
-                        else:
-                            return {'success': False, 'cot_type': cot_type, 'error': '无法提取CoT长度信息'}
-                    else:
-                        return {'success': False, 'cot_type': cot_type, 'error': '生成的数据为空'}
-                
-                except json.JSONDecodeError as e:
-                    return {'success': False, 'cot_type': cot_type, 'error': f'JSON解析错误: {e}'}
+                return validate_cot_file(cot_type, latest_file)
             else:
                 return {'success': False, 'cot_type': cot_type, 'error': '未找到生成的文件'}
         else:
@@ -121,7 +162,7 @@ def generate_cot_data_safe(cot_type, games=100):
         print(f"[{cot_type}] ✗ 生成失败: {str(e)}")
         return {'success': False, 'cot_type': cot_type, 'error': str(e)}
 
-def main():
+def main(fanout=False):
     print("=" * 80)
     print("五种CoT长度训练数据串行生成器 - 安全版本")
     print("=" * 80)
@@ -136,12 +177,17 @@ def main():
     games_per_type = 100  # 每种类型生成5个游戏
     cot_types = list(COT_CONFIGS.keys())
     
-    print(f"将串行生成 {len(cot_types)} 种CoT长度类型，每种 {games_per_type} 个游戏")
-    print()
+    if fanout:
+        print(f"fan-out模式: 运行 {games_per_type} 个游戏，同时生成 {len(cot_types)} 种CoT长度")
+        print()
+        results = generate_cot_data_fanout(cot_types, games_per_type)
+    else:
+        print(f"将串行生成 {len(cot_types)} 种CoT长度类型，每种 {games_per_type} 个游戏")
+        print()
+        results = []
     
     # 串行执行
-    results = []
-    for i, cot_type in enumerate(cot_types, 1):
+    for i, cot_type in enumerate([] if fanout else cot_types, 1):
         print(f"进度: {i}/{len(cot_types)} - 处理 {cot_type}")
         
         result = generate_cot_data_safe(cot_type, games_per_type)
@@ -201,5 +247,5 @@ def main():
         return False
 
 if __name__ == "__main__":
-    success = main()
+    success = main(fanout='--fanout' in sys.argv[1:])
     sys.exit(0 if success else 1)
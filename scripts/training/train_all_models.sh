@@ -28,8 +28,8 @@ COT_TYPES=("tiny" "short" "medium" "long" "very_long" "ultra_long")
 AVAILABLE_DATA=()
 
 for cot_type in "${COT_TYPES[@]}"; do
-    # 找到最新的数据文件
-    latest_file=$(ls -t ${DATA_DIR}/long_cot_sft_data_${cot_type}_*.json 2>/dev/null | head -n1)
+    # 找到最新的数据文件（JSON或带偏移索引的JSONL，LLaMA-Factory都可以直接读取）
+    latest_file=$(ls -t ${DATA_DIR}/long_cot_sft_data_${cot_type}_*.json ${DATA_DIR}/long_cot_sft_data_${cot_type}_*.jsonl 2>/dev/null | head -n1)
     if [ -n "$latest_file" ]; then
         echo "✅ $cot_type: $latest_file"
         AVAILABLE_DATA+=("$cot_type:$latest_file")
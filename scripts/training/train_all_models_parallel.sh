@@ -31,8 +31,9 @@ echo ""
 echo "🔍 检查训练数据文件..."
 data_files_found=0
 for cot_type in tiny short medium long very_long ultra_long; do
-    pattern="data/processed/long_cot_sft_data_${cot_type}_*.json"
-    files=($(ls $pattern 2>/dev/null))
+    pattern="data/processed/long_cot_sft_data_${cot_type}_*.json(l)"
+    # JSON或JSONL数据文件，按修改时间排序，最后一个是最新的
+    files=($(ls -tr data/processed/long_cot_sft_data_${cot_type}_*.json data/processed/long_cot_sft_data_${cot_type}_*.jsonl 2>/dev/null))
     if [ ${#files[@]} -gt 0 ]; then
         latest_file="${files[-1]}"  # 获取最新文件
         echo "✅ 找到 ${cot_type} 数据: $latest_file"
@@ -72,8 +73,9 @@ for cot_type in "${!COT_TYPES[@]}"; do
     gpu_id=${COT_TYPES[$cot_type]}
     
     # 查找对应的数据文件
-    pattern="data/processed/long_cot_sft_data_${cot_type}_*.json"
-    files=($(ls $pattern 2>/dev/null))
+    pattern="data/processed/long_cot_sft_data_${cot_type}_*.json(l)"
+    # JSON或JSONL数据文件，按修改时间排序，最后一个是最新的
+    files=($(ls -tr data/processed/long_cot_sft_data_${cot_type}_*.json data/processed/long_cot_sft_data_${cot_type}_*.jsonl 2>/dev/null))
     if [ ${#files[@]} -eq 0 ]; then
         echo "❌ 跳过 ${cot_type}：未找到数据文件 $pattern"
         continue
@@ -0,0 +1,231 @@
+"""
+规则策略的批量（向量化）实现
+
+QwenAgent.act_batch 的核心：对一批棋盘编码同时做出决策，
+获胜/阻挡/fork/位置评分全部来自 utils.tactics 的查找表，每一步只有少量numpy数组操作。
+决策规则与 QwenAgent._strategic_decision 及四个策略分支逐条对应，
+在多个候选位置之间均匀随机选择：move_distributions 给出每个局面的落子分布，
+decide_batch / sample_moves 按分布抽样。
+
+棋盘编码: state = x_mask | o_mask << 9（第i位对应第i格），执子方由双方棋子数推断（X先手）。
+"""
+
+import random
+from typing import Sequence
+
+import numpy as np
+
+from agents.qwen_agent import COT_LENGTH_MAP, STRATEGY_MAP, CoTLengthType, GameContext, StrategyType
+from utils.shared_tables import shared_arrays
+from utils.tactics import FORK_SQUARES, FULL_MASK, THREAT_COUNT, WIN_SQUARES
+
+STRATEGY_ORDER = [StrategyType.AGGRESSIVE, StrategyType.CONSERVATIVE, StrategyType.OPPORTUNISTIC, StrategyType.BALANCED]
+STRATEGY_CODES = {strategy: code for code, strategy in enumerate(STRATEGY_ORDER)}
+AGGRESSIVE, CONSERVATIVE, OPPORTUNISTIC, BALANCED = range(4)
+
+COT_LENGTH_ORDER = list(CoTLengthType)
+COT_LENGTH_CODES = {cot_length: code for code, cot_length in enumerate(COT_LENGTH_ORDER)}
+
+CENTER_MASK = 1 << 4
+CORNER_MASK = (1 << 0) | (1 << 2) | (1 << 6) | (1 << 8)
+EDGE_MASK = (1 << 1) | (1 << 3) | (1 << 5) | (1 << 7)
+POSITION_VALUES = np.array([2.0, 1.0, 2.0, 1.0, 3.0, 1.0, 2.0, 1.0, 2.0], dtype=np.float32)
+
+POPCOUNT = np.array([bin(mask).count('1') for mask in range(1 << 9)], dtype=np.int64)
+# NTH_BIT[mask, k]: mask中第k个（从低位数起）被置位的格子
+NTH_BIT = np.full((1 << 9, 9), -1, dtype=np.int8)
+for _mask in range(1 << 9):
+    for _k, _pos in enumerate(pos for pos in range(9) if _mask >> pos & 1):
+        NTH_BIT[_mask, _k] = _pos
+LOWEST_BIT = np.array([mask & -mask for mask in range(1 << 9)], dtype=np.int64)
+
+
+def _build_best_evaluated_table() -> np.ndarray:
+    """BEST_EVALUATED[own << 9 | opp]: _evaluate_move 得分最高的空位（位掩码）
+
+    得分 = 位置价值 + 2 * 落子后威胁线路数 + 1.5 * 落子后fork空位数
+    """
+    idx = np.arange(1 << 18, dtype=np.int64)
+    own, opp = idx >> 9, idx & FULL_MASK
+    valid = (own & opp) == 0
+    fork_count = POPCOUNT[FORK_SQUARES.astype(np.int64)]
+
+    scores = np.full((1 << 18, 9), -np.inf, dtype=np.float32)
+    for pos in range(9):
+        bit = 1 << pos
+        empty = valid & (((own | opp) & bit) == 0)
+        after = ((own | bit) << 9) | opp
+        score = POSITION_VALUES[pos] + 2.0 * THREAT_COUNT[after] + 1.5 * fork_count[after]
+        scores[:, pos] = np.where(empty, score, -np.inf)
+
+    best = scores.max(axis=1, keepdims=True)
+    is_best = (scores == best) & np.isfinite(scores)
+    table = (is_best * (1 << np.arange(9))).sum(axis=1).astype(np.uint16)
+    table.setflags(write=False)
+    return table
+
+
+BEST_EVALUATED, = shared_arrays("batch_policy.best_evaluated") or (_build_best_evaluated_table(),)
+
+
+def _shared_arrays():
+    return {"batch_policy.best_evaluated": BEST_EVALUATED}
+
+
+def game_phase_of(occupied: int) -> str:
+    """与 QwenAgent._update_game_phase 相同的阶段划分"""
+    if occupied <= 2:
+        return "opening"
+    if occupied <= 6:
+        return "middle"
+    return "endgame"
+
+
+_SPLITMIX_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+
+
+def splitmix64(x: np.ndarray) -> np.ndarray:
+    """SplitMix64 混合函数（uint64数组，溢出按模2^64回绕）"""
+    z = np.asarray(x, dtype=np.uint64) + _SPLITMIX_GAMMA
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+class BatchContext:
+    """一批对局中同一执子方的context（GameContext的数组版本）"""
+
+    __slots__ = ('strategy_codes', 'cot_length_codes', 'move_counts', 'rng', 'py_rng', 'game_seeds')
+
+    def __init__(self, strategies: Sequence, cot_lengths: Sequence, seed=None, per_game_streams: bool = False):
+        """
+        Args:
+            strategies: 每局的StrategyType或策略名称
+            cot_lengths: 每局的CoTLengthType或长度名称
+            seed: 决策随机数（numpy）与CoT文本随机数（random.Random）的种子
+            per_game_streams: 每局使用独立的计数器式随机数流（SplitMix64(局种子, 步数)），
+                              对局的决策不受批大小和在批中的位置影响
+        """
+        self.strategy_codes = np.array([STRATEGY_CODES[STRATEGY_MAP.get(s, StrategyType.BALANCED) if isinstance(s, str) else s]
+                                        for s in strategies], dtype=np.int8)
+        self.cot_length_codes = np.array([COT_LENGTH_CODES[COT_LENGTH_MAP.get(c, CoTLengthType.MEDIUM) if isinstance(c, str) else c]
+                                          for c in cot_lengths], dtype=np.int8)
+        if len(self.strategy_codes) != len(self.cot_length_codes):
+            raise ValueError("strategies和cot_lengths长度不一致")
+        self.move_counts = np.zeros(len(self.strategy_codes), dtype=np.int32)
+        self.rng = np.random.default_rng(seed)
+        self.py_rng = random.Random(seed)
+        self.game_seeds = None
+        if per_game_streams:
+            self.game_seeds = np.random.SeedSequence(seed).generate_state(len(self.strategy_codes), dtype=np.uint64)
+
+    def __len__(self) -> int:
+        return len(self.strategy_codes)
+
+    def strategy(self, i: int) -> StrategyType:
+        return STRATEGY_ORDER[self.strategy_codes[i]]
+
+    def cot_length(self, i: int) -> CoTLengthType:
+        return COT_LENGTH_ORDER[self.cot_length_codes[i]]
+
+    def draws(self, n: int) -> np.ndarray:
+        """本步决策所用的 [0, 1) 随机数（在move_counts递增之前调用）"""
+        if self.game_seeds is None:
+            return self.rng.random(n)
+        bits = splitmix64(self.game_seeds[:n] ^ splitmix64(self.move_counts[:n].astype(np.uint64)))
+        return (bits >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+
+def candidate_masks(states: np.ndarray, strategy_codes: np.ndarray) -> np.ndarray:
+    """每个局面在对应策略下的候选落子（位掩码），标量实现在这些位置中均匀随机选择"""
+    states = np.asarray(states, dtype=np.int64)
+    x, o = states & FULL_MASK, states >> 9
+    x_to_move = POPCOUNT[x] == POPCOUNT[o]
+    own = np.where(x_to_move, x, o)
+    opp = np.where(x_to_move, o, x)
+    idx = own << 9 | opp
+    rev = opp << 9 | own
+    empty = FULL_MASK & ~(own | opp)
+    occupied = POPCOUNT[own | opp]
+
+    win = WIN_SQUARES[idx].astype(np.int64)
+    block = WIN_SQUARES[rev].astype(np.int64)
+    my_fork = FORK_SQUARES[idx].astype(np.int64)
+    opp_fork = FORK_SQUARES[rev].astype(np.int64)
+    best = BEST_EVALUATED[idx].astype(np.int64)
+    center = empty & CENTER_MASK
+    corners = empty & CORNER_MASK
+    edges = empty & EDGE_MASK
+
+    aggressive = strategy_codes == AGGRESSIVE
+    conservative = strategy_codes == CONSERVATIVE
+    opportunistic = strategy_codes == OPPORTUNISTIC
+    balanced = strategy_codes == BALANCED
+    opening = opportunistic & (occupied <= 2)
+    middle = opportunistic & (occupied > 2) & (occupied <= 6)
+
+    candidates = np.zeros_like(states)
+    decided = np.zeros(len(states), dtype=bool)
+
+    def take(condition, mask):
+        selected = ~decided & condition & (mask != 0)
+        candidates[selected] = mask[selected]
+        decided[selected] = True
+
+    everyone = np.ones(len(states), dtype=bool)
+    # 1. 自己能获胜  2. 阻止对手获胜（保守策略面对多个威胁时选第一个）
+    take(everyone, win)
+    take(everyone, np.where(conservative & (POPCOUNT[block] > 1), LOWEST_BIT[block], block))
+    # 3. 策略分支
+    for condition, mask in [
+        (aggressive, my_fork), (aggressive, center), (aggressive, corners),
+        (conservative, opp_fork), (conservative, center), (conservative, corners), (conservative, edges),
+        (opening, center), (opening, corners),
+        (middle, my_fork), (middle, opp_fork),
+        (opportunistic, best), (balanced, best),
+    ]:
+        take(condition, mask)
+    take(everyone, empty)
+    return candidates
+
+
+def move_distributions(states: np.ndarray, strategy_codes: np.ndarray) -> np.ndarray:
+    """每个局面在对应策略下的落子概率分布，形状为 (n, 9)；没有空位的局面全为0"""
+    candidates = candidate_masks(states, strategy_codes)
+    bits = (candidates[:, None] >> np.arange(9)) & 1
+    counts = np.maximum(POPCOUNT[candidates], 1)
+    return bits / counts[:, None]
+
+
+def sample_moves(probabilities: np.ndarray, draws: np.ndarray) -> np.ndarray:
+    """按分布做逆CDF抽样，返回落子位置数组（int8），全零分布返回-1"""
+    cumulative = np.cumsum(probabilities, axis=1)
+    totals = cumulative[:, -1]
+    moves = (cumulative <= (draws * totals)[:, None]).sum(axis=1)
+    # 浮点舍入可能越过最后一个非零概率位置，回退到最后一个可选位置
+    last = probabilities.shape[1] - 1 - np.argmax(probabilities[:, ::-1] > 0, axis=1)
+    moves = np.minimum(moves, last)
+    return np.where(totals > 0, moves, -1).astype(np.int8)
+
+
+def decide_batch(states: np.ndarray, strategy_codes: np.ndarray, draws: np.ndarray) -> np.ndarray:
+    """对一批局面做出决策（等价于 sample_moves(move_distributions(...), draws)，直接按位查表）
+
+    Args:
+        states: 棋盘编码数组
+        strategy_codes: 每局的策略编号（STRATEGY_ORDER下标）
+        draws: [0, 1) 均匀随机数，用于在候选位置中选择
+
+    Returns:
+        落子位置数组（int8），没有空位的局面为-1
+    """
+    candidates = candidate_masks(states, strategy_codes)
+    k = np.minimum((draws * POPCOUNT[candidates]).astype(np.int64), 8)
+    return NTH_BIT[candidates, k]
+
+
+def contexts_to_arrays(contexts: Sequence[GameContext]):
+    """把一组GameContext转换为策略编号数组，并从各自的随机数源抽取决策随机数"""
+    strategy_codes = np.fromiter((STRATEGY_CODES[ctx.strategy] for ctx in contexts), dtype=np.int8, count=len(contexts))
+    draws = np.fromiter((ctx.rng.random() for ctx in contexts), dtype=np.float64, count=len(contexts))
+    return strategy_codes, draws
@@ -0,0 +1,110 @@
+"""
+惰性棋盘分析记录
+
+替代 QwenAgent._deep_board_analysis 原先一次性构建的嵌套dict：
+廉价字段在构造时赋值，威胁列表、已占位置、战略位置和逐格评估在首次访问时才计算。
+同时支持属性访问和 analysis['threats'] 这样的映射访问，策略决策与CoT生成代码无需修改。
+"""
+
+import random
+from typing import Callable, Dict, List, Optional
+
+from utils.tactics import FORK_SQUARES, MASK_SQUARES, WIN_SQUARES, board_masks, moves_to_mask
+
+
+class BoardAnalysis:
+    """单步落子的棋盘分析"""
+
+    FIELDS = (
+        'board_state', 'my_symbol', 'opponent_symbol', 'available_moves', 'occupied_positions',
+        'threats', 'strategic_positions', 'game_phase', 'move_count', 'move_evaluations'
+    )
+
+    __slots__ = (
+        'board_state', 'my_symbol', 'opponent_symbol', 'available_moves', 'game_phase', 'move_count',
+        'strategy', 'cot_length', 'rng',
+        '_evaluate_move', '_occupied_positions', '_threats', '_strategic_positions', '_move_evaluations'
+    )
+
+    def __init__(self, board: List[str], my_symbol: str, opponent_symbol: str, available_moves: List[int],
+                 game_phase: str, move_count: int,
+                 evaluate_move: Optional[Callable[[list, int, str, str], float]] = None,
+                 strategy=None, cot_length=None, rng=None):
+        """
+        Args:
+            board: 当前棋盘（分析期间不应被修改）
+            evaluate_move: 逐格评估函数 (board, move, my_symbol, opponent_symbol) -> score，
+                           仅在访问 move_evaluations 时调用
+            strategy, cot_length, rng: 本局context中的策略、CoT长度和随机数源，供决策与CoT生成使用
+        """
+        self.board_state = board
+        self.my_symbol = my_symbol
+        self.opponent_symbol = opponent_symbol
+        self.available_moves = available_moves
+        self.game_phase = game_phase
+        self.move_count = move_count
+        self.strategy = strategy
+        self.cot_length = cot_length
+        self.rng = rng if rng is not None else random
+        self._evaluate_move = evaluate_move
+        self._occupied_positions = None
+        self._threats = None
+        self._strategic_positions = None
+        self._move_evaluations = None
+
+    @property
+    def occupied_positions(self) -> Dict[int, str]:
+        if self._occupied_positions is None:
+            self._occupied_positions = {i: cell for i, cell in enumerate(self.board_state) if cell != ' '}
+        return self._occupied_positions
+
+    @property
+    def threats(self) -> Dict[str, List[int]]:
+        if self._threats is None:
+            own, opp = board_masks(self.board_state, self.my_symbol)
+            available = moves_to_mask(self.available_moves)
+            self._threats = {
+                'my_winning_moves': list(MASK_SQUARES[WIN_SQUARES[own << 9 | opp] & available]),
+                'opponent_winning_moves': list(MASK_SQUARES[WIN_SQUARES[opp << 9 | own] & available]),
+                'my_fork_opportunities': list(MASK_SQUARES[FORK_SQUARES[own << 9 | opp] & available]),
+                'opponent_fork_opportunities': list(MASK_SQUARES[FORK_SQUARES[opp << 9 | own] & available])
+            }
+        return self._threats
+
+    @property
+    def strategic_positions(self) -> Dict:
+        if self._strategic_positions is None:
+            self._strategic_positions = {
+                'center': 4 in self.available_moves,
+                'corners': [pos for pos in [0, 2, 6, 8] if pos in self.available_moves],
+                'edges': [pos for pos in [1, 3, 5, 7] if pos in self.available_moves]
+            }
+        return self._strategic_positions
+
+    @property
+    def move_evaluations(self) -> Dict[int, float]:
+        if self._move_evaluations is None:
+            self._move_evaluations = {
+                move: self._evaluate_move(self.board_state, move, self.my_symbol, self.opponent_symbol)
+                for move in self.available_moves
+            } if self._evaluate_move else {}
+        return self._move_evaluations
+
+    # 映射访问，兼容原来的dict用法
+    def __getitem__(self, key: str):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key) -> bool:
+        return key in self.FIELDS
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def keys(self):
+        return iter(self.FIELDS)
+
+    def to_dict(self) -> Dict:
+        """展开所有字段（会触发全部惰性计算）"""
+        return {key: getattr(self, key) for key in self.FIELDS}
@@ -0,0 +1,243 @@
+"""
+四子棋（重力棋）规则智能体
+
+接口与 QwenAgent 相同：policy(observation, context) 只读写传入的 GameContext，
+SelfPlayRunner 无需修改即可驱动；act_batch 对 VectorConnectFourEnv 的整批对局同时决策。
+决策规则全部是位棋盘运算并按批实现（move_distributions），单局决策是批大小为1的特例：
+
+1. 能一步连成k子则获胜
+2. 否则阻挡对手的一步获胜
+3. 否则排除会让对手在上方一格获胜的列（除非别无选择），按策略打分：
+   aggressive 优先制造下一步的获胜点，conservative 只看离中心的距离，
+   opportunistic 在安全列中均匀选择，balanced 兼顾中心与获胜点
+在得分最高的列之间均匀随机选择。
+
+用法（策略两两对战的胜率表）:
+    python src/agents/connect_four_agent.py --num-games 2000
+"""
+
+import os
+import sys
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from agents.batch_policy import (AGGRESSIVE, BALANCED, CONSERVATIVE, STRATEGY_CODES, STRATEGY_ORDER,
+                                 sample_moves)
+from agents.qwen_agent import COT_LENGTH_MAP, STRATEGY_MAP, CoTLengthType, GameContext
+from utils.board_utils import parse_board_from_observation
+from utils.connect_four import GravityGeometry, VectorConnectFourEnv, resolve_gravity_geometry
+
+# 每种CoT长度包含的分析段落数（见 ConnectFourAgent.render_cot）
+COT_SECTIONS = {
+    CoTLengthType.TINY: 1,
+    CoTLengthType.SHORT: 2,
+    CoTLengthType.MEDIUM: 3,
+    CoTLengthType.LONG: 4,
+    CoTLengthType.VERY_LONG: 5,
+    CoTLengthType.ULTRA_LONG: 6,  # 额外的逐列向前一步推演（analyze_batch(lookahead=True)）
+}
+
+
+def analyze_batch(own: np.ndarray, opp: np.ndarray, heights: np.ndarray, geometry: GravityGeometry,
+                  lookahead: bool = False) -> Dict[str, np.ndarray]:
+    """逐列的战术分析，所有数组形状为 (n, cols)
+
+    Returns:
+        legal: 未满的列; wins: 一步获胜; blocks: 对手在该列一步获胜;
+        unsafe: 落子后对手可在其上方获胜; threats: 落子后自己下一步的获胜点数; center: 中心权重;
+        opponent_replies（仅 lookahead=True）: 落子后对手可一步获胜的列（按列的位掩码），供超长CoT的推演段落使用
+    """
+    own, opp = own[:, None], opp[:, None]
+    tops = np.array(geometry.tops, dtype=np.int64)
+    legal = heights < tops
+    bits = np.where(legal, np.left_shift(1, heights), 0)
+    above = np.where(heights + 1 < tops, bits << 1, 0)
+
+    wins = legal & geometry.is_win(own | bits)
+    blocks = legal & geometry.is_win(opp | bits)
+    unsafe = legal & (above != 0) & geometry.is_win(opp | above)
+
+    threats = np.zeros(heights.shape, dtype=np.int64)
+    replies = np.zeros(heights.shape, dtype=np.int64)
+    column_bits = np.left_shift(1, np.arange(geometry.cols, dtype=np.int64))
+    for col in range(geometry.cols):
+        after = own[:, 0] | bits[:, col]
+        next_heights = heights + (np.arange(geometry.cols) == col) * legal[:, col:col + 1]
+        next_bits = np.where(next_heights < tops, np.left_shift(1, next_heights), 0)
+        threats[:, col] = ((next_bits != 0) & geometry.is_win(after[:, None] | next_bits)).sum(axis=1)
+        if lookahead:
+            opponent_wins = (next_bits != 0) & geometry.is_win(opp | next_bits)
+            replies[:, col] = (opponent_wins * column_bits).sum(axis=1)
+    threats = np.where(legal, threats, 0)
+
+    center = np.array([(geometry.cols - 1) - abs(2 * col - (geometry.cols - 1)) for col in range(geometry.cols)])
+    analysis = {"legal": legal, "wins": wins, "blocks": blocks, "unsafe": unsafe, "threats": threats,
+                "center": np.broadcast_to(center, heights.shape)}
+    if lookahead:
+        analysis["opponent_replies"] = np.where(legal, replies, 0)
+    return analysis
+
+
+def move_distributions(own: np.ndarray, opp: np.ndarray, heights: np.ndarray, strategy_codes: np.ndarray,
+                       geometry: GravityGeometry, analysis: Dict[str, np.ndarray] = None) -> np.ndarray:
+    """每个局面的落子分布，形状 (n, cols)；没有合法落子的行全为0"""
+    analysis = analysis or analyze_batch(own, opp, heights, geometry)
+    legal, wins, blocks = analysis["legal"], analysis["wins"], analysis["blocks"]
+
+    safe = legal & ~analysis["unsafe"]
+    safe = np.where(safe.any(axis=1, keepdims=True), safe, legal)
+    codes = np.asarray(strategy_codes)[:, None]
+    center, threats = analysis["center"], analysis["threats"]
+    scores = np.select([codes == AGGRESSIVE, codes == CONSERVATIVE, codes == BALANCED],
+                       [10 * threats + center, center, 2 * threats + center], default=0)
+    scores = np.where(safe, scores, np.iinfo(np.int64).min)
+    best = safe & (scores == scores.max(axis=1, keepdims=True))
+
+    candidates = np.where(wins.any(axis=1, keepdims=True), wins,
+                          np.where(blocks.any(axis=1, keepdims=True), blocks, best))
+    totals = candidates.sum(axis=1, keepdims=True)
+    return np.where(totals > 0, candidates / np.maximum(totals, 1), 0.0)
+
+
+class ConnectFourAgent:
+    """四子棋规则智能体，可选地生成中文CoT"""
+
+    def __init__(self, geometry=None, strategy: str = None, cot_length: str = 'medium'):
+        self.geometry = resolve_gravity_geometry(geometry)
+        self.strategy = strategy
+        self.cot_length = cot_length
+        self.last_cot = ""
+
+    def __call__(self, observation: str) -> str:
+        """无context调用：使用智能体自身的策略与CoT长度"""
+        context = GameContext(strategy=self.strategy, cot_length=self.cot_length)
+        action, self.last_cot = self.policy(observation, context)
+        return action
+
+    def _position(self, observation: str) -> Optional[Tuple[int, int, List[int], str]]:
+        """观察文本 -> (own, opp, col_heights, 执子方标记)，解析失败返回None"""
+        board = parse_board_from_observation(observation, self.geometry.layout)
+        if board is None:
+            return None
+        x_mask, o_mask, heights = self.geometry.from_board(board)
+        if board.count('X') == board.count('O'):
+            return x_mask, o_mask, heights, 'X'
+        return o_mask, x_mask, heights, 'O'
+
+    def policy(self, observation: str, context: GameContext) -> Tuple[str, str]:
+        """根据观察选择落子列，返回 ("[列号]", CoT)"""
+        position = self._position(observation)
+        if position is None:
+            raise ValueError("无法从观察文本中解析重力棋盘")
+        own, opp, heights, mark = position
+        context.move_count += 1
+        context.player_mark = mark
+
+        lookahead = CoTLengthType.ULTRA_LONG in (context.cot_length, *(context.render_lengths or []))
+        analysis = analyze_batch(np.array([own], dtype=np.int64), np.array([opp], dtype=np.int64),
+                                 np.array([heights], dtype=np.int64), self.geometry, lookahead)
+        codes = np.array([STRATEGY_CODES[context.strategy]], dtype=np.int8)
+        probabilities = move_distributions(None, None, None, codes, self.geometry, analysis)
+        column = int(sample_moves(probabilities, np.array([context.rng.random()]))[0])
+
+        row = {key: value[0] for key, value in analysis.items()}
+        cot = self.render_cot(row, column, mark, context.strategy, context.cot_length, context.move_count)
+        if context.render_lengths:
+            context.cot_variants = {length.value: self.render_cot(row, column, mark, context.strategy, length,
+                                                                  context.move_count)
+                                    for length in context.render_lengths}
+        context.last_cot = cot
+        return f"[{column}]", cot
+
+    def render_cot(self, analysis: Dict[str, np.ndarray], column: int, mark: str, strategy,
+                   cot_length, move_count: int) -> str:
+        """按CoT长度渲染推理文本（段落数见 COT_SECTIONS）"""
+        if isinstance(cot_length, str):
+            cot_length = COT_LENGTH_MAP.get(cot_length, CoTLengthType.MEDIUM)
+        columns = [col for col in range(self.geometry.cols) if analysis["legal"][col]]
+        wins = [col for col in columns if analysis["wins"][col]]
+        blocks = [col for col in columns if analysis["blocks"][col]]
+        unsafe = [col for col in columns if analysis["unsafe"][col]]
+
+        if column in wins:
+            reason = f"第{column}列可以直接连成{self.geometry.k}子获胜"
+        elif column in blocks:
+            reason = f"对手下一步可在第{column}列获胜，必须阻挡"
+        elif analysis["threats"][column] > 0:
+            reason = f"第{column}列能制造{analysis['threats'][column]}个下一步的获胜点"
+        else:
+            reason = f"第{column}列不会送给对手获胜点"
+
+        sections = [f"第{move_count}手，可落子的列：{', '.join(map(str, columns))}。"]
+        column_notes = []
+        for col in columns:
+            if col in wins:
+                note = "一步获胜"
+            elif col in blocks:
+                note = "阻挡对手获胜"
+            elif col in unsafe:
+                note = "会让对手在上方获胜"
+            else:
+                note = f"安全，获胜点{analysis['threats'][col]}个，中心权重{analysis['center'][col]}"
+            column_notes.append(f"- 第{col}列：{note}")
+        sections.append("逐列分析：\n" + "\n".join(column_notes))
+        sections.append(f"检查：我方一步获胜的列 {wins or '无'}，对手一步获胜的列 {blocks or '无'}，"
+                        f"不安全的列 {unsafe or '无'}。")
+        sections.append(f"策略：{strategy.value}。先取胜，再阻挡，然后避开送给对手获胜点的列，"
+                        f"在剩余列中按策略偏好选择。")
+        if "opponent_replies" in analysis:
+            lookahead_notes = []
+            for col in columns:
+                replies = [c for c in range(self.geometry.cols) if int(analysis["opponent_replies"][col]) >> c & 1]
+                lookahead_notes.append(f"- 落在第{col}列后：对手一步获胜的列 {replies or '无'}，"
+                                       f"我方下一步的获胜点{analysis['threats'][col]}个")
+            sections.append("向前一步推演：\n" + "\n".join(lookahead_notes))
+
+        # 结论总在最后，较短的CoT只保留前面的分析段落
+        sections = sections[:COT_SECTIONS[cot_length] - 1] + [f"我是{mark}，{reason}，选择第{column}列。"]
+        return "\n\n".join(sections)
+
+    def act_batch(self, env: VectorConnectFourEnv, strategy_codes: np.ndarray, draws: np.ndarray) -> np.ndarray:
+        """为 env 中所有对局的当前执子方选择落子列；已结束的对局返回-1"""
+        own, opp = env.own_and_opponent()
+        probabilities = move_distributions(own, opp, env.col_heights, strategy_codes, self.geometry)
+        return sample_moves(probabilities, draws)
+
+
+def play_matchup(agent: ConnectFourAgent, strategies: Sequence, num_games: int, seed: int = 0) -> Dict[str, int]:
+    """两种策略（StrategyType或名称）在批量环境中对战 num_games 局（strategies[0] 执X先手），返回胜负统计"""
+    env = VectorConnectFourEnv(num_games, agent.geometry)
+    rng = np.random.default_rng(seed)
+    codes = np.array([STRATEGY_CODES[STRATEGY_MAP.get(strategy, strategy)] for strategy in strategies], dtype=np.int8)
+    while not env.done.all():
+        columns = agent.act_batch(env, codes[env.current_player], rng.random(num_games))
+        env.step(np.where(env.done, 0, columns))
+    return {"x_wins": int((env.winner == 0).sum()), "o_wins": int((env.winner == 1).sum()),
+            "draws": int(((env.winner < 0) & env.done).sum())}
+
+
+def main():
+    """策略两两对战，输出先手胜率表"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Round-robin of rule strategies on the vectorized Connect Four env')
+    parser.add_argument('--num-games', type=int, default=2000, help='Games per ordered strategy pair')
+    parser.add_argument('--geometry', type=str, default=None, help='rows x cols k, e.g. 6x7k4')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    agent = ConnectFourAgent(args.geometry)
+    print(f"🎮 {agent.geometry.name}，每组 {args.num_games} 局（行: X，列: O，数值: X胜/O胜/平）")
+    for x_strategy in STRATEGY_ORDER:
+        cells = []
+        for o_strategy in STRATEGY_ORDER:
+            result = play_matchup(agent, (x_strategy, o_strategy), args.num_games, args.seed)
+            cells.append(f"{result['x_wins']}/{result['o_wins']}/{result['draws']}")
+        print(f"{x_strategy.value:>14}: " + "  ".join(f"{cell:>16}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
+import asyncio
 import random
 import re
 import os
-from typing import List, Dict, Tuple
+import numpy as np
+from typing import List, Dict, Optional, Tuple
 from enum import Enum
 
 try:
@@ -11,6 +13,9 @@ except ImportError:
     print("Warning: QwenWrapper not available, using fallback strategy")
     QWEN_AVAILABLE = False
 
+from agents.board_analysis import BoardAnalysis
+from utils.tactics import fork_squares, threat_count, winning_squares
+
 class StrategyType(Enum):
     CONSERVATIVE = "conservative"  # 保守型：优先防守，避免风险
     AGGRESSIVE = "aggressive"     # 激进型：优先进攻，寻求主动
@@ -25,57 +30,117 @@ class CoTLengthType(Enum):
     VERY_LONG = "very_long"  # 很长推理 (~2000 chars)
     ULTRA_LONG = "ultra_long"  # 超长推理 (~4000 chars)
 
-class QwenAgent:
-    def __init__(self, model_path=None, load_model=False, strategy=None, cot_length=None, use_lora=False):
-        self.model_path = model_path
-        self.model = None
-        self.last_cot = ""
-        self.player_mark = "X"  # Will be set dynamically
-        self.use_lora = use_lora  # 是否使用LoRA模型
-        
-        # 策略多样性：随机选择或指定策略
+STRATEGY_MAP = {
+    'conservative': StrategyType.CONSERVATIVE,
+    'aggressive': StrategyType.AGGRESSIVE,
+    'balanced': StrategyType.BALANCED,
+    'opportunistic': StrategyType.OPPORTUNISTIC
+}
+
+COT_LENGTH_MAP = {
+    'tiny': CoTLengthType.TINY,
+    'short': CoTLengthType.SHORT,
+    'medium': CoTLengthType.MEDIUM,
+    'long': CoTLengthType.LONG,
+    'very_long': CoTLengthType.VERY_LONG,
+    'ultra_long': CoTLengthType.ULTRA_LONG
+}
+
+class GameContext:
+    """单局对弈的智能体状态：策略、CoT长度、步数、阶段和随机数源
+
+    QwenAgent.policy 只读写传入的context，不修改智能体自身，
+    因此同一个（已加载模型的）智能体可以同时服务多局对弈或多个线程。
+    """
+
+    __slots__ = ('strategy', 'cot_length', 'move_count', 'game_phase', 'player_mark', 'last_cot', 'rng',
+                 'render_lengths', 'cot_variants')
+
+    def __init__(self, strategy=None, cot_length=None, seed=None, rng=None, render_lengths=None):
+        """
+        Args:
+            strategy: StrategyType或策略名称，None表示随机选择
+            cot_length: CoTLengthType或长度名称，None表示随机选择
+            seed: 为本局创建独立的 random.Random(seed)
+            rng: 直接指定随机数源；都未指定时使用全局random模块
+            render_lengths: 额外渲染的CoT长度列表；每步用同一次棋盘分析生成各长度的CoT，
+                            结果保存在 cot_variants（{长度名称: CoT}）
+        """
+        self.rng = rng if rng is not None else (random.Random(seed) if seed is not None else random)
+
         if isinstance(strategy, str):
-            strategy_map = {
-                'conservative': StrategyType.CONSERVATIVE,
-                'aggressive': StrategyType.AGGRESSIVE, 
-                'balanced': StrategyType.BALANCED,
-                'opportunistic': StrategyType.OPPORTUNISTIC
-            }
-            self.strategy = strategy_map.get(strategy, StrategyType.BALANCED)
+            self.strategy = STRATEGY_MAP.get(strategy, StrategyType.BALANCED)
         else:
-            self.strategy = strategy or random.choice(list(StrategyType))
-            
-        # CoT长度控制：新增功能
+            self.strategy = strategy or self.rng.choice(list(StrategyType))
+
         if isinstance(cot_length, str):
-            cot_map = {
-                'tiny': CoTLengthType.TINY,
-                'short': CoTLengthType.SHORT,
-                'medium': CoTLengthType.MEDIUM,
-                'long': CoTLengthType.LONG,
-                'very_long': CoTLengthType.VERY_LONG,
-                'ultra_long': CoTLengthType.ULTRA_LONG
-            }
-            self.cot_length = cot_map.get(cot_length, CoTLengthType.MEDIUM)
+            self.cot_length = COT_LENGTH_MAP.get(cot_length, CoTLengthType.MEDIUM)
         else:
-            self.cot_length = cot_length or random.choice(list(CoTLengthType))
-            
+            self.cot_length = cot_length or self.rng.choice(list(CoTLengthType))
+
+        self.render_lengths = [COT_LENGTH_MAP[c] if isinstance(c, str) else c for c in (render_lengths or [])]
+        self.move_count = 0
         self.game_phase = "opening"  # opening, middle, endgame
+        self.player_mark = "X"
+        self.last_cot = ""
+        self.cot_variants = None
+
+    def reset(self):
+        """开始新的一局"""
         self.move_count = 0
+        self.game_phase = "opening"
+        self.player_mark = "X"
+        self.last_cot = ""
+        self.cot_variants = None
+
+class QwenAgent:
+    def __init__(self, model_path=None, load_model=False, strategy=None, cot_length=None, use_lora=False, corpus=None,
+                 inference_server=None, server_model=None, speculative=False, routing_table=None):
+        """speculative: 加载的模型以规则CoT为草稿做推测解码（models.template_speculation），草稿长度取每局context的CoT长度
+        routing_table: 按局面类别在多个CoT长度adapter间路由（models.adapter_router 学习的路由表路径）
+        """
+        self.model_path = model_path
+        self.model = None
+        self.use_lora = use_lora  # 是否使用LoRA模型
         
-        if load_model and QWEN_AVAILABLE:
+        # 物化的CoT语料库（CoTCorpus或其目录）：规则策略优先直接查表，查不到时即时生成
+        if isinstance(corpus, str):
+            from utils.cot_corpus import CoTCorpus
+            corpus = CoTCorpus(corpus)
+        self.corpus = corpus
+        
+        # 策略多样性与CoT长度控制：未指定时随机选择
+        # 直接调用 agent(observation) 时使用这个默认context；并发对弈请为每局创建GameContext并调用policy
+        self.context = GameContext(strategy=strategy, cot_length=cot_length)
+        
+        if inference_server:
+            # 通过本地推理服务生成（models.inference_server），本进程不加载模型
+            from models.inference_client import RemoteModel
+            self.model = RemoteModel(inference_server, server_model)
+            if self.model.is_loaded:
+                print(f"Using inference server: {inference_server}" + (f" (model: {server_model})" if server_model else ""))
+            else:
+                print("Using fallback strategy")
+        elif load_model and QWEN_AVAILABLE:
             try:
-                if use_lora:
+                if routing_table:
+                    # 多个CoT长度adapter共享基础模型，每步按局面类别选择
+                    print(f"Loading adapter router from: {routing_table}")
+                    from models.adapter_router import AdapterRouter
+                    self.model = AdapterRouter(routing_table)
+                elif use_lora:
                     # 加载LoRA微调模型
                     print(f"Loading LoRA model from: {model_path}")
                     # 假设基础模型在项目的qwen目录
                     base_model_path = model_path.replace("/models/", "/").replace("_cot_lora", "").split("/")[-1]
                     if "qwen" not in base_model_path:
                         base_model_path = os.path.join(os.path.dirname(model_path), "..", "..", "qwen")
-                    self.model = QwenWrapper(model_path, use_lora=True, base_model_path=base_model_path)
+                    self.model = QwenWrapper(model_path, use_lora=True, base_model_path=base_model_path,
+                                             speculative_cot_length=self._speculative_length(speculative))
                 else:
                     # 加载基础模型
                     print(f"Loading base model from: {model_path}")
-                    self.model = QwenWrapper(model_path)
+                    self.model = QwenWrapper(model_path, speculative_cot_length=self._speculative_length(speculative))
                     
                 self.model.load_model()
                 print("Qwen model loaded successfully")
@@ -88,63 +153,196 @@ class QwenAgent:
         """Main method called by the environment - compatible with SmartAgent interface"""
         return self.act(observation)
 
+    # 兼容旧接口：这些属性代理到默认context
+    strategy = property(lambda self: self.context.strategy,
+                        lambda self, value: setattr(self.context, 'strategy', value))
+    cot_length = property(lambda self: self.context.cot_length,
+                          lambda self, value: setattr(self.context, 'cot_length', value))
+    game_phase = property(lambda self: self.context.game_phase,
+                          lambda self, value: setattr(self.context, 'game_phase', value))
+    move_count = property(lambda self: self.context.move_count,
+                          lambda self, value: setattr(self.context, 'move_count', value))
+    player_mark = property(lambda self: self.context.player_mark,
+                           lambda self, value: setattr(self.context, 'player_mark', value))
+    last_cot = property(lambda self: self.context.last_cot,
+                        lambda self, value: setattr(self.context, 'last_cot', value))
+
     def act(self, observation):
-        """Generate action based on observation"""
+        """Generate action based on observation (uses the agent's default context)"""
+        action, _ = self.policy(observation, self.context)
+        return action
+
+    def policy(self, observation, context: GameContext) -> Tuple[str, str]:
+        """无状态决策接口：根据观察和本局context返回 (action, cot)
+
+        只更新context中的步数、阶段和CoT，不修改智能体本身
+        """
+        available_moves = self._begin_turn(observation, context)
+        if not available_moves:
+            return "[0]", ""  # Fallback to first position
+
+        # Generate action using model or fallback strategy
+        if self._model_ready():
+            # Use actual Qwen model
+            cot, action = self.model.generate_move_with_cot(observation, context.player_mark, **self._draft_kwargs(context))
+        else:
+            # Use enhanced strategy-based reasoning
+            cot, action = self.generate_strategic_cot(observation, context)
+        return self._finish_turn(action, cot, available_moves, context)
+
+    async def apolicy(self, observation, context: GameContext) -> Tuple[str, str]:
+        """policy 的asyncio版本（AsyncSelfPlayRunner 使用）
+
+        推理服务上的模型（RemoteModel）直接await请求；本地模型在线程中生成，避免阻塞事件循环；
+        规则策略是纯计算，直接在当前协程中完成
+        """
+        available_moves = self._begin_turn(observation, context)
+        if not available_moves:
+            return "[0]", ""
+
+        if self._model_ready():
+            if hasattr(self.model, 'agenerate_move_with_cot'):
+                cot, action = await self.model.agenerate_move_with_cot(observation, context.player_mark)
+            else:
+                cot, action = await asyncio.to_thread(self.model.generate_move_with_cot, observation, context.player_mark,
+                                                      **self._draft_kwargs(context))
+        else:
+            cot, action = self.generate_strategic_cot(observation, context)
+        return self._finish_turn(action, cot, available_moves, context)
+
+    def _speculative_length(self, speculative) -> Optional[str]:
+        return self.context.cot_length.value if speculative else None
+
+    def _draft_kwargs(self, context: GameContext) -> Dict:
+        """推测解码的本地模型按本局的CoT长度、策略和步数渲染草稿"""
+        if getattr(self.model, 'speculator', None) is None:
+            return {}
+        return {"draft_cot_length": context.cot_length.value, "draft_strategy": context.strategy.value,
+                "draft_move_count": context.move_count}
+
+    def _model_ready(self) -> bool:
+        return bool(self.model and hasattr(self.model, 'is_loaded') and self.model.is_loaded)
+
+    def _begin_turn(self, observation, context: GameContext) -> List[int]:
+        """解析可落子位置并更新context的步数、阶段和执子方；无可落子位置时返回空列表"""
         available_moves = self._parse_available_moves(observation)
         if not available_moves:
-            return "[0]"  # Fallback to first position
+            return available_moves
 
         # 更新游戏阶段和步数统计
-        self.move_count += 1
-        self._update_game_phase(observation)
+        context.move_count += 1
+        self._update_game_phase(observation, context)
 
         # Determine player mark from observation
         if "Player X's turn" in observation:
-            self.player_mark = "X"
+            context.player_mark = "X"
         elif "Player O's turn" in observation:
-            self.player_mark = "O"
+            context.player_mark = "O"
+        return available_moves
 
-        # Generate action using model or fallback strategy
-        if self.model and hasattr(self.model, 'is_loaded') and self.model.is_loaded:
-            # Use actual Qwen model
-            cot, action = self.model.generate_move_with_cot(observation, self.player_mark)
-            self.last_cot = cot
-            
-            # Validate action is in available moves
-            try:
-                action_int = int(action)
-                if action_int in available_moves:
-                    return f"[{action_int}]"
-            except (ValueError, TypeError):
-                pass
-            
-            # Fallback if invalid action
-            return f"[{random.choice(available_moves)}]"
-        else:
-            # Use enhanced strategy-based reasoning
-            cot, action = self.generate_strategic_cot(observation)
-            self.last_cot = cot
-            
-            try:
-                action_int = int(action)
-                if action_int in available_moves:
-                    return f"[{action_int}]"
-            except (ValueError, TypeError):
-                pass
-            
-            return f"[{random.choice(available_moves)}]"
+    def _finish_turn(self, action, cot, available_moves, context: GameContext) -> Tuple[str, str]:
+        """记录CoT并校验落子，非法时从可落子位置中随机选择"""
+        context.last_cot = cot
+
+        # Validate action is in available moves
+        try:
+            action_int = int(action)
+            if action_int in available_moves:
+                return f"[{action_int}]", cot
+        except (ValueError, TypeError):
+            pass
+
+        # Fallback if invalid action
+        return f"[{context.rng.choice(available_moves)}]", cot
     
-    def _update_game_phase(self, observation):
+    def act_batch(self, states, contexts, render_mask=None):
+        """批量决策：一次为整批对局选择落子（规则策略，向量化查表）
+
+        Args:
+            states: 棋盘编码数组（x_mask | o_mask << 9），见 agents.batch_policy
+            contexts: BatchContext，或与states等长的GameContext列表
+            render_mask: 布尔数组，只为其中为True的对局生成CoT；None表示都不生成
+
+        Returns:
+            (actions, cots): 落子位置数组（无空位为-1），以及CoT列表（未生成的为None）
+        """
+        from agents.batch_policy import BatchContext, contexts_to_arrays, decide_batch
+
+        states = np.asarray(states, dtype=np.int64)
+        if isinstance(contexts, BatchContext):
+            strategy_codes, draws = contexts.strategy_codes, contexts.draws(len(states))
+            contexts.move_counts += 1
+        else:
+            strategy_codes, draws = contexts_to_arrays(contexts)
+            for context in contexts:
+                context.move_count += 1
+
+        actions = decide_batch(states, strategy_codes, draws)
+
+        cots = [None] * len(states)
+        if render_mask is not None:
+            for i in np.flatnonzero(render_mask):
+                if actions[i] < 0:
+                    continue
+                if isinstance(contexts, BatchContext):
+                    cots[i] = self.render_cot(int(states[i]), int(actions[i]), contexts.strategy(i),
+                                              contexts.cot_length(i), int(contexts.move_counts[i]), contexts.py_rng)
+                else:
+                    context = contexts[i]
+                    cots[i] = self.render_cot(int(states[i]), int(actions[i]), context.strategy,
+                                              context.cot_length, context.move_count, context.rng)
+                    context.last_cot = cots[i]
+        return actions, cots
+
+    def render_cot(self, state: int, action: int, strategy, cot_length, move_count: int, rng=None) -> str:
+        """为已选定的落子生成CoT（批量决策之后只为需要保留的样本调用）"""
+        if self.corpus is not None:
+            from utils.cot_corpus import board_context
+            from utils.vector_env import decode_board
+
+            if board_context(decode_board(state))[2] == move_count:
+                cot = self.corpus.render(state, action, strategy, cot_length, rng if rng is not None else random)
+                if cot is not None:
+                    return cot
+        analysis = self._analysis_for_state(state, strategy, cot_length, move_count, rng)
+        return self._generate_detailed_reasoning(analysis, action, analysis.my_symbol, analysis.opponent_symbol)
+
+    def render_cot_variants(self, state: int, action: int, strategy, cot_lengths, move_count: int, rng=None) -> Dict[str, str]:
+        """只做一次棋盘分析，为多个CoT长度生成推理文本，返回 {长度名称: CoT}"""
+        cot_lengths = [COT_LENGTH_MAP[c] if isinstance(c, str) else c for c in cot_lengths]
+        analysis = self._analysis_for_state(state, strategy, cot_lengths[0], move_count, rng)
+        return self._render_cot_variants(analysis, action, cot_lengths)
+
+    def _analysis_for_state(self, state: int, strategy, cot_length, move_count: int, rng=None) -> BoardAnalysis:
+        """由棋盘编码构造分析（执子方由棋子数推断）"""
+        from agents.batch_policy import game_phase_of
+        from utils.vector_env import decode_board
+
+        board = decode_board(state)
+        my_symbol = 'X' if board.count('X') == board.count('O') else 'O'
+        opponent_symbol = 'O' if my_symbol == 'X' else 'X'
+        available_moves = [i for i, cell in enumerate(board) if cell == ' ']
+        if isinstance(strategy, str):
+            strategy = STRATEGY_MAP.get(strategy, StrategyType.BALANCED)
+        if isinstance(cot_length, str):
+            cot_length = COT_LENGTH_MAP.get(cot_length, CoTLengthType.MEDIUM)
+        return BoardAnalysis(board, my_symbol, opponent_symbol, available_moves,
+                             game_phase_of(9 - len(available_moves)), move_count,
+                             evaluate_move=self._evaluate_move,
+                             strategy=strategy, cot_length=cot_length, rng=rng)
+
+    def _update_game_phase(self, observation, context: GameContext = None):
         """Update game phase based on board state"""
+        context = context or self.context
         board = self._parse_board_state(observation)
         occupied_count = sum(1 for cell in board if cell != ' ')
         
         if occupied_count <= 2:
-            self.game_phase = "opening"
+            context.game_phase = "opening"
         elif occupied_count <= 6:
-            self.game_phase = "middle"
+            context.game_phase = "middle"
         else:
-            self.game_phase = "endgame"
+            context.game_phase = "endgame"
 
     def _parse_available_moves(self, observation) -> List[int]:
         """Parse available moves from observation string"""
@@ -155,7 +353,7 @@ class QwenAgent:
                 last_moves_part = available_moves_parts[-1]
                 # Extract numbers from '[0]', '[1]', etc.
                 import re
-                matches = re.findall(r'\[(\d)\]', last_moves_part)
+                matches = re.findall(r'\[(\d+)\]', last_moves_part)
                 available = [int(match) for match in matches]
                 return available
 
@@ -222,8 +420,9 @@ class QwenAgent:
             'selected_move': selected_move
         }
 
-    def generate_strategic_cot(self, game_history: str) -> Tuple[str, int]:
+    def generate_strategic_cot(self, game_history: str, context: GameContext = None) -> Tuple[str, int]:
         """Generate strategy-aware chain-of-thought reasoning"""
+        context = context or self.context
         # Extract current game state
         current_state = self._extract_current_state(game_history)
         board_state = self._parse_board_state(game_history)
@@ -231,8 +430,14 @@ class QwenAgent:
         opponent_symbol = 'O' if my_symbol == 'X' else 'X'
         available_moves = current_state['available_moves']
         
+        if self.corpus is not None and not context.render_lengths:
+            result = self._sample_from_corpus(board_state, my_symbol, available_moves, context)
+            if result is not None:
+                move, cot = result
+                return cot, move
+        
         # 深层分析
-        analysis = self._deep_board_analysis(board_state, my_symbol, opponent_symbol, available_moves)
+        analysis = self._deep_board_analysis(board_state, my_symbol, opponent_symbol, available_moves, context)
         
         # 根据策略类型选择决策
         selected_move = self._strategic_decision(analysis, available_moves)
@@ -240,57 +445,59 @@ class QwenAgent:
         # 生成详细的推理过程
         cot = self._generate_detailed_reasoning(analysis, selected_move, my_symbol, opponent_symbol)
         
+        # 复用同一次分析渲染其他长度的CoT
+        if context.render_lengths:
+            context.cot_variants = self._render_cot_variants(analysis, selected_move, context.render_lengths,
+                                                             primary=(context.cot_length, cot))
+        
         return cot, selected_move
     
-    def _deep_board_analysis(self, board: list, my_symbol: str, opponent_symbol: str, available_moves: list) -> dict:
-        """深层棋盘分析，包含多维度评估"""
-        analysis = {
-            'board_state': board.copy(),
-            'my_symbol': my_symbol,
-            'opponent_symbol': opponent_symbol,
-            'available_moves': available_moves.copy(),
-            'occupied_positions': {},
-            'threats': {
-                'my_winning_moves': [],
-                'opponent_winning_moves': [],
-                'my_fork_opportunities': [],
-                'opponent_fork_opportunities': []
-            },
-            'strategic_positions': {
-                'center': 4 in available_moves,
-                'corners': [pos for pos in [0, 2, 6, 8] if pos in available_moves],
-                'edges': [pos for pos in [1, 3, 5, 7] if pos in available_moves]
-            },
-            'game_phase': self.game_phase,
-            'move_count': self.move_count
-        }
-        
-        # 记录已占位置
-        for i, cell in enumerate(board):
-            if cell != ' ':
-                analysis['occupied_positions'][i] = cell
-        
-        # 威胁分析
-        analysis['threats']['my_winning_moves'] = self._find_all_winning_moves(board, my_symbol, available_moves)
-        analysis['threats']['opponent_winning_moves'] = self._find_all_winning_moves(board, opponent_symbol, available_moves)
-        analysis['threats']['my_fork_opportunities'] = self._find_all_fork_opportunities(board, my_symbol, available_moves)
-        analysis['threats']['opponent_fork_opportunities'] = self._find_all_fork_opportunities(board, opponent_symbol, available_moves)
-        
-        # 每个可选位置的评估
-        analysis['move_evaluations'] = {}
-        for move in available_moves:
-            analysis['move_evaluations'][move] = self._evaluate_move(board, move, my_symbol, opponent_symbol)
-        
-        return analysis
+    def _sample_from_corpus(self, board_state: list, my_symbol: str, available_moves: list,
+                            context: GameContext) -> Optional[Tuple[int, str]]:
+        """从物化语料库抽样 (落子, CoT)
+
+        只有当局面与语料库构建时的假设一致（可用位置即空格、执子方与步数由棋子数推出）时才查表，
+        否则返回None，由调用方即时生成
+        """
+        from utils.cot_corpus import board_context
+        from utils.vector_env import encode_board
+
+        if available_moves != [i for i, cell in enumerate(board_state) if cell == ' ']:
+            return None
+        if board_context(board_state) != (my_symbol, 'O' if my_symbol == 'X' else 'X', context.move_count, context.game_phase):
+            return None
+        return self.corpus.sample(encode_board(board_state), context.strategy, context.cot_length, context.rng)
+    
+    def _render_cot_variants(self, analysis: BoardAnalysis, selected_move: int, cot_lengths, primary=None) -> Dict[str, str]:
+        """基于同一个分析结果，为每个CoT长度生成推理文本，返回 {长度名称: CoT}"""
+        original_length = analysis.cot_length
+        variants = {}
+        for cot_length in cot_lengths:
+            if primary is not None and cot_length == primary[0]:
+                variants[cot_length.value] = primary[1]
+                continue
+            analysis.cot_length = cot_length
+            variants[cot_length.value] = self._generate_detailed_reasoning(
+                analysis, selected_move, analysis.my_symbol, analysis.opponent_symbol)
+        analysis.cot_length = original_length
+        return variants
+    
+    def _deep_board_analysis(self, board: list, my_symbol: str, opponent_symbol: str, available_moves: list,
+                             context: GameContext = None) -> BoardAnalysis:
+        """深层棋盘分析，包含多维度评估（威胁、位置和逐格评估在首次访问时计算）"""
+        context = context or self.context
+        return BoardAnalysis(board, my_symbol, opponent_symbol, available_moves,
+                             context.game_phase, context.move_count, evaluate_move=self._evaluate_move,
+                             strategy=context.strategy, cot_length=context.cot_length, rng=context.rng)
     
     def _strategic_decision(self, analysis: dict, available_moves: list) -> int:
         """根据策略类型和分析结果做出决策"""
         threats = analysis['threats']
-        strategy = self.strategy
+        strategy = analysis.strategy
         
         # 1. 绝对优先：自己能获胜
         if threats['my_winning_moves']:
-            return random.choice(threats['my_winning_moves'])
+            return analysis.rng.choice(threats['my_winning_moves'])
         
         # 2. 绝对优先：阻止对手获胜
         if threats['opponent_winning_moves']:
@@ -302,7 +509,7 @@ class QwenAgent:
                     # 保守策略：阻止最危险的威胁
                     return self._select_most_critical_defense(analysis, threats['opponent_winning_moves'])
                 else:
-                    return random.choice(threats['opponent_winning_moves'])
+                    return analysis.rng.choice(threats['opponent_winning_moves'])
         
         # 3. 策略导向的决策
         if strategy == StrategyType.AGGRESSIVE:
@@ -318,7 +525,7 @@ class QwenAgent:
         """激进策略：优先进攻和创造威胁"""
         # 1. 寻找fork机会
         if analysis['threats']['my_fork_opportunities']:
-            return random.choice(analysis['threats']['my_fork_opportunities'])
+            return analysis.rng.choice(analysis['threats']['my_fork_opportunities'])
         
         # 2. 占据中心
         if analysis['strategic_positions']['center']:
@@ -326,16 +533,16 @@ class QwenAgent:
         
         # 3. 占据角落，增加获胜可能
         if analysis['strategic_positions']['corners']:
-            return random.choice(analysis['strategic_positions']['corners'])
+            return analysis.rng.choice(analysis['strategic_positions']['corners'])
         
         # 4. 随机选择剩余位置
-        return random.choice(available_moves)
+        return analysis.rng.choice(available_moves)
     
     def _conservative_decision(self, analysis: dict, available_moves: list) -> int:
         """保守策略：优先防守和稳定发展"""
         # 1. 阻止对手fork
         if analysis['threats']['opponent_fork_opportunities']:
-            return random.choice(analysis['threats']['opponent_fork_opportunities'])
+            return analysis.rng.choice(analysis['threats']['opponent_fork_opportunities'])
         
         # 2. 稳步占据好位置
         if analysis['strategic_positions']['center']:
@@ -343,13 +550,13 @@ class QwenAgent:
         
         # 3. 优先占角落而非边缘
         if analysis['strategic_positions']['corners']:
-            return random.choice(analysis['strategic_positions']['corners'])
+            return analysis.rng.choice(analysis['strategic_positions']['corners'])
         
         # 4. 最后选择边缘
         if analysis['strategic_positions']['edges']:
-            return random.choice(analysis['strategic_positions']['edges'])
+            return analysis.rng.choice(analysis['strategic_positions']['edges'])
             
-        return random.choice(available_moves)
+        return analysis.rng.choice(available_moves)
     
     def _opportunistic_decision(self, analysis: dict, available_moves: list) -> int:
         """机会主义策略：根据局面灵活调整"""
@@ -359,18 +566,18 @@ class QwenAgent:
             if analysis['strategic_positions']['center']:
                 return 4
             if analysis['strategic_positions']['corners']:
-                return random.choice(analysis['strategic_positions']['corners'])
+                return analysis.rng.choice(analysis['strategic_positions']['corners'])
         
         elif analysis['game_phase'] == 'middle':
             # 中局阶段，平衡攻守
             if analysis['threats']['my_fork_opportunities']:
-                return random.choice(analysis['threats']['my_fork_opportunities'])
+                return analysis.rng.choice(analysis['threats']['my_fork_opportunities'])
             if analysis['threats']['opponent_fork_opportunities']:
-                return random.choice(analysis['threats']['opponent_fork_opportunities'])
+                return analysis.rng.choice(analysis['threats']['opponent_fork_opportunities'])
         
         # 默认选择评分最高的位置
         best_moves = self._get_best_evaluated_moves(analysis)
-        return random.choice(best_moves)
+        return analysis.rng.choice(best_moves)
     
     def _balanced_decision(self, analysis: dict, available_moves: list) -> int:
         """均衡策略：攻守兼备"""
@@ -379,9 +586,9 @@ class QwenAgent:
         
         # 在最佳选择中引入少量随机性
         if len(best_moves) > 1:
-            return random.choice(best_moves)
+            return analysis.rng.choice(best_moves)
         
-        return best_moves[0] if best_moves else random.choice(available_moves)
+        return best_moves[0] if best_moves else analysis.rng.choice(available_moves)
         """Generate detailed chain-of-thought reasoning for the current move"""
         # Extract current board state and available moves
         current_state = self._extract_current_state(game_history)
@@ -489,100 +696,21 @@ class QwenAgent:
     
     def _find_winning_move(self, board: list, symbol: str, available_moves: list) -> int:
         """Find if there's a winning move for the given symbol"""
-        # All possible winning combinations
-        winning_combos = [
-            [0, 1, 2], [3, 4, 5], [6, 7, 8],  # Rows
-            [0, 3, 6], [1, 4, 7], [2, 5, 8],  # Columns
-            [0, 4, 8], [2, 4, 6]              # Diagonals
-        ]
-        
-        for combo in winning_combos:
-            # Count symbols in this combo
-            symbol_count = sum(1 for pos in combo if board[pos] == symbol)
-            empty_positions = [pos for pos in combo if board[pos] == ' ']
-            
-            # If we have 2 symbols and 1 empty space, we can win
-            if symbol_count == 2 and len(empty_positions) == 1:
-                winning_pos = empty_positions[0]
-                if winning_pos in available_moves:
-                    return winning_pos
-        
-        return None
+        winning_moves = winning_squares(board, symbol, available_moves)
+        return winning_moves[0] if winning_moves else None
     
     def _find_fork_opportunity(self, board: list, symbol: str, available_moves: list) -> int:
         """Find fork opportunities (positions that create multiple winning threats)"""
-        winning_combos = [
-            [0, 1, 2], [3, 4, 5], [6, 7, 8],  # Rows
-            [0, 3, 6], [1, 4, 7], [2, 5, 8],  # Columns
-            [0, 4, 8], [2, 4, 6]              # Diagonals
-        ]
-        
-        for pos in available_moves:
-            if board[pos] == ' ':  # Should be empty
-                # Try placing our symbol here
-                test_board = board.copy()
-                test_board[pos] = symbol
-                
-                # Count how many winning opportunities this creates
-                winning_opportunities = 0
-                for combo in winning_combos:
-                    symbol_count = sum(1 for p in combo if test_board[p] == symbol)
-                    empty_count = sum(1 for p in combo if test_board[p] == ' ')
-                    # A winning opportunity is when we have 2 symbols and 1 empty space
-                    if symbol_count == 2 and empty_count == 1:
-                        winning_opportunities += 1
-                
-                # If this position creates 2 or more winning opportunities, it's a fork
-                if winning_opportunities >= 2:
-                    return pos
-        
-        return None
+        fork_moves = fork_squares(board, symbol, available_moves)
+        return fork_moves[0] if fork_moves else None
 
     def _find_all_winning_moves(self, board: list, symbol: str, available_moves: list) -> list:
         """找到所有能获胜的位置"""
-        winning_moves = []
-        winning_combos = [
-            [0, 1, 2], [3, 4, 5], [6, 7, 8],  # Rows
-            [0, 3, 6], [1, 4, 7], [2, 5, 8],  # Columns
-            [0, 4, 8], [2, 4, 6]              # Diagonals
-        ]
-        
-        for combo in winning_combos:
-            symbol_count = sum(1 for pos in combo if board[pos] == symbol)
-            empty_positions = [pos for pos in combo if board[pos] == ' ']
-            
-            if symbol_count == 2 and len(empty_positions) == 1:
-                winning_pos = empty_positions[0]
-                if winning_pos in available_moves:
-                    winning_moves.append(winning_pos)
-        
-        return winning_moves
+        return winning_squares(board, symbol, available_moves)
 
     def _find_all_fork_opportunities(self, board: list, symbol: str, available_moves: list) -> list:
         """找到所有fork机会"""
-        fork_moves = []
-        winning_combos = [
-            [0, 1, 2], [3, 4, 5], [6, 7, 8],  # Rows
-            [0, 3, 6], [1, 4, 7], [2, 5, 8],  # Columns
-            [0, 4, 8], [2, 4, 6]              # Diagonals
-        ]
-        
-        for pos in available_moves:
-            if board[pos] == ' ':
-                test_board = board.copy()
-                test_board[pos] = symbol
-                
-                winning_opportunities = 0
-                for combo in winning_combos:
-                    symbol_count = sum(1 for p in combo if test_board[p] == symbol)
-                    empty_count = sum(1 for p in combo if test_board[p] == ' ')
-                    if symbol_count == 2 and empty_count == 1:
-                        winning_opportunities += 1
-                
-                if winning_opportunities >= 2:
-                    fork_moves.append(pos)
-        
-        return fork_moves
+        return fork_squares(board, symbol, available_moves)
 
     def _get_best_evaluated_moves(self, analysis: dict) -> list:
         """获取评分最高的移动"""
@@ -614,27 +742,27 @@ class QwenAgent:
         test_board = board.copy()
         test_board[move] = my_symbol
         
-        # 检查是否创造了获胜威胁
-        winning_threats = len(self._find_all_winning_moves(test_board, my_symbol, list(range(9))))
+        # 检查是否创造了获胜威胁（按威胁线路计数）
+        winning_threats = threat_count(test_board, my_symbol)
         score += winning_threats * 2.0
         
         # 检查是否创造了fork
-        fork_opportunities = len(self._find_all_fork_opportunities(test_board, my_symbol, list(range(9))))
+        fork_opportunities = len(self._find_all_fork_opportunities(test_board, my_symbol, None))
         score += fork_opportunities * 1.5
         
         return score
     
     def _generate_detailed_reasoning(self, analysis: dict, selected_move: int, my_symbol: str, opponent_symbol: str) -> str:
         """生成详细的推理过程，支持不同CoT长度控制"""
-        if self.cot_length == CoTLengthType.TINY:
+        if analysis.cot_length == CoTLengthType.TINY:
             return self._generate_tiny_cot(analysis, selected_move, my_symbol, opponent_symbol)
-        elif self.cot_length == CoTLengthType.SHORT:
+        elif analysis.cot_length == CoTLengthType.SHORT:
             return self._generate_short_cot(analysis, selected_move, my_symbol, opponent_symbol)
-        elif self.cot_length == CoTLengthType.MEDIUM:
+        elif analysis.cot_length == CoTLengthType.MEDIUM:
             return self._generate_medium_cot(analysis, selected_move, my_symbol, opponent_symbol)
-        elif self.cot_length == CoTLengthType.LONG:
+        elif analysis.cot_length == CoTLengthType.LONG:
             return self._generate_long_cot(analysis, selected_move, my_symbol, opponent_symbol)
-        elif self.cot_length == CoTLengthType.VERY_LONG:
+        elif analysis.cot_length == CoTLengthType.VERY_LONG:
             return self._generate_very_long_cot_original(analysis, selected_move, my_symbol, opponent_symbol)
         else:  # ULTRA_LONG
             return self._generate_ultra_long_cot_original(analysis, selected_move, my_symbol, opponent_symbol)
@@ -645,11 +773,11 @@ class QwenAgent:
         if threats['my_winning_moves']:
             return f"\n思考：发现获胜机会！位置{selected_move}可以立即获胜，必须选择。当前{analysis['game_phase']}阶段，这是最佳时机，毫不犹豫地选择这个位置。\n答案: [{selected_move}]"
         elif threats['opponent_winning_moves']:
-            return f"\n思考：对手威胁！必须阻止位置{threats['opponent_winning_moves'][0]}的获胜，选择{selected_move}防守。{self.strategy.value}策略下的最优选择，保持游戏平衡。\n答案: [{selected_move}]"
+            return f"\n思考：对手威胁！必须阻止位置{threats['opponent_winning_moves'][0]}的获胜，选择{selected_move}防守。{analysis.strategy.value}策略下的最优选择，保持游戏平衡。\n答案: [{selected_move}]"
         elif selected_move == 4:
-            return f"\n思考：占据中心位置{selected_move}最有价值，控制4条获胜线路。在{analysis['game_phase']}阶段建立优势，符合{self.strategy.value}策略，为后续发展奠定基础。\n答案: [{selected_move}]"
+            return f"\n思考：占据中心位置{selected_move}最有价值，控制4条获胜线路。在{analysis['game_phase']}阶段建立优势，符合{analysis.strategy.value}策略，为后续发展奠定基础。\n答案: [{selected_move}]"
         else:
-            return f"\n思考：选择位置{selected_move}。{analysis['game_phase']}阶段有{len(analysis['available_moves'])}个选择，此位置符合{self.strategy.value}策略需求，是当前最优决策。\n答案: [{selected_move}]"
+            return f"\n思考：选择位置{selected_move}。{analysis['game_phase']}阶段有{len(analysis['available_moves'])}个选择，此位置符合{analysis.strategy.value}策略需求，是当前最优决策。\n答案: [{selected_move}]"
     
     def _generate_short_cot(self, analysis: dict, selected_move: int, my_symbol: str, opponent_symbol: str) -> str:
         """生成简短推理过程 (约100-150字符)"""
@@ -666,7 +794,7 @@ class QwenAgent:
         elif threats['opponent_winning_moves']:
             reasoning_parts.append(f"【防守需求】必须阻止对手位置：{threats['opponent_winning_moves']}")
         else:
-            reasoning_parts.append(f"【策略选择】采用{self.strategy.value}策略")
+            reasoning_parts.append(f"【策略选择】采用{analysis.strategy.value}策略")
         
         # 决策说明
         if selected_move == 4:
@@ -728,7 +856,7 @@ class QwenAgent:
             StrategyType.BALANCED: "均衡型策略，攻守兼备，根据局面灵活调整重点，既重视进攻也重视防守",
             StrategyType.OPPORTUNISTIC: "机会主义策略，灵活应对局面变化，抓住一切有利时机，适应性强"
         }
-        reasoning_parts.append(f"【策略导向分析】采用{strategy_explanations[self.strategy]}")
+        reasoning_parts.append(f"【策略导向分析】采用{strategy_explanations[analysis.strategy]}")
         
         # 候选动作评分
         move_evals = analysis['move_evaluations']
@@ -785,7 +913,7 @@ class QwenAgent:
             StrategyType.BALANCED: "均衡型策略：攻守兼备，根据当前局面灵活调整重点，既不放过进攻机会也不忽视防守需求",
             StrategyType.OPPORTUNISTIC: "机会主义策略：灵活应对局面变化，优先抓住当前最有利的机会，适应性强"
         }
-        reasoning_parts.append(f"【策略指导思想】采用{strategy_explanations[self.strategy]}")
+        reasoning_parts.append(f"【策略指导思想】采用{strategy_explanations[analysis.strategy]}")
         
         # 5. 候选动作详细评分分析
         move_evals = analysis['move_evaluations']
@@ -876,16 +1004,16 @@ class QwenAgent:
             return "【反事实分析】无其他选择"
         
         # 选择一个替代方案进行分析
-        alt_move = random.choice(alternatives[:2])  # 分析前2个替代方案之一
+        alt_move = analysis.rng.choice(alternatives[:2])  # 分析前2个替代方案之一
         
         # 模拟替代选择的结果
         test_board = analysis['board_state'].copy()
         test_board[alt_move] = my_symbol
         
-        alt_winning = len(self._find_all_winning_moves(test_board, my_symbol, list(range(9))))
+        alt_winning = threat_count(test_board, my_symbol)
         current_board = analysis['board_state'].copy()
         current_board[selected_move] = my_symbol
-        current_winning = len(self._find_all_winning_moves(current_board, my_symbol, list(range(9))))
+        current_winning = threat_count(current_board, my_symbol)
         
         if current_winning > alt_winning:
             return f"【反事实分析】若选择位置{alt_move}，将减少{current_winning - alt_winning}个获胜机会"
@@ -1026,7 +1154,7 @@ class QwenAgent:
             }
         }
         
-        strategy_info = strategy_philosophy[self.strategy]
+        strategy_info = strategy_philosophy[analysis.strategy]
         reasoning_parts.append(f"【战略哲学与指导思想】")
         reasoning_parts.append(f"  - 核心理念：{strategy_info['core']}")
         for detail in strategy_info['details']:
@@ -1316,7 +1444,7 @@ class QwenAgent:
             StrategyType.BALANCED: "均衡型策略哲学深度解析：攻守兼备的中庸之道，根据当前局面的具体情况灵活调整重点，既不放过任何进攻机会也不忽视防守需求，追求整体最优解。该策略适应性强，能够应对各种复杂局面",
             StrategyType.OPPORTUNISTIC: "机会主义策略哲学深度解析：高度灵活的适应性策略，根据局面变化随时调整战术，优先抓住当前最有利的机会，不拘泥于固定模式，善于变通。该策略强调时机把握和灵活应变"
         }
-        reasoning_parts.append(f"【策略哲学深度思考】{strategy_philosophies[self.strategy]}")
+        reasoning_parts.append(f"【策略哲学深度思考】{strategy_philosophies[analysis.strategy]}")
         
         # 5. 候选动作全面评分分析
         move_evals = analysis['move_evaluations']
@@ -1494,7 +1622,7 @@ class QwenAgent:
             StrategyType.BALANCED: "均衡型策略哲学：攻守兼备的中庸之道，根据当前局面的具体情况灵活调整重点，既不放过任何进攻机会也不忽视防守需求，追求整体最优解",
             StrategyType.OPPORTUNISTIC: "机会主义策略哲学：高度灵活的适应性策略，根据局面变化随时调整战术，优先抓住当前最有利的机会，不拘泥于固定模式"
         }
-        reasoning_parts.append(f"【深层策略哲学】{strategy_philosophies[self.strategy]}")
+        reasoning_parts.append(f"【深层策略哲学】{strategy_philosophies[analysis.strategy]}")
         
         # 5. 全候选动作深度评分分析
         move_evals = analysis['move_evaluations']
@@ -1648,8 +1776,8 @@ class QwenAgent:
                 "适用场景": "局面变化快速的时刻，需要临场应变的情况"
             }
         }
-        current_strategy = strategy_systems[self.strategy]
-        reasoning_parts.append(f"  当前采用：{self.strategy.value}策略体系")
+        current_strategy = strategy_systems[analysis.strategy]
+        reasoning_parts.append(f"  当前采用：{analysis.strategy.value}策略体系")
         for aspect, description in current_strategy.items():
             reasoning_parts.append(f"    - {aspect}：{description}")
         
@@ -1864,7 +1992,7 @@ class QwenAgent:
             StrategyType.BALANCED: "均衡型策略：攻守兼备，灵活调整重点",
             StrategyType.OPPORTUNISTIC: "机会主义策略：敏锐捕捉有利时机"
         }
-        reasoning_parts.append(f"【策略框架】{strategy_explanations[self.strategy]}")
+        reasoning_parts.append(f"【策略框架】{strategy_explanations[analysis.strategy]}")
         
         # 5. 候选动作评估
         move_evals = analysis['move_evaluations']
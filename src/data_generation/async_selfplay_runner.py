@@ -0,0 +1,185 @@
+"""
+asyncio self-play：成千上万局对局作为协程并发进行
+
+SelfPlayRunner 一局接一局地同步推进，agent背后是推理服务时每局都要阻塞等待一次请求。
+AsyncSelfPlayRunner 为每局创建独立的环境，通过可等待的 agent.apolicy 决策（QwenAgent 连接
+models.inference_server 时直接await请求），最多 concurrency 局同时在等待模型，
+配合服务端的微批处理使模型持续满载，对局逻辑在等待期间交替执行。
+
+完成的对局立即写入输出sink（默认逐行追加到 data/raw/self_play_data_*.jsonl），
+对局记录的格式与 SelfPlayRunner._run_single_game 相同。
+
+用法:
+    runner = AsyncSelfPlayRunner(lambda: make("TicTacToe-v0"), {0: agent, 1: agent}, concurrency=512)
+    runner.run_self_play(num_games=10000, fixed_cot_length='short')
+"""
+
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+from data_generation.selfplay_runner import SelfPlayRunner
+from utils.processing_manifest import ProcessingManifest
+
+
+class JsonlGameSink:
+    """把完成的对局逐行追加到JSONL文件
+
+    写入期间文件名带 .partial 后缀，close时改名为最终文件并登记到处理清单，
+    格式化任务不会读到写了一半的文件；需要边生成边消费时可以直接读取 .partial 文件。
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            path = os.path.join(project_root, "data", "raw", f"self_play_data_{timestamp}_{os.getpid()}.jsonl")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.count = 0
+        self._file = open(path + ".partial", 'w', encoding='utf-8')
+
+    def write(self, game):
+        self._file.write(json.dumps(game, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.count += 1
+
+    def close(self):
+        """完成写入，返回最终文件路径"""
+        if self._file.closed:
+            return self.path
+        self._file.close()
+        os.replace(self.path + ".partial", self.path)
+        ProcessingManifest(os.path.dirname(os.path.abspath(self.path))).register_raw_file(self.path)
+        print(f"Self-play data saved to {self.path} ({self.count} games)")
+        return self.path
+
+
+class AsyncSelfPlayRunner(SelfPlayRunner):
+    """以协程并发运行对局的self-play（agent需要支持policy接口，可另外提供异步的apolicy）"""
+
+    def __init__(self, env_factory, agents, concurrency=256, enable_test_avoidance=True, storage_format="jsonl",
+                 sink=None):
+        """
+        Args:
+            env_factory: 无参数调用返回一个新环境（每局一个，如 lambda: make("TicTacToe-v0")）
+            agents: {player_id: agent}，有 apolicy 时await它，否则直接调用同步的 policy
+            concurrency: 同时进行的对局数上限（即同时挂起的模型请求上限）
+            storage_format: jsonl 完成一局写入一局；json / columnar 与 SelfPlayRunner 相同，结束时一次性保存
+            sink: 自定义输出，提供 write(game) 的对象或接收一局记录的函数；有 close() 时结束时调用
+        """
+        if storage_format not in ("jsonl", "json", "columnar"):
+            raise ValueError(f"Unknown storage format: {storage_format}")
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be positive: {concurrency}")
+        if not all(hasattr(agents[pid], 'policy') for pid in (0, 1)):
+            raise ValueError("AsyncSelfPlayRunner需要支持policy接口的agent（每局状态保存在GameContext中）")
+        super().__init__(env_factory(), agents, enable_test_avoidance=enable_test_avoidance,
+                         storage_format="json" if storage_format == "jsonl" else storage_format)
+        self.storage_format = storage_format
+        self.env_factory = env_factory
+        self.concurrency = concurrency
+        self.sink = sink
+        self.last_run_stats = {}
+
+    def run_self_play(self, num_games, cot_length_control=True, fixed_cot_length=None, fanout_cot_lengths=None):
+        """同步入口；已在事件循环中时请直接 await arun_self_play(...)"""
+        return asyncio.run(self.arun_self_play(num_games, cot_length_control, fixed_cot_length, fanout_cot_lengths))
+
+    async def arun_self_play(self, num_games, cot_length_control=True, fixed_cot_length=None, fanout_cot_lengths=None):
+        """并发运行num_games局，返回按完成顺序排列的对局记录列表"""
+        self.fanout_cot_lengths = list(fanout_cot_lengths or [])
+        strategies, cot_lengths = self._combination_pools(cot_length_control, fixed_cot_length)
+        plans = [self._plan_game(game_id, strategies, cot_lengths, cot_length_control, fixed_cot_length)
+                 for game_id in range(num_games)]
+
+        sink = self.sink
+        if sink is None and self.storage_format == "jsonl":
+            sink = JsonlGameSink()
+        # 测试集只包含井字棋局面；一次性保存时由 _save_self_play_data 过滤
+        test_avoider = self.test_avoider if getattr(self.env, 'game_name', "TicTacToe-v0") == "TicTacToe-v0" else None
+        if sink is None:
+            test_avoider = None
+
+        history = []
+        stats = {"moves": 0, "written": 0}
+        progress_every = max(1, num_games // 10)
+        pending = iter(range(num_games))
+
+        async def worker():
+            # 所有worker共享同一个迭代器，每局只会被取走一次
+            for game_id in pending:
+                strategy_combo, cot_combo = plans[game_id]
+                game = await self._play_game(self._make_game_contexts(strategy_combo, cot_combo))
+                game['strategies'] = strategy_combo  # 记录策略组合
+                game['cot_lengths'] = cot_combo  # 记录CoT长度组合
+                history.append(game)
+                stats["moves"] += len(game["moves"])
+                if sink is not None and self._emit(game, sink, test_avoider):
+                    stats["written"] += 1
+                if len(history) % progress_every == 0:
+                    print(f"  已完成 {len(history)}/{num_games} 局")
+
+        print(f"🚀 并发self-play: {num_games} 局，并发上限 {self.concurrency}")
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, num_games))))
+        finally:
+            # 出错时也保留已完成的对局
+            if sink is not None and hasattr(sink, 'close'):
+                saved = sink.close()
+                if isinstance(saved, str):
+                    self.last_saved_file = saved
+        elapsed = time.perf_counter() - start
+
+        self.last_run_stats = {
+            "games": num_games,
+            "moves": stats["moves"],
+            "seconds": round(elapsed, 4),
+            "games_per_second": round(num_games / elapsed, 1) if elapsed else None,
+        }
+        print(f"⚡ 并发self-play完成: {num_games} 局, {stats['moves']} 步, {elapsed:.2f}s "
+              f"({self.last_run_stats['games_per_second']} 局/秒)")
+
+        if sink is None:
+            self.last_saved_file = self._save_self_play_data(history)
+        elif test_avoider:
+            print(f"🛡️  测试集规避: 写入 {stats['written']}/{num_games} 个游戏")
+        return history
+
+    async def _play_game(self, contexts):
+        """在独立环境中运行一局，记录格式与 _run_single_game 相同"""
+        env = self.env_factory()
+        env.reset(num_players=2)
+        game_history = []
+
+        for turn in range(getattr(env, 'max_turns', 9)):
+            player_id, observation = env.get_observation()
+            action, cot = await self._decide(self.agents[player_id], observation, contexts[player_id])
+            done, info = env.step(action)
+            game_history.append(self._move_record(player_id, observation, action, turn, info, cot, contexts[player_id]))
+            if done:
+                break
+
+        rewards, game_info = env.close()
+        return self._game_record(game_history, rewards, game_info, env)
+
+    async def _decide(self, agent, observation, context):
+        if hasattr(agent, 'apolicy'):
+            return await agent.apolicy(observation, context)
+        # 同步policy（规则策略）是纯计算，直接在事件循环中执行
+        return agent.policy(observation, context)
+
+    def _emit(self, game, sink, test_avoider):
+        """应用测试集规避后写入sink；整局都被规避时不写入，返回是否写入"""
+        if test_avoider:
+            game = test_avoider.filter_game_moves(game)
+            if not game.get('moves'):
+                return False
+        if hasattr(sink, 'write'):
+            sink.write(game)
+        else:
+            sink(game)
+        return True
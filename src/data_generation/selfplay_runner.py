@@ -14,11 +14,19 @@ except ImportError:
     TEST_SET_AVOIDANCE_AVAILABLE = False
     print("⚠️  测试集规避功能不可用，将生成所有数据")
 
+from utils.columnar_store import COLUMNAR_SUFFIX, write_columnar
+from utils.processing_manifest import ProcessingManifest, atomic_write_json
+
 class SelfPlayRunner:
-    def __init__(self, env, agents, enable_test_avoidance=True):
+    def __init__(self, env, agents, enable_test_avoidance=True, storage_format="json"):
+        if storage_format not in ("json", "columnar"):
+            raise ValueError(f"Unknown storage format: {storage_format}")
         self.env = env
         self.agents = agents
+        self.storage_format = storage_format  # json: 缩进JSON; columnar: 压缩列式格式(.colz)
         self.enable_test_avoidance = enable_test_avoidance
+        self.last_saved_file = None  # 最近一次保存的原始数据文件
+        self.fanout_cot_lengths = []  # 额外渲染的CoT长度（见run_self_play）
         
         # 初始化测试集规避器
         self.test_avoider = None
@@ -34,52 +42,69 @@ class SelfPlayRunner:
         else:
             print("📋 测试集规避功能已禁用")
 
-    def run_self_play(self, num_games, cot_length_control=True, fixed_cot_length=None):
-        """Run self-play for specified number of games with diverse strategies and CoT length control"""
+    def run_self_play(self, num_games, cot_length_control=True, fixed_cot_length=None, fanout_cot_lengths=None):
+        """Run self-play for specified number of games with diverse strategies and CoT length control
+
+        fanout_cot_lengths: 额外渲染的CoT长度列表；每步落子复用同一次棋盘分析，
+                            为每个长度生成CoT并保存在 move["cot_variants"] 中（需要agent支持policy接口）
+        """
+        self.fanout_cot_lengths = list(fanout_cot_lengths or [])
         history = []
-        strategies = ['aggressive', 'conservative', 'balanced', 'opportunistic']
-        
-        # 如果指定了固定的CoT长度，使用固定值；否则使用多样化的CoT长度
+        strategies, cot_lengths = self._combination_pools(cot_length_control, fixed_cot_length)
         if fixed_cot_length:
-            cot_lengths = [fixed_cot_length]
             print(f"使用固定CoT长度: {fixed_cot_length}")
-        elif cot_length_control:
-            cot_lengths = ['short', 'medium', 'long', 'ultra_long']
-        else:
-            cot_lengths = ['medium']
         
         for game_id in range(num_games):
             print(f"Starting game {game_id + 1}/{num_games}")
-            
-            # 为每个游戏随机分配不同的策略组合
-            strategy_combo = self._get_strategy_combination(strategies, game_id)
-            
-            # 为每个游戏分配CoT长度组合
-            if fixed_cot_length:
-                # 使用固定的CoT长度
-                cot_combo = [fixed_cot_length, fixed_cot_length]
-            elif cot_length_control:
-                # 使用多样化的CoT长度
-                cot_combo = self._get_cot_length_combination(cot_lengths, game_id)
-            else:
-                # 使用默认medium长度
-                cot_combo = ['medium', 'medium']
+            strategy_combo, cot_combo = self._plan_game(game_id, strategies, cot_lengths, cot_length_control, fixed_cot_length)
             
             print(f"Strategy combination: Player 0 = {strategy_combo[0]}, Player 1 = {strategy_combo[1]}")
             print(f"CoT length combination: Player 0 = {cot_combo[0]}, Player 1 = {cot_combo[1]}")
             
-            # 重新初始化agents with new strategies and CoT lengths
-            self._update_agent_configuration(strategy_combo, cot_combo)
+            # 支持policy接口的agent使用每局独立的context，不再修改agent本身
+            contexts = self._make_game_contexts(strategy_combo, cot_combo)
+            if contexts is None:
+                self._update_agent_configuration(strategy_combo, cot_combo)
             
-            game_history = self._run_single_game()
+            game_history = self._run_single_game(contexts)
             game_history['strategies'] = strategy_combo  # 记录策略组合
             game_history['cot_lengths'] = cot_combo  # 记录CoT长度组合
             history.append(game_history)
         
         # Save the data
-        self._save_self_play_data(history)
+        self.last_saved_file = self._save_self_play_data(history)
         return history
     
+    def _combination_pools(self, cot_length_control, fixed_cot_length):
+        """本次运行可选的策略和CoT长度"""
+        strategies = ['aggressive', 'conservative', 'balanced', 'opportunistic']
+        
+        # 如果指定了固定的CoT长度，使用固定值；否则使用多样化的CoT长度
+        if fixed_cot_length:
+            cot_lengths = [fixed_cot_length]
+        elif cot_length_control:
+            cot_lengths = ['short', 'medium', 'long', 'ultra_long']
+        else:
+            cot_lengths = ['medium']
+        return strategies, cot_lengths
+    
+    def _plan_game(self, game_id, strategies, cot_lengths, cot_length_control, fixed_cot_length):
+        """为一局分配 (策略组合, CoT长度组合)"""
+        # 为每个游戏随机分配不同的策略组合
+        strategy_combo = self._get_strategy_combination(strategies, game_id)
+        
+        # 为每个游戏分配CoT长度组合
+        if fixed_cot_length:
+            # 使用固定的CoT长度
+            cot_combo = [fixed_cot_length, fixed_cot_length]
+        elif cot_length_control:
+            # 使用多样化的CoT长度
+            cot_combo = self._get_cot_length_combination(cot_lengths, game_id)
+        else:
+            # 使用默认medium长度
+            cot_combo = ['medium', 'medium']
+        return strategy_combo, cot_combo
+    
     def _get_strategy_combination(self, strategies, game_id):
         """生成多样化的策略组合"""
         # 确保策略多样性的几种模式
@@ -115,6 +140,14 @@ class SelfPlayRunner:
         pattern = cot_patterns[game_id % len(cot_patterns)]
         return pattern()
     
+    def _make_game_contexts(self, strategies, cot_lengths):
+        """为本局的两名玩家创建GameContext；任一agent不支持policy接口时返回None"""
+        if not all(hasattr(self.agents[pid], 'policy') for pid in (0, 1)):
+            return None
+        from agents.qwen_agent import GameContext
+        return {pid: GameContext(strategy=strategies[pid], cot_length=cot_lengths[pid],
+                                 render_lengths=self.fanout_cot_lengths) for pid in (0, 1)}
+    
     def _update_agent_configuration(self, strategies, cot_lengths=None):
         """更新agents的策略和CoT长度配置"""
         if hasattr(self.agents[0], 'strategy'):
@@ -151,31 +184,26 @@ class SelfPlayRunner:
             self.agents[1].game_phase = "opening" 
             self.agents[1].move_count = 0
 
-    def _run_single_game(self):
+    def _run_single_game(self, contexts=None):
+        """运行一局；contexts为 {player_id: GameContext} 时通过agent.policy决策"""
         self.env.reset(num_players=2)
         game_history = []
         
-        for turn in range(9):  # Maximum number of turns
+        # 井字棋最多9手；其他棋盘（如重力棋）由环境给出 max_turns
+        for turn in range(getattr(self.env, 'max_turns', 9)):  # Maximum number of turns
             player_id, observation = self.env.get_observation()
-            action = self.agents[player_id](observation)
+            if contexts is not None:
+                action, cot = self.agents[player_id].policy(observation, contexts[player_id])
+            else:
+                action = self.agents[player_id](observation)
+                cot = getattr(self.agents[player_id], 'last_cot', None)
             
             print(f"\nPlayer {player_id} action: {action}")
             
             done, info = self.env.step(action)
             
-            # 保存更完整的信息，包括观察数据和 CoT
-            move_data = {
-                "player": player_id,
-                "observation": observation,  # 保存观察数据
-                "action": action,
-                "turn": turn + 1,
-                "info": info.copy()
-            }
-            
-            # 如果智能体有 CoT 推理过程，也保存下来
-            if hasattr(self.agents[player_id], 'last_cot') and self.agents[player_id].last_cot:
-                move_data["cot"] = self.agents[player_id].last_cot
-            
+            move_data = self._move_record(player_id, observation, action, turn, info, cot,
+                                          contexts[player_id] if contexts is not None else None)
             game_history.append(move_data)
             
             if done:
@@ -186,50 +214,87 @@ class SelfPlayRunner:
         print(game_info)
         
         # 返回完整的游戏数据
-        return {
+        return self._game_record(game_history, rewards, game_info, self.env)
+    
+    def _move_record(self, player_id, observation, action, turn, info, cot, context=None):
+        """一步落子的记录（turn从0开始）"""
+        # 保存更完整的信息，包括观察数据和 CoT
+        move_data = {
+            "player": player_id,
+            "observation": observation,  # 保存观察数据
+            "action": action,
+            "turn": turn + 1,
+            "info": info.copy()
+        }
+        
+        # 如果智能体有 CoT 推理过程，也保存下来
+        if cot:
+            move_data["cot"] = cot
+        if context is not None and context.cot_variants:
+            move_data["cot_variants"] = context.cot_variants
+        return move_data
+    
+    def _game_record(self, game_history, rewards, game_info, env):
+        """一局的完整记录"""
+        game_data = {
             "moves": game_history,
             "result": game_info,
             "rewards": rewards
         }
+        game_name = getattr(env, 'game_name', None)
+        if game_name:
+            game_data["game"] = game_name
+        return game_data
     
     def _save_self_play_data(self, history):
         """Save self-play data to JSON file with optional test set avoidance"""
         import os
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
-        # 应用测试集规避过滤
-        if self.test_avoider:
+        # 应用测试集规避过滤（测试集只包含井字棋局面，其他游戏不过滤）
+        test_avoider = self.test_avoider if getattr(self.env, 'game_name', "TicTacToe-v0") == "TicTacToe-v0" else None
+        if test_avoider:
             print("🛡️  应用测试集规避过滤...")
             original_count = len(history)
-            history = self.test_avoider.filter_self_play_data(history)
+            history = test_avoider.filter_self_play_data(history)
             filtered_count = len(history)
             print(f"📊 过滤结果: {original_count} -> {filtered_count} 个游戏")
         
+        suffix = COLUMNAR_SUFFIX if self.storage_format == "columnar" else ".json"
+        
         # Use absolute path to ensure file is saved correctly
         try:
             project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
             data_dir = os.path.join(project_root, "data", "raw")
             os.makedirs(data_dir, exist_ok=True)
-            filename = os.path.join(data_dir, f"self_play_data_{timestamp}.json")
+            # 文件名带上进程号，避免并行worker在同一秒写入时互相覆盖
+            filename = os.path.join(data_dir, f"self_play_data_{timestamp}_{os.getpid()}{suffix}")
         except Exception as e:
             # Fallback to current directory
             print(f"Could not create data directory: {e}")
-            filename = f"self_play_data_{timestamp}.json"
+            data_dir = None
+            filename = f"self_play_data_{timestamp}_{os.getpid()}{suffix}"
         
         # 添加元数据
         data_with_metadata = {
             "generation_info": {
                 "timestamp": timestamp,
                 "total_games": len(history),
-                "test_set_avoidance_enabled": self.test_avoider is not None,
-                "avoider_stats": self.test_avoider.get_statistics() if self.test_avoider else None
+                "test_set_avoidance_enabled": test_avoider is not None,
+                "avoider_stats": test_avoider.get_statistics() if test_avoider else None
             },
             "games": history
         }
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data_with_metadata, f, indent=2, ensure_ascii=False)
+        # 原子写入并登记到处理清单，格式化任务不会读到写了一半的文件
+        if self.storage_format == "columnar":
+            write_columnar(data_with_metadata, filename)
+        else:
+            atomic_write_json(filename, data_with_metadata)
+        if data_dir:
+            ProcessingManifest(data_dir).register_raw_file(filename)
         
         print(f"Self-play data saved to {filename}")
-        if self.test_avoider:
-            print(f"✅ 数据已经过测试集规避过滤")
\ No newline at end of file
+        if test_avoider:
+            print(f"✅ 数据已经过测试集规避过滤")
+        return filename
\ No newline at end of file
@@ -0,0 +1,154 @@
+"""
+向量化self-play：VectorTicTacToeEnv + QwenAgent.act_batch
+
+整批对局同步推进（所有对局同时开始，X在偶数步落子），每一步只有一次act_batch和一次env.step。
+对局过程只记录棋盘编码和落子；CoT在对局结束后才渲染，且只为会被保留的落子生成
+（默认只有获胜方的落子，与 SelfPlayDataFormatter 的 filter_winners_only 一致）。
+输出的对局记录与 SelfPlayRunner 相同，可直接交给数据格式化流程。
+"""
+
+import time
+
+import numpy as np
+
+from agents.batch_policy import BatchContext
+from data_generation.selfplay_runner import SelfPlayRunner
+from utils.mock_env import render_observation
+from utils.vector_env import VectorTicTacToeEnv, decode_board
+
+
+class VectorSelfPlayRunner(SelfPlayRunner):
+    """使用批量决策的规则self-play（不支持加载模型的agent）"""
+
+    def __init__(self, agent, batch_size=4096, enable_test_avoidance=True, storage_format="json",
+                 cot_for="winner", seed=None):
+        """
+        Args:
+            agent: 提供act_batch/render_cot的QwenAgent（两名玩家共用）
+            batch_size: 每批同时进行的对局数
+            cot_for: "winner" 只为获胜方落子生成CoT；"all" 为全部落子生成
+            seed: 决策随机数种子
+        """
+        if cot_for not in ("winner", "all"):
+            raise ValueError(f"Unknown cot_for: {cot_for}")
+        super().__init__(VectorTicTacToeEnv(batch_size), {0: agent, 1: agent},
+                         enable_test_avoidance=enable_test_avoidance, storage_format=storage_format)
+        self.agent = agent
+        self.batch_size = batch_size
+        self.cot_for = cot_for
+        self.seed = seed
+        self.last_run_stats = {}
+
+    def run_self_play(self, num_games, cot_length_control=True, fixed_cot_length=None, fanout_cot_lengths=None):
+        """批量运行num_games局并保存，返回对局记录列表
+
+        fanout_cot_lengths: 额外渲染的CoT长度列表，每步只做一次分析，结果保存在 move["cot_variants"]
+        """
+        self.fanout_cot_lengths = list(fanout_cot_lengths or [])
+        strategies = ['aggressive', 'conservative', 'balanced', 'opportunistic']
+        if fixed_cot_length:
+            cot_lengths = [fixed_cot_length]
+        elif cot_length_control:
+            cot_lengths = ['short', 'medium', 'long', 'ultra_long']
+        else:
+            cot_lengths = ['medium']
+
+        history = []
+        total_moves = 0
+        decide_time = 0.0
+        seed_sequence = np.random.SeedSequence(self.seed)
+
+        for start in range(0, num_games, self.batch_size):
+            n = min(self.batch_size, num_games - start)
+            strategy_combos = [self._get_strategy_combination(strategies, start + i) for i in range(n)]
+            if fixed_cot_length or not cot_length_control:
+                cot_combos = [[cot_lengths[0]] * 2 for _ in range(n)]
+            else:
+                cot_combos = [self._get_cot_length_combination(cot_lengths, start + i) for i in range(n)]
+
+            player_seeds = seed_sequence.spawn(2)
+            contexts = [BatchContext([combo[pid] for combo in strategy_combos],
+                                     [combo[pid] for combo in cot_combos],
+                                     seed=int(player_seeds[pid].generate_state(1)[0])) for pid in (0, 1)]
+
+            batch_start = time.perf_counter()
+            states, actions, active = self._play_batch(n, contexts)
+            decide_time += time.perf_counter() - batch_start
+            total_moves += int(active.sum())
+
+            for i in range(n):
+                game = self._build_game_record(i, states[:, i], actions[:, i], active[:, i], contexts)
+                game['strategies'] = strategy_combos[i]
+                game['cot_lengths'] = cot_combos[i]
+                history.append(game)
+
+        self.last_run_stats = {
+            "games": num_games,
+            "moves": total_moves,
+            "decide_seconds": round(decide_time, 4),
+            "moves_per_second": round(total_moves / decide_time) if decide_time else None,
+        }
+        print(f"⚡ 批量self-play: {num_games} 局, {total_moves} 步, "
+              f"决策+环境 {decide_time:.3f}s ({self.last_run_stats['moves_per_second']} 步/秒)")
+
+        self.last_saved_file = self._save_self_play_data(history)
+        return history
+
+    def _play_batch(self, n, contexts):
+        """同步推进一批对局，返回每一步的 (棋盘编码, 落子, 是否仍在进行) 数组，形状为 (9, n)"""
+        states = np.zeros((9, n), dtype=np.int64)
+        actions = np.full((9, n), -1, dtype=np.int8)
+        active = np.zeros((9, n), dtype=bool)
+
+        self.env.reset(n)
+        for turn in range(9):
+            active[turn] = ~self.env.done
+            if not active[turn].any():
+                break
+            states[turn] = self.env.states
+            actions[turn], _ = self.agent.act_batch(states[turn], contexts[turn % 2])
+            self.env.step(actions[turn])
+        return states, actions, active
+
+    def _build_game_record(self, i, states, actions, active, contexts):
+        """把第i局的数组记录展开为与 SelfPlayRunner._run_single_game 相同的格式（需在下一批开始前调用）"""
+        result = self.env.game_info(i)
+        winner = result["winner"]
+        final_state = int(self.env.states[i])
+        num_turns = int(active.sum())
+        moves = []
+        for turn in range(num_turns):
+            player = turn % 2
+            state, action = int(states[turn]), int(actions[turn])
+            board_after = decode_board(int(states[turn + 1]) if turn + 1 < num_turns else final_state)
+            game_over = turn == num_turns - 1
+            move = {
+                "player": player,
+                "observation": render_observation(decode_board(state), player),
+                "action": f"[{action}]",
+                "turn": turn + 1,
+                "info": {
+                    "winner": winner if game_over else None,
+                    "turn": turn + 1,
+                    "board": board_after,
+                    "game_over": game_over
+                }
+            }
+            if self.cot_for == "all" or player == winner:
+                context = contexts[player]
+                if self.fanout_cot_lengths:
+                    primary = context.cot_length(i)
+                    lengths = [primary] + [c for c in self.fanout_cot_lengths if c not in (primary, primary.value)]
+                    variants = self.agent.render_cot_variants(state, action, context.strategy(i), lengths,
+                                                              turn // 2 + 1, context.py_rng)
+                    move["cot"] = variants[primary.value]
+                    move["cot_variants"] = variants
+                else:
+                    move["cot"] = self.agent.render_cot(state, action, context.strategy(i), context.cot_length(i),
+                                                        turn // 2 + 1, context.py_rng)
+            moves.append(move)
+
+        rewards = [0.0, 0.0]
+        if winner is not None:
+            rewards[winner], rewards[1 - winner] = 1.0, -1.0
+        return {"moves": moves, "result": result, "rewards": rewards}
@@ -2,7 +2,6 @@ import sys
 import traceback
 import argparse
 import os
-import glob
 import json
 from datetime import datetime
 
@@ -16,50 +15,112 @@ except ImportError:
 from agents.qwen_agent import QwenAgent
 from agents.smart_agent import SmartAgent
 from data_generation.selfplay_runner import SelfPlayRunner
+from data_generation.async_selfplay_runner import AsyncSelfPlayRunner
+from data_generation.vector_selfplay_runner import VectorSelfPlayRunner
+from utils.processing_manifest import ProcessingManifest, atomic_write_json
+from utils.sample_dedup import SampleDeduplicator
+from utils.sft_index import write_indexed_jsonl
+from utils.cot_rerender import parse_cot_lengths, write_sft_variants
 
 def main():
     parser = argparse.ArgumentParser(description='TicTacToe Self-Play Data Generation')
     parser.add_argument('--num-games', type=int, default=10, help='Number of games to play')
     parser.add_argument('--load-qwen', action='store_true', help='Load actual Qwen model (requires GPU)')
     parser.add_argument('--model-path', type=str, default=None, help='Path to Qwen model')
+    parser.add_argument('--inference-server', type=str, default=None,
+                        help='Use a running models/inference_server.py (http://host:port or unix:///path) instead of loading the model')
+    parser.add_argument('--server-model', type=str, default=None, help='Model name on the inference server (default: its first model)')
+    parser.add_argument('--speculative', action='store_true',
+                        help='With --load-qwen, draft each CoT from the rule agent\'s template and verify it with the model (for template-fine-tuned models)')
+    parser.add_argument('--routing-table', type=str, default=None,
+                        help='With --load-qwen, route each position to a CoT-length adapter using a table from models/adapter_router.py learn')
     parser.add_argument('--cot-length', type=str, default='medium', 
                        choices=['tiny', 'short', 'medium', 'long', 'very_long', 'ultra_long'],
                        help='CoT length type for data generation')
     parser.add_argument('--process-id', type=str, default=None, help='Process ID for parallel execution')
     parser.add_argument('--output-suffix', type=str, default=None, help='Output file suffix for independent files')
+    parser.add_argument('--storage-format', type=str, default=None, choices=['json', 'columnar', 'jsonl'],
+                       help='Raw self-play storage: indented JSON, compressed columnar (.colz), or JSONL streamed game by game '
+                            '(--async-concurrency only; its default). Default: json')
+    parser.add_argument('--dedup-max-per-state', type=int, default=None,
+                       help='Keep at most N samples per (canonical board, strategy, CoT length); disabled by default')
+    parser.add_argument('--dedup-weights', action='store_true',
+                       help='Attach a weight (occurrences / kept) to each deduplicated sample')
+    parser.add_argument('--sft-format', type=str, default='json', choices=['json', 'jsonl'],
+                       help='SFT output: JSON array or JSONL with a byte-offset index (.idx) for random access')
+    parser.add_argument('--vectorized', action='store_true',
+                       help='Rule-based self-play with batched decisions on a vectorized env (ignored with --load-qwen)')
+    parser.add_argument('--batch-size', type=int, default=4096, help='Games advanced together in --vectorized mode')
+    parser.add_argument('--cot-for', type=str, default='winner', choices=['winner', 'all'],
+                       help='In --vectorized mode, render CoT only for the winner\'s moves or for all moves')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for --vectorized mode')
+    parser.add_argument('--async-concurrency', type=int, default=None,
+                        help='Run games as asyncio coroutines with at most N in flight (pair with --inference-server)')
+    parser.add_argument('--cot-corpus', type=str, default=None,
+                        help='Materialized CoT corpus directory (built by utils/cot_corpus.py); rule-based moves are looked up instead of generated')
+    parser.add_argument('--game', type=str, default='TicTacToe-v0', choices=['TicTacToe-v0', 'ConnectFour-v0'],
+                        help='Game to play; ConnectFour-v0 always uses the mock gravity env and the rule-based ConnectFourAgent')
+    parser.add_argument('--fanout-cot-lengths', type=str, default=None,
+                        help='Comma separated CoT lengths (or "all") rendered from the same analysis; writes one SFT file per length')
     
     args = parser.parse_args()
+    if args.game != 'TicTacToe-v0' and (args.load_qwen or args.inference_server or args.vectorized or args.cot_corpus):
+        parser.error(f"--load-qwen / --inference-server / --vectorized / --cot-corpus only support TicTacToe-v0, not {args.game}")
+    if args.storage_format is None:
+        args.storage_format = 'jsonl' if args.async_concurrency else 'json'
+    elif args.storage_format == 'jsonl' and not args.async_concurrency:
+        parser.error("--storage-format jsonl requires --async-concurrency")
     
     try:
-        if TEXTARENA_AVAILABLE:
+        if args.game != 'TicTacToe-v0':
+            print(f"Using mock {args.game} environment...")
+            from utils.mock_env import make
+            env_factory = lambda: make(args.game)
+        elif TEXTARENA_AVAILABLE:
             print("Using TextArena environment...")
             # Initialize the TextArena environment
-            env = ta.make("TicTacToe-v0")
+            env_factory = lambda: ta.make("TicTacToe-v0")
         else:
             print("Using mock environment...")
             # Use mock environment as fallback
             from utils.mock_env import MockTicTacToeEnv
-            env = MockTicTacToeEnv()
+            env_factory = MockTicTacToeEnv
         
-        # Initialize agents - use the same agent type for true self-play
+        # Initialize agents - one shared agent for true self-play;
+        # per-game strategy / CoT length live in GameContext, so the model is loaded only once
         print("Initializing agents...")
-        if args.load_qwen:
-            print("Loading Qwen models (this may take a while)...")
-            agent_x = QwenAgent(model_path=args.model_path, load_model=True, cot_length=args.cot_length)  # Player 0 (X)
-            agent_o = QwenAgent(model_path=args.model_path, load_model=True, cot_length=args.cot_length)  # Player 1 (O)
+        if args.game == 'ConnectFour-v0':
+            print("Using rule-based Connect Four strategy...")
+            from agents.connect_four_agent import ConnectFourAgent
+            agent = ConnectFourAgent(cot_length=args.cot_length)
+        elif args.inference_server:
+            print(f"Using inference server {args.inference_server}...")
+            agent = QwenAgent(cot_length=args.cot_length, inference_server=args.inference_server,
+                              server_model=args.server_model)
+        elif args.load_qwen:
+            print("Loading Qwen model (this may take a while)...")
+            agent = QwenAgent(model_path=args.model_path, load_model=True, cot_length=args.cot_length,
+                              speculative=args.speculative, routing_table=args.routing_table)
         else:
             print("Using rule-based strategy...")
-            agent_x = QwenAgent(cot_length=args.cot_length)  # Player 0 (X)
-            agent_o = QwenAgent(cot_length=args.cot_length)  # Player 1 (O)
+            agent = QwenAgent(cot_length=args.cot_length, corpus=args.cot_corpus)
         
         agents = {
-            0: agent_x,
-            1: agent_o,
+            0: agent,  # Player 0 (X)
+            1: agent,  # Player 1 (O)
         }
         
         # Set up self-play runner
         print("Setting up self-play runner...")
-        self_play_runner = SelfPlayRunner(env, agents)
+        if args.vectorized and not (args.load_qwen or args.inference_server):
+            self_play_runner = VectorSelfPlayRunner(agent, batch_size=args.batch_size, storage_format=args.storage_format,
+                                                    cot_for=args.cot_for, seed=args.seed)
+        elif args.async_concurrency:
+            # 每局一个环境，最多N局同时等待模型
+            self_play_runner = AsyncSelfPlayRunner(env_factory, agents, concurrency=args.async_concurrency,
+                                                   storage_format=args.storage_format)
+        else:
+            self_play_runner = SelfPlayRunner(env_factory(), agents, storage_format=args.storage_format)
         
         # Run self-play data generation
         print(f"Starting self-play data generation for {args.num_games} games...")
@@ -67,25 +128,28 @@ def main():
         if args.process_id:
             print(f"Process ID: {args.process_id}")
         
+        fanout_cot_lengths = parse_cot_lengths(args.fanout_cot_lengths) if args.fanout_cot_lengths else None
+        if fanout_cot_lengths:
+            print(f"Fan-out CoT lengths: {', '.join(fanout_cot_lengths)}")
+        
         # 使用固定的CoT长度参数
         if args.cot_length:
-            self_play_runner.run_self_play(num_games=args.num_games, cot_length_control=False, fixed_cot_length=args.cot_length)
+            self_play_runner.run_self_play(num_games=args.num_games, cot_length_control=False, fixed_cot_length=args.cot_length,
+                                           fanout_cot_lengths=fanout_cot_lengths)
         else:
-            self_play_runner.run_self_play(num_games=args.num_games)
+            self_play_runner.run_self_play(num_games=args.num_games, fanout_cot_lengths=fanout_cot_lengths)
         print("Self-play completed successfully!")
         
         # 格式化数据为SFT训练格式
         print("🔄 格式化数据为SFT训练格式...")
         from utils.data_formatter import SelfPlayDataFormatter
         
-        # 找到最新生成的数据文件
+        # 直接使用本次运行保存的数据文件，而不是按创建时间猜测"最新"文件
+        # （并行worker同时写入时按ctime挑选会拿到别人的文件）
         project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        data_dir = os.path.join(project_root, "data", "raw")
-        pattern = f"{data_dir}/self_play_data_*.json"
-        files = glob.glob(pattern)
+        latest_file = self_play_runner.last_saved_file
         
-        if files:
-            latest_file = max(files, key=os.path.getctime)
+        if latest_file and os.path.exists(latest_file):
             print(f"📂 处理文件: {latest_file}")
             
             # 使用SelfPlayDataFormatter来格式化数据
@@ -96,20 +160,44 @@ def main():
             if isinstance(games_data, dict) and 'games' in games_data:
                 games_data = games_data['games']
             
+            # 可选：按规范化局面去重
+            deduplicator = None
+            if args.dedup_max_per_state is not None:
+                deduplicator = SampleDeduplicator(max_per_state=args.dedup_max_per_state,
+                                                  assign_weights=args.dedup_weights)
+            
+            if fanout_cot_lengths:
+                # 每个长度一份SFT文件（各自独立去重）
+                make_deduplicator = (lambda: SampleDeduplicator(max_per_state=args.dedup_max_per_state,
+                                                                assign_weights=args.dedup_weights)) if deduplicator else None
+                tag = args.output_suffix or datetime.now().strftime('%Y%m%d_%H%M%S')
+                outputs = write_sft_variants(games_data, fanout_cot_lengths, os.path.join(project_root, "data", "processed"),
+                                             tag, args.sft_format, formatter, make_deduplicator)
+                ProcessingManifest(os.path.dirname(latest_file)).register_outputs(
+                    latest_file, {f"llama_factory_{length}": output["path"] for length, output in outputs.items()}
+                )
+                return
+            
             # 格式化为LLaMA Factory格式
-            llama_factory_data = formatter.format_for_llama_factory(games_data)
+            llama_factory_data = formatter.format_for_llama_factory(games_data, deduplicator=deduplicator)
             
             # 保存格式化后的数据
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            extension = args.sft_format
             if args.output_suffix:
                 # 使用指定的后缀创建独立文件名
-                output_file = os.path.join(project_root, "data", "processed", f"long_cot_sft_data_{args.output_suffix}.json")
+                output_file = os.path.join(project_root, "data", "processed", f"long_cot_sft_data_{args.output_suffix}.{extension}")
             else:
-                output_file = os.path.join(project_root, "data", "processed", f"long_cot_sft_data_{args.cot_length}_{timestamp}.json")
+                output_file = os.path.join(project_root, "data", "processed", f"long_cot_sft_data_{args.cot_length}_{timestamp}.{extension}")
             os.makedirs(os.path.dirname(output_file), exist_ok=True)
             
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(llama_factory_data, f, indent=2, ensure_ascii=False)
+            if args.sft_format == 'jsonl':
+                write_indexed_jsonl(llama_factory_data, output_file)
+            else:
+                atomic_write_json(output_file, llama_factory_data)
+            ProcessingManifest(os.path.dirname(latest_file)).register_outputs(
+                latest_file, {f"llama_factory_{args.cot_length}": output_file}
+            )
             
             print(f"✅ SFT数据已保存到: {output_file}")
         else:
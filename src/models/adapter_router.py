@@ -0,0 +1,306 @@
+"""
+按局面难度路由CoT长度adapter
+
+六个CoT长度adapter（tiny … ultra_long）在不同阶段/移动类型上的准确率不同，但目前每个局面都交给同一个
+（往往是很长的）adapter回答。AdapterRouter 先用求解器廉价地给局面分类（移动类型、阶段、难度、威胁数），
+再按路由表把局面交给该类中满足准确率要求的最短adapter。
+
+路由表由已有的 evaluation_*.json（multi_optimal_evaluator 的输出）学习：
+    对每个类别，候选adapter的准确率 >= 该类别最高准确率 - tolerance 时视为满足要求，从中选平均输出最短的；
+    样本数少于 min_cases 的类别（以及评估中没出现过的类别）使用整体准确率最高的adapter。
+    每类只有十几个案例时，"准确率不低于最高者"的挑选本身会带入噪声，因此除了样本内估计，
+    还用留一法（去掉一个案例重新学习该案例所在类别的路由，再看它在该案例上是否答对）估计路由效果。
+
+运行时所有adapter共享一份基础模型（PeftModel.load_adapter），每步只切换当前adapter。
+
+用法:
+    python src/models/adapter_router.py learn evaluation/evaluation_*.json --output configs/adapter_routing.json
+    python src/models/adapter_router.py show configs/adapter_routing.json
+    python src/main.py --load-qwen --routing-table configs/adapter_routing.json
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.board_utils import parse_board_from_observation
+from utils.tactics import threat_count
+from utils.tictactoe_oracle import difficulty_of, find_all_optimal_moves, stage_of
+
+ADAPTER_ORDER = ("tiny", "short", "medium", "long", "very_long", "ultra_long")  # 训练CoT由短到长
+DEFAULT_FEATURES = ("stage", "move_type")
+
+
+def _threats(board: List[str], player: str) -> str:
+    opponent = 'O' if player == 'X' else 'X'
+    return f"{min(threat_count(board, player), 2)}v{min(threat_count(board, opponent), 2)}"
+
+
+FEATURES: Dict[str, Callable[[List[str], str], str]] = {
+    "move_type": lambda board, player: find_all_optimal_moves(board, player)[1],
+    "stage": lambda board, player: stage_of(board),
+    "difficulty": lambda board, player: difficulty_of(stage_of(board), find_all_optimal_moves(board, player)[1]),
+    "threats": _threats,  # 己方/对方"两子一空"线路数（截断到2）
+}
+
+
+def position_class(board: List[str], player: str, features: Sequence[str] = DEFAULT_FEATURES) -> str:
+    """局面类别，如 "stage=midgame|move_type=blocking_move" """
+    return "|".join(f"{name}={FEATURES[name](board, player)}" for name in features)
+
+
+def adapter_name(evaluation: Dict, filename: str) -> Optional[str]:
+    """评估结果对应的CoT长度adapter名；基线模型等其他结果返回None"""
+    model_path = evaluation.get("evaluation_info", {}).get("model_path", "")
+    match = re.search(r'qwen_(.+)_cot_lora', os.path.basename(os.path.normpath(model_path)))
+    if not match:
+        match = re.search(r'evaluation_(.+?)_(?:cuda_\d+|cpu|auto)_', os.path.basename(filename))
+    name = match.group(1) if match else None
+    return name if name in ADAPTER_ORDER else None
+
+
+def learn_routing_table(evaluation_files: Sequence[str], features: Sequence[str] = DEFAULT_FEATURES,
+                        tolerance: float = 0.0, min_cases: int = 20, length_fn: Callable[[str], int] = len) -> Dict:
+    """从评估结果学习路由表
+
+    Args:
+        evaluation_files: multi_optimal_evaluator 输出的JSON；同一adapter有多个文件时以文件名排序靠后的为准
+        features: 局面分类特征（FEATURES的键）
+        tolerance: 允许比该类别最高准确率低的幅度（0-1），0即不损失准确率
+        min_cases: 类别中每个adapter至少要有的案例数，否则该类别使用默认adapter
+        length_fn: 输出长度的度量，默认字符数（可传入 lambda text: len(tokenizer(text)["input_ids"])）
+    """
+    results, adapter_paths = {}, {}
+    for path in sorted(evaluation_files):
+        with open(path, 'r', encoding='utf-8') as f:
+            evaluation = json.load(f)
+        name = adapter_name(evaluation, path)
+        if name is None or not evaluation.get("detailed_results"):
+            print(f"⏭️  跳过 {os.path.basename(path)}（不是CoT长度adapter的评估结果）")
+            continue
+        results[name] = {(r["board_state"], r["player"]): r for r in evaluation["detailed_results"]}
+        adapter_paths[name] = evaluation.get("evaluation_info", {}).get("model_path")
+    if not results:
+        raise ValueError("没有可用的adapter评估结果")
+
+    # 只比较所有adapter都评估过的案例，保证各adapter面对同一组局面
+    adapters = [name for name in ADAPTER_ORDER if name in results]
+    shared_cases = set.intersection(*(set(cases) for cases in results.values()))
+    if not shared_cases:
+        counts = ", ".join(f"{name}: {len(results[name])}" for name in adapters)
+        raise ValueError(f"各adapter的评估结果没有共同的局面（{counts}），请用同一测试集评估")
+    classes = {}
+    for board_state, player in shared_cases:
+        board = parse_board_from_observation(f"Game Board:\n{board_state}")
+        classes[(board_state, player)] = position_class(board, player, features)
+
+    # 各adapter在每个类别（及整体）上的 [答对数, 输出长度和]；留一法估计时减去单个案例的贡献
+    scores = {key: {name: (int(results[name][key]["is_correct"]), length_fn(results[name][key]["model_output"]))
+                    for name in adapters} for key in shared_cases}
+    by_class = defaultdict(list)
+    for key, label in classes.items():
+        by_class[label].append(key)
+
+    def totals(case_keys) -> Dict[str, List[int]]:
+        return {name: [sum(scores[key][name][0] for key in case_keys), sum(scores[key][name][1] for key in case_keys)]
+                for name in adapters}
+
+    def summarize(total: Dict[str, List[int]], n: int, excluded=None) -> Dict[str, Dict]:
+        summary = {}
+        for name, (correct, length) in total.items():
+            if excluded is not None:
+                correct, length, cases = correct - scores[excluded][name][0], length - scores[excluded][name][1], n - 1
+            else:
+                cases = n
+            summary[name] = {
+                "cases": cases,
+                "accuracy": correct / cases if cases else 0.0,
+                "mean_output_length": length / cases if cases else 0.0,
+            }
+        return summary
+
+    def cheapest(summary: Dict[str, Dict]) -> str:
+        best_accuracy = max(stats["accuracy"] for stats in summary.values())
+        eligible = [name for name, stats in summary.items() if stats["accuracy"] >= best_accuracy - tolerance - 1e-9]
+        return min(eligible, key=lambda name: (summary[name]["mean_output_length"], ADAPTER_ORDER.index(name)))
+
+    def default_of(overall: Dict[str, Dict]) -> str:
+        # 默认adapter：整体准确率最高者中输出最短的（不放宽tolerance）
+        best_accuracy = max(stats["accuracy"] for stats in overall.values())
+        return min((name for name in adapters if overall[name]["accuracy"] == best_accuracy),
+                   key=lambda name: overall[name]["mean_output_length"])
+
+    overall_totals = totals(shared_cases)
+    class_totals = {label: totals(case_keys) for label, case_keys in by_class.items()}
+
+    def learn(excluded=None) -> tuple:
+        """(默认adapter, {类别: (adapter, 候选统计)}, 整体统计)；excluded 为留一法中去掉的案例，只重新学习它所在的类别"""
+        overall = summarize(overall_totals, len(shared_cases), excluded)
+        default = default_of(overall)
+        labels = [classes[excluded]] if excluded is not None else sorted(by_class)
+        routes = {}
+        for label in labels:
+            n = len(by_class[label])
+            summary = summarize(class_totals[label], n, excluded)
+            routes[label] = (cheapest(summary) if summary[default]["cases"] >= min_cases else default, summary)
+        return default, routes, overall
+
+    default, routes, overall = learn()
+
+    # 样本内估计：在学习用的案例上评估路由效果（挑选噪声使其偏乐观）
+    routed = [routes[classes[key]][0] for key in shared_cases]
+    routed_correct = sum(scores[key][name][0] for key, name in zip(shared_cases, routed))
+    routed_length = sum(scores[key][name][1] for key, name in zip(shared_cases, routed))
+    # 留一法估计：每个案例由不含它的数据学出的路由作答
+    loo_correct = loo_length = 0
+    for key in shared_cases:
+        _, loo_routes, _ = learn(excluded=key)
+        name = loo_routes[classes[key]][0]
+        loo_correct += scores[key][name][0]
+        loo_length += scores[key][name][1]
+    return {
+        "created_at": datetime.now().isoformat(),
+        "features": list(features),
+        "tolerance": tolerance,
+        "min_cases": min_cases,
+        "default": default,
+        "adapters": adapter_paths,
+        "routes": {label: route[0] for label, route in routes.items()},
+        "class_stats": {label: route[1] for label, route in routes.items()},
+        "estimate": {
+            "cases": len(shared_cases),
+            "routed_accuracy": routed_correct / len(shared_cases),
+            "routed_mean_output_length": routed_length / len(shared_cases),
+            "loo_routed_accuracy": loo_correct / len(shared_cases),
+            "loo_routed_mean_output_length": loo_length / len(shared_cases),
+            "default_accuracy": overall[default]["accuracy"],
+            "default_mean_output_length": overall[default]["mean_output_length"],
+            "usage": dict(Counter(routed)),
+        },
+    }
+
+
+class AdapterRouter:
+    """按路由表为每个局面选择adapter的模型（接口与 QwenWrapper.generate_move_with_cot 相同，可直接用作 QwenAgent.model）"""
+
+    def __init__(self, table: Dict, adapter_paths: Optional[Dict[str, str]] = None, base_model_path: str = None,
+                 device: str = "auto"):
+        """
+        Args:
+            table: learn_routing_table 的结果（或其JSON文件路径）
+            adapter_paths: {adapter名: 路径}，覆盖路由表中记录的评估时路径
+            base_model_path: 基础模型路径，默认与 QwenWrapper 相同
+        """
+        if isinstance(table, str):
+            with open(table, 'r', encoding='utf-8') as f:
+                table = json.load(f)
+        self.table = table
+        self.features = table["features"]
+        self.routes = table["routes"]
+        self.default = table["default"]
+        self.adapter_paths = {**table.get("adapters", {}), **(adapter_paths or {})}
+        used = sorted(set(self.routes.values()) | {self.default}, key=ADAPTER_ORDER.index)
+        missing = [name for name in used if not self.adapter_paths.get(name)]
+        if missing:
+            raise ValueError(f"路由表中的adapter缺少路径: {missing}")
+        self.used_adapters = used
+        self.base_model_path = base_model_path
+        self.device = device
+        self.wrapper = None
+        self.is_loaded = False
+        self.speculator = None  # QwenAgent 按此判断是否传入草稿参数
+        self.usage = Counter()
+        self._peft_names = {}
+        self._lock = threading.Lock()  # set_adapter 是模型级状态，生成期间不能被其他线程切换
+
+    def load_model(self):
+        """加载基础模型和路由表用到的全部adapter（共享基础权重）"""
+        from models.qwen_wrapper import QwenWrapper
+
+        first, *rest = self.used_adapters
+        # 合并后的checkpoint不能切换adapter，这里总是以PeftModel加载
+        self.wrapper = QwenWrapper(self.adapter_paths[first], device=self.device, use_lora=True,
+                                   base_model_path=self.base_model_path, use_merged_cache=False)
+        self.wrapper.load_model()
+        if not self.wrapper.is_loaded:
+            return
+        self._peft_names[first] = "default"
+        for name in rest:
+            self.wrapper.model.load_adapter(self.adapter_paths[name], adapter_name=name)
+            self._peft_names[name] = name
+        self.is_loaded = True
+        print(f"Adapter router loaded: {', '.join(self.used_adapters)} (default: {self.default})")
+
+    def route(self, observation: str, player_mark: str = "X") -> str:
+        board = parse_board_from_observation(observation)
+        if board is None:
+            return self.default
+        return self.routes.get(position_class(board, player_mark, self.features), self.default)
+
+    def generate_move_with_cot(self, observation: str, player_mark: str = "X", **kwargs):
+        """选择adapter后交给 QwenWrapper.generate_move_with_cot，其余参数（如草稿参数）原样传递"""
+        name = self.route(observation, player_mark)
+        with self._lock:
+            self.usage[name] += 1
+            self.wrapper.model.set_adapter(self._peft_names[name])
+            return self.wrapper.generate_move_with_cot(observation, player_mark, **kwargs)
+
+
+def main():
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description='Learn and inspect difficulty-aware CoT adapter routing tables')
+    parser.add_argument('command', choices=['learn', 'show'])
+    parser.add_argument('paths', nargs='+', help='learn: evaluation_*.json files (globs allowed); show: routing table')
+    parser.add_argument('--features', type=str, default=','.join(DEFAULT_FEATURES),
+                        help=f'Comma-separated position features: {", ".join(FEATURES)}')
+    parser.add_argument('--tolerance', type=float, default=0.0, help='Allowed per-class accuracy drop (0-1)')
+    parser.add_argument('--min-cases', type=int, default=20, help='Classes with fewer cases use the default adapter')
+    parser.add_argument('--tokenizer', type=str, default=None, help='Measure output length in tokens with this tokenizer')
+    parser.add_argument('--output', type=str, default=None, help='Where to write the learned routing table')
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        with open(args.paths[0], 'r', encoding='utf-8') as f:
+            table = json.load(f)
+    else:
+        files = sorted({path for pattern in args.paths for path in glob.glob(pattern)})
+        length_fn = len
+        if args.tokenizer:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(args.tokenizer, trust_remote_code=True)
+            length_fn = lambda text: len(tokenizer(text)["input_ids"])
+        features = [name.strip() for name in args.features.split(',') if name.strip()]
+        unknown = [name for name in features if name not in FEATURES]
+        if unknown:
+            parser.error(f"未知特征: {unknown}")
+        table = learn_routing_table(files, features, args.tolerance, args.min_cases, length_fn)
+        if args.output:
+            os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(table, f, ensure_ascii=False, indent=2)
+            print(f"💾 路由表已保存到: {args.output}")
+
+    print(f"🧭 特征: {', '.join(table['features'])} | 默认adapter: {table['default']}")
+    for label, name in table["routes"].items():
+        stats = table["class_stats"][label][name]
+        print(f"  {label:<45} -> {name:<10} 准确率 {stats['accuracy']:.0%}（{stats['cases']} 例）")
+    estimate = table["estimate"]
+    print(f"📊 路由: 准确率 {estimate['routed_accuracy']:.1%}，平均输出 {estimate['routed_mean_output_length']:.0f} | "
+          f"默认adapter: 准确率 {estimate['default_accuracy']:.1%}，平均输出 {estimate['default_mean_output_length']:.0f}"
+          f"（{estimate['cases']} 例，样本内估计）")
+    if "loo_routed_accuracy" in estimate:
+        print(f"📊 路由（留一法）: 准确率 {estimate['loo_routed_accuracy']:.1%}，"
+              f"平均输出 {estimate['loo_routed_mean_output_length']:.0f}")
+
+
+if __name__ == "__main__":
+    main()
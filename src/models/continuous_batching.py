@@ -0,0 +1,285 @@
+"""
+连续批处理（iteration-level batching）生成调度器
+
+静态批次（QwenWrapper.generate_batch、MultiOptimalEvaluator）中，60个token就结束的tiny CoT
+要陪同一批里需要1500个token的ultra_long一起等到最后。ContinuousBatchingScheduler 在每个解码步:
+
+1. 把排队的请求接纳进运行中的批次（单独prefill，得到该序列自己的KV缓存）
+2. 把运行中各序列的KV缓存左侧补齐后拼成一批，前向一步，每个序列各采样一个token
+3. 把结果缓存按序列切回，已生成EOS或达到 max_new_tokens 的序列立即移出并返回结果
+
+每个序列保留自己的生成参数（max_new_tokens / temperature / do_sample），不同参数的请求可以同批解码。
+只依赖 PyTorch 和 transformers 的 forward(past_key_values=...) 接口，CPU上用小模型即可运行和测试。
+缓存每步重新拼接一次，开销与运行中的缓存总量成正比；适用于本项目这种短prompt、CoT长度差异大的场景。
+
+接口与 QwenWrapper.generate_batch 相同:
+    scheduler = ContinuousBatchingScheduler(model, tokenizer, max_batch_size=32)
+    responses = scheduler.generate_batch(prompts, max_new_tokens=300, temperature=0.7, do_sample=True)
+    future = scheduler.submit(prompt, max_new_tokens=60)   # 单条请求，返回 concurrent.futures.Future
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+import torch
+
+try:
+    from transformers import DynamicCache
+except ImportError:  # 旧版本transformers只接受tuple格式的缓存
+    DynamicCache = None
+
+
+class _Sequence:
+    """运行中的一条生成请求及其KV缓存"""
+
+    __slots__ = ('prompt_ids', 'max_new_tokens', 'temperature', 'do_sample', 'future',
+                 'generated', 'cache', 'length', 'enqueued')
+
+    def __init__(self, prompt_ids: List[int], max_new_tokens: int, temperature: float, do_sample: bool):
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.do_sample = do_sample
+        self.future = Future()
+        self.generated = []  # 已采样的token（最后一个尚未写入缓存）
+        self.cache = None  # 每层 (key, value)，形状 (1, heads, length, head_dim)
+        self.length = 0  # 缓存中的token数
+        self.enqueued = time.monotonic()
+
+
+def _cache_layers(past) -> List[tuple]:
+    """把模型返回的缓存（DynamicCache或tuple）转为每层 (key, value) 列表"""
+    if hasattr(past, 'to_legacy_cache'):
+        past = past.to_legacy_cache()
+    elif hasattr(past, 'layers'):
+        past = [(layer.keys, layer.values) for layer in past.layers]
+    return [(key, value) for key, value in past]
+
+
+def _make_cache(layers: List[tuple]):
+    """每层 (key, value) 列表转为模型接受的缓存格式"""
+    if DynamicCache is None:
+        return tuple(layers)
+    if hasattr(DynamicCache, 'from_legacy_cache'):
+        return DynamicCache.from_legacy_cache(tuple(layers))
+    cache = DynamicCache()
+    for layer_idx, (key, value) in enumerate(layers):
+        cache.update(key, value, layer_idx)
+    return cache
+
+
+def repeat_cache(past, k: int):
+    """把模型返回的缓存中每条序列复制k份（batch维相邻排列），返回模型接受的缓存格式
+
+    用于同一prompt只prefill一次、再展开为k条序列一起解码
+    """
+    return _make_cache([(key.repeat_interleave(k, dim=0), value.repeat_interleave(k, dim=0))
+                        for key, value in _cache_layers(past)])
+
+
+def _pad_left(tensor: torch.Tensor, length: int) -> torch.Tensor:
+    """在序列维（dim=2）左侧补零到length"""
+    missing = length - tensor.shape[2]
+    if missing == 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[2] = missing
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=2)
+
+
+class ContinuousBatchingScheduler:
+    """逐解码步接纳/移出序列的生成调度器（后台线程执行，线程安全）"""
+
+    def __init__(self, model, tokenizer, max_batch_size: int = 32, eos_token_id=None):
+        """
+        Args:
+            model: transformers因果语言模型（含PeftModel），需支持 past_key_values / position_ids
+            tokenizer: 对应的tokenizer
+            max_batch_size: 同时解码的序列数上限，其余请求排队，有序列结束时在下一步接纳
+            eos_token_id: 结束token（int或列表），默认取 generation_config / tokenizer 的设置
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        generation_config = getattr(model, 'generation_config', None)
+        if eos_token_id is None:
+            eos_token_id = getattr(generation_config, 'eos_token_id', None)
+        if eos_token_id is None:
+            eos_token_id = tokenizer.eos_token_id
+        if eos_token_id is None:
+            eos_token_id = []
+        self.eos_token_ids = set(eos_token_id if isinstance(eos_token_id, (list, tuple)) else [eos_token_id])
+        # 与 model.generate 一致，采样时沿用模型自带的 top_k / top_p
+        self.top_k = getattr(generation_config, 'top_k', None) or 0
+        self.top_p = getattr(generation_config, 'top_p', None) or 1.0
+        self.device = next(model.parameters()).device
+
+        self._incoming = queue.Queue()
+        self._waiting = deque()
+        self._running: List[_Sequence] = []
+        self._closing = False
+        self._closed = False
+        self._stats = {"steps": 0, "admitted": 0, "finished": 0, "tokens": 0, "running_sum": 0, "max_running": 0}
+        self._stats_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name="continuous-batching", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt: str, max_new_tokens: int = 300, temperature: float = 0.7, do_sample: bool = True) -> Future:
+        """提交一条prompt，Future的结果为新生成部分的文本"""
+        if self._closed:
+            raise RuntimeError("调度器已关闭")
+        prompt_ids = self.tokenizer(prompt, return_tensors="pt", truncation=True)["input_ids"][0].tolist()
+        sequence = _Sequence(prompt_ids, max_new_tokens, temperature, do_sample)
+        self._incoming.put(sequence)
+        return sequence.future
+
+    def generate_batch(self, prompts: List[str], max_new_tokens: int = 300, temperature: float = 0.7,
+                       do_sample: bool = True) -> List[str]:
+        """与 QwenWrapper.generate_batch 相同的接口；各条结果按prompt顺序返回"""
+        futures = [self.submit(prompt, max_new_tokens, temperature, do_sample) for prompt in prompts]
+        return [future.result() for future in futures]
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        running_sum = stats.pop("running_sum")
+        stats["mean_running"] = round(running_sum / stats["steps"], 3) if stats["steps"] else 0.0
+        stats["waiting"] = self._incoming.qsize() + len(self._waiting)
+        return stats
+
+    def close(self):
+        """停止接收请求，生成完已提交的请求后退出"""
+        if not self._closed:
+            self._closed = True
+            self._incoming.put(None)
+            self._thread.join()
+
+    def _loop(self):
+        while True:
+            if not self._running and not self._waiting:
+                if self._closing:
+                    break
+                self._receive(self._incoming.get())  # 空闲时阻塞等待
+            while True:
+                try:
+                    self._receive(self._incoming.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.step()
+            except Exception as e:
+                # 前向出错时让当前批次和排队中的请求都得到异常，调度器继续服务后续请求
+                for sequence in self._running + list(self._waiting):
+                    if not sequence.future.done():
+                        sequence.future.set_exception(e)
+                self._running, self._waiting = [], deque()
+
+    def _receive(self, sequence: Optional[_Sequence]):
+        if sequence is None:
+            self._closing = True
+        else:
+            self._waiting.append(sequence)
+
+    @torch.no_grad()
+    def step(self):
+        """接纳排队的序列，所有运行中的序列解码一个token，移出已结束的序列"""
+        while self._waiting and len(self._running) < self.max_batch_size:
+            sequence = self._waiting.popleft()
+            if sequence.max_new_tokens <= 0:
+                self._finish(sequence)
+                continue
+            try:
+                self._prefill(sequence)
+            except Exception as e:
+                sequence.future.set_exception(e)
+        self._evict()
+        if not self._running:
+            return
+
+        batch = self._running
+        max_length = max(sequence.length for sequence in batch)
+        layers = [
+            (torch.cat([_pad_left(sequence.cache[layer][0], max_length) for sequence in batch]),
+             torch.cat([_pad_left(sequence.cache[layer][1], max_length) for sequence in batch]))
+            for layer in range(len(batch[0].cache))
+        ]
+        attention_mask = torch.zeros((len(batch), max_length + 1), dtype=torch.long, device=self.device)
+        for i, sequence in enumerate(batch):
+            attention_mask[i, max_length - sequence.length:] = 1
+        input_ids = torch.tensor([[sequence.generated[-1]] for sequence in batch], device=self.device)
+        position_ids = torch.tensor([[sequence.length] for sequence in batch], device=self.device)
+
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+                             past_key_values=_make_cache(layers), use_cache=True)
+        next_tokens = self._sample(outputs.logits[:, -1, :], batch)
+
+        new_layers = _cache_layers(outputs.past_key_values)
+        for i, sequence in enumerate(batch):
+            start = max_length - sequence.length  # 去掉左侧补齐部分
+            sequence.cache = [(key[i:i + 1, :, start:], value[i:i + 1, :, start:]) for key, value in new_layers]
+            sequence.length += 1
+            sequence.generated.append(next_tokens[i])
+
+        with self._stats_lock:
+            self._stats["steps"] += 1
+            self._stats["tokens"] += len(batch)
+            self._stats["running_sum"] += len(batch)
+            self._stats["max_running"] = max(self._stats["max_running"], len(batch))
+        self._evict()
+
+    def _prefill(self, sequence: _Sequence):
+        """单独编码prompt，建立该序列的KV缓存并采样第一个token"""
+        input_ids = torch.tensor([sequence.prompt_ids], device=self.device)
+        outputs = self.model(input_ids=input_ids, use_cache=True)
+        sequence.cache = _cache_layers(outputs.past_key_values)
+        sequence.length = len(sequence.prompt_ids)
+        sequence.generated.append(self._sample(outputs.logits[:, -1, :], [sequence])[0])
+        self._running.append(sequence)
+        with self._stats_lock:
+            self._stats["admitted"] += 1
+            self._stats["tokens"] += 1
+
+    def _sample(self, logits: torch.Tensor, batch: List[_Sequence]) -> List[int]:
+        """每行按该序列自己的参数选择下一个token（贪心或温度采样）"""
+        logits = logits.float()
+        tokens = logits.argmax(dim=-1)
+        sampled_rows = [i for i, sequence in enumerate(batch) if sequence.do_sample and sequence.temperature > 0]
+        if sampled_rows:
+            rows = torch.tensor(sampled_rows, device=logits.device)
+            temperatures = torch.tensor([batch[i].temperature for i in sampled_rows], device=logits.device)
+            scores = logits[rows] / temperatures.unsqueeze(1)
+            if self.top_k and self.top_k < scores.shape[-1]:
+                kth = torch.topk(scores, self.top_k, dim=-1).values[:, -1:]
+                scores = scores.masked_fill(scores < kth, float('-inf'))
+            if self.top_p < 1.0:
+                sorted_scores, order = torch.sort(scores, descending=True, dim=-1)
+                cumulative = sorted_scores.softmax(dim=-1).cumsum(dim=-1)
+                # 保留累计概率达到top_p所需的最少token（至少一个）
+                remove = cumulative - sorted_scores.softmax(dim=-1) >= self.top_p
+                scores = scores.scatter(-1, order, sorted_scores.masked_fill(remove, float('-inf')))
+            tokens[rows] = torch.multinomial(scores.softmax(dim=-1), 1).squeeze(1)
+        return tokens.tolist()
+
+    def _evict(self):
+        """移出已结束的序列并返回结果"""
+        still_running = []
+        for sequence in self._running:
+            if sequence.generated[-1] in self.eos_token_ids or len(sequence.generated) >= sequence.max_new_tokens:
+                self._finish(sequence)
+            else:
+                still_running.append(sequence)
+        self._running = still_running
+
+    def _finish(self, sequence: _Sequence):
+        sequence.cache = None
+        if not sequence.generated:
+            sequence.future.set_result("")
+            return
+        text = self.tokenizer.decode(sequence.generated, skip_special_tokens=True)
+        sequence.future.set_result(text.strip())
+        with self._stats_lock:
+            self._stats["finished"] += 1
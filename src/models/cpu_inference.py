@@ -0,0 +1,58 @@
+"""
+CPU推理: 线性层动态int8量化与线程设置
+
+没有GPU时 QwenWrapper 以float32加载，0.5B模型每个token都要读一遍约2GB权重，CPU节点基本跑不动。
+这里用 PyTorch 的动态量化（torch.ao.quantization.quantize_dynamic）把所有 nn.Linear 的权重转为int8，
+激活在运行时按批动态量化，权重读取量和矩阵乘开销约为float32的1/4；embedding和LayerNorm保持float32。
+LoRA模型先合并adapter（merge_and_unload）再量化，否则LoRA的旁路层不会被量化。
+
+线程数默认取本进程可用的CPU核数（OMP_NUM_THREADS 已设置时以它为准）；同一台机器上运行多个
+推理进程时请为每个进程指定 --cpu-threads，避免线程超额订阅。
+
+用法:
+    wrapper = QwenWrapper(model_path, cpu_int8=True, cpu_threads=16)
+    python src/models/inference_server.py --model tiny=models/qwen_tiny_cot_lora --lora-base qwen --cpu-int8
+    python evaluation/cpu_int8_benchmark.py --model-path models/qwen_tiny_cot_lora --test-set ... # 精度与吞吐对比
+"""
+
+import io
+import os
+from typing import Optional
+
+import torch
+
+
+def configure_cpu_threads(num_threads: Optional[int] = None) -> int:
+    """设置PyTorch的计算线程数（算子内并行），返回实际使用的线程数
+
+    解码是一串依赖的小矩阵乘，算子间并行没有收益，interop线程固定为1
+    """
+    if not num_threads:
+        env_threads = os.environ.get("OMP_NUM_THREADS")
+        if env_threads and env_threads.isdigit():
+            num_threads = int(env_threads)
+        elif hasattr(os, 'sched_getaffinity'):
+            num_threads = len(os.sched_getaffinity(0))  # 容器/taskset限制后的可用核数
+        else:
+            num_threads = os.cpu_count() or 1
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # 已有并行任务运行后不能再修改interop线程数
+    return torch.get_num_threads()
+
+
+def quantize_int8(model):
+    """把模型的全部 nn.Linear 动态量化为int8（原地修改CPU上的float32模型），返回量化后的模型"""
+    if hasattr(model, 'merge_and_unload'):
+        model = model.merge_and_unload()  # PeftModel: 先把LoRA合并进基础权重
+    model = model.float().eval()
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def model_size_mb(model) -> float:
+    """模型state_dict序列化后的大小（MB），量化后的打包权重也计算在内"""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return round(buffer.tell() / (1024 ** 2), 1)
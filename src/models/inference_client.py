@@ -0,0 +1,190 @@
+"""
+本地推理服务（models.inference_server）的客户端
+
+只依赖标准库，self-play进程不需要安装torch/transformers。RemoteModel 提供与 QwenWrapper 相同的
+is_loaded / generate_move_with_cot 接口，QwenAgent(inference_server=地址) 用它代替本地模型。
+带 a 前缀的方法（amove / agenerate / agenerate_move_with_cot）基于asyncio，供 AsyncSelfPlayRunner
+在一个线程里同时挂起成百上千个请求。
+
+地址格式: "http://127.0.0.1:8765" 或 "unix:///tmp/qwen.sock"
+
+用法（压测，N个并发客户端）:
+    python src/models/inference_client.py bench --address http://127.0.0.1:8765 --clients 32 --requests 20
+"""
+
+import asyncio
+import http.client
+import json
+import os
+import socket
+import sys
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self._socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._socket_path)
+
+
+class InferenceClient:
+    """推理服务的JSON客户端（每次请求一个连接，可在多线程中共享）"""
+
+    def __init__(self, address: str, timeout: float = 600.0):
+        self.address = address
+        self.timeout = timeout
+        parsed = urlparse(address)
+        if parsed.scheme == "unix":
+            self._socket_path = parsed.path
+            self._host = None
+        elif parsed.scheme == "http":
+            self._socket_path = None
+            self._host, self._port = parsed.hostname, parsed.port or 80
+        else:
+            raise ValueError(f"不支持的推理服务地址: {address}")
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self._socket_path:
+            return _UnixHTTPConnection(self._socket_path, self.timeout)
+        return http.client.HTTPConnection(self._host, self._port, timeout=self.timeout)
+
+    def _request(self, method: str, path: str, payload: Optional[Dict] = None) -> Dict:
+        connection = self._connection()
+        try:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else None
+            headers = {"Content-Type": "application/json"} if body is not None else {}
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            data = json.loads(response.read() or b"{}")
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise RuntimeError(f"推理服务返回 {response.status}: {data.get('error')}")
+        return data
+
+    async def _arequest(self, method: str, path: str, payload: Optional[Dict] = None) -> Dict:
+        """_request 的asyncio版本（服务端按HTTP/1.0应答，读到连接关闭即为完整响应）"""
+        if self._socket_path:
+            opening = asyncio.open_unix_connection(self._socket_path)
+        else:
+            opening = asyncio.open_connection(self._host, self._port)
+        reader, writer = await asyncio.wait_for(opening, self.timeout)
+        try:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else b""
+            header = (f"{method} {path} HTTP/1.0\r\nHost: localhost\r\n"
+                      f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n")
+            writer.write(header.encode('ascii') + body)
+            await writer.drain()
+            raw = await asyncio.wait_for(reader.read(), self.timeout)
+        finally:
+            writer.close()
+        head, _, content = raw.partition(b"\r\n\r\n")
+        status = int(head.split(None, 2)[1]) if head else 0
+        data = json.loads(content or b"{}")
+        if status != 200:
+            raise RuntimeError(f"推理服务返回 {status}: {data.get('error')}")
+        return data
+
+    def generate(self, prompts: List[str], model: Optional[str] = None, **params) -> List[str]:
+        return self._request("POST", "/generate", {"model": model, "prompts": prompts, "params": params})["responses"]
+
+    def move(self, observation: str, player_mark: str, model: Optional[str] = None, **params) -> Tuple[str, str]:
+        moves = self._request("POST", "/move", {"model": model, "observations": [observation],
+                                                "player_marks": [player_mark], "params": params})["moves"]
+        cot, action = moves[0]
+        return cot, action
+
+    async def agenerate(self, prompts: List[str], model: Optional[str] = None, **params) -> List[str]:
+        data = await self._arequest("POST", "/generate", {"model": model, "prompts": prompts, "params": params})
+        return data["responses"]
+
+    async def amove(self, observation: str, player_mark: str, model: Optional[str] = None, **params) -> Tuple[str, str]:
+        data = await self._arequest("POST", "/move", {"model": model, "observations": [observation],
+                                                      "player_marks": [player_mark], "params": params})
+        cot, action = data["moves"][0]
+        return cot, action
+
+    def metrics(self) -> Dict:
+        return self._request("GET", "/metrics")
+
+    def health(self) -> Dict:
+        return self._request("GET", "/health")
+
+
+class RemoteModel:
+    """通过推理服务生成落子的模型代理（与 QwenWrapper 接口相同）"""
+
+    def __init__(self, address: str, model: Optional[str] = None, **params):
+        self.client = InferenceClient(address)
+        self.model = model
+        self.params = params
+        try:
+            models = self.client.health()["models"]
+            self.is_loaded = model is None or model in models
+            if not self.is_loaded:
+                print(f"⚠️  推理服务上没有模型 {model}（可用: {', '.join(models)}）")
+        except (OSError, RuntimeError) as e:
+            print(f"⚠️  无法连接推理服务 {address}: {e}")
+            self.is_loaded = False
+
+    def generate_move_with_cot(self, observation: str, player_mark: str = "X") -> Tuple[str, str]:
+        """返回 (cot, action)"""
+        return self.client.move(observation, player_mark, self.model, **self.params)
+
+    async def agenerate_move_with_cot(self, observation: str, player_mark: str = "X") -> Tuple[str, str]:
+        """generate_move_with_cot 的asyncio版本"""
+        return await self.client.amove(observation, player_mark, self.model, **self.params)
+
+
+def main():
+    """压测：N个线程各发送若干条 /move 请求，报告客户端延迟和服务端批处理指标"""
+    import argparse
+    import threading
+    import time
+
+    from utils.mock_env import render_observation
+
+    parser = argparse.ArgumentParser(description='Load test the local inference server')
+    parser.add_argument('command', choices=['bench'])
+    parser.add_argument('--address', type=str, default='http://127.0.0.1:8765')
+    parser.add_argument('--model', type=str, default=None)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=20, help='Requests per client')
+    args = parser.parse_args()
+
+    client = InferenceClient(args.address)
+    observation = render_observation([' '] * 9, 0)
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(args.requests):
+            start = time.monotonic()
+            client.move(observation, "X", args.model)
+            with lock:
+                latencies.append((time.monotonic() - start) * 1000)
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=worker) for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    latencies.sort()
+    print(f"📊 {len(latencies)} 请求 / {elapsed:.2f}s = {len(latencies) / elapsed:.1f} req/s，"
+          f"客户端延迟 p50 {latencies[len(latencies) // 2]:.1f}ms，p95 {latencies[int(len(latencies) * 0.95)]:.1f}ms")
+    print(json.dumps(client.metrics(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,461 @@
+"""
+本地微批推理服务
+
+每个模型/LoRA adapter在服务进程中只加载一份 QwenWrapper；多个self-play进程（或线程）通过
+localhost HTTP 或 Unix socket 发送请求，服务按模型把请求合并成批次调用 generate_batch：
+
+- 批次策略: 第一个请求到达后最多等待 max_wait_ms 或凑满 max_batch_size 个即发出；
+  生成参数（max_new_tokens / temperature / do_sample）不同的请求不会合并到同一批
+- 连续批处理（--continuous-batching N）: 后端带 ContinuousBatchingScheduler 时请求逐条转交调度器，
+  在下一个解码步加入运行中的批次，不等待之前的批次生成完；不同生成参数的请求也可同批解码
+- 指标: GET /metrics 返回每个模型的请求数、批次数、批大小分布、排队/生成/端到端延迟分位数和吞吐量
+
+接口（JSON）:
+    POST /generate  {"model": 名称, "prompts": [...], "params": {...}}          -> {"responses": [...]}
+    POST /move      {"model": 名称, "observations": [...], "player_marks": [...]} -> {"moves": [[cot, action], ...]}
+    GET  /metrics, GET /health
+
+客户端见 models.inference_client（QwenAgent(inference_server=...) 使用它）。
+
+用法:
+    python src/models/inference_server.py --model qwen=/path/to/qwen --model tiny=/path/to/qwen_tiny_cot_lora \\
+        --lora-base /path/to/qwen --port 8765 --max-batch-size 32 --max-wait-ms 5
+    python src/models/inference_server.py --stand-in --socket /tmp/qwen.sock   # 无GPU时的替身模型
+"""
+
+import json
+import os
+import queue
+import re
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+GENERATION_PARAMS = ("max_new_tokens", "temperature", "do_sample")
+_LATENCY_WINDOW = 10000  # 计算延迟分位数时保留的最近样本数
+_THROUGHPUT_WINDOW = 10.0  # 近期吞吐量的统计窗口（秒）
+
+
+class StandInModel:
+    """与 QwenWrapper 接口相同的替身模型：总是选择第一个可用位置
+
+    用于在没有GPU/transformers的环境中端到端测试服务；latency_ms / per_item_ms 模拟
+    一次 generate 调用的固定开销和每条样本的边际开销，以体现批处理的效果。
+    """
+
+    is_loaded = True
+
+    def __init__(self, latency_ms: float = 0.0, per_item_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.per_item_ms = per_item_ms
+        self.batch_sizes = []
+
+    def build_prompt(self, observation: str, player_mark: str = "X") -> str:
+        return f"你的角色是{player_mark}。\n当前游戏状态：\n{observation}\n开始分析："
+
+    def generate_batch(self, prompts: List[str], max_new_tokens: int = 300, temperature: float = 0.7,
+                       do_sample: bool = True) -> List[str]:
+        self.batch_sizes.append(len(prompts))
+        time.sleep((self.latency_ms + self.per_item_ms * len(prompts)) / 1000)
+        responses = []
+        for prompt in prompts:
+            moves = re.findall(r'\[(\d+)\]', prompt.split("Available Moves:")[-1]) if "Available Moves:" in prompt else []
+            move = moves[0] if moves else "0"
+            responses.append(f"思考过程：\n1. 替身模型选择第一个可用位置\n\n答案: [{move}]")
+        return responses
+
+    def parse_response(self, response: str, observation: str) -> Tuple[str, str]:
+        match = re.search(r'答案\s*:\s*\[(\d+)\]', response)
+        return response.split("答案:")[0].strip(), match.group(1) if match else "0"
+
+
+class _Request:
+    __slots__ = ('prompt', 'params', 'future', 'enqueued')
+
+    def __init__(self, prompt: str, params: Tuple):
+        self.prompt = prompt
+        self.params = params
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+def _percentiles(values) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"p50": round(pick(0.50), 3), "p95": round(pick(0.95), 3), "p99": round(pick(0.99), 3),
+            "max": round(ordered[-1], 3)}
+
+
+class BatchMetrics:
+    """单个模型的批处理与延迟统计（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.batch_sizes = Counter()
+        self.queue_wait_ms = deque(maxlen=_LATENCY_WINDOW)
+        self.generate_ms = deque(maxlen=_LATENCY_WINDOW)
+        self.latency_ms = deque(maxlen=_LATENCY_WINDOW)
+        self._completions = deque()  # (完成时间, 请求数)，用于近期吞吐量
+
+    def record_batch(self, requests: List[_Request], started: float, finished: float, failed: bool):
+        with self._lock:
+            self.batches += 1
+            self.requests += len(requests)
+            self.errors += len(requests) if failed else 0
+            self.batch_sizes[len(requests)] += 1
+            self.generate_ms.append((finished - started) * 1000)
+            for request in requests:
+                self.queue_wait_ms.append((started - request.enqueued) * 1000)
+                self.latency_ms.append((finished - request.enqueued) * 1000)
+            self._completions.append((finished, len(requests)))
+            while self._completions and self._completions[0][0] < finished - _THROUGHPUT_WINDOW:
+                self._completions.popleft()
+
+    def snapshot(self, queue_depth: int = 0) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            uptime = now - self.started
+            window = min(_THROUGHPUT_WINDOW, uptime) or 1e-9
+            recent = sum(count for finished, count in self._completions if finished >= now - _THROUGHPUT_WINDOW)
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "errors": self.errors,
+                "queue_depth": queue_depth,
+                "mean_batch_size": round(self.requests / self.batches, 3) if self.batches else 0.0,
+                "batch_size_histogram": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                "queue_wait_ms": _percentiles(self.queue_wait_ms),
+                "generate_ms": _percentiles(self.generate_ms),
+                "latency_ms": _percentiles(self.latency_ms),
+                "throughput_rps": round(self.requests / uptime, 3) if uptime > 0 else 0.0,
+                "recent_throughput_rps": round(recent / window, 3),
+            }
+
+
+class MicroBatcher:
+    """把单条prompt请求合并成批次，由一个后台线程串行调用 backend.generate_batch"""
+
+    def __init__(self, backend, max_batch_size: int = 32, max_wait_ms: float = 5.0, name: str = "model"):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self.metrics = BatchMetrics()
+        self._queue = queue.Queue()
+        self._carry = deque()  # 生成参数与当前批次不同、留待下一批的请求
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt: str, params: Optional[Dict] = None) -> Future:
+        if self._closed:
+            raise RuntimeError(f"模型 {self.name} 的批处理器已关闭")
+        request = _Request(prompt, tuple(sorted((params or {}).items())))
+        self._queue.put(request)
+        return request.future
+
+    def close(self):
+        """停止接收请求，处理完已排队的请求后退出"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def _next_batch(self) -> Optional[List[_Request]]:
+        first = self._carry.popleft() if self._carry else self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        for request in [r for r in self._carry if r.params == first.params][:self.max_batch_size - 1]:
+            self._carry.remove(request)
+            batch.append(request)
+
+        deadline = first.enqueued + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)  # 当前批次处理完后再退出
+                break
+            if request.params == first.params:
+                batch.append(request)
+            else:
+                self._carry.append(request)
+        return batch
+
+    def _loop(self):
+        scheduler = getattr(self.backend, 'scheduler', None)
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            if scheduler is not None:
+                for request in batch:
+                    self._forward(scheduler, request)
+                continue
+            started = time.monotonic()
+            try:
+                responses = self.backend.generate_batch([r.prompt for r in batch], **dict(batch[0].params))
+                failed = False
+            except Exception as e:
+                responses, failed = e, True
+            finished = time.monotonic()
+            self.metrics.record_batch(batch, started, finished, failed)
+            for i, request in enumerate(batch):
+                if failed:
+                    request.future.set_exception(responses)
+                else:
+                    request.future.set_result(responses[i])
+
+        while self._carry:
+            self._carry.popleft().future.set_exception(RuntimeError("推理服务已关闭"))
+
+    def _forward(self, scheduler, request: _Request):
+        """连续批处理：把请求交给调度器，完成时回填结果（每条请求按一个批次计入指标）"""
+        started = time.monotonic()
+
+        def done(future: Future):
+            error = future.exception()
+            self.metrics.record_batch([request], started, time.monotonic(), error is not None)
+            if error is not None:
+                request.future.set_exception(error)
+            else:
+                request.future.set_result(future.result())
+
+        try:
+            scheduler.submit(request.prompt, **dict(request.params)).add_done_callback(done)
+        except Exception as e:
+            self.metrics.record_batch([request], started, time.monotonic(), True)
+            request.future.set_exception(e)
+
+
+class InferenceService:
+    """按模型名称管理后端与批处理器"""
+
+    def __init__(self, backends: Dict[str, object], max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 default_model: Optional[str] = None):
+        if not backends:
+            raise ValueError("至少需要一个模型")
+        self.backends = backends
+        self.default_model = default_model or next(iter(backends))
+        self.batchers = {name: MicroBatcher(backend, max_batch_size, max_wait_ms, name)
+                         for name, backend in backends.items()}
+        self.started = time.monotonic()
+
+    def _batcher(self, model: Optional[str]) -> MicroBatcher:
+        name = model or self.default_model
+        if name not in self.batchers:
+            raise KeyError(f"未知模型: {name}（可用: {', '.join(self.batchers)}）")
+        return self.batchers[name]
+
+    def generate(self, prompts: List[str], model: Optional[str] = None, params: Optional[Dict] = None) -> List[str]:
+        params = {key: value for key, value in (params or {}).items() if key in GENERATION_PARAMS}
+        batcher = self._batcher(model)
+        futures = [batcher.submit(prompt, params) for prompt in prompts]
+        return [future.result() for future in futures]
+
+    def move(self, observations: List[str], player_marks: List[str], model: Optional[str] = None,
+             params: Optional[Dict] = None) -> List[Tuple[str, str]]:
+        """按 QwenWrapper 的prompt格式生成并解析 (CoT, 落子)"""
+        backend = self._batcher(model).backend
+        prompts = [backend.build_prompt(observation, mark) for observation, mark in zip(observations, player_marks)]
+        responses = self.generate(prompts, model, params)
+        return [backend.parse_response(response, observation) for response, observation in zip(responses, observations)]
+
+    def metrics(self) -> Dict:
+        models = {name: batcher.metrics.snapshot(batcher._queue.qsize() + len(batcher._carry))
+                  for name, batcher in self.batchers.items()}
+        for name, backend in self.backends.items():
+            scheduler = getattr(backend, 'scheduler', None)
+            if scheduler is not None:
+                models[name]["continuous_batching"] = scheduler.stats()
+        return {
+            "uptime_s": round(time.monotonic() - self.started, 3),
+            "default_model": self.default_model,
+            "models": models,
+        }
+
+    def close(self):
+        for batcher in self.batchers.values():
+            batcher.close()
+        for backend in self.backends.values():
+            scheduler = getattr(backend, 'scheduler', None)
+            if scheduler is not None:
+                scheduler.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "TicTacToeInference/1.0"
+
+    def address_string(self):
+        return self.client_address[0] if isinstance(self.client_address, tuple) and self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        pass  # 每个请求都打印日志会拖慢服务，指标见 /metrics
+
+    def _reply(self, status: int, payload: Dict):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/metrics":
+            self._reply(200, service.metrics())
+        elif self.path == "/health":
+            self._reply(200, {"status": "ok", "models": list(service.batchers)})
+        else:
+            self._reply(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        service = self.server.service
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path == "/generate":
+                responses = service.generate(request["prompts"], request.get("model"), request.get("params"))
+                self._reply(200, {"responses": responses})
+            elif self.path == "/move":
+                moves = service.move(request["observations"], request["player_marks"], request.get("model"),
+                                     request.get("params"))
+                self._reply(200, {"moves": [list(move) for move in moves]})
+            else:
+                self._reply(404, {"error": f"unknown path {self.path}"})
+        except KeyError as e:
+            self._reply(400, {"error": str(e)})
+        except Exception as e:
+            self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+
+
+class _TCPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # 默认的5在几十个客户端同时连接时会丢弃连接
+
+
+class _UnixServer(ThreadingHTTPServer):
+    address_family = socket.AF_UNIX
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def server_bind(self):
+        socketserver.TCPServer.server_bind(self)
+        self.server_name, self.server_port = "localhost", 0
+
+
+def start_server(service: InferenceService, host: str = "127.0.0.1", port: int = 8765,
+                 socket_path: Optional[str] = None) -> Tuple[ThreadingHTTPServer, str]:
+    """在后台线程中启动HTTP服务，返回 (server, 客户端地址)；port=0 时自动选择端口"""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = _UnixServer(socket_path, _Handler)
+        address = f"unix://{socket_path}"
+    else:
+        server = _TCPServer((host, port), _Handler)
+        address = f"http://{host}:{server.server_address[1]}"
+    server.service = service
+    threading.Thread(target=server.serve_forever, name="inference-http", daemon=True).start()
+    return server, address
+
+
+def stop_server(server: ThreadingHTTPServer):
+    """停止HTTP服务和所有批处理器，删除Unix socket文件"""
+    server.shutdown()
+    server.server_close()
+    server.service.close()
+    if server.address_family == socket.AF_UNIX and os.path.exists(server.server_address):
+        os.unlink(server.server_address)
+
+
+def load_backends(specs: List[str], lora_base: Optional[str] = None, device: str = "auto",
+                  continuous_batch_size: Optional[int] = None, cpu_int8: bool = False,
+                  cpu_threads: Optional[int] = None) -> Dict[str, object]:
+    """解析 "名称=路径" 列表并加载 QwenWrapper；路径中有 adapter_config.json 时按LoRA加载
+
+    continuous_batch_size: 为每个模型创建连续批处理调度器（同时解码的序列数上限）
+    cpu_int8 / cpu_threads: 在CPU上以int8动态量化的模型服务（models.cpu_inference）
+    """
+    from models.qwen_wrapper import QwenWrapper
+
+    backends = {}
+    for spec in specs:
+        name, _, path = spec.partition('=')
+        if not path:
+            name, path = os.path.basename(os.path.normpath(spec)), spec
+        use_lora = os.path.exists(os.path.join(path, "adapter_config.json"))
+        wrapper = QwenWrapper(path, device=device, use_lora=use_lora, base_model_path=lora_base if use_lora else None,
+                              continuous_batch_size=continuous_batch_size, cpu_int8=cpu_int8, cpu_threads=cpu_threads)
+        wrapper.load_model()
+        if not wrapper.is_loaded:
+            raise RuntimeError(f"模型 {name} 加载失败: {path}")
+        backends[name] = wrapper
+        print(f"✅ 已加载模型 {name}: {path}{'（LoRA）' if use_lora else ''}")
+    return backends
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Local micro-batching inference server for self-play clients')
+    parser.add_argument('--model', action='append', default=[], help='name=path (repeatable); LoRA adapters are detected by adapter_config.json')
+    parser.add_argument('--lora-base', type=str, default=None, help='Base model path for LoRA adapters')
+    parser.add_argument('--device', type=str, default='auto')
+    parser.add_argument('--stand-in', action='store_true', help='Serve the rule-based stand-in model (no GPU needed)')
+    parser.add_argument('--stand-in-latency-ms', type=float, default=0.0, help='Simulated per-generate cost of the stand-in model')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', type=str, default=None, help='Serve on a Unix socket instead of TCP')
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--continuous-batching', type=int, default=None, metavar='N',
+                        help='Schedule generation per decode step with at most N running sequences per model')
+    parser.add_argument('--cpu-int8', action='store_true', help='Serve on CPU with int8 dynamically quantized linear layers')
+    parser.add_argument('--cpu-threads', type=int, default=None, help='Torch threads for CPU inference (default: available cores)')
+    args = parser.parse_args()
+
+    if args.stand_in:
+        backends = {"stand_in": StandInModel(latency_ms=args.stand_in_latency_ms)}
+    elif args.model:
+        backends = load_backends(args.model, args.lora_base, args.device, args.continuous_batching,
+                                 args.cpu_int8, args.cpu_threads)
+    else:
+        parser.error("需要 --model 或 --stand-in")
+
+    service = InferenceService(backends, args.max_batch_size, args.max_wait_ms)
+    server, address = start_server(service, args.host, args.port, args.socket)
+    print(f"🚀 推理服务已启动: {address}（模型: {', '.join(backends)}，max_batch_size={args.max_batch_size}，"
+          f"max_wait_ms={args.max_wait_ms}）")
+    try:
+        while True:
+            time.sleep(60)
+            for name, stats in service.metrics()["models"].items():
+                print(f"📊 {name}: {stats['requests']} 请求 / {stats['batches']} 批，平均批大小 {stats['mean_batch_size']}，"
+                      f"p95延迟 {stats['latency_ms']['p95']}ms，近期吞吐 {stats['recent_throughput_rps']} req/s")
+    except KeyboardInterrupt:
+        print("\n🛑 正在关闭推理服务...")
+    finally:
+        stop_server(server)
+
+
+if __name__ == "__main__":
+    main()
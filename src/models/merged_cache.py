@@ -0,0 +1,213 @@
+"""
+LoRA adapter合并导出与快速加载缓存
+
+QwenWrapper 和 MultiOptimalEvaluator 每次启动都要 PeftModel.from_pretrained(base, adapter)，
+推理时还要经过未合并的LoRA层（每个线性层多两次小矩阵乘）。本模块把adapter一次性合并进基础权重
+（merge_and_unload），以safetensors格式保存到按 (adapter内容, 基础模型) 哈希命名的缓存目录；
+加载方优先使用缓存，像普通模型一样加载（safetensors按内存映射读取，low_cpu_mem_usage避免额外拷贝）。
+
+缓存目录: 环境变量 QWEN_MERGED_CACHE，默认 <项目根目录>/models/merged_cache/<名称>-<哈希>/
+adapter或基础模型变化后哈希随之变化，旧缓存不会被误用。
+
+用法:
+    python src/models/merged_cache.py export --adapter models/qwen_tiny_cot_lora --base qwen
+    python src/models/merged_cache.py export --all models/ --base qwen     # 目录下的全部adapter
+    python src/models/merged_cache.py list
+    python src/models/merged_cache.py bench --adapter models/qwen_tiny_cot_lora --base qwen
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+ENV_VAR = "QWEN_MERGED_CACHE"
+INFO_FILE = "merge_info.json"
+_ADAPTER_FILES = ("adapter_config.json", "adapter_model.safetensors", "adapter_model.bin")
+_WEIGHT_SUFFIXES = (".safetensors", ".bin")
+
+
+def default_cache_dir() -> str:
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return os.environ.get(ENV_VAR) or os.path.join(project_root, "models", "merged_cache")
+
+
+def is_adapter(path: str) -> bool:
+    return os.path.exists(os.path.join(path, "adapter_config.json"))
+
+
+def adapter_fingerprint(adapter_path: str, base_model_path: str) -> str:
+    """adapter文件内容 + 基础模型（config.json内容与权重文件名/大小）的哈希
+
+    基础模型权重有数GB，不逐字节哈希；同名同大小的权重被替换时请删除缓存
+    """
+    digest = hashlib.sha256()
+    for name in _ADAPTER_FILES:
+        path = os.path.join(adapter_path, name)
+        if os.path.exists(path):
+            digest.update(name.encode('utf-8'))
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+    config_path = os.path.join(base_model_path, "config.json")
+    if os.path.exists(config_path):
+        with open(config_path, 'rb') as f:
+            digest.update(f.read())
+    for name in sorted(os.listdir(base_model_path)) if os.path.isdir(base_model_path) else []:
+        if name.endswith(_WEIGHT_SUFFIXES):
+            digest.update(f"{name}:{os.path.getsize(os.path.join(base_model_path, name))}".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def merged_checkpoint_dir(adapter_path: str, base_model_path: str, cache_dir: Optional[str] = None) -> str:
+    name = os.path.basename(os.path.normpath(adapter_path))
+    return os.path.join(cache_dir or default_cache_dir(), f"{name}-{adapter_fingerprint(adapter_path, base_model_path)}")
+
+
+def cached_merged_path(adapter_path: str, base_model_path: str, cache_dir: Optional[str] = None) -> Optional[str]:
+    """已导出的合并checkpoint目录；没有（或导出未完成）时返回None"""
+    if not (is_adapter(adapter_path) and base_model_path and os.path.isdir(base_model_path)):
+        return None
+    path = merged_checkpoint_dir(adapter_path, base_model_path, cache_dir)
+    return path if os.path.exists(os.path.join(path, INFO_FILE)) else None
+
+
+def export_merged(adapter_path: str, base_model_path: str, cache_dir: Optional[str] = None, dtype: str = "float16",
+                  force: bool = False) -> str:
+    """合并adapter并保存为safetensors checkpoint（含tokenizer），返回缓存目录
+
+    先写入临时目录，完成后改名，并行任务不会读到写了一半的checkpoint
+    """
+    import torch
+    from peft import PeftModel
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    target = merged_checkpoint_dir(adapter_path, base_model_path, cache_dir)
+    if os.path.exists(os.path.join(target, INFO_FILE)) and not force:
+        print(f"✅ 已有合并缓存: {target}")
+        return target
+
+    started = time.time()
+    print(f"🔄 合并 {adapter_path} -> {base_model_path}")
+    base_model = AutoModelForCausalLM.from_pretrained(base_model_path, torch_dtype=getattr(torch, dtype),
+                                                      low_cpu_mem_usage=True, trust_remote_code=True)
+    merged = PeftModel.from_pretrained(base_model, adapter_path).merge_and_unload()
+    tokenizer = AutoTokenizer.from_pretrained(base_model_path, trust_remote_code=True)
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=os.path.basename(target) + ".", dir=os.path.dirname(target))
+    try:
+        merged.save_pretrained(staging, safe_serialization=True)
+        tokenizer.save_pretrained(staging)
+        with open(os.path.join(staging, INFO_FILE), 'w', encoding='utf-8') as f:
+            json.dump({
+                "adapter_path": os.path.abspath(adapter_path),
+                "base_model_path": os.path.abspath(base_model_path),
+                "fingerprint": adapter_fingerprint(adapter_path, base_model_path),
+                "dtype": dtype,
+                "exported_at": datetime.now().isoformat(),
+            }, f, ensure_ascii=False, indent=2)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.replace(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    print(f"✅ 合并checkpoint已保存: {target}（{time.time() - started:.1f}s）")
+    return target
+
+
+def load_merged_model(path: str, device_map="auto", torch_dtype=None):
+    """加载合并checkpoint，返回 (model, tokenizer)；safetensors权重按内存映射读取"""
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    if torch_dtype is None:
+        torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+    tokenizer = AutoTokenizer.from_pretrained(path, trust_remote_code=True)
+    model = AutoModelForCausalLM.from_pretrained(path, torch_dtype=torch_dtype, device_map=device_map,
+                                                 low_cpu_mem_usage=True, use_safetensors=True, trust_remote_code=True)
+    return model, tokenizer
+
+
+def list_cached(cache_dir: Optional[str] = None) -> List[Dict]:
+    cache_dir = cache_dir or default_cache_dir()
+    entries = []
+    for name in sorted(os.listdir(cache_dir)) if os.path.isdir(cache_dir) else []:
+        info_path = os.path.join(cache_dir, name, INFO_FILE)
+        if os.path.exists(info_path):
+            with open(info_path, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+            stale = (not os.path.isdir(info["adapter_path"]) or
+                     adapter_fingerprint(info["adapter_path"], info["base_model_path"]) != info["fingerprint"])
+            entries.append({"path": os.path.join(cache_dir, name), "stale": stale, **info})
+    return entries
+
+
+def _bench(adapter_path: str, base_model_path: str, tokens: int):
+    """比较 PeftModel 与合并checkpoint 的冷启动时间和每token延迟（贪心解码）"""
+    import torch
+    from models.qwen_wrapper import QwenWrapper
+
+    merged_path = export_merged(adapter_path, base_model_path)
+    prompt = QwenWrapper(adapter_path).build_prompt("Game Board:\n  |   |  \n---------\n  | X |  \n---------\n  |   |  ", "O")
+    for label, use_cache in (("PeftModel", False), ("合并缓存", True)):
+        wrapper = QwenWrapper(adapter_path, use_lora=True, base_model_path=base_model_path, use_merged_cache=use_cache)
+        started = time.time()
+        wrapper.load_model()
+        load_seconds = time.time() - started
+        inputs = wrapper.tokenizer(prompt, return_tensors="pt").to(wrapper.model.device)
+        with torch.no_grad():
+            wrapper.model.generate(**inputs, max_new_tokens=4, do_sample=False)  # 预热
+            started = time.time()
+            wrapper.model.generate(**inputs, max_new_tokens=tokens, min_new_tokens=tokens, do_sample=False)
+        per_token_ms = (time.time() - started) / tokens * 1000
+        print(f"📊 {label}: 加载 {load_seconds:.2f}s，每token {per_token_ms:.2f}ms")
+        del wrapper
+    print(f"   合并缓存: {merged_path}")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Merge LoRA adapters into base weights and cache the checkpoints')
+    parser.add_argument('command', choices=['export', 'list', 'bench'])
+    parser.add_argument('--adapter', type=str, action='append', default=[], help='LoRA adapter directory (repeatable)')
+    parser.add_argument('--all', type=str, default=None, help='Export every adapter found directly under this directory')
+    parser.add_argument('--base', type=str, default=None, help='Base model path')
+    parser.add_argument('--cache-dir', type=str, default=None, help=f'Cache directory (default: ${ENV_VAR} or models/merged_cache)')
+    parser.add_argument('--dtype', type=str, default='float16', choices=['float16', 'bfloat16', 'float32'])
+    parser.add_argument('--force', action='store_true', help='Re-export even if a cached checkpoint exists')
+    parser.add_argument('--tokens', type=int, default=128, help='Tokens generated per run in bench')
+    args = parser.parse_args()
+    if args.cache_dir:
+        os.environ[ENV_VAR] = args.cache_dir  # bench中的QwenWrapper也使用同一个缓存目录
+
+    if args.command == 'list':
+        for entry in list_cached(args.cache_dir):
+            print(f"{'⚠️  过期' if entry['stale'] else '✅'} {entry['path']}  <- {entry['adapter_path']} ({entry['exported_at']})")
+        return
+
+    adapters = list(args.adapter)
+    if args.all:
+        adapters += [os.path.join(args.all, name) for name in sorted(os.listdir(args.all))
+                     if is_adapter(os.path.join(args.all, name))]
+    if not adapters or not args.base:
+        parser.error("需要 --adapter/--all 和 --base")
+
+    for adapter in adapters:
+        if args.command == 'export':
+            export_merged(adapter, args.base, args.cache_dir, args.dtype, args.force)
+        else:
+            _bench(adapter, args.base, args.tokens)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,7 @@ Qwen model wrapper for TicTacToe self-play
 import os
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM
-from typing import Tuple, Optional
+from typing import List, Tuple, Optional
 
 try:
     from peft import PeftModel
@@ -18,7 +18,18 @@ except ImportError:
 class QwenWrapper:
     """Wrapper for Qwen model to generate TicTacToe moves with CoT reasoning"""
     
-    def __init__(self, model_path: str = None, device: str = "auto", use_lora: bool = False, base_model_path: str = None):
+    def __init__(self, model_path: str = None, device: str = "auto", use_lora: bool = False, base_model_path: str = None,
+                 continuous_batch_size: Optional[int] = None, speculative_cot_length: Optional[str] = None,
+                 use_merged_cache: bool = True, cpu_int8: bool = False, cpu_threads: Optional[int] = None):
+        """
+        cpu_int8: 在CPU上以float32加载后把线性层动态量化为int8（models.cpu_inference），用于没有GPU的节点
+        cpu_threads: CPU推理的线程数，默认取可用核数
+        use_merged_cache: LoRA模型优先加载 models.merged_cache 导出的合并checkpoint（不经过PeftModel）
+        continuous_batch_size: 设置后 generate_batch 通过连续批处理调度器生成
+                               （models.continuous_batching，同时解码的序列数上限）
+        speculative_cot_length: 设置后 generate_move_with_cot 以规则智能体该长度的CoT为草稿做推测解码
+                                （models.template_speculation，适用于用模板CoT微调的模型）
+        """
         self.model_path = model_path or self._get_default_model_path()
         self.device = device
         self.use_lora = use_lora
@@ -26,6 +37,15 @@ class QwenWrapper:
         self.model = None
         self.tokenizer = None
         self.is_loaded = False
+        self.continuous_batch_size = continuous_batch_size
+        self.scheduler = None  # ContinuousBatchingScheduler（load_model后创建）
+        self.speculative_cot_length = speculative_cot_length
+        self.speculator = None  # TemplateDraftDecoder（load_model后创建）
+        self.use_merged_cache = use_merged_cache
+        self.cpu_int8 = cpu_int8
+        self.cpu_threads = cpu_threads
+        if cpu_int8:
+            self.device = "cpu"  # 动态量化的算子只有CPU实现
         
     def _get_default_model_path(self) -> str:
         """Get default model path relative to project root"""
@@ -39,10 +59,35 @@ class QwenWrapper:
         project_root = os.path.dirname(os.path.dirname(current_dir))
         return os.path.join(project_root, "qwen")
     
+    def _torch_dtype(self):
+        """GPU上用float16；CPU上用float32（int8量化也从float32权重开始）"""
+        if self.device != "cpu" and torch.cuda.is_available():
+            return torch.float16
+        return torch.float32
+    
     def load_model(self):
         """Load the Qwen model and tokenizer"""
         try:
-            if self.use_lora:
+            if self.device == "cpu" or not torch.cuda.is_available():
+                from models.cpu_inference import configure_cpu_threads
+                print(f"CPU inference threads: {configure_cpu_threads(self.cpu_threads)}")
+            
+            merged_path = None
+            if self.use_lora and self.use_merged_cache:
+                from models.merged_cache import cached_merged_path
+                merged_path = cached_merged_path(self.model_path, self.base_model_path)
+            
+            if merged_path:
+                # adapter已合并进基础权重：按普通模型加载
+                print(f"Loading merged LoRA checkpoint from: {merged_path}")
+                from models.merged_cache import load_merged_model
+                self.model, self.tokenizer = load_merged_model(
+                    merged_path,
+                    device_map=self.device,
+                    torch_dtype=self._torch_dtype()
+                )
+                
+            elif self.use_lora:
                 if not PEFT_AVAILABLE:
                     raise ImportError("PEFT not available for LoRA loading")
                 print(f"Loading LoRA model from: {self.model_path}")
@@ -57,13 +102,14 @@ class QwenWrapper:
                 # Load base model
                 base_model = AutoModelForCausalLM.from_pretrained(
                     self.base_model_path,
-                    torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-                    device_map=self.device if self.device != "auto" else "auto",
+                    torch_dtype=self._torch_dtype(),
+                    device_map=self.device,
                     trust_remote_code=True
                 )
                 
                 # Load LoRA adapter
                 self.model = PeftModel.from_pretrained(base_model, self.model_path)
+                print("💡 可运行 python src/models/merged_cache.py export 预先合并adapter，加快加载和推理")
                 
             else:
                 print(f"Loading base Qwen model from: {self.model_path}")
@@ -77,14 +123,27 @@ class QwenWrapper:
                 # Load model
                 self.model = AutoModelForCausalLM.from_pretrained(
                     self.model_path,
-                    torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-                    device_map=self.device if self.device != "auto" else "auto",
+                    torch_dtype=self._torch_dtype(),
+                    device_map=self.device,
                     trust_remote_code=True
                 )
             
             # Set pad token if not exists
             if self.tokenizer.pad_token is None:
                 self.tokenizer.pad_token = self.tokenizer.eos_token
+            
+            if self.cpu_int8:
+                from models.cpu_inference import model_size_mb, quantize_int8
+                self.model = quantize_int8(self.model)
+                print(f"Quantized linear layers to int8 ({model_size_mb(self.model)} MB)")
+                
+            if self.continuous_batch_size:
+                from models.continuous_batching import ContinuousBatchingScheduler
+                self.scheduler = ContinuousBatchingScheduler(self.model, self.tokenizer,
+                                                             max_batch_size=self.continuous_batch_size)
+            if self.speculative_cot_length:
+                from models.template_speculation import TemplateDraftDecoder
+                self.speculator = TemplateDraftDecoder(self.model, self.tokenizer)
                 
             self.is_loaded = True
             print(f"Model loaded successfully on device: {self.model.device}")
@@ -94,13 +153,16 @@ class QwenWrapper:
             print("Falling back to rule-based strategy")
             self.is_loaded = False
     
-    def generate_move_with_cot(self, observation: str, player_mark: str = "X") -> Tuple[str, str]:
+    def generate_move_with_cot(self, observation: str, player_mark: str = "X", draft_cot_length: Optional[str] = None,
+                               draft_strategy: str = 'balanced', draft_move_count: Optional[int] = None) -> Tuple[str, str]:
         """
         Generate a move with Chain of Thought reasoning
         
         Args:
             observation: Current game state description
             player_mark: "X" or "O"
+            draft_cot_length / draft_strategy: 推测解码时规则草稿的CoT长度（默认 speculative_cot_length）和策略
+            draft_move_count: 草稿CoT中的步数（本局智能体的第几步），None表示第1步
             
         Returns:
             (cot_reasoning, action) tuple
@@ -110,35 +172,58 @@ class QwenWrapper:
             return self._fallback_strategy(observation, player_mark)
         
         try:
-            # Create prompt for CoT reasoning
-            prompt = self._create_cot_prompt(observation, player_mark)
-            
-            # Generate response
-            inputs = self.tokenizer(prompt, return_tensors="pt", padding=True, truncation=True)
-            if hasattr(self.model, 'device'):
-                inputs = {k: v.to(self.model.device) for k, v in inputs.items()}
-            
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=300,
-                    temperature=0.7,
-                    do_sample=True,
-                    pad_token_id=self.tokenizer.eos_token_id
-                )
-            
-            # Decode response
-            response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            response = response[len(prompt):].strip()
+            # Create prompt for CoT reasoning and generate response
+            prompt = self.build_prompt(observation, player_mark)
+            if self.speculator is not None:
+                from models.template_drafts import render_draft
+                cot_length = draft_cot_length or self.speculative_cot_length
+                draft = render_draft(observation, cot_length, draft_strategy, move_count=draft_move_count,
+                                     player_mark=player_mark)
+                response = self.speculator.generate(prompt, draft, label=cot_length)
+            else:
+                response = self.generate_batch([prompt])[0]
             
             # Parse CoT and action
-            cot, action = self._parse_response(response, observation)
+            cot, action = self.parse_response(response, observation)
             return cot, action
             
         except Exception as e:
             print(f"Error in model generation: {e}")
             return self._fallback_strategy(observation, player_mark)
     
+    def generate_batch(self, prompts: List[str], max_new_tokens: int = 300, temperature: float = 0.7,
+                       do_sample: bool = True) -> List[str]:
+        """一次 generate 调用为一批prompt生成回复（左侧padding），只返回新生成的部分
+
+        启用连续批处理时，各条prompt交给调度器，与其他调用方的请求逐解码步合并，各自结束即返回
+        """
+        if self.scheduler is not None:
+            return self.scheduler.generate_batch(prompts, max_new_tokens, temperature, do_sample)
+        self.tokenizer.padding_side = "left"
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True, truncation=True)
+        if hasattr(self.model, 'device'):
+            inputs = {k: v.to(self.model.device) for k, v in inputs.items()}
+        
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                temperature=temperature,
+                do_sample=do_sample,
+                pad_token_id=self.tokenizer.pad_token_id
+            )
+        
+        new_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+        return [text.strip() for text in self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)]
+    
+    def build_prompt(self, observation: str, player_mark: str = "X") -> str:
+        """CoT推理的prompt（推理服务按prompt合并批次）"""
+        return self._create_cot_prompt(observation, player_mark)
+    
+    def parse_response(self, response: str, observation: str) -> Tuple[str, str]:
+        """从模型回复中解析 (CoT, 落子)"""
+        return self._parse_response(response, observation)
+    
     def _create_cot_prompt(self, observation: str, player_mark: str) -> str:
         """Create a prompt for Chain of Thought reasoning"""
         prompt = f"""你是一个井字棋专家。请分析当前棋盘状态，详细思考最优落子位置。
@@ -0,0 +1,37 @@
+"""
+模板草稿推测解码的草稿渲染
+
+草稿是规则智能体为当前局面渲染的CoT，按SFT样本的输出格式拼接答案。
+本模块不依赖torch，推测解码器见 models.template_speculation。
+"""
+
+import os
+import sys
+from typing import Optional
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+_draft_agent = None
+
+
+def render_draft(observation: str, cot_length: str, strategy: str = 'balanced', seed: int = 0, agent=None,
+                 move_count: Optional[int] = None, player_mark: Optional[str] = None) -> str:
+    """规则智能体对当前局面的CoT，按SFT样本的输出格式（与 SelfPlayDataFormatter 相同）拼接答案
+
+    move_count / player_mark 为本局智能体的步数（含当前这一步）和执子方，CoT中的"第N步"与之一致；
+    不指定时按新的一局（第1步）、执子方从观察中解析
+    """
+    global _draft_agent
+    from agents.qwen_agent import GameContext, QwenAgent
+
+    if agent is None:
+        if _draft_agent is None:
+            _draft_agent = QwenAgent()
+        agent = _draft_agent
+    context = GameContext(strategy=strategy, cot_length=cot_length, seed=seed)
+    if move_count is not None:
+        context.move_count = move_count - 1  # policy 会把当前这一步计入
+    if player_mark is not None:
+        context.player_mark = player_mark
+    action, cot = agent.policy(observation, context)
+    return f"{cot}\n\n答案: [{action.strip('[]')}]"
@@ -0,0 +1,258 @@
+"""
+模板草稿推测解码（template-draft speculative decoding）
+
+微调模型是用 QwenAgent 的CoT模板文本训练的，它对某个局面的输出与规则智能体为同一局面渲染的CoT
+高度一致。TemplateDraftDecoder 把规则CoT（按SFT样本的输出格式，见 models.template_drafts.render_draft）当作草稿，
+由目标模型按块验证:
+
+- 每次前向把最多 chunk_size 个草稿token与上一个token一起送入模型，一次得到每个位置的预测
+- 与草稿一致的前缀直接接受；第一个不一致的位置改用模型自己的token，KV缓存回退到该位置
+- 失配后逐token正常解码，同时用最近 resync_ngram 个token在草稿中重新定位，对齐后恢复按块验证
+  （规则CoT里随机措辞处的分歧通常只有几个token）
+
+贪心解码时输出与逐token解码相同；采样时按推测采样规则接受草稿token（接受概率为目标分布在该token上的
+概率，拒绝时从去掉该token后的目标分布重采样），输出分布与直接采样相同（只做温度缩放，不做top-k/top-p）。
+
+每个CoT长度分别统计草稿接受率和每次前向生成的token数，见 TemplateDraftDecoder.report()。
+
+用法:
+    python src/models/template_speculation.py --model-path models/qwen_ultra_long_cot_lora --lora-base qwen \\
+        --cot-lengths tiny,medium,ultra_long --positions 16
+"""
+
+import itertools
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from models.template_drafts import render_draft
+
+
+def _crop_cache(past, length: int):
+    """把KV缓存截断到前length个位置"""
+    if hasattr(past, 'crop'):
+        past.crop(length)
+        return past
+    return tuple((key[:, :, :length], value[:, :, :length]) for key, value in past)
+
+
+class TemplateDraftDecoder:
+    """用规则CoT作草稿、目标模型按块验证的单序列解码器"""
+
+    def __init__(self, model, tokenizer, chunk_size: int = 16, resync_ngram: int = 3, eos_token_id=None):
+        """
+        Args:
+            model: transformers因果语言模型（含PeftModel）
+            tokenizer: 对应的tokenizer
+            chunk_size: 每次前向验证的草稿token数
+            resync_ngram: 失配后用最近几个token在草稿中重新定位
+            eos_token_id: 结束token（int或列表），默认取 generation_config / tokenizer 的设置
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.chunk_size = chunk_size
+        self.resync_ngram = resync_ngram
+        if eos_token_id is None:
+            eos_token_id = getattr(getattr(model, 'generation_config', None), 'eos_token_id', None)
+        if eos_token_id is None:
+            eos_token_id = tokenizer.eos_token_id
+        if eos_token_id is None:
+            eos_token_id = []
+        self.eos_token_ids = set(eos_token_id if isinstance(eos_token_id, (list, tuple)) else [eos_token_id])
+        self.device = next(model.parameters()).device
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    @torch.no_grad()
+    def generate(self, prompt: str, draft: str, max_new_tokens: int = 300, temperature: float = 0.7,
+                 do_sample: bool = True, label: Optional[str] = None) -> str:
+        """以draft为草稿为prompt生成回复（只返回新生成部分）；label为统计分组（通常是CoT长度）"""
+        started = time.perf_counter()
+        prompt_ids = self.tokenizer(prompt, return_tensors="pt", truncation=True)["input_ids"].to(self.device)
+        draft_ids = self.tokenizer(draft, add_special_tokens=False)["input_ids"]
+        sample = do_sample and temperature > 0
+
+        outputs = self.model(input_ids=prompt_ids, use_cache=True)
+        past = outputs.past_key_values
+        logits = outputs.logits[0, -1]  # 预测下一个位置；pending不为None时无效
+        cache_length = prompt_ids.shape[1]
+        pending = None  # 已生成但尚未写入缓存的token
+        draft_pos = 0  # 下一个输出位置对应的草稿下标；None表示未对齐
+        anchor = 0  # 最近一次对齐时的草稿下标，重新定位时优先从这里向后查找
+        generated: List[int] = []
+        counts = {"drafted": 0, "accepted": 0, "forward_passes": 1}
+
+        while len(generated) < max_new_tokens and not (generated and generated[-1] in self.eos_token_ids):
+            remaining = max_new_tokens - len(generated)
+            chunk = draft_ids[draft_pos:draft_pos + min(self.chunk_size, remaining)] if draft_pos is not None else []
+
+            if not chunk and pending is None:
+                # 没有可用草稿：按模型分布取下一个token，下一轮写入缓存
+                token = self._choose(logits, sample, temperature)
+                generated.append(token)
+                pending = token
+                draft_pos = self._resync(generated, draft_ids, anchor)
+                continue
+
+            inputs = ([pending] if pending is not None else []) + chunk
+            outputs = self.model(input_ids=torch.tensor([inputs], device=self.device), past_key_values=past, use_cache=True)
+            counts["forward_passes"] += 1
+            past = outputs.past_key_values
+            step_logits = outputs.logits[0]
+            if pending is not None:
+                verify_logits = step_logits[:len(chunk)]
+            else:
+                verify_logits = torch.cat([logits.unsqueeze(0), step_logits[:len(chunk) - 1]]) if chunk else step_logits[:0]
+
+            accepted, correction = 0, None
+            for j, token in enumerate(chunk):
+                ok, alternative = self._verify(verify_logits[j], token, sample, temperature)
+                if not ok:
+                    correction = alternative
+                    break
+                accepted += 1
+                if token in self.eos_token_ids:
+                    break
+            counts["drafted"] += len(chunk)
+            counts["accepted"] += accepted
+            generated.extend(chunk[:accepted])
+
+            if correction is None and accepted == len(chunk):
+                # 全部接受：缓存中已包含全部输入，最后一个位置的预测即下一个token的分布
+                cache_length += len(inputs)
+                logits = step_logits[-1]
+                pending = None
+                if draft_pos is not None:
+                    draft_pos += len(chunk)
+                    anchor = draft_pos
+            else:
+                # 回退到最后一个被接受的token（提前遇到EOS时同样截断）
+                cache_length += len(inputs) - len(chunk) + accepted
+                past = _crop_cache(past, cache_length)
+                pending = None
+                anchor = draft_pos + accepted
+                if correction is not None:
+                    generated.append(correction)
+                    pending = correction
+                    draft_pos = self._resync(generated, draft_ids, anchor)
+                else:
+                    logits = step_logits[len(inputs) - len(chunk) + accepted - 1]
+
+        if generated and generated[-1] in self.eos_token_ids:
+            generated = generated[:-1]
+        counts["generated"] = len(generated)
+        self._record(label or "default", counts, time.perf_counter() - started)
+        return self.tokenizer.decode(generated, skip_special_tokens=True).strip()
+
+    def _choose(self, logits: torch.Tensor, sample: bool, temperature: float) -> int:
+        if not sample:
+            return int(logits.argmax())
+        return int(torch.multinomial((logits.float() / temperature).softmax(dim=-1), 1))
+
+    def _verify(self, logits: torch.Tensor, token: int, sample: bool, temperature: float):
+        """返回 (是否接受草稿token, 拒绝时模型给出的替代token)"""
+        if not sample:
+            choice = int(logits.argmax())
+            return choice == token, choice
+        probs = (logits.float() / temperature).softmax(dim=-1)
+        if torch.rand(()) < probs[token]:
+            return True, token
+        probs[token] = 0
+        return False, int(torch.multinomial(probs / probs.sum(), 1))
+
+    def _resync(self, generated: List[int], draft_ids: List[int], anchor: int = 0) -> Optional[int]:
+        """在草稿中查找最近resync_ngram个token（从anchor附近开始向后，再从头），返回其后的草稿下标；
+        找不到时返回None"""
+        n = self.resync_ngram
+        if len(generated) < n:
+            return None
+        tail = generated[-n:]
+        last = len(draft_ids) - n
+        start = min(max(anchor - n, 0), max(last, 0))
+        for i in itertools.chain(range(start, last), range(0, start)):
+            if draft_ids[i:i + n] == tail:
+                return i + n
+        return None
+
+    def _record(self, label: str, counts: Dict[str, int], seconds: float):
+        stats = self.stats.setdefault(label, {"calls": 0, "drafted": 0, "accepted": 0, "generated": 0,
+                                              "forward_passes": 0, "seconds": 0.0})
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        for key, value in counts.items():
+            stats[key] += value
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """每个CoT长度的草稿接受率与每次前向生成的token数（逐token解码为1）"""
+        report = {}
+        for label, stats in self.stats.items():
+            report[label] = {
+                **{key: round(value, 4) if isinstance(value, float) else value for key, value in stats.items()},
+                "acceptance_rate": round(stats["accepted"] / stats["drafted"], 4) if stats["drafted"] else 0.0,
+                "tokens_per_forward": round(stats["generated"] / stats["forward_passes"], 3) if stats["forward_passes"] else 0.0,
+            }
+        return report
+
+
+def main():
+    """对比逐token贪心解码与模板草稿推测解码：每个CoT长度的接受率、实际加速比和输出一致性"""
+    import argparse
+    import json
+    import random
+
+    from models.qwen_wrapper import QwenWrapper
+    from utils.cot_rerender import parse_cot_lengths
+    from utils.mock_env import render_observation
+    from utils.tictactoe_oracle import _enumerate
+
+    parser = argparse.ArgumentParser(description='Template-draft speculative decoding benchmark')
+    parser.add_argument('--model-path', type=str, required=True)
+    parser.add_argument('--lora-base', type=str, default=None, help='Base model path when --model-path is a LoRA adapter')
+    parser.add_argument('--device', type=str, default='auto')
+    parser.add_argument('--cot-lengths', type=str, default='tiny,medium,ultra_long')
+    parser.add_argument('--positions', type=int, default=16, help='Random positions per CoT length')
+    parser.add_argument('--max-new-tokens', type=int, default=2048)
+    parser.add_argument('--chunk-size', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    use_lora = os.path.exists(os.path.join(args.model_path, "adapter_config.json"))
+    wrapper = QwenWrapper(args.model_path, device=args.device, use_lora=use_lora, base_model_path=args.lora_base)
+    wrapper.load_model()
+    if not wrapper.is_loaded:
+        sys.exit(1)
+    decoder = TemplateDraftDecoder(wrapper.model, wrapper.tokenizer, chunk_size=args.chunk_size)
+
+    rng = random.Random(args.seed)
+    boards = [list(board) for board in _enumerate() if ' ' in board]
+    results = {}
+    for cot_length in parse_cot_lengths(args.cot_lengths):
+        baseline_seconds, matches = 0.0, 0
+        for _ in range(args.positions):
+            board = rng.choice(boards)
+            observation = render_observation(board, 0 if board.count('X') == board.count('O') else 1)
+            mark = 'X' if board.count('X') == board.count('O') else 'O'
+            prompt = wrapper.build_prompt(observation, mark)
+
+            start = time.perf_counter()
+            expected = wrapper.generate_batch([prompt], args.max_new_tokens, do_sample=False)[0]
+            baseline_seconds += time.perf_counter() - start
+            response = decoder.generate(prompt, render_draft(observation, cot_length, seed=rng.randrange(2 ** 31)),
+                                        args.max_new_tokens, do_sample=False, label=cot_length)
+            matches += response == expected
+
+        stats = decoder.report()[cot_length]
+        results[cot_length] = {**stats, "baseline_seconds": round(baseline_seconds, 3),
+                               "speedup": round(baseline_seconds / stats["seconds"], 2) if stats["seconds"] else None,
+                               "identical_outputs": f"{matches}/{args.positions}"}
+        print(f"📊 {cot_length}: 接受率 {stats['acceptance_rate']:.1%}，每次前向 {stats['tokens_per_forward']} token，"
+              f"加速 {results[cot_length]['speedup']}x，输出一致 {matches}/{args.positions}")
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
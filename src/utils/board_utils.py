@@ -0,0 +1,104 @@
+"""
+井字棋棋盘通用工具：棋盘解析、对称变换与规范化
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+from utils.mnk import TICTACTOE, resolve_geometry
+
+# 所有获胜线路：行、列、对角线（由棋盘几何生成，顺序与原先手写的列表相同）
+WINNING_LINES = list(TICTACTOE.lines)
+
+# 棋盘的8种对称变换（二面体群D4），SYMMETRIES[t][i] 表示变换后第i格取原棋盘的哪一格
+SYMMETRIES = [
+    (0, 1, 2, 3, 4, 5, 6, 7, 8),  # 恒等
+    (6, 3, 0, 7, 4, 1, 8, 5, 2),  # 顺时针旋转90°
+    (8, 7, 6, 5, 4, 3, 2, 1, 0),  # 旋转180°
+    (2, 5, 8, 1, 4, 7, 0, 3, 6),  # 逆时针旋转90°
+    (2, 1, 0, 5, 4, 3, 8, 7, 6),  # 水平翻转
+    (6, 7, 8, 3, 4, 5, 0, 1, 2),  # 垂直翻转
+    (0, 3, 6, 1, 4, 7, 2, 5, 8),  # 主对角线翻转
+    (8, 5, 2, 7, 4, 1, 6, 3, 0),  # 副对角线翻转
+]
+
+
+def transform_board(board: List[str], transform: int) -> List[str]:
+    """对棋盘应用一次对称变换"""
+    return [board[i] for i in SYMMETRIES[transform]]
+
+
+def canonical_board(board: List[str]) -> Tuple[str, int]:
+    """返回棋盘在8种对称变换下字典序最小的表示，以及对应的变换编号"""
+    best, best_transform = None, 0
+    for t in range(len(SYMMETRIES)):
+        candidate = ''.join(transform_board(board, t))
+        if best is None or candidate < best:
+            best, best_transform = candidate, t
+    return best, best_transform
+
+
+def side_to_move(board: List[str]) -> str:
+    """根据双方棋子数量推断轮到谁（X先手）"""
+    return 'X' if board.count('X') == board.count('O') else 'O'
+
+
+def parse_board_from_observation(observation: str, geometry=None) -> Optional[List[str]]:
+    """从观察文本中解析当前棋盘，兼容TextArena（Current Board）与mock环境（Game Board）格式
+
+    geometry: 棋盘几何（utils.mnk.BoardGeometry），默认3x3。解析失败时返回None
+    """
+    geometry = resolve_geometry(geometry)
+    if not observation:
+        return None
+    lines = observation.split('\n')
+
+    # 取最后一次出现的棋盘，保证是当前状态
+    header_index = None
+    for i, line in enumerate(lines):
+        if 'Current Board:' in line or 'Game Board:' in line:
+            header_index = i
+    if header_index is None:
+        return None
+
+    rows = []
+    for line in lines[header_index + 1:]:
+        if '|' in line:
+            rows.append(line)
+        elif rows and '---' not in line:
+            break
+        if len(rows) == geometry.rows:
+            break
+    if len(rows) != geometry.rows:
+        return None
+
+    board = []
+    for row in rows:
+        cells = row.split('|')
+        if len(cells) != geometry.cols:
+            return None
+        for cell in cells:
+            cell = cell.strip()
+            board.append(cell if cell in ('X', 'O') else ' ')
+    return board
+
+
+def board_before_move(game: Dict, move_index: int) -> Optional[List[str]]:
+    """获取对局中第move_index步落子前的棋盘
+
+    优先从观察文本解析；解析失败时使用上一步记录的info.board
+    （仅当两步的turn连续，即中间没有被测试集规避过滤掉的棋步）
+    """
+    moves = game.get('moves', [])
+    move = moves[move_index]
+    board = parse_board_from_observation(move.get('observation', ''))
+    if board is not None:
+        return board
+
+    turn = move.get('turn')
+    if move_index == 0:
+        return [' '] * 9 if turn in (None, 1) else None
+    previous = moves[move_index - 1]
+    previous_board = previous.get('info', {}).get('board')
+    if previous_board and len(previous_board) == 9 and turn == previous.get('turn', 0) + 1:
+        return list(previous_board)
+    return None
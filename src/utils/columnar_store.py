@@ -0,0 +1,448 @@
+"""
+自对弈数据的压缩列式存储格式
+
+原始self-play文件以缩进JSON保存每一步的完整观察文本、CoT和info.board副本，
+体积远大于其携带的信息量。本模块提供一种紧凑的列式二进制格式 (.colz)：
+
+- 棋盘按小整数存储（0=空, 1=X, 2=O），每步一个格子一字节；每局记录棋盘大小与列数，
+  支持 4x4、5x5 等 m,n,k 棋盘
+- CoT字符串按模板族（执子方的CoT长度）做字典编码；多长度fan-out的 cot_variants 中各长度的CoT
+  使用同一组按长度划分的字典
+- 观察文本在能由棋盘重新渲染时不落盘，读取时按需再生成
+- 每一列单独压缩（安装了zstandard时用zstd，否则回退到zlib）
+
+无法套用列式结构的记录（例如TextArena格式的观察或额外字段）会原样存入
+溢出列，因此读取结果与原JSON完全一致。
+"""
+
+import json
+import os
+import re
+import struct
+import zlib
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from utils.mnk import BoardGeometry
+from utils.mock_env import render_observation
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+MAGIC = b"TTTCOLZ1"
+COLUMNAR_SUFFIX = ".colz"
+
+CELL_CODES = {' ': 0, 'X': 1, 'O': 2}
+CODE_CELLS = [' ', 'X', 'O']
+_ACTION_PATTERN = re.compile(r'^\[(0|[1-9]\d?)\]$')  # 与 f"[{action}]" 互逆，且在int8范围内
+_MOVE_KEYS = (['player', 'observation', 'action', 'turn', 'info'],
+              ['player', 'observation', 'action', 'turn', 'info', 'cot'],
+              ['player', 'observation', 'action', 'turn', 'info', 'cot_variants'],
+              ['player', 'observation', 'action', 'turn', 'info', 'cot', 'cot_variants'])
+_INFO_KEYS = ['winner', 'turn', 'board', 'game_over']
+
+# 定长数值列及其dtype
+_NUMERIC_COLUMNS = {
+    'player': np.int8,
+    'action': np.int8,
+    'turn': np.int16,
+    'info_winner': np.int8,
+    'info_turn': np.int16,
+    'info_game_over': np.int8,
+    'obs_index': np.int32,
+    'cot_family': np.int16,
+    'cot_index': np.int32,
+    'cot_variant_count': np.int16,  # 该步 cot_variants 的长度数，-1表示没有
+    'overflow': np.int32,
+}
+
+
+def _compress(payload: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(payload)
+    return zlib.compress(payload, 9)
+
+
+def _decompress(payload: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return zlib.decompress(payload)
+
+
+def encode_board(board: List[str]) -> List[int]:
+    """棋盘列表 -> 小整数编码"""
+    return [CELL_CODES[cell] for cell in board]
+
+
+def decode_board(codes) -> List[str]:
+    """小整数编码 -> 棋盘列表"""
+    return [CODE_CELLS[int(code)] for code in codes]
+
+
+class _StringDictionary:
+    """字符串字典编码"""
+
+    def __init__(self):
+        self.values = []
+        self._index = {}
+
+    def add(self, value: str) -> int:
+        if value not in self._index:
+            self._index[value] = len(self.values)
+            self.values.append(value)
+        return self._index[value]
+
+
+@lru_cache(maxsize=None)
+def _geometry(size: int, cols: int) -> Optional[BoardGeometry]:
+    """渲染观察文本用的棋盘几何（只取决于行列数）；cols为0表示无法渲染"""
+    if cols <= 0:
+        return None
+    rows = size // cols
+    return BoardGeometry(rows, cols, min(rows, cols))
+
+
+def _board_layout(game: Dict) -> Tuple[int, int]:
+    """一局的 (棋盘格子数, 列数)：格子数取第一步的 info.board；
+    列数取能把第一步观察文本原样渲染出来的那一个，都不匹配时为0（观察文本全部存储）"""
+    for move in game.get('moves', []):
+        info = move.get('info')
+        board = info.get('board') if isinstance(info, dict) else None
+        if not isinstance(board, list) or not board:
+            continue
+        size = len(board)
+        for cols in sorted((c for c in range(1, size + 1) if size % c == 0), key=lambda c: abs(c * c - size)):
+            if render_observation([' '] * size, move.get('player'), _geometry(size, cols)) == move.get('observation'):
+                return size, cols
+        return size, 0
+    return 9, 3
+
+
+def _is_standard_move(move: Dict, board_size: int = 9) -> bool:
+    """判断一步棋是否符合mock环境/SelfPlayRunner产生的标准结构（棋盘为本局的格子数）"""
+    if list(move.keys()) not in _MOVE_KEYS:
+        return False
+    info = move['info']
+    if not isinstance(info, dict) or list(info.keys()) != _INFO_KEYS:
+        return False
+    board = info['board']
+    return (
+        isinstance(board, list) and len(board) == board_size and all(cell in CELL_CODES for cell in board)
+        and move['player'] in (0, 1)
+        and isinstance(move['action'], str) and _ACTION_PATTERN.match(move['action']) is not None
+        and isinstance(move['observation'], str)
+        and isinstance(move['turn'], int) and isinstance(info['turn'], int)
+        and info['winner'] in (None, 0, 1) and isinstance(info['game_over'], bool)
+        and ('cot' not in move or isinstance(move['cot'], str))
+        and ('cot_variants' not in move or (isinstance(move['cot_variants'], dict) and all(
+            isinstance(key, str) and isinstance(value, str) for key, value in move['cot_variants'].items())))
+    )
+
+
+def _cot_family(families: _StringDictionary, dictionaries: List[_StringDictionary], name: str) -> int:
+    """模板族编号，新的模板族同时创建其CoT字典"""
+    family = families.add(name)
+    if family == len(dictionaries):
+        dictionaries.append(_StringDictionary())
+    return family
+
+
+def encode_games(games: List[Dict]) -> Dict:
+    """把游戏列表编码为 {列名: numpy数组或字符串列表}"""
+    cols = {name: [] for name in _NUMERIC_COLUMNS}
+    boards = []
+    observations = _StringDictionary()
+    overflow_records = _StringDictionary()
+    cot_families = _StringDictionary()
+    cot_dictionaries = []
+    variant_families, variant_indices = [], []
+    game_meta = []
+    move_offsets = [0]
+    board_sizes, board_cols = [], []
+
+    for game in games:
+        cot_lengths = game.get('cot_lengths') or []
+        board_size, num_cols = _board_layout(game)
+        geometry = _geometry(board_size, num_cols)
+        board_sizes.append(board_size)
+        board_cols.append(num_cols)
+        previous_board, previous_turn = [' '] * board_size, 0
+
+        for move in game.get('moves', []):
+            if not _is_standard_move(move, board_size):
+                for name in _NUMERIC_COLUMNS:
+                    if name != 'overflow':
+                        cols[name].append(-1)
+                cols['overflow'].append(overflow_records.add(json.dumps(move, ensure_ascii=False)))
+                boards.extend([0] * board_size)
+                previous_board, previous_turn = None, None
+                continue
+
+            info = move['info']
+            cols['overflow'].append(-1)
+            cols['player'].append(move['player'])
+            cols['action'].append(int(move['action'][1:-1]))
+            cols['turn'].append(move['turn'])
+            cols['info_winner'].append(-1 if info['winner'] is None else info['winner'])
+            cols['info_turn'].append(info['turn'])
+            cols['info_game_over'].append(int(info['game_over']))
+            boards.extend(encode_board(info['board']))
+
+            # 观察文本能由上一步棋盘重新渲染时不存储
+            renderable = (geometry is not None and previous_board is not None and move['turn'] == previous_turn + 1
+                          and render_observation(previous_board, move['player'], geometry) == move['observation'])
+            cols['obs_index'].append(-1 if renderable else observations.add(move['observation']))
+
+            # CoT按执子方的CoT长度（模板族）分别做字典编码
+            if 'cot' in move:
+                family_name = str(cot_lengths[move['player']]) if len(cot_lengths) == 2 else ''
+                family = _cot_family(cot_families, cot_dictionaries, family_name)
+                cols['cot_family'].append(family)
+                cols['cot_index'].append(cot_dictionaries[family].add(move['cot']))
+            else:
+                cols['cot_family'].append(-1)
+                cols['cot_index'].append(-1)
+
+            # fan-out的各长度CoT：每个长度一个字典（与同名模板族共用）
+            if 'cot_variants' in move:
+                cols['cot_variant_count'].append(len(move['cot_variants']))
+                for length, cot in move['cot_variants'].items():
+                    family = _cot_family(cot_families, cot_dictionaries, length)
+                    variant_families.append(family)
+                    variant_indices.append(cot_dictionaries[family].add(cot))
+            else:
+                cols['cot_variant_count'].append(-1)
+
+            previous_board, previous_turn = info['board'], move['turn']
+
+        move_offsets.append(len(cols['overflow']))
+        game_meta.append(json.dumps([[key, None if key == 'moves' else value] for key, value in game.items()],
+                                    ensure_ascii=False))
+
+    encoded = {name: np.asarray(cols[name], dtype=dtype) for name, dtype in _NUMERIC_COLUMNS.items()}
+    encoded['move_offsets'] = np.asarray(move_offsets, dtype=np.int64)
+    encoded['board_sizes'] = np.asarray(board_sizes, dtype=np.int16)
+    encoded['board_cols'] = np.asarray(board_cols, dtype=np.int16)
+    encoded['board'] = np.asarray(boards, dtype=np.uint8)  # 各步棋盘首尾相接，每步占本局的格子数
+    encoded['game_meta'] = game_meta
+    encoded['observations'] = observations.values
+    encoded['overflow_records'] = overflow_records.values
+    encoded['cot_variant_family'] = np.asarray(variant_families, dtype=np.int16)
+    encoded['cot_variant_index'] = np.asarray(variant_indices, dtype=np.int32)
+    encoded['cot_family_names'] = cot_families.values
+    encoded['cot_dictionaries'] = [d.values for d in cot_dictionaries]
+    return encoded
+
+
+def write_columnar(data, path: str, codec: Optional[str] = None) -> str:
+    """把原始self-play数据（带metadata的dict或游戏列表）写入.colz文件"""
+    codec = codec or ("zstd" if ZSTD_AVAILABLE else "zlib")
+    if codec == "zstd" and not ZSTD_AVAILABLE:
+        raise ImportError("zstandard未安装，无法使用zstd编码")
+
+    if isinstance(data, dict) and 'games' in data:
+        games = data['games']
+        metadata = {key: value for key, value in data.items() if key != 'games'}
+        wrapped = True
+    else:
+        games, metadata, wrapped = data, {}, False
+
+    encoded = encode_games(games)
+    columns, payloads, offset = [], [], 0
+    for name, value in encoded.items():
+        if isinstance(value, np.ndarray):
+            raw = np.ascontiguousarray(value).tobytes()
+            spec = {"name": name, "kind": "array", "dtype": value.dtype.str, "shape": list(value.shape)}
+        else:
+            raw = json.dumps(value, ensure_ascii=False).encode('utf-8')
+            spec = {"name": name, "kind": "json"}
+        payload = _compress(raw, codec)
+        spec.update({"offset": offset, "nbytes": len(payload)})
+        columns.append(spec)
+        payloads.append(payload)
+        offset += len(payload)
+
+    header = json.dumps({
+        "codec": codec,
+        "wrapped": wrapped,
+        "metadata": metadata,
+        "num_games": len(games),
+        "columns": columns,
+    }, ensure_ascii=False).encode('utf-8')
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for payload in payloads:
+            f.write(payload)
+    os.replace(tmp_path, path)
+    return path
+
+
+class ColumnarGameReader:
+    """读取.colz文件，按需解码列并重建与原JSON一致的游戏字典"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"不是列式self-play文件: {path}")
+            header_size = struct.unpack('<I', f.read(4))[0]
+            self.header = json.loads(f.read(header_size).decode('utf-8'))
+            self._data_start = len(MAGIC) + 4 + header_size
+        self.codec = self.header['codec']
+        self._specs = {spec['name']: spec for spec in self.header['columns']}
+        self._cache = {}
+
+    def __len__(self) -> int:
+        return self.header['num_games']
+
+    @property
+    def metadata(self) -> Dict:
+        return self.header['metadata']
+
+    def column(self, name: str):
+        """解码单列（结果缓存），只读取该列对应的字节"""
+        if name not in self._cache:
+            spec = self._specs[name]
+            with open(self.path, 'rb') as f:
+                f.seek(self._data_start + spec['offset'])
+                raw = _decompress(f.read(spec['nbytes']), self.codec)
+            if spec['kind'] == 'array':
+                value = np.frombuffer(raw, dtype=np.dtype(spec['dtype'])).reshape(spec['shape'])
+            else:
+                value = json.loads(raw.decode('utf-8'))
+            self._cache[name] = value
+        return self._cache[name]
+
+    def _game_boards(self, game_index: int):
+        """一局各步的棋盘编码，形状 (步数, 格子数)"""
+        offsets = self.column('move_offsets')
+        start, end = int(offsets[game_index]), int(offsets[game_index + 1])
+        if 'board_sizes' not in self._specs:  # 旧文件：定长9格的二维棋盘列
+            return self.column('board')[start:end]
+        if '_board_starts' not in self._cache:
+            sizes = self.column('board_sizes').astype(np.int64)
+            self._cache['_board_starts'] = np.concatenate([[0], np.cumsum(np.diff(offsets) * sizes)])
+        size = int(self.column('board_sizes')[game_index])
+        board_start = int(self._cache['_board_starts'][game_index])
+        return self.column('board')[board_start:board_start + (end - start) * size].reshape(end - start, size)
+
+    def _game_geometry(self, game_index: int) -> Optional[BoardGeometry]:
+        if 'board_sizes' not in self._specs:
+            return _geometry(9, 3)
+        return _geometry(int(self.column('board_sizes')[game_index]), int(self.column('board_cols')[game_index]))
+
+    def _decode_move(self, i: int, previous_board: Optional[List[str]], board_codes, geometry=None) -> Dict:
+        overflow = int(self.column('overflow')[i])
+        if overflow >= 0:
+            return json.loads(self.column('overflow_records')[overflow])
+
+        player = int(self.column('player')[i])
+        obs_index = int(self.column('obs_index')[i])
+        if obs_index < 0:
+            observation = render_observation(previous_board, player, geometry)
+        else:
+            observation = self.column('observations')[obs_index]
+
+        winner = int(self.column('info_winner')[i])
+        move = {
+            "player": player,
+            "observation": observation,
+            "action": f"[{int(self.column('action')[i])}]",
+            "turn": int(self.column('turn')[i]),
+            "info": {
+                "winner": None if winner < 0 else winner,
+                "turn": int(self.column('info_turn')[i]),
+                "board": decode_board(board_codes),
+                "game_over": bool(self.column('info_game_over')[i]),
+            },
+        }
+        family = int(self.column('cot_family')[i])
+        if family >= 0:
+            move["cot"] = self.column('cot_dictionaries')[family][int(self.column('cot_index')[i])]
+        if 'cot_variant_count' in self._specs and int(self.column('cot_variant_count')[i]) >= 0:
+            move["cot_variants"] = self._cot_variants(i)
+        return move
+
+    def _cot_variants(self, i: int) -> Dict[str, str]:
+        if '_variant_starts' not in self._cache:
+            counts = np.maximum(self.column('cot_variant_count').astype(np.int64), 0)
+            self._cache['_variant_starts'] = np.concatenate([[0], np.cumsum(counts)])
+        start, end = (int(x) for x in self._cache['_variant_starts'][i:i + 2])
+        names, dictionaries = self.column('cot_family_names'), self.column('cot_dictionaries')
+        return {names[family]: dictionaries[family][index]
+                for family, index in zip(self.column('cot_variant_family')[start:end].tolist(),
+                                         self.column('cot_variant_index')[start:end].tolist())}
+
+    def iter_games(self) -> Iterator[Dict]:
+        """逐个产出游戏字典"""
+        offsets = self.column('move_offsets')
+        for game_index, meta in enumerate(self.column('game_meta')):
+            moves = []
+            boards = self._game_boards(game_index)
+            geometry = self._game_geometry(game_index)
+            previous_board = [' '] * boards.shape[1]
+            start = int(offsets[game_index])
+            for i in range(start, int(offsets[game_index + 1])):
+                move = self._decode_move(i, previous_board, boards[i - start], geometry)
+                moves.append(move)
+                previous_board = move.get('info', {}).get('board')
+            game = {}
+            for key, value in json.loads(meta):
+                game[key] = moves if key == 'moves' else value
+            yield game
+
+    def read(self):
+        """读取全部数据，返回与原JSON文件相同的结构"""
+        games = list(self.iter_games())
+        if self.header['wrapped']:
+            data = dict(self.metadata)
+            data['games'] = games
+            return data
+        return games
+
+
+def read_columnar(path: str):
+    """读取.colz文件，返回与原JSON文件相同的结构"""
+    return ColumnarGameReader(path).read()
+
+
+def convert_json_file(json_path: str, output_path: str = None, codec: Optional[str] = None) -> str:
+    """把现有的原始JSON文件转换为.colz格式"""
+    output_path = output_path or os.path.splitext(json_path)[0] + COLUMNAR_SUFFIX
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return write_columnar(data, output_path, codec)
+
+
+def main():
+    """把data/raw中的JSON原始文件批量转换为列式格式"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert self-play JSON files to the compressed columnar format')
+    parser.add_argument('files', nargs='+', help='self_play_data_*.json files')
+    parser.add_argument('--codec', choices=['zstd', 'zlib'], default=None, help='compression codec')
+    parser.add_argument('--verify', action='store_true', help='re-read and compare with the source JSON')
+    args = parser.parse_args()
+
+    for json_path in args.files:
+        output_path = convert_json_file(json_path, codec=args.codec)
+        json_size, col_size = os.path.getsize(json_path), os.path.getsize(output_path)
+        print(f"✅ {json_path} -> {output_path}: {json_size} -> {col_size} 字节 ({json_size / max(col_size, 1):.1f}x)")
+        if args.verify:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                original = json.load(f)
+            assert read_columnar(output_path) == original, f"往返校验失败: {json_path}"
+            print("   往返校验通过")
+
+
+if __name__ == "__main__":
+    main()
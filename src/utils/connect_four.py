@@ -0,0 +1,351 @@
+"""
+四子棋（Connect Four）风格的重力棋盘环境
+
+棋子落入所选列最低的空位，横、竖、斜任一方向连成k子获胜（默认6行7列、k=4）。
+MockConnectFourEnv 与 MockTicTacToeEnv 接口相同（reset / get_observation / step / close），
+观察文本同样以 "Game Board:" 给出棋盘、以 "Available Moves" 列出可落子的列，
+SelfPlayRunner 可以直接使用；VectorConnectFourEnv 一次推进整批对局。
+
+位棋盘布局：第c列自底向上第h行对应第 c*(rows+1)+h 位，每列顶端留一位哨兵，
+col_heights 记录每列下一个空位的位序号。获胜检测只需移位与运算：
+m & (m >> s) & (m >> 2s) & ...（k-1次），s = 1（竖）、rows+1（横）、rows（/斜）、rows+2（\\斜），
+哨兵位保证不会跨列误连；同一段代码对Python int和numpy int64数组都成立。
+
+用法:
+    python src/utils/connect_four.py --num-games 10000 --geometry 6x7k4
+"""
+
+import os
+import re
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.mnk import BoardGeometry
+
+GAME_NAME = "ConnectFour-v0"
+
+
+class GravityGeometry:
+    """rows x cols 的重力棋盘，k子连线获胜"""
+
+    def __init__(self, rows: int = 6, cols: int = 7, k: int = 4):
+        if rows < 1 or cols < 1 or k < 2 or k > max(rows, cols):
+            raise ValueError(f"无效的棋盘几何: {rows}x{cols} k={k}")
+        if (rows + 1) * cols > 63:
+            raise ValueError(f"棋盘过大，位棋盘需要 {(rows + 1) * cols} 位（上限63）")
+        self.rows, self.cols, self.k = rows, cols, k
+        self.size = rows * cols
+        self.height = rows + 1
+        self.shifts = (1, self.height, self.height - 1, self.height + 1)  # 竖、横、/斜、\斜
+        self.bottoms = tuple(c * self.height for c in range(cols))  # 每列最底一格的位序号
+        self.tops = tuple(bottom + rows for bottom in self.bottoms)  # 每列哨兵位序号（该列已满）
+        # 按列中心距离排序的列（中心优先）与文本渲染使用的行优先（自顶向下）棋盘几何
+        self.center_order = tuple(sorted(range(cols), key=lambda c: (abs(2 * c - (cols - 1)), c)))
+        self.layout = BoardGeometry(rows, cols, k)
+
+    @classmethod
+    def parse(cls, spec: str) -> "GravityGeometry":
+        """解析 "6x7k4" 或 "6x7" 形式的描述（省略k时 k = 4）"""
+        match = re.fullmatch(r'\s*(\d+)x(\d+)(?:k(\d+))?\s*', spec)
+        if not match:
+            raise ValueError(f"无法解析棋盘几何: {spec}")
+        return cls(int(match.group(1)), int(match.group(2)), int(match.group(3) or 4))
+
+    @property
+    def name(self) -> str:
+        return f"{self.rows}x{self.cols}k{self.k}"
+
+    def __repr__(self) -> str:
+        return f"GravityGeometry({self.name})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, GravityGeometry) and (self.rows, self.cols, self.k) == (other.rows, other.cols, other.k)
+
+    def __hash__(self) -> int:
+        return hash(('gravity', self.rows, self.cols, self.k))
+
+    # ---- 位棋盘运算（int 与 numpy int64 数组通用）----
+    def win_bits(self, mask):
+        """mask 中所有k连线起点的位（非零即已获胜）"""
+        result = mask & 0
+        for shift in self.shifts:
+            line = mask
+            for i in range(1, self.k):
+                line = line & (mask >> (i * shift))
+            result = result | line
+        return result
+
+    def is_win(self, mask) -> bool:
+        return self.win_bits(mask) != 0
+
+    def cell_of(self, bit_index: int) -> int:
+        """位序号 -> 行优先（自顶向下）的格子序号"""
+        col, h = divmod(bit_index, self.height)
+        return (self.rows - 1 - h) * self.cols + col
+
+    def to_board(self, x_mask: int, o_mask: int) -> List[str]:
+        """位棋盘 -> ['X', 'O', ' ', ...]（行优先，第0行在最上方）"""
+        board = [' '] * self.size
+        for col in range(self.cols):
+            for h in range(self.rows):
+                bit = 1 << (self.bottoms[col] + h)
+                if x_mask & bit:
+                    board[self.cell_of(self.bottoms[col] + h)] = 'X'
+                elif o_mask & bit:
+                    board[self.cell_of(self.bottoms[col] + h)] = 'O'
+        return board
+
+    def from_board(self, board: List[str]) -> Tuple[int, int, List[int]]:
+        """['X', 'O', ' ', ...] -> (x_mask, o_mask, col_heights)；悬空的棋子（下方有空格）抛出ValueError"""
+        x_mask = o_mask = 0
+        heights = list(self.bottoms)
+        for col in range(self.cols):
+            for h in range(self.rows):
+                cell = board[self.cell_of(self.bottoms[col] + h)]
+                if cell == ' ':
+                    continue
+                if heights[col] != self.bottoms[col] + h:
+                    raise ValueError(f"第{col}列存在悬空的棋子")
+                bit = 1 << heights[col]
+                if cell == 'X':
+                    x_mask |= bit
+                else:
+                    o_mask |= bit
+                heights[col] += 1
+        return x_mask, o_mask, heights
+
+    def legal_columns(self, heights: List[int]) -> List[int]:
+        return [col for col in range(self.cols) if heights[col] < self.tops[col]]
+
+    def winning_columns(self, own: int, heights: List[int]) -> List[int]:
+        """落子后立即连成k子的列"""
+        return [col for col in self.legal_columns(heights) if self.is_win(own | 1 << heights[col])]
+
+
+CONNECT_FOUR = GravityGeometry(6, 7, 4)
+
+
+def resolve_gravity_geometry(geometry=None) -> GravityGeometry:
+    """None -> 标准6x7四子棋；字符串 -> GravityGeometry.parse"""
+    if geometry is None:
+        return CONNECT_FOUR
+    if isinstance(geometry, str):
+        return GravityGeometry.parse(geometry)
+    return geometry
+
+
+def parse_column(action) -> Optional[int]:
+    """解析 "[3]"、"[col 3]"、"3" 或整数形式的列号，失败返回None"""
+    if isinstance(action, (int, np.integer)):
+        return int(action)
+    match = re.search(r'(\d+)', str(action))
+    return int(match.group(1)) if match else None
+
+
+def render_observation(board: List[str], current_player: int, columns: List[int], geometry=None) -> str:
+    """执子方的观察文本（与 mock_env.render_observation 格式相同，可选落子为列号）"""
+    geometry = resolve_gravity_geometry(geometry)
+    column_labels = " ".join(f"{col:<3}" for col in range(geometry.cols)).rstrip()
+    return f"""Game Board:
+{geometry.layout.board_to_string(board)}
+{column_labels}
+
+Player {'X' if current_player == 0 else 'O'}'s turn. Drop a piece into a column; it falls to the lowest empty row.
+Available Moves: {['[{}]'.format(col) for col in columns]}"""
+
+
+class MockConnectFourEnv:
+    """Mock implementation of a Connect Four environment compatible with TextArena API"""
+
+    game_name = GAME_NAME
+
+    def __init__(self, geometry=None):
+        self.geometry = resolve_gravity_geometry(geometry)
+        self.max_turns = self.geometry.size
+        self.reset()
+
+    def reset(self, num_players=2):
+        """Reset the environment to initial state"""
+        self.masks = [0, 0]
+        self.col_heights = list(self.geometry.bottoms)
+        self.board = [' '] * self.geometry.size
+        self.current_player = 0
+        self.game_over = False
+        self.winner = None
+        self.turn_count = 0
+        return self.get_observation()
+
+    def get_observation(self) -> Tuple[int, str]:
+        """Get current observation for the active player"""
+        columns = self.geometry.legal_columns(self.col_heights)
+        return self.current_player, render_observation(self.board, self.current_player, columns, self.geometry)
+
+    def step(self, action) -> Tuple[bool, Dict[str, Any]]:
+        """Execute an action ("[3]" / "[col 3]" / 3) and return (done, info)"""
+        column = parse_column(action)
+        if column is None:
+            return False, {"error": f"Invalid action format: {action}"}
+        if not (0 <= column < self.geometry.cols):
+            return False, {"error": f"Column out of range: {column}"}
+        if self.col_heights[column] >= self.geometry.tops[column]:
+            return False, {"error": f"Column {column} is full"}
+
+        bit_index = self.col_heights[column]
+        self.masks[self.current_player] |= 1 << bit_index
+        self.col_heights[column] += 1
+        self.board[self.geometry.cell_of(bit_index)] = 'X' if self.current_player == 0 else 'O'
+        self.turn_count += 1
+
+        if self.geometry.is_win(self.masks[self.current_player]):
+            self.game_over = True
+            self.winner = self.current_player
+        elif self.turn_count == self.geometry.size:
+            self.game_over = True
+            self.winner = None  # Draw
+
+        if not self.game_over:
+            self.current_player = 1 - self.current_player
+
+        info = {
+            "winner": self.winner,
+            "turn": self.turn_count,
+            "board": self.board.copy(),
+            "game_over": self.game_over
+        }
+        return self.game_over, info
+
+    def close(self) -> Tuple[List[float], Dict[str, Any]]:
+        """Close the environment and return final results"""
+        rewards = [0.0, 0.0]
+        if self.winner is not None:
+            rewards[self.winner] = 1.0
+            rewards[1 - self.winner] = -1.0
+
+        game_info = {
+            "winner": self.winner,
+            "final_board": self.geometry.layout.board_to_string(self.board),
+            "game_over": self.game_over,
+            "total_turns": self.turn_count,
+            "outcome": "draw" if self.winner is None else f"player_{self.winner}_wins"
+        }
+        return rewards, game_info
+
+
+class VectorConnectFourEnv:
+    """num_envs 局同时进行的重力棋（规则与 MockConnectFourEnv 相同）"""
+
+    game_name = GAME_NAME
+
+    def __init__(self, num_envs: int, geometry=None):
+        self.geometry = resolve_gravity_geometry(geometry)
+        self.num_envs = num_envs
+        self._bottoms = np.array(self.geometry.bottoms, dtype=np.int64)
+        self._tops = np.array(self.geometry.tops, dtype=np.int64)
+        self.reset()
+
+    def reset(self, num_envs: int = None):
+        """重置全部对局"""
+        if num_envs is not None:
+            self.num_envs = num_envs
+        n = self.num_envs
+        self.masks = np.zeros((2, n), dtype=np.int64)  # masks[0]: X, masks[1]: O
+        self.col_heights = np.tile(self._bottoms, (n, 1))
+        self.current_player = np.zeros(n, dtype=np.int8)
+        self.done = np.zeros(n, dtype=bool)
+        self.winner = np.full(n, -1, dtype=np.int8)  # -1: 未结束或平局
+        self.turn_count = np.zeros(n, dtype=np.int16)
+
+    def legal_moves(self) -> np.ndarray:
+        """(num_envs, cols) 布尔数组：未结束对局中未满的列"""
+        return (self.col_heights < self._tops) & ~self.done[:, None]
+
+    def own_and_opponent(self) -> Tuple[np.ndarray, np.ndarray]:
+        """当前执子方与对手的位棋盘"""
+        rows = np.arange(self.num_envs)
+        player = self.current_player.astype(np.int64)
+        return self.masks[player, rows], self.masks[1 - player, rows]
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """为所有未结束的对局在给定列落子，返回 (done, winner)
+
+        已结束的对局忽略对应的action；未结束对局的非法落子抛出ValueError
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        active = ~self.done
+        rows = np.arange(self.num_envs)
+        columns = np.clip(actions, 0, self.geometry.cols - 1)
+        heights = self.col_heights[rows, columns]
+        illegal = active & ((actions < 0) | (actions >= self.geometry.cols) | (heights >= self._tops[columns]))
+        if illegal.any():
+            i = int(np.flatnonzero(illegal)[0])
+            raise ValueError(f"Illegal action {actions[i]} in env {i}")
+
+        bits = np.where(active, np.left_shift(1, heights), 0)
+        player = self.current_player.astype(np.int64)
+        self.masks[player, rows] |= bits
+        self.col_heights[rows, columns] += active
+        self.turn_count += active
+
+        won = active & self.geometry.is_win(self.masks[player, rows])
+        full = active & (self.turn_count == self.geometry.size)
+        self.winner[won] = self.current_player[won]
+        self.done |= won | full
+        self.current_player = np.where(active & ~self.done, 1 - self.current_player, self.current_player).astype(np.int8)
+        return self.done.copy(), self.winner.copy()
+
+    def board(self, i: int) -> List[str]:
+        return self.geometry.to_board(int(self.masks[0, i]), int(self.masks[1, i]))
+
+    def get_observation(self, i: int) -> Tuple[int, str]:
+        """第i局当前执子方的观察文本（与 MockConnectFourEnv.get_observation 格式相同）"""
+        player = int(self.current_player[i])
+        columns = [int(col) for col in np.flatnonzero(self.col_heights[i] < self._tops)]
+        return player, render_observation(self.board(i), player, columns, self.geometry)
+
+    def game_info(self, i: int) -> dict:
+        """第i局结束后的信息（与 MockConnectFourEnv.close 的game_info格式相同）"""
+        winner = int(self.winner[i]) if self.winner[i] >= 0 else None
+        return {
+            "winner": winner,
+            "final_board": self.geometry.layout.board_to_string(self.board(i)),
+            "game_over": bool(self.done[i]),
+            "total_turns": int(self.turn_count[i]),
+            "outcome": "draw" if winner is None else f"player_{winner}_wins"
+        }
+
+
+def main():
+    """用随机落子测量批量环境的吞吐量"""
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Benchmark the vectorized Connect Four environment with random play')
+    parser.add_argument('--num-games', type=int, default=10000)
+    parser.add_argument('--geometry', type=str, default=CONNECT_FOUR.name, help='rows x cols k, e.g. 6x7k4')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    env = VectorConnectFourEnv(args.num_games, args.geometry)
+    rng = np.random.default_rng(args.seed)
+    start = time.time()
+    moves = 0
+    while not env.done.all():
+        legal = env.legal_moves()
+        scores = np.where(legal, rng.random(legal.shape), -1.0)
+        moves += int((~env.done).sum())
+        env.step(scores.argmax(axis=1))
+    elapsed = time.time() - start
+
+    x_wins = int((env.winner == 0).sum())
+    o_wins = int((env.winner == 1).sum())
+    print(f"🎮 {env.geometry.name}: {args.num_games} 局 / {moves} 步，用时 {elapsed:.2f}s "
+          f"({moves / max(elapsed, 1e-9):,.0f} 步/秒)")
+    print(f"📊 X胜 {x_wins}，O胜 {o_wins}，平局 {args.num_games - x_wins - o_wins}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+物化的CoT语料库：按 (局面, 策略, CoT长度) 索引规则agent可能输出的全部落子与CoT
+
+规则agent的输出只取决于落子前的棋盘（执子方、步数和阶段都可由棋盘推出）、策略、CoT长度，
+以及决策与CoT生成过程中的若干次 rng.choice。构建时对全部4520个可达非终局局面、
+4种策略、6种长度，用“脚本化”的随机数源枚举每一条 rng.choice 路径，
+记录每个叶子的选择路径、落子和CoT文本：
+
+- 索引 (corpus.npz): 有序键 state * 24 + 策略 * 6 + 长度 -> 叶子区间；
+  每个叶子保存选择路径 (k, n)、决策所用的选择次数、落子和文本编号
+- 文本 (texts.bin): 去重后的CoT，每 BLOCK_SIZE 条一块单独压缩（zstd或zlib），按块随机读取
+
+查询时沿选择路径依次调用 rng.choice(range(n))，与即时生成消耗相同的随机数，
+因此同一个随机数源得到的落子和CoT与即时生成完全一致。语料库同时是agent全部可能输出的审计清单。
+
+注意文本中包含具体格子编号，索引必须使用实际局面而不是对称规范化局面。
+
+用法:
+    python src/utils/cot_corpus.py build --output data/cot_corpus
+    python src/utils/cot_corpus.py stats data/cot_corpus
+"""
+
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# 作为脚本运行时把src加入路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from agents.board_analysis import BoardAnalysis
+from agents.qwen_agent import COT_LENGTH_MAP, STRATEGY_MAP, CoTLengthType, StrategyType
+from utils.columnar_store import ZSTD_AVAILABLE, _compress, _decompress
+from utils.shared_tables import shared_table_pool
+from utils.tictactoe_oracle import _enumerate
+from utils.vector_env import decode_board, encode_board
+
+CORPUS_VERSION = 1
+INDEX_FILE = "corpus.npz"
+TEXT_FILE = "texts.bin"
+META_FILE = "meta.json"
+BLOCK_SIZE = 64
+
+CORPUS_STRATEGIES = list(StrategyType)
+CORPUS_LENGTHS = list(CoTLengthType)
+_STRATEGY_CODES = {strategy: code for code, strategy in enumerate(CORPUS_STRATEGIES)}
+_LENGTH_CODES = {cot_length: code for code, cot_length in enumerate(CORPUS_LENGTHS)}
+
+
+def corpus_key(state: int, strategy: StrategyType, cot_length: CoTLengthType) -> int:
+    return (state * len(CORPUS_STRATEGIES) + _STRATEGY_CODES[strategy]) * len(CORPUS_LENGTHS) + _LENGTH_CODES[cot_length]
+
+
+def board_context(board: List[str]) -> Tuple[str, str, int, str]:
+    """由棋盘推出 (我方棋子, 对手棋子, 步数, 阶段)，与从空棋盘开始的对局中agent的状态一致"""
+    from agents.batch_policy import game_phase_of
+
+    my_symbol = 'X' if board.count('X') == board.count('O') else 'O'
+    opponent_symbol = 'O' if my_symbol == 'X' else 'X'
+    occupied = 9 - board.count(' ')
+    return my_symbol, opponent_symbol, board.count(my_symbol) + 1, game_phase_of(occupied)
+
+
+class _ScriptedRandom:
+    """按预先给定的下标执行 rng.choice，并记录每次选择的 (k, n)"""
+
+    def __init__(self, script):
+        self.script = script
+        self.trace = []
+
+    def choice(self, seq):
+        depth = len(self.trace)
+        k = self.script[depth] if depth < len(self.script) else 0
+        self.trace.append((k, len(seq)))
+        return seq[k]
+
+
+def enumerate_outputs(agent, board: List[str], strategy: StrategyType, cot_length: CoTLengthType) -> List[Dict]:
+    """枚举一个 (局面, 策略, 长度) 下所有 rng.choice 路径对应的 (落子, CoT)"""
+    my_symbol, opponent_symbol, move_count, game_phase = board_context(board)
+    available_moves = [i for i, cell in enumerate(board) if cell == ' ']
+    leaves = []
+    pending = [[]]
+    while pending:
+        script = pending.pop()
+        rng = _ScriptedRandom(script)
+        analysis = BoardAnalysis(board, my_symbol, opponent_symbol, available_moves, game_phase, move_count,
+                                 evaluate_move=agent._evaluate_move,
+                                 strategy=strategy, cot_length=cot_length, rng=rng)
+        move = agent._strategic_decision(analysis, available_moves)
+        decision_depth = len(rng.trace)
+        cot = agent._generate_detailed_reasoning(analysis, move, my_symbol, opponent_symbol)
+        leaves.append({"path": rng.trace, "decision_depth": decision_depth, "move": move, "cot": cot})
+        # 当前脚本之后的每个选择点，尝试所有其他分支
+        for depth in range(len(script), len(rng.trace)):
+            prefix = [k for k, _ in rng.trace[:depth]]
+            for k in range(1, rng.trace[depth][1]):
+                pending.append(prefix + [k])
+    leaves.sort(key=lambda leaf: [k for k, _ in leaf["path"]])
+    return leaves
+
+
+def _enumerate_state(state: int):
+    from agents.qwen_agent import QwenAgent
+
+    agent = QwenAgent(strategy='balanced', cot_length='medium')
+    board = decode_board(state)
+    return state, [(strategy, cot_length, enumerate_outputs(agent, board, strategy, cot_length))
+                   for strategy in CORPUS_STRATEGIES for cot_length in CORPUS_LENGTHS]
+
+
+def build_corpus(output_dir: str, workers: Optional[int] = None, states: Optional[List[int]] = None) -> Dict:
+    """枚举全部局面并写出语料库，返回统计信息
+
+    Args:
+        output_dir: 输出目录
+        workers: 并行进程数，默认使用全部CPU
+        states: 只物化这些局面（用于测试），默认全部可达非终局局面
+    """
+    start = time.time()
+    if states is None:
+        states = [encode_board(list(board)) for board in _enumerate()]
+
+    keys, leaf_starts = [], [0]
+    path_starts, path_k, path_n = [0], [], []
+    decision_depths, moves, text_ids = [], [], []
+    text_table = {}
+    texts = []
+
+    # worker映射父进程发布的战术表，不再各自生成
+    with shared_table_pool(max_workers=workers) as executor:
+        results = sorted(executor.map(_enumerate_state, states, chunksize=16), key=lambda item: item[0])
+
+    for state, groups in results:
+        for strategy, cot_length, leaves in groups:
+            keys.append(corpus_key(state, strategy, cot_length))
+            for leaf in leaves:
+                text_id = text_table.get(leaf["cot"])
+                if text_id is None:
+                    text_id = text_table[leaf["cot"]] = len(texts)
+                    texts.append(leaf["cot"])
+                path_k.extend(k for k, _ in leaf["path"])
+                path_n.extend(n for _, n in leaf["path"])
+                path_starts.append(len(path_k))
+                decision_depths.append(leaf["decision_depth"])
+                moves.append(leaf["move"])
+                text_ids.append(text_id)
+            leaf_starts.append(len(moves))
+
+    os.makedirs(output_dir, exist_ok=True)
+    codec = "zstd" if ZSTD_AVAILABLE else "zlib"
+    block_offsets = [0]
+    text_path = os.path.join(output_dir, TEXT_FILE)
+    with open(text_path + ".tmp", 'wb') as f:
+        for block_start in range(0, len(texts), BLOCK_SIZE):
+            payload = '\x00'.join(texts[block_start:block_start + BLOCK_SIZE]).encode('utf-8')
+            f.write(_compress(payload, codec))
+            block_offsets.append(f.tell())
+    os.replace(text_path + ".tmp", text_path)
+
+    index_path = os.path.join(output_dir, INDEX_FILE)
+    with open(index_path + ".tmp", 'wb') as f:
+        np.savez_compressed(
+            f,
+            keys=np.asarray(keys, dtype=np.int64),
+            leaf_starts=np.asarray(leaf_starts, dtype=np.int64),
+            path_starts=np.asarray(path_starts, dtype=np.int64),
+            path_k=np.asarray(path_k, dtype=np.int8),
+            path_n=np.asarray(path_n, dtype=np.int8),
+            decision_depths=np.asarray(decision_depths, dtype=np.int8),
+            moves=np.asarray(moves, dtype=np.int8),
+            text_ids=np.asarray(text_ids, dtype=np.int32),
+            block_offsets=np.asarray(block_offsets, dtype=np.int64),
+        )
+    os.replace(index_path + ".tmp", index_path)
+
+    stats = {
+        "version": CORPUS_VERSION,
+        "codec": codec,
+        "block_size": BLOCK_SIZE,
+        "positions": len(states),
+        "keys": len(keys),
+        "leaves": len(moves),
+        "unique_texts": len(texts),
+        "text_bytes": sum(len(text.encode('utf-8')) for text in texts),
+        "compressed_bytes": block_offsets[-1],
+        "build_seconds": round(time.time() - start, 1),
+    }
+    with open(os.path.join(output_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(stats, f, indent=2, ensure_ascii=False)
+    return stats
+
+
+class CoTCorpus:
+    """物化语料库的读取器"""
+
+    def __init__(self, corpus_dir: str, cache_blocks: int = 256):
+        with open(os.path.join(corpus_dir, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != CORPUS_VERSION:
+            raise ValueError(f"不支持的语料库版本: {self.meta.get('version')}")
+        with np.load(os.path.join(corpus_dir, INDEX_FILE)) as data:
+            for name in data.files:
+                setattr(self, name, data[name])
+        self.codec = self.meta["codec"]
+        self.block_size = self.meta["block_size"]
+        self._text_file = open(os.path.join(corpus_dir, TEXT_FILE), 'rb')
+        self._cache_blocks = cache_blocks
+        self._blocks = OrderedDict()
+
+    def close(self):
+        self._text_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def num_texts(self) -> int:
+        return int(self.meta["unique_texts"])
+
+    def _block(self, block_id: int) -> List[str]:
+        block = self._blocks.get(block_id)
+        if block is None:
+            start, end = self.block_offsets[block_id], self.block_offsets[block_id + 1]
+            self._text_file.seek(start)
+            block = _decompress(self._text_file.read(end - start), self.codec).decode('utf-8').split('\x00')
+            self._blocks[block_id] = block
+            if len(self._blocks) > self._cache_blocks:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(block_id)
+        return block
+
+    def text(self, text_id: int) -> str:
+        return self._block(text_id // self.block_size)[text_id % self.block_size]
+
+    def iter_texts(self) -> Iterator[str]:
+        """按编号遍历全部去重后的CoT文本（审计用）"""
+        for block_id in range(len(self.block_offsets) - 1):
+            yield from self._block(block_id)
+
+    def leaf_range(self, state: int, strategy, cot_length) -> Optional[range]:
+        """(局面, 策略, 长度) 对应的叶子下标区间；不在语料库中时返回None"""
+        if isinstance(strategy, str):
+            strategy = STRATEGY_MAP[strategy]
+        if isinstance(cot_length, str):
+            cot_length = COT_LENGTH_MAP[cot_length]
+        key = corpus_key(state, strategy, cot_length)
+        pos = int(np.searchsorted(self.keys, key))
+        if pos == len(self.keys) or self.keys[pos] != key:
+            return None
+        return range(int(self.leaf_starts[pos]), int(self.leaf_starts[pos + 1]))
+
+    def _path(self, leaf: int) -> List[Tuple[int, int]]:
+        start, end = self.path_starts[leaf], self.path_starts[leaf + 1]
+        return list(zip(self.path_k[start:end].tolist(), self.path_n[start:end].tolist()))
+
+    def _walk(self, leaves: List[int], depth: int, rng) -> int:
+        """从depth开始沿选择路径抽样，返回到达的叶子"""
+        paths = {leaf: self._path(leaf) for leaf in leaves}
+        while True:
+            finished = [leaf for leaf in leaves if len(paths[leaf]) == depth]
+            if finished:
+                return finished[0]
+            n = paths[leaves[0]][depth][1]
+            k = rng.choice(range(n))
+            leaves = [leaf for leaf in leaves if paths[leaf][depth][0] == k]
+            depth += 1
+
+    def sample(self, state: int, strategy, cot_length, rng) -> Optional[Tuple[int, str]]:
+        """抽样 (落子, CoT)，随机数消耗与即时生成相同"""
+        leaves = self.leaf_range(state, strategy, cot_length)
+        if not leaves:
+            return None
+        leaf = self._walk(list(leaves), 0, rng)
+        return int(self.moves[leaf]), self.text(int(self.text_ids[leaf]))
+
+    def render(self, state: int, action: int, strategy, cot_length, rng) -> Optional[str]:
+        """为已选定的落子抽样CoT（对应 QwenAgent.render_cot）"""
+        leaves = self.leaf_range(state, strategy, cot_length)
+        if not leaves:
+            return None
+        leaves = [leaf for leaf in leaves if self.moves[leaf] == action]
+        if not leaves:
+            return None
+        leaf = self._walk(leaves, int(self.decision_depths[leaves[0]]), rng)
+        return self.text(int(self.text_ids[leaf]))
+
+    def outputs(self, state: int, strategy, cot_length) -> List[Dict]:
+        """列出某个 (局面, 策略, 长度) 下所有可能的输出及其概率"""
+        results = []
+        for leaf in self.leaf_range(state, strategy, cot_length) or []:
+            path = self._path(leaf)
+            results.append({
+                "move": int(self.moves[leaf]),
+                "probability": float(np.prod([1.0 / n for _, n in path])) if path else 1.0,
+                "cot": self.text(int(self.text_ids[leaf])),
+            })
+        return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build or inspect the materialized CoT corpus')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='Enumerate every position and materialize all CoT variants')
+    build_parser.add_argument('--output', type=str, default=None, help='Defaults to data/cot_corpus')
+    build_parser.add_argument('--workers', type=int, default=None, help='Worker processes')
+    stats_parser = subparsers.add_parser('stats', help='Print corpus statistics')
+    stats_parser.add_argument('corpus_dir', type=str)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        output_dir = args.output or os.path.join(project_root, "data", "cot_corpus")
+        print(f"🏗️  物化CoT语料库 -> {output_dir}")
+        stats = build_corpus(output_dir, workers=args.workers)
+    else:
+        with CoTCorpus(args.corpus_dir) as corpus:
+            stats = corpus.meta
+    for name, value in stats.items():
+        print(f"  {name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
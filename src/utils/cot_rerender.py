@@ -0,0 +1,153 @@
+"""
+多长度CoT的fan-out输出与离线重渲染
+
+CoT文本只依赖落子前的棋盘、执子方策略和选定的落子，与对局过程本身无关。因此：
+
+- self-play时每步只做一次棋盘分析，为所有需要的长度渲染CoT（move["cot_variants"]），
+  再由 write_sft_variants 为每个长度写出一份SFT文件；
+- 已有的原始对局可以用 rerender_games 直接从记录的棋盘重新生成任意长度的CoT，无需重新对弈。
+
+用法:
+    python src/utils/cot_rerender.py data/raw/self_play_data_*.json --cot-lengths short,long
+"""
+
+import os
+import sys
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+# 作为脚本运行时把src加入路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from agents.qwen_agent import COT_LENGTH_MAP, STRATEGY_MAP, CoTLengthType, GameContext, QwenAgent, StrategyType
+from utils.board_utils import board_before_move
+from utils.processing_manifest import atomic_write_json
+from utils.sft_index import write_indexed_jsonl
+from utils.vector_env import encode_board
+
+
+def parse_cot_lengths(spec: str) -> List[str]:
+    """解析 "short,long" 或 "all" 形式的长度列表"""
+    if spec.strip() == "all":
+        return [cot_length.value for cot_length in CoTLengthType]
+    lengths = [item.strip() for item in spec.split(',') if item.strip()]
+    unknown = [item for item in lengths if item not in COT_LENGTH_MAP]
+    if unknown:
+        raise ValueError(f"未知的CoT长度: {', '.join(unknown)}")
+    return list(dict.fromkeys(lengths))
+
+
+def _winner_of(game: Dict) -> Optional[int]:
+    winner = game.get('result', {}).get('winner')
+    return winner if winner in (0, 1) else None
+
+
+def rerender_games(games: List[Dict], cot_lengths: Sequence[str], agent: QwenAgent = None,
+                   seed: Optional[int] = None, winners_only: bool = True) -> int:
+    """为已有对局中的落子重新生成各长度的CoT，写入 move["cot_variants"]（原地修改）
+
+    Args:
+        games: 原始对局记录（需要 observation 或 info.board 以还原落子前的棋盘）
+        cot_lengths: 需要生成的CoT长度名称
+        agent: 用于渲染的规则agent，默认新建一个
+        seed: CoT文本随机数种子
+        winners_only: 只处理获胜方的落子（与SFT格式化的 filter_winners_only 一致）
+
+    Returns:
+        重新渲染的落子数；无法还原棋盘的落子被跳过
+    """
+    agent = agent or QwenAgent()
+    rng = GameContext(seed=seed).rng
+    rendered = 0
+    for game in games:
+        winner = _winner_of(game)
+        if winners_only and winner is None:
+            continue
+        strategies = game.get('strategies') or [None, None]
+        for move_index, move in enumerate(game.get('moves', [])):
+            player = move['player']
+            if winners_only and player != winner:
+                continue
+            board = board_before_move(game, move_index)
+            if board is None:
+                continue
+            action = int(str(move.get('action', '')).strip('[]'))
+            strategy = STRATEGY_MAP.get(strategies[player], StrategyType.BALANCED)
+            move_count = (move.get('turn', move_index + 1) - 1) // 2 + 1
+            variants = agent.render_cot_variants(encode_board(board), action, strategy, cot_lengths, move_count, rng)
+            move['cot_variants'] = {**move.get('cot_variants', {}), **variants}
+            rendered += 1
+    return rendered
+
+
+def write_sft_variants(games: List[Dict], cot_lengths: Sequence[str], output_dir: str, tag: str,
+                       sft_format: str = "json", formatter=None,
+                       make_deduplicator: Optional[Callable] = None) -> Dict[str, Dict]:
+    """为每个CoT长度格式化并写出一份LLaMA-Factory SFT文件
+
+    各长度依次处理：格式化是纯Python计算，线程并行受GIL限制没有收益，
+    且 formatter.last_dedup_stats 是共享状态，依次处理才能取到各长度自己的去重统计。
+
+    Args:
+        games: 带 move["cot_variants"] 的对局记录
+        output_dir: 输出目录，文件名为 long_cot_sft_data_{长度}_{tag}.{json|jsonl}
+        make_deduplicator: 可选的去重器工厂（每个长度使用独立的去重器）
+
+    Returns:
+        {长度名称: {"path": 输出文件路径, "samples": 样本数, "dedup_stats": 去重统计或None}}
+    """
+    if formatter is None:
+        from utils.data_formatter import SelfPlayDataFormatter
+        formatter = SelfPlayDataFormatter()
+    os.makedirs(output_dir, exist_ok=True)
+
+    outputs = {}
+    for cot_length in cot_lengths:
+        deduplicator = make_deduplicator() if make_deduplicator else None
+        formatter.last_dedup_stats = None
+        samples = formatter.format_for_llama_factory(games, deduplicator=deduplicator, cot_variant=cot_length)
+        output_file = os.path.join(output_dir, f"long_cot_sft_data_{cot_length}_{tag}.{sft_format}")
+        if sft_format == 'jsonl':
+            write_indexed_jsonl(samples, output_file)
+        else:
+            atomic_write_json(output_file, samples)
+        print(f"✅ {cot_length}: {len(samples)} 条样本 -> {output_file}")
+        outputs[cot_length] = {"path": output_file, "samples": len(samples),
+                               "dedup_stats": formatter.last_dedup_stats}
+    return outputs
+
+
+def main():
+    """为已有原始对局离线生成多个长度的SFT数据"""
+    import argparse
+
+    from utils.data_formatter import SelfPlayDataFormatter
+    from utils.processing_manifest import ProcessingManifest
+
+    parser = argparse.ArgumentParser(description='Re-render CoT at multiple lengths for existing self-play games')
+    parser.add_argument('files', nargs='+', help='self_play_data_* raw files (.json or .colz)')
+    parser.add_argument('--cot-lengths', type=str, default='all', help='Comma separated CoT lengths, or "all"')
+    parser.add_argument('--output-dir', type=str, default=None, help='Defaults to data/processed')
+    parser.add_argument('--sft-format', type=str, default='json', choices=['json', 'jsonl'])
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for CoT text')
+    args = parser.parse_args()
+
+    cot_lengths = parse_cot_lengths(args.cot_lengths)
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    output_dir = args.output_dir or os.path.join(project_root, "data", "processed")
+
+    formatter = SelfPlayDataFormatter()
+    agent = QwenAgent()
+    for raw_file in args.files:
+        games = formatter._extract_games(formatter.load_self_play_data(raw_file))
+        rendered = rerender_games(games, cot_lengths, agent=agent, seed=args.seed)
+        print(f"🔁 {raw_file}: 重新渲染 {rendered} 步 x {len(cot_lengths)} 种长度")
+        tag = f"{os.path.splitext(os.path.basename(raw_file))[0]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        outputs = write_sft_variants(games, cot_lengths, output_dir, tag, args.sft_format, formatter)
+        ProcessingManifest(os.path.dirname(os.path.abspath(raw_file))).register_outputs(
+            raw_file, {f"llama_factory_{length}": output["path"] for length, output in outputs.items()}
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,20 +4,35 @@ Data formatter for converting self-play game data into training format
 
 import json
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 
+from utils.board_utils import board_before_move
+from utils.columnar_store import COLUMNAR_SUFFIX, read_columnar
+from utils.sample_dedup import SampleDeduplicator, print_dedup_statistics
+
+# 各游戏的SFT指令；对局记录没有 "game" 字段时按井字棋处理
+GAME_INSTRUCTIONS = {
+    "TicTacToe-v0": "井字棋游戏中，请分析当前棋盘状态并选择最优落子位置。",
+    "ConnectFour-v0": "四子棋游戏中，请分析当前棋盘状态并选择最优的落子列。",
+}
+
 
 class SelfPlayDataFormatter:
     """Convert self-play game data into format suitable for SFT training"""
     
     def __init__(self):
         self.training_data = []
+        self.last_dedup_stats = None  # 最近一次去重的统计信息
     
     def _get_winner_from_result(self, result: Dict) -> int:
         """从result字典中判断获胜者"""
         if not result:
             return None
+        
+        # mock环境直接给出winner字段
+        if 'winner' in result and not isinstance(result.get('winner'), dict):
+            return result['winner']
             
         # 检查每个玩家的结果信息
         for player_id, player_result in result.items():
@@ -33,17 +48,29 @@ class SelfPlayDataFormatter:
         return None
     
     def load_self_play_data(self, data_file: str) -> List[Dict]:
-        """Load self-play data from JSON file"""
+        """Load self-play data from a JSON file, a compressed columnar (.colz) file,
+        or a JSONL file streamed by AsyncSelfPlayRunner (one game per line)"""
+        if data_file.endswith(COLUMNAR_SUFFIX):
+            return read_columnar(data_file)
+        if data_file.endswith('.jsonl'):
+            with open(data_file, 'r', encoding='utf-8') as f:
+                return [json.loads(line) for line in f if line.strip()]
         with open(data_file, 'r', encoding='utf-8') as f:
             return json.load(f)
     
-    def format_for_sft(self, games_data: List[Dict], filter_winners_only: bool = True) -> List[Dict]:
+    def format_for_sft(self, games_data: List[Dict], filter_winners_only: bool = True,
+                       deduplicator: Optional[SampleDeduplicator] = None,
+                       cot_variant: Optional[str] = None) -> List[Dict]:
         """
         Convert game data into SFT training format
+        （instruction 按 game["game"] 取自 GAME_INSTRUCTIONS，缺省为井字棋）
         
         Args:
             games_data: List of game dictionaries from self-play
             filter_winners_only: If True, only use moves from winning games
+            deduplicator: 可选的样本去重器，按 (规范化局面, 策略, CoT长度) 去重
+            cot_variant: 使用 move["cot_variants"] 中该长度的CoT（多长度fan-out），
+                         没有该长度CoT的落子被跳过；None表示使用 move["cot"]
             
         Returns:
             List of training samples in format:
@@ -54,7 +81,7 @@ class SelfPlayDataFormatter:
             }
         """
         
-        training_samples = []
+        keyed_samples = []
         
         for game in games_data:
             # 从result中判断获胜者
@@ -68,15 +95,34 @@ class SelfPlayDataFormatter:
             
             # Extract moves from the winning player
             if winner is not None:
-                for move in moves:
+                for move_index, move in enumerate(moves):
                     if move['player'] == winner:
+                        if cot_variant is not None:
+                            variants = move.get('cot_variants') or {}
+                            if cot_variant not in variants:
+                                continue
+                            move = dict(move, cot=variants[cot_variant])
                         # Create training sample
                         sample = self._create_training_sample(move, game)
                         if sample:
-                            training_samples.append(sample)
+                            key = self._dedup_key(game, move_index, cot_variant) if deduplicator else None
+                            keyed_samples.append((key, sample))
         
+        if deduplicator is None:
+            return [sample for _, sample in keyed_samples]
+        
+        training_samples, self.last_dedup_stats = deduplicator.deduplicate(keyed_samples)
+        print_dedup_statistics(self.last_dedup_stats)
         return training_samples
     
+    def _dedup_key(self, game_data: Dict, move_index: int, cot_variant: Optional[str] = None):
+        """构造样本的去重键：落子前的规范化局面 + 执子方、策略、CoT长度"""
+        player = game_data['moves'][move_index]['player']
+        strategies = game_data.get('strategies') or [None, None]
+        cot_lengths = game_data.get('cot_lengths') or [None, None]
+        board = board_before_move(game_data, move_index)
+        return SampleDeduplicator.make_key(board, strategies[player], cot_variant or cot_lengths[player])
+    
     def _create_training_sample(self, move_data: Dict, game_data: Dict) -> Dict:
         """Create a single training sample from move data"""
         
@@ -113,7 +159,7 @@ class SelfPlayDataFormatter:
         
         # 创建训练样本
         sample = {
-            "instruction": "井字棋游戏中，请分析当前棋盘状态并选择最优落子位置。",
+            "instruction": GAME_INSTRUCTIONS.get(game_data.get('game'), GAME_INSTRUCTIONS["TicTacToe-v0"]),
             "input": f"当前游戏状态：\n{observation}\n\n你是{player_mark}，请详细分析棋盘局面，思考最优策略，然后给出你的落子选择。",
             "output": output
         }
@@ -153,43 +199,71 @@ class SelfPlayDataFormatter:
                     }
                 ]
             }
+            if 'weight' in sample:
+                formatted_sample['weight'] = sample['weight']
             llama_factory_samples.append(formatted_sample)
         
         return llama_factory_samples
     
-    def format_for_llama_factory(self, games_data: List[Dict], filter_winners_only: bool = True) -> List[Dict]:
+    def format_for_llama_factory(self, games_data: List[Dict], filter_winners_only: bool = True,
+                                 deduplicator: Optional[SampleDeduplicator] = None,
+                                 cot_variant: Optional[str] = None) -> List[Dict]:
         """
         Convert game data directly into LLaMA-Factory training format
         
         Args:
             games_data: List of game dictionaries from self-play
             filter_winners_only: If True, only use moves from winning games
+            deduplicator: 可选的样本去重器
+            cot_variant: 使用指定长度的CoT变体（见 format_for_sft）
             
         Returns:
             List of training samples in LLaMA-Factory conversation format
         """
         # First convert to standard format
-        standard_samples = self.format_for_sft(games_data, filter_winners_only)
+        standard_samples = self.format_for_sft(games_data, filter_winners_only, deduplicator, cot_variant)
         
         # Then convert to LLaMA-Factory format
         return self.create_llama_factory_format(standard_samples)
     
-    def process_self_play_directory(self, data_dir: str, output_dir: str = None):
-        """Process all self-play data files in a directory"""
+    def _extract_games(self, data) -> List[Dict]:
+        """兼容带metadata的文件格式（{"generation_info":..., "games": [...]}）"""
+        if isinstance(data, dict) and 'games' in data:
+            return data['games']
+        return data
+    
+    def _list_raw_files(self, data_dir: str) -> List[str]:
+        """按文件名排序列出所有self-play原始数据文件"""
+        return [
+            os.path.join(data_dir, filename)
+            for filename in sorted(os.listdir(data_dir))
+            if filename.startswith('self_play_data_') and filename.endswith(('.json', '.jsonl', COLUMNAR_SUFFIX))
+        ]
+    
+    def process_self_play_directory(self, data_dir: str, output_dir: str = None, incremental: bool = False):
+        """Process all self-play data files in a directory
+        
+        Args:
+            data_dir: 原始数据目录
+            output_dir: 输出目录
+            incremental: 为True时借助处理清单只格式化新增或变化的文件，
+                其余文件直接复用已登记的分片
+        """
         
         if output_dir is None:
             output_dir = data_dir
         
-        all_training_samples = []
-        
-        # Find all self-play data files
-        for filename in os.listdir(data_dir):
-            if filename.startswith('self_play_data_') and filename.endswith('.json'):
-                filepath = os.path.join(data_dir, filename)
-                print(f"Processing {filename}...")
+        if incremental:
+            all_training_samples = self._process_incrementally(data_dir, output_dir)
+        else:
+            all_training_samples = []
+            
+            # Find all self-play data files
+            for filepath in self._list_raw_files(data_dir):
+                print(f"Processing {os.path.basename(filepath)}...")
                 
                 # Load and format data
-                games_data = self.load_self_play_data(filepath)
+                games_data = self._extract_games(self.load_self_play_data(filepath))
                 training_samples = self.format_for_sft(games_data)
                 all_training_samples.extend(training_samples)
         
@@ -214,6 +288,34 @@ class SelfPlayDataFormatter:
         else:
             print("No training samples generated")
             return None, None
+    
+    def _process_incrementally(self, data_dir: str, output_dir: str) -> List[Dict]:
+        """只格式化清单中未处理或内容变化的原始文件，返回全部分片合并后的样本"""
+        from utils.processing_manifest import ProcessingManifest, atomic_write_json
+        
+        manifest = ProcessingManifest(data_dir)
+        raw_files = self._list_raw_files(data_dir)
+        pending = manifest.pending_files(raw_files, "sft")
+        print(f"📋 原始文件 {len(raw_files)} 个，需要处理 {len(pending)} 个")
+        
+        shard_dir = os.path.join(output_dir, "shards")
+        for item in pending:
+            filepath = item['path']
+            print(f"Processing {os.path.basename(filepath)}...")
+            games_data = self._extract_games(self.load_self_play_data(filepath))
+            training_samples = self.format_for_sft(games_data)
+            
+            stem = os.path.splitext(os.path.basename(filepath))[0]
+            shard_file = os.path.join(shard_dir, f"sft_shard_{stem}.json")
+            atomic_write_json(shard_file, training_samples)
+            manifest.register_outputs(filepath, {"sft": shard_file}, item['fingerprint'])
+        
+        # 合并所有分片只涉及I/O，不再重新格式化
+        all_training_samples = []
+        for shard_file in manifest.shards_for(raw_files, "sft"):
+            with open(shard_file, 'r', encoding='utf-8') as f:
+                all_training_samples.extend(json.load(f))
+        return all_training_samples
 
 
 # Legacy functions for compatibility
@@ -256,9 +358,9 @@ def main():
     # Ensure processed directory exists
     os.makedirs(processed_data_dir, exist_ok=True)
     
-    # Process the data
+    # Process the data (incrementally: only new or changed raw files are formatted)
     if os.path.exists(raw_data_dir):
-        formatter.process_self_play_directory(raw_data_dir, processed_data_dir)
+        formatter.process_self_play_directory(raw_data_dir, processed_data_dir, incremental=True)
     else:
         print(f"Raw data directory not found: {raw_data_dir}")
 
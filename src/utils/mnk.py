@@ -0,0 +1,389 @@
+"""
+通用 m,n,k 棋盘引擎与求解器
+
+井字棋是 m,n,k 游戏（rows x cols 棋盘，k子连线获胜）中 3,3,3 的特例。本模块按棋盘几何生成
+所有获胜线路的位掩码，并提供：
+
+- BoardGeometry: 线路掩码、每格所在线路、战术查询（一步获胜 / 威胁线数 / fork）、棋盘文本渲染
+- MNKSolver: negamax + alpha-beta，Zobrist哈希置换表，走法排序（置换表走法、必胜、必堵、
+  按所在线路数排序的位置），迭代加深，可设时间预算
+
+评分规则与 utils.tictactoe_oracle 一致：当前执子方在第p手（根为第0手）获胜记为 win_score - p，
+win_score = 格子数 + 1（3x3时为10），和棋为0，因此3x3上的结果与原minimax完全相同。
+
+用法:
+    python src/utils/mnk.py bench --geometry 3x3k3 4x4k3 4x4k4 5x5k4 --time-limit 30
+"""
+
+import os
+import random
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+EXACT, LOWER, UPPER = 0, 1, 2
+SOLVED_DEPTH = 1 << 30  # 置换表中不依赖搜索视界（子树已搜到终局）的条目深度
+
+
+class BoardGeometry:
+    """rows x cols 棋盘，k子连线获胜"""
+
+    def __init__(self, rows: int = 3, cols: int = 3, k: int = 3):
+        if rows < 1 or cols < 1 or k < 1 or k > max(rows, cols):
+            raise ValueError(f"无效的棋盘几何: {rows}x{cols} k={k}")
+        self.rows, self.cols, self.k = rows, cols, k
+        self.size = rows * cols
+        self.full_mask = (1 << self.size) - 1
+
+        lines = []
+        for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):  # 行、列、主对角线方向、副对角线方向
+            for r in range(rows):
+                for c in range(cols):
+                    end_r, end_c = r + dr * (k - 1), c + dc * (k - 1)
+                    if 0 <= end_r < rows and 0 <= end_c < cols:
+                        lines.append(tuple((r + dr * i) * cols + c + dc * i for i in range(k)))
+        self.lines: Tuple[Tuple[int, ...], ...] = tuple(lines)
+        self.line_masks: Tuple[int, ...] = tuple(sum(1 << pos for pos in line) for line in lines)
+        self.lines_through: Tuple[Tuple[int, ...], ...] = tuple(
+            tuple(mask for mask in self.line_masks if mask >> pos & 1) for pos in range(self.size)
+        )
+        self.cell_weights: Tuple[int, ...] = tuple(len(masks) for masks in self.lines_through)
+
+    @classmethod
+    def parse(cls, spec: str) -> "BoardGeometry":
+        """解析 "4x4k3" 或 "4x4" 形式的描述（省略k时 k = min(rows, cols)）"""
+        match = re.fullmatch(r'\s*(\d+)x(\d+)(?:k(\d+))?\s*', spec)
+        if not match:
+            raise ValueError(f"无法解析棋盘几何: {spec}")
+        rows, cols = int(match.group(1)), int(match.group(2))
+        return cls(rows, cols, int(match.group(3)) if match.group(3) else min(rows, cols))
+
+    @property
+    def name(self) -> str:
+        return f"{self.rows}x{self.cols}k{self.k}"
+
+    def __repr__(self) -> str:
+        return f"BoardGeometry({self.rows}, {self.cols}, {self.k})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, BoardGeometry) and (self.rows, self.cols, self.k) == (other.rows, other.cols, other.k)
+
+    def __hash__(self) -> int:
+        return hash((self.rows, self.cols, self.k))
+
+    def empty_board(self) -> List[str]:
+        return [' '] * self.size
+
+    # ---- 位掩码工具 ----
+    def squares(self, mask: int) -> List[int]:
+        return [pos for pos in range(self.size) if mask >> pos & 1]
+
+    def board_masks(self, board: List[str], symbol: str) -> Tuple[int, int]:
+        """返回 (symbol方位掩码, 另一方位掩码)"""
+        own = opp = 0
+        for pos, cell in enumerate(board):
+            if cell == symbol:
+                own |= 1 << pos
+            elif cell != ' ':
+                opp |= 1 << pos
+        return own, opp
+
+    def is_win(self, mask: int, last_move: Optional[int] = None) -> bool:
+        """mask中是否已有k子连线；给出last_move时只检查经过该格的线路"""
+        lines = self.line_masks if last_move is None else self.lines_through[last_move]
+        return any(mask & line == line for line in lines)
+
+    def winner(self, board: List[str]) -> Optional[str]:
+        for symbol in ('X', 'O'):
+            if self.is_win(self.board_masks(board, symbol)[0]):
+                return symbol
+        return None
+
+    def win_squares(self, own: int, opp: int) -> int:
+        """己方一步即可获胜的空位（位掩码）"""
+        result = 0
+        k_minus_one = self.k - 1
+        for line in self.line_masks:
+            if not opp & line and (own & line).bit_count() == k_minus_one:
+                result |= line & ~own
+        return result
+
+    def threat_count(self, own: int, opp: int) -> int:
+        """己方"差一子连线"的线路数量"""
+        k_minus_one = self.k - 1
+        return sum(1 for line in self.line_masks if not opp & line and (own & line).bit_count() == k_minus_one)
+
+    def fork_squares(self, own: int, opp: int) -> int:
+        """落子后威胁线路数 >= 2 的空位（位掩码）"""
+        result = 0
+        empty = self.full_mask & ~(own | opp)
+        for pos in self.squares(empty):
+            if self.threat_count(own | 1 << pos, opp) >= 2:
+                result |= 1 << pos
+        return result
+
+    # ---- 文本渲染 ----
+    def board_to_string(self, board: List[str]) -> str:
+        rows = [" | ".join(board[r * self.cols:(r + 1) * self.cols]) for r in range(self.rows)]
+        return f"\n{'-' * (4 * self.cols - 3)}\n".join(rows)
+
+
+TICTACTOE = BoardGeometry(3, 3, 3)
+
+
+def resolve_geometry(geometry=None) -> BoardGeometry:
+    """None -> 标准井字棋；字符串 -> BoardGeometry.parse"""
+    if geometry is None:
+        return TICTACTOE
+    if isinstance(geometry, str):
+        return BoardGeometry.parse(geometry)
+    return geometry
+
+
+class _Timeout(Exception):
+    pass
+
+
+class SearchResult:
+    """一次求解的结果与开销"""
+
+    __slots__ = ('value', 'best_move', 'depth', 'exact', 'nodes', 'tt_hits', 'seconds')
+
+    def __init__(self, value, best_move, depth, exact, nodes, tt_hits, seconds):
+        self.value = value
+        self.best_move = best_move
+        self.depth = depth
+        self.exact = exact
+        self.nodes = nodes
+        self.tt_hits = tt_hits
+        self.seconds = seconds
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class MNKSolver:
+    """带置换表的 alpha-beta 求解器（同一求解器的置换表在多次查询间复用）"""
+
+    def __init__(self, geometry: BoardGeometry = None, seed: int = 0, max_table_size: int = 5_000_000):
+        self.geometry = resolve_geometry(geometry)
+        rng = random.Random(seed)
+        self.zobrist = tuple(tuple(rng.getrandbits(64) for _ in range(self.geometry.size)) for _ in range(2))
+        self.win_score = self.geometry.size + 1
+        self.max_table_size = max_table_size
+        self.table: Dict[int, Tuple[int, int, float, int]] = {}
+        self.nodes = 0
+        self.tt_hits = 0
+        self._deadline = None
+        self._horizon_hit = False
+        # 中心附近、所在线路多的格子优先
+        self._move_order = tuple(sorted(range(self.geometry.size), key=lambda pos: -self.geometry.cell_weights[pos]))
+
+    # ---- 局面表示 ----
+    def _position(self, board: List[str]) -> Tuple[int, int, int, int]:
+        """返回 (执子方掩码, 对方掩码, 执子方编号0=X/1=O, Zobrist哈希)"""
+        x_mask, o_mask = self.geometry.board_masks(board, 'X')
+        side = 0 if x_mask.bit_count() == o_mask.bit_count() else 1
+        zobrist_hash = 0
+        for pos in range(self.geometry.size):
+            if x_mask >> pos & 1:
+                zobrist_hash ^= self.zobrist[0][pos]
+            elif o_mask >> pos & 1:
+                zobrist_hash ^= self.zobrist[1][pos]
+        me, opp = (x_mask, o_mask) if side == 0 else (o_mask, x_mask)
+        return me, opp, side, zobrist_hash
+
+    def _heuristic(self, me: int, opp: int) -> float:
+        """搜索视界处的静态评估，取值在 (-0.5, 0.5)，不会与胜负分数混淆"""
+        score = 0
+        for line in self.geometry.line_masks:
+            mine, theirs = me & line, opp & line
+            if mine and not theirs:
+                score += 4 ** mine.bit_count()
+            elif theirs and not mine:
+                score -= 4 ** theirs.bit_count()
+        return 0.4 * score / (len(self.geometry.line_masks) * 4 ** self.geometry.k)
+
+    def _to_table(self, value: float, ply: int) -> float:
+        if value >= 1:
+            return value + ply
+        if value <= -1:
+            return value - ply
+        return value
+
+    def _from_table(self, value: float, ply: int) -> float:
+        if value >= 1:
+            return value - ply
+        if value <= -1:
+            return value + ply
+        return value
+
+    # ---- 搜索 ----
+    def _negamax(self, me: int, opp: int, side: int, zobrist_hash: int, depth: int, ply: int,
+                 alpha: float, beta: float) -> float:
+        self.nodes += 1
+        if self._deadline is not None and not self.nodes & 0xFFF and time.perf_counter() > self._deadline:
+            raise _Timeout()
+
+        geometry = self.geometry
+        empty = geometry.full_mask & ~(me | opp)
+        if not empty:
+            return 0
+        depth = min(depth, empty.bit_count())
+
+        tt_move = -1
+        entry = self.table.get(zobrist_hash)
+        if entry is not None:
+            entry_depth, flag, stored, tt_move = entry
+            if entry_depth >= depth:
+                value = self._from_table(stored, ply)
+                if flag == EXACT or (flag == LOWER and value >= beta) or (flag == UPPER and value <= alpha):
+                    self.tt_hits += 1
+                    if entry_depth < SOLVED_DEPTH:
+                        self._horizon_hit = True
+                    return value
+
+        # 一步获胜
+        wins = geometry.win_squares(me, opp) & empty
+        if wins:
+            return self.win_score - ply
+        # 对方有两个及以上获胜点时必败（对方在下一手获胜）
+        blocks = geometry.win_squares(opp, me) & empty
+        if blocks & (blocks - 1):
+            return -(self.win_score - ply - 1)
+
+        if depth == 0:
+            self._horizon_hit = True
+            return self._heuristic(me, opp)
+
+        if blocks:
+            moves = [blocks.bit_length() - 1]
+        else:
+            moves = [pos for pos in self._move_order if empty >> pos & 1]
+            if tt_move in moves:
+                moves.remove(tt_move)
+                moves.insert(0, tt_move)
+
+        original_alpha = alpha
+        outer_horizon_hit, self._horizon_hit = self._horizon_hit, False
+        best_value, best_move = -float('inf'), moves[0]
+        keys = self.zobrist[side]
+        for pos in moves:
+            value = -self._negamax(opp, me | 1 << pos, 1 - side, zobrist_hash ^ keys[pos], depth - 1, ply + 1,
+                                   -beta, -alpha)
+            if value > best_value:
+                best_value, best_move = value, pos
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                break
+
+        if best_value <= original_alpha:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        if len(self.table) >= self.max_table_size:
+            self.table.clear()
+        stored_depth = depth if self._horizon_hit else SOLVED_DEPTH
+        self.table[zobrist_hash] = (stored_depth, flag, self._to_table(best_value, ply), best_move)
+        self._horizon_hit = self._horizon_hit or outer_horizon_hit
+        return best_value
+
+    def solve(self, board: List[str], time_limit: Optional[float] = None,
+              max_depth: Optional[int] = None) -> SearchResult:
+        """迭代加深求解当前局面（执子方视角）
+
+        完整搜索到终局（没有触及视界）时 exact=True；超时返回最后一次完成的迭代结果
+        """
+        me, opp, side, zobrist_hash = self._position(board)
+        empty_count = (self.geometry.full_mask & ~(me | opp)).bit_count()
+        max_depth = empty_count if max_depth is None else min(max_depth, empty_count)
+        start = time.perf_counter()
+        nodes_before, hits_before = self.nodes, self.tt_hits
+        self._deadline = start + time_limit if time_limit else None
+
+        value, depth, exact = 0, 0, empty_count == 0
+        try:
+            for iteration_depth in range(1, max_depth + 1):
+                self._horizon_hit = False
+                value = self._negamax(me, opp, side, zobrist_hash, iteration_depth, 0, -float('inf'), float('inf'))
+                depth = iteration_depth
+                if not self._horizon_hit:
+                    exact = True
+                    break
+        except _Timeout:
+            pass
+        finally:
+            self._deadline = None
+
+        entry = self.table.get(zobrist_hash)
+        best_move = entry[3] if entry is not None else None
+        if best_move is None or best_move < 0:
+            wins = self.geometry.win_squares(me, opp) & ~(me | opp) & self.geometry.full_mask
+            best_move = wins.bit_length() - 1 if wins else None
+        return SearchResult(value, best_move, depth, exact, self.nodes - nodes_before,
+                            self.tt_hits - hits_before, round(time.perf_counter() - start, 4))
+
+    def move_scores(self, board: List[str]) -> Dict[int, float]:
+        """每个空位落子后的精确分数（执子方视角，等价于 tictactoe_oracle.move_scores）"""
+        me, opp, side, zobrist_hash = self._position(board)
+        empty = self.geometry.full_mask & ~(me | opp)
+        scores = {}
+        for pos in self.geometry.squares(empty):
+            after = me | 1 << pos
+            if self.geometry.is_win(after, pos):
+                scores[pos] = self.win_score
+                continue
+            self._horizon_hit = False
+            scores[pos] = -self._negamax(opp, after, 1 - side, zobrist_hash ^ self.zobrist[side][pos],
+                                         self.geometry.size, 1, -float('inf'), float('inf'))
+        return scores
+
+    def optimal_moves(self, board: List[str]) -> Tuple[List[int], float]:
+        """所有最优落子（升序）与最优分数"""
+        scores = self.move_scores(board)
+        best = max(scores.values())
+        return [pos for pos, score in scores.items() if score == best], best
+
+
+def benchmark(geometries: List[BoardGeometry], time_limit: Optional[float] = None) -> List[Dict]:
+    """从空棋盘求解每种几何，记录节点数、置换表命中、耗时以及是否完整求解"""
+    results = []
+    for geometry in geometries:
+        solver = MNKSolver(geometry)
+        result = solver.solve(geometry.empty_board(), time_limit=time_limit)
+        row = {"geometry": geometry.name, "lines": len(geometry.line_masks), "table_entries": len(solver.table)}
+        row.update(result.to_dict())
+        results.append(row)
+        print(f"  {geometry.name:<8} 值={result.value!s:<8} 深度={result.depth:<3} "
+              f"{'完整求解' if result.exact else '未完成'}  节点={result.nodes:<10} "
+              f"置换表命中={result.tt_hits:<9} 耗时={result.seconds}s")
+    return results
+
+
+def main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='m,n,k board engine and solver')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    bench_parser = subparsers.add_parser('bench', help='Measure solver cost per board size')
+    bench_parser.add_argument('--geometry', nargs='+', default=['3x3k3', '4x4k3', '4x4k4', '5x5k4'],
+                              help='Board geometries such as 4x4k3')
+    bench_parser.add_argument('--time-limit', type=float, default=60.0, help='Seconds per geometry')
+    bench_parser.add_argument('--output', type=str, default=None, help='Optional JSON report path')
+    args = parser.parse_args()
+
+    print("⏱️  m,n,k 求解开销（空棋盘）")
+    results = benchmark([BoardGeometry.parse(spec) for spec in args.geometry], time_limit=args.time_limit)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"📝 报告已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
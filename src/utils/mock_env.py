@@ -1,17 +1,38 @@
 """
 Mock TicTacToe environment for testing self-play when TextArena is not available.
+
+棋盘几何可参数化（utils.mnk.BoardGeometry，例如 4x4 k=3），默认是标准3x3井字棋。
 """
 
 import random
 import re
 from typing import List, Tuple, Dict, Any
 
+from utils.mnk import resolve_geometry
+
+
+def board_to_string(board: List[str], geometry=None) -> str:
+    """Convert board to string representation"""
+    return resolve_geometry(geometry).board_to_string(board)
+
+
+def render_observation(board: List[str], current_player: int, geometry=None) -> str:
+    """Render the observation text for the player to move (format similar to TextArena)"""
+    available_moves = [i for i, cell in enumerate(board) if cell == ' ']
+    return f"""Game Board:
+{board_to_string(board, geometry)}
+
+Player {'X' if current_player == 0 else 'O'}'s turn.
+Available Moves: {['[{}]'.format(i) for i in available_moves]}"""
+
 
 class MockTicTacToeEnv:
     """Mock implementation of TicTacToe environment compatible with TextArena API"""
     
-    def __init__(self):
-        self.board = [' '] * 9
+    def __init__(self, geometry=None):
+        self.geometry = resolve_geometry(geometry)
+        self.max_turns = self.geometry.size  # 自对弈循环的步数上限（井字棋为9）
+        self.board = self.geometry.empty_board()
         self.current_player = 0
         self.game_over = False
         self.winner = None
@@ -19,7 +40,7 @@ class MockTicTacToeEnv:
     
     def reset(self, num_players=2):
         """Reset the environment to initial state"""
-        self.board = [' '] * 9
+        self.board = self.geometry.empty_board()
         self.current_player = 0
         self.game_over = False
         self.winner = None
@@ -28,25 +49,7 @@ class MockTicTacToeEnv:
     
     def get_observation(self) -> Tuple[int, str]:
         """Get current observation for the active player"""
-        board_str = self._board_to_string()
-        available_moves = [i for i, cell in enumerate(self.board) if cell == ' ']
-        
-        # Format observation similar to TextArena
-        obs = f"""Game Board:
-{board_str}
-
-Player {'X' if self.current_player == 0 else 'O'}'s turn.
-Available Moves: {['[{}]'.format(i) for i in available_moves]}"""
-        
-        return self.current_player, obs
-    
-    def _board_to_string(self) -> str:
-        """Convert board to string representation"""
-        rows = []
-        for i in range(0, 9, 3):
-            row = " | ".join(self.board[i:i+3])
-            rows.append(row)
-        return "\n---------\n".join(rows)
+        return self.current_player, render_observation(self.board, self.current_player, self.geometry)
     
     def step(self, action) -> Tuple[bool, Dict[str, Any]]:
         """Execute an action and return (done, info)"""
@@ -58,7 +61,7 @@ Available Moves: {['[{}]'.format(i) for i in available_moves]}"""
                 return False, {"error": f"Invalid action format: {action}"}
         
         # Validate action
-        if not (0 <= action <= 8):
+        if not (0 <= action < self.geometry.size):
             return False, {"error": f"Action out of range: {action}"}
         
         if self.board[action] != ' ':
@@ -91,16 +94,10 @@ Available Moves: {['[{}]'.format(i) for i in available_moves]}"""
     
     def _check_winner(self) -> bool:
         """Check if current player has won"""
-        # Define winning lines: rows, columns, diagonals
-        lines = [
-            [0, 1, 2], [3, 4, 5], [6, 7, 8],  # rows
-            [0, 3, 6], [1, 4, 7], [2, 5, 8],  # columns
-            [0, 4, 8], [2, 4, 6]              # diagonals
-        ]
-        
+        # Winning lines (rows, columns, diagonals) are generated from the board geometry
         current_mark = 'X' if self.current_player == 0 else 'O'
         
-        for line in lines:
+        for line in self.geometry.lines:
             if all(self.board[i] == current_mark for i in line):
                 return True
         
@@ -118,7 +115,7 @@ Available Moves: {['[{}]'.format(i) for i in available_moves]}"""
         
         game_info = {
             "winner": self.winner,
-            "final_board": self._board_to_string(),
+            "final_board": board_to_string(self.board, self.geometry),
             "game_over": self.game_over,
             "total_turns": self.turn_count,
             "outcome": "draw" if self.winner is None else f"player_{self.winner}_wins"
@@ -127,9 +124,16 @@ Available Moves: {['[{}]'.format(i) for i in available_moves]}"""
         return rewards, game_info
 
 
-def make(game_name: str):
-    """Factory function to create environment (TextArena-like interface)"""
+def make(game_name: str, geometry=None):
+    """Factory function to create environment (TextArena-like interface)
+
+    geometry: 可选的棋盘几何（BoardGeometry或 "4x4k3" 形式的字符串；
+              ConnectFour-v0 使用 GravityGeometry或 "6x7k4" 形式的字符串）
+    """
     if game_name == "TicTacToe-v0":
-        return MockTicTacToeEnv()
+        return MockTicTacToeEnv(geometry)
+    elif game_name == "ConnectFour-v0":
+        from utils.connect_four import MockConnectFourEnv
+        return MockConnectFourEnv(geometry)
     else:
         raise ValueError(f"Unknown game: {game_name}")
@@ -0,0 +1,147 @@
+"""
+增量处理清单 - 记录 data/raw 中每个原始文件的指纹及其派生的处理结果
+
+清单记录每个原始self-play文件的大小、修改时间和内容哈希，以及由它生成的
+SFT分片文件。重复运行格式化任务时只需处理新增或内容发生变化的文件。
+所有写操作都在文件锁内完成，并通过临时文件 + os.replace 原子替换清单，
+多个并行worker可以安全地同时登记输出。
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+MANIFEST_FILENAME = "processing_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def compute_file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """计算文件内容的sha256哈希"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def atomic_write_json(path: str, data, indent: Optional[int] = 2):
+    """先写入同目录临时文件再原子替换，读者永远不会看到写了一半的文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".json")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=indent, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)  # mkstemp默认0600
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ProcessingManifest:
+    """data/raw 的增量处理清单"""
+
+    def __init__(self, data_dir: str, manifest_path: str = None):
+        self.data_dir = os.path.abspath(data_dir)
+        self.manifest_path = manifest_path or os.path.join(self.data_dir, MANIFEST_FILENAME)
+        self.lock_path = self.manifest_path + ".lock"
+
+    @contextmanager
+    def _locked(self):
+        """获取清单的排他锁（跨进程）"""
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read(self) -> Dict:
+        if not os.path.exists(self.manifest_path):
+            return {"version": MANIFEST_VERSION, "raw_files": {}}
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def load(self) -> Dict:
+        """读取清单快照"""
+        with self._locked():
+            return self._read()
+
+    def _key(self, raw_path: str) -> str:
+        """清单中使用相对data_dir的路径作为键"""
+        return os.path.relpath(os.path.abspath(raw_path), self.data_dir)
+
+    def _fingerprint(self, raw_path: str, previous: Dict = None) -> Dict:
+        """计算文件指纹；大小和mtime都未变化时复用已记录的哈希"""
+        stat = os.stat(raw_path)
+        if previous and previous.get('size') == stat.st_size and previous.get('mtime') == stat.st_mtime:
+            content_hash = previous['sha256']
+        else:
+            content_hash = compute_file_hash(raw_path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": content_hash}
+
+    def register_raw_file(self, raw_path: str):
+        """登记新写入的原始文件（由self-play写入方调用）"""
+        with self._locked():
+            manifest = self._read()
+            key = self._key(raw_path)
+            entry = manifest["raw_files"].get(key, {})
+            fingerprint = self._fingerprint(raw_path)
+            if entry.get('sha256') != fingerprint['sha256']:
+                # 内容变化，之前的分片已失效
+                entry = {"shards": {}}
+            entry.update(fingerprint)
+            entry.setdefault("registered_at", datetime.now().isoformat())
+            manifest["raw_files"][key] = entry
+            atomic_write_json(self.manifest_path, manifest)
+
+    def register_outputs(self, raw_path: str, shards: Dict[str, str], fingerprint: Dict = None):
+        """原子地登记由原始文件派生的处理结果"""
+        with self._locked():
+            manifest = self._read()
+            key = self._key(raw_path)
+            entry = manifest["raw_files"].get(key, {"shards": {}})
+            fingerprint = fingerprint or self._fingerprint(raw_path, entry)
+            if entry.get('sha256') not in (None, fingerprint['sha256']):
+                # 原始文件内容已变化，旧分片全部作废
+                entry["shards"] = {}
+            entry.update(fingerprint)
+            entry.setdefault("shards", {}).update(shards)
+            entry["processed_at"] = datetime.now().isoformat()
+            manifest["raw_files"][key] = entry
+            atomic_write_json(self.manifest_path, manifest)
+
+    def pending_files(self, raw_paths: List[str], shard_name: str) -> List[Dict]:
+        """返回尚未生成某类分片、或内容已变化需要重新处理的文件及其当前指纹"""
+        manifest = self.load()
+        pending = []
+        for raw_path in raw_paths:
+            entry = manifest["raw_files"].get(self._key(raw_path))
+            fingerprint = self._fingerprint(raw_path, entry)
+            if entry and entry.get('sha256') == fingerprint['sha256']:
+                shard_path = entry.get('shards', {}).get(shard_name)
+                if shard_path and os.path.exists(shard_path):
+                    continue
+            pending.append({"path": raw_path, "fingerprint": fingerprint})
+        return pending
+
+    def shards_for(self, raw_paths: List[str], shard_name: str) -> List[str]:
+        """按原始文件顺序返回某类已登记分片的路径"""
+        manifest = self.load()
+        shards = []
+        for raw_path in raw_paths:
+            entry = manifest["raw_files"].get(self._key(raw_path), {})
+            shard_path = entry.get('shards', {}).get(shard_name)
+            if shard_path and os.path.exists(shard_path):
+                shards.append(shard_path)
+        return shards
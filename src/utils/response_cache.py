@@ -0,0 +1,66 @@
+"""
+模型回复的持久化缓存
+
+全状态空间评估要为数千个局面生成回复；同一模型、同一生成配置下同一prompt的回复只需要生成一次，
+中断后重跑、换一种统计口径或与其他模型配对比较时直接读取缓存。
+
+缓存是单个SQLite文件（标准库，多进程可同时读），键为 (模型标识, 生成配置, prompt) 的SHA-256。
+模型标识由调用方提供，应能区分权重的变化（如 models.merged_cache.adapter_fingerprint）。
+采样生成的回复也会缓存：缓存命中时复用同一个样本，而不是重新采样。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Dict, List, Optional, Sequence
+
+
+class ResponseCache:
+    """(模型, 生成配置, prompt) -> 回复文本 的SQLite缓存"""
+
+    def __init__(self, path: str, model_key: str, generation_config: Optional[Dict] = None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.namespace = json.dumps([model_key, generation_config or {}], sort_keys=True, ensure_ascii=False)
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL)")
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _key(self, prompt: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\n{prompt}".encode('utf-8')).hexdigest()
+
+    def get_many(self, prompts: Sequence[str]) -> List[Optional[str]]:
+        """按顺序返回各prompt的缓存回复，未缓存的为None"""
+        keys = [self._key(prompt) for prompt in prompts]
+        found = {}
+        for start in range(0, len(keys), 500):  # SQLite单条语句的参数个数有限
+            chunk = keys[start:start + 500]
+            rows = self._db.execute(f"SELECT key, response FROM responses WHERE key IN ({','.join('?' * len(chunk))})",
+                                    chunk)
+            found.update(rows.fetchall())
+        responses = [found.get(key) for key in keys]
+        hits = sum(response is not None for response in responses)
+        self.hits += hits
+        self.misses += len(responses) - hits
+        return responses
+
+    def put_many(self, prompts: Sequence[str], responses: Sequence[str]):
+        self._db.executemany("INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)",
+                             [(self._key(prompt), response) for prompt, response in zip(prompts, responses)])
+        self._db.commit()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 4) if total else 0.0}
@@ -0,0 +1,86 @@
+"""
+SFT样本去重与重新加权
+
+self-play会大量重复相同的开局局面，导致训练集被少数几百个几乎相同的样本主导。
+这里按 (规范化局面 + 执子方, 策略, CoT长度) 对样本分组，每组最多保留
+max_per_state 个样本，并可选地为保留样本写入权重以保留原始频率信息。
+"""
+
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from utils.board_utils import canonical_board, side_to_move
+
+
+class SampleDeduplicator:
+    """按规范化局面对SFT样本去重"""
+
+    def __init__(self, max_per_state: Optional[int] = 1, assign_weights: bool = False):
+        """
+        Args:
+            max_per_state: 每个 (局面, 策略, CoT长度) 最多保留的样本数，None表示不限制
+            assign_weights: 为保留样本写入 "weight" 字段（组内出现次数 / 保留数）
+        """
+        if max_per_state is not None and max_per_state < 1:
+            raise ValueError(f"max_per_state必须为正整数: {max_per_state}")
+        self.max_per_state = max_per_state
+        self.assign_weights = assign_weights
+
+    @staticmethod
+    def make_key(board: Optional[List[str]], strategy: Optional[str], cot_length: Optional[str]) -> Tuple:
+        """构造去重键；无法解析棋盘时返回None（样本不参与去重）"""
+        if board is None:
+            return None
+        canonical, _ = canonical_board(board)
+        return (canonical, side_to_move(board), strategy, cot_length)
+
+    def deduplicate(self, keyed_samples: List[Tuple[Tuple, Dict]]) -> Tuple[List[Dict], Dict]:
+        """对 (key, sample) 列表去重，返回保留的样本和统计信息"""
+        occurrences = Counter(key for key, _ in keyed_samples if key is not None)
+        kept_counts = Counter()
+        kept = []
+
+        for key, sample in keyed_samples:
+            if key is not None:
+                if self.max_per_state is not None and kept_counts[key] >= self.max_per_state:
+                    continue
+                kept_counts[key] += 1
+            kept.append((key, sample))
+
+        samples = []
+        for key, sample in kept:
+            if key is not None and self.assign_weights:
+                sample = dict(sample)
+                sample["weight"] = round(occurrences[key] / kept_counts[key], 4)
+            samples.append(sample)
+
+        stats = self._build_statistics(keyed_samples, samples, occurrences)
+        return samples, stats
+
+    def _build_statistics(self, keyed_samples, samples, occurrences: Counter) -> Dict:
+        total = len(keyed_samples)
+        kept = len(samples)
+        return {
+            "total_samples": total,
+            "kept_samples": kept,
+            "dropped_samples": total - kept,
+            "reduction_ratio": round((total - kept) / total, 4) if total else 0.0,
+            "unique_states": len(occurrences),
+            "unkeyed_samples": sum(1 for key, _ in keyed_samples if key is None),
+            "max_per_state": self.max_per_state,
+            "most_repeated_states": [
+                {"board": key[0], "side": key[1], "strategy": key[2], "cot_length": key[3], "count": count}
+                for key, count in occurrences.most_common(5)
+            ]
+        }
+
+
+def print_dedup_statistics(stats: Dict):
+    """打印去重统计"""
+    print(f"🧹 样本去重结果:")
+    print(f"  原始样本: {stats['total_samples']}")
+    print(f"  保留样本: {stats['kept_samples']}")
+    print(f"  去除重复: {stats['dropped_samples']} ({stats['reduction_ratio']*100:.1f}%)")
+    print(f"  独特局面: {stats['unique_states']}")
+    for item in stats['most_repeated_states']:
+        print(f"  - {item['board']!r} {item['side']} {item['strategy']}/{item['cot_length']}: {item['count']}次")
@@ -0,0 +1,183 @@
+"""
+带偏移索引的JSONL SFT数据集
+
+data/processed 中的LLaMA-Factory JSON文件必须整体解析才能查看或抽样单条记录，
+对ultra_long数据集来说很慢。这里把样本写成 JSONL + 二进制偏移索引 (.idx)：
+
+- 索引文件: 8字节魔数 + uint64记录数 + (n+1)个uint64字节偏移（小端）
+- IndexedSFTDataset 通过mmap打开数据文件，__getitem__ 只解析对应的一行，
+  长度查询直接读索引，随机抽样无需解析整个文件
+
+LLaMA-Factory本身可以直接读取 .jsonl 数据文件。
+"""
+
+import json
+import mmap
+import os
+import random
+import struct
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+INDEX_MAGIC = b"SFTIDX01"
+INDEX_SUFFIX = ".idx"
+_HEADER = struct.Struct('<8sQ')
+
+
+def index_path_for(jsonl_path: str) -> str:
+    return jsonl_path + INDEX_SUFFIX
+
+
+def _write_index(offsets: List[int], index_path: str):
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(INDEX_MAGIC, len(offsets) - 1))
+        f.write(np.asarray(offsets, dtype='<u8').tobytes())
+    os.replace(tmp_path, index_path)
+
+
+def write_indexed_jsonl(samples: Iterable[Dict], jsonl_path: str) -> str:
+    """把样本写成JSONL并生成偏移索引，返回JSONL路径"""
+    offsets = [0]
+    tmp_path = jsonl_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        for sample in samples:
+            line = json.dumps(sample, ensure_ascii=False).encode('utf-8') + b"\n"
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    os.replace(tmp_path, jsonl_path)
+    _write_index(offsets, index_path_for(jsonl_path))
+    return jsonl_path
+
+
+def build_index(jsonl_path: str) -> str:
+    """为已有的JSONL文件扫描换行符重建索引
+
+    空行（包括文件中间的空行）不算作记录：每条记录从一个非空行开始，
+    其后的空行并入该记录的字节范围（json.loads 忽略空白），文件末尾的空行被忽略
+    """
+    offsets = []
+    position = end = 0
+    with open(jsonl_path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                offsets.append(position)
+                end = position + len(line)
+            position += len(line)
+    offsets.append(end)
+    index_path = index_path_for(jsonl_path)
+    _write_index(offsets, index_path)
+    return index_path
+
+
+def convert_json_to_indexed_jsonl(json_path: str, jsonl_path: str = None) -> str:
+    """把现有的LLaMA-Factory JSON数组文件转换为 JSONL + 索引"""
+    jsonl_path = jsonl_path or os.path.splitext(json_path)[0] + ".jsonl"
+    with open(json_path, 'r', encoding='utf-8') as f:
+        samples = json.load(f)
+    return write_indexed_jsonl(samples, jsonl_path)
+
+
+def response_text(sample: Dict) -> str:
+    """取出样本中的模型回答（LLaMA-Factory对话格式或alpaca格式）"""
+    if 'conversations' in sample:
+        return ''.join(turn.get('value', '') for turn in sample['conversations'] if turn.get('from') == 'gpt')
+    return sample.get('output', '')
+
+
+class IndexedSFTDataset:
+    """通过mmap随机访问的JSONL SFT数据集"""
+
+    def __init__(self, jsonl_path: str, rebuild_index: bool = False):
+        self.jsonl_path = jsonl_path
+        index_path = index_path_for(jsonl_path)
+        if rebuild_index or not os.path.exists(index_path) \
+                or os.path.getmtime(index_path) < os.path.getmtime(jsonl_path):
+            build_index(jsonl_path)
+
+        with open(index_path, 'rb') as f:
+            magic, count = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"无效的索引文件: {index_path}")
+        self._count = count
+        self._offsets = np.memmap(index_path, dtype='<u8', mode='r', offset=_HEADER.size, shape=(count + 1,))
+
+        self._file = open(jsonl_path, 'rb')
+        size = os.path.getsize(jsonl_path)
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _resolve(self, index: int) -> int:
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(f"index {index} out of range for {self._count} records")
+        return index
+
+    def raw(self, index: int) -> bytes:
+        """返回第index条记录的原始字节（不解析）"""
+        index = self._resolve(index)
+        return self._mmap[int(self._offsets[index]):int(self._offsets[index + 1])]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        return json.loads(self.raw(index))
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(self._count):
+            yield self[i]
+
+    def record_sizes(self) -> np.ndarray:
+        """每条记录的字节数，只读索引"""
+        return np.diff(np.asarray(self._offsets, dtype=np.int64)) - 1
+
+    def sample_indices(self, k: int, seed: Optional[int] = None) -> List[int]:
+        """无放回随机抽取k个记录下标"""
+        k = min(k, self._count)
+        return sorted(random.Random(seed).sample(range(self._count), k))
+
+    def sample(self, k: int, seed: Optional[int] = None) -> List[Dict]:
+        """随机抽样k条记录，只解析被选中的记录"""
+        return [self[i] for i in self.sample_indices(k, seed)]
+
+    def cot_lengths(self, indices: Optional[Iterable[int]] = None) -> List[int]:
+        """指定记录（默认全部）的回答字符数"""
+        indices = range(self._count) if indices is None else indices
+        return [len(response_text(self[i])) for i in indices]
+
+
+def main():
+    """把LLaMA-Factory JSON文件转换为带索引的JSONL，并打印抽样统计"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert SFT JSON files to indexed JSONL')
+    parser.add_argument('files', nargs='+', help='long_cot_sft_data_*.json files')
+    parser.add_argument('--stat-samples', type=int, default=1000, help='records sampled for CoT length stats')
+    args = parser.parse_args()
+
+    for json_path in args.files:
+        jsonl_path = convert_json_to_indexed_jsonl(json_path)
+        with IndexedSFTDataset(jsonl_path) as dataset:
+            lengths = dataset.cot_lengths(dataset.sample_indices(args.stat_samples, seed=0))
+            avg = sum(lengths) / len(lengths) if lengths else 0
+            print(f"✅ {json_path} -> {jsonl_path}: {len(dataset)} 条记录, 抽样平均回答长度 {avg:.1f} 字符")
+
+
+if __name__ == "__main__":
+    main()
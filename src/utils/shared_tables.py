@@ -0,0 +1,256 @@
+"""
+跨进程共享的只读查找表
+
+战术表（utils.tactics）、批量策略表（agents.batch_policy）和井字棋求解表（utils.tictactoe_oracle）
+原本在每个进程里各自生成，求解结果还各自缓存在lru_cache中；worker池扩展到几十上百个进程时，
+每个worker都要重复这些工作并持有一份副本。
+
+SharedTables.publish 在父进程中把全部表一次性写入一个内存映射文件（有 /dev/shm 时放在那里），
+并通过环境变量 TTT_SHARED_TABLES 把清单路径传给子进程。子进程（fork、spawn或subprocess启动的都可以）
+导入上述模块时调用 shared_arrays 直接映射该文件，得到只读的numpy视图，不再重新生成，
+物理内存中只有一份。父进程关闭 SharedTables（或 shared_table_pool 退出）时删除文件。
+
+没有使用 multiprocessing.shared_memory：Python 3.13之前，每个attach的进程都会把共享内存登记到
+resource_tracker，进程退出时被误删或报告泄漏；内存映射文件的效果相同且没有这个问题。
+
+用法:
+    with shared_table_pool(max_workers=64) as executor:
+        results = list(executor.map(work, items))
+
+    python src/utils/shared_tables.py bench --workers 16
+"""
+
+import atexit
+import importlib
+import json
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+# 作为脚本运行时（以及spawn启动的worker重新导入本文件时）把src加入路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+ENV_VAR = "TTT_SHARED_TABLES"
+DATA_FILE = "tables.bin"
+MANIFEST_FILE = "manifest.json"
+_ALIGNMENT = 64
+
+# 提供共享表的模块及其导出函数（返回 {表名: 数组}）
+TABLE_PROVIDERS = (
+    ("utils.tactics", "_shared_arrays"),
+    ("agents.batch_policy", "_shared_arrays"),
+    ("utils.tictactoe_oracle", "_shared_arrays"),
+)
+
+_attached: Optional["SharedTables"] = None
+_attached_path: Optional[str] = None
+
+
+class SharedTables:
+    """一组映射到同一个文件的只读numpy数组"""
+
+    def __init__(self, directory: str, arrays: Dict[str, np.ndarray], owner: bool, mapping: Optional[mmap.mmap] = None):
+        self.directory = directory
+        self.arrays = arrays
+        self.owner = owner  # 创建者负责删除文件
+        self._mapping = mapping
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_FILE)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays.values())
+
+    @classmethod
+    def publish(cls, tables: Dict[str, np.ndarray] = None, directory: str = None, export_env: bool = True) -> "SharedTables":
+        """把表写入内存映射文件并（默认）通过环境变量通知之后启动的子进程
+
+        Args:
+            tables: {表名: 数组}，默认收集 TABLE_PROVIDERS 中的全部表
+            directory: 存放位置，默认在 /dev/shm（不存在时用系统临时目录）下新建
+            export_env: 设置 TTT_SHARED_TABLES，使子进程导入时自动映射
+        """
+        if tables is None:
+            tables = collect_tables()
+        if directory is None:
+            base = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
+            directory = tempfile.mkdtemp(prefix=f"ttt_tables_{os.getpid()}_", dir=base)
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+        layout, offset = {}, 0
+        with open(os.path.join(directory, DATA_FILE), 'wb') as f:
+            for name, array in tables.items():
+                array = np.ascontiguousarray(array)
+                padding = -offset % _ALIGNMENT
+                f.write(b'\x00' * padding)
+                offset += padding
+                layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+                f.write(array.tobytes())
+                offset += array.nbytes
+
+        manifest_path = os.path.join(directory, MANIFEST_FILE)
+        with open(manifest_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump({"data_file": DATA_FILE, "tables": layout}, f)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+        published = cls._map(directory, owner=True)
+        if export_env:
+            os.environ[ENV_VAR] = manifest_path
+        atexit.register(published.close)
+        return published
+
+    @classmethod
+    def attach(cls, manifest_path: str) -> "SharedTables":
+        """映射已发布的表（只读）"""
+        return cls._map(os.path.dirname(os.path.abspath(manifest_path)), owner=False)
+
+    @classmethod
+    def _map(cls, directory: str, owner: bool) -> "SharedTables":
+        with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        with open(os.path.join(directory, manifest["data_file"]), 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        arrays = {}
+        for name, entry in manifest["tables"].items():
+            dtype = np.dtype(entry["dtype"])
+            count = int(np.prod(entry["shape"], dtype=np.int64))
+            arrays[name] = np.frombuffer(mapping, dtype=dtype, count=count, offset=entry["offset"]).reshape(entry["shape"])
+        return cls(directory, arrays, owner, mapping)
+
+    def close(self):
+        """创建者删除文件并撤销环境变量；已映射的视图在进程内仍然有效直到被回收"""
+        if self.owner and os.path.isdir(self.directory):
+            shutil.rmtree(self.directory, ignore_errors=True)
+            if os.environ.get(ENV_VAR) == self.manifest_path:
+                del os.environ[ENV_VAR]
+        self.owner = False
+
+    def __enter__(self) -> "SharedTables":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def collect_tables() -> Dict[str, np.ndarray]:
+    """导入 TABLE_PROVIDERS 中的模块并收集它们的表（在本进程中生成）"""
+    tables = {}
+    for module_name, function_name in TABLE_PROVIDERS:
+        tables.update(getattr(importlib.import_module(module_name), function_name)())
+    return tables
+
+
+def attached_tables() -> Optional[SharedTables]:
+    """本进程映射的共享表；环境变量未设置或文件不可用时返回None"""
+    global _attached, _attached_path
+    manifest_path = os.environ.get(ENV_VAR)
+    if not manifest_path:
+        return None
+    if _attached is None or _attached_path != manifest_path:
+        try:
+            _attached = SharedTables.attach(manifest_path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️  共享查找表不可用，将在本进程中生成: {e}")
+            _attached = None
+        _attached_path = manifest_path
+    return _attached
+
+
+def shared_arrays(*names: str) -> Optional[Tuple[np.ndarray, ...]]:
+    """返回共享表中的这些数组；任一不存在时返回None（调用方自行生成）"""
+    tables = attached_tables()
+    if tables is None or not all(name in tables.arrays for name in names):
+        return None
+    return tuple(tables.arrays[name] for name in names)
+
+
+def attach_worker(manifest_path: str):
+    """ProcessPoolExecutor 的initializer：在worker中映射共享表并预先导入依赖它们的模块"""
+    os.environ[ENV_VAR] = manifest_path
+    attached_tables()
+    for module_name, _ in TABLE_PROVIDERS:
+        importlib.import_module(module_name)
+
+
+@contextmanager
+def shared_table_pool(max_workers: Optional[int] = None, mp_context=None) -> Iterator[ProcessPoolExecutor]:
+    """发布共享表并创建使用它们的进程池；退出时先关闭进程池，再删除共享文件"""
+    published = SharedTables.publish()
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context,
+                                 initializer=attach_worker, initargs=(published.manifest_path,)) as executor:
+            yield executor
+    finally:
+        published.close()
+
+
+def _memory_usage() -> Dict[str, float]:
+    """本进程的RSS/PSS（MB，读取 /proc/self/smaps_rollup）"""
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup", 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ("Rss", "Pss"):
+                    usage[key.lower()] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return usage
+
+
+def _probe(_):
+    """bench用：导入全部表、完成一次求解表查询后报告启动耗时与内存"""
+    import time
+
+    start = time.time()
+    for module_name, _ in TABLE_PROVIDERS:
+        importlib.import_module(module_name)
+    from utils.tictactoe_oracle import _enumerate, find_all_optimal_moves
+    for board in _enumerate():
+        find_all_optimal_moves(list(board), 'X' if board.count('X') == board.count('O') else 'O')
+    return {"seconds": time.time() - start, "shared": attached_tables() is not None, **_memory_usage()}
+
+
+def main():
+    """比较共享与不共享时每个worker的启动耗时和内存"""
+    import argparse
+    import multiprocessing
+
+    parser = argparse.ArgumentParser(description='Shared lookup tables for worker pools')
+    parser.add_argument('command', choices=['bench'])
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    for shared in (False, True):
+        if shared:
+            pool = shared_table_pool(args.workers, mp_context=context)
+        else:
+            pool = _plain_pool(args.workers, context)
+        with pool as executor:
+            reports = list(executor.map(_probe, range(args.workers)))
+        label = "共享" if shared else "独立"
+        mean = {key: sum(r.get(key, 0) for r in reports) / len(reports) for key in ("seconds", "rss", "pss")}
+        print(f"📊 {label}: {args.workers} 个worker，平均启动+全表查询 {mean['seconds']:.2f}s，"
+              f"RSS {mean['rss']:.1f}MB，PSS {mean['pss']:.1f}MB")
+
+
+@contextmanager
+def _plain_pool(max_workers: int, mp_context) -> Iterator[ProcessPoolExecutor]:
+    os.environ.pop(ENV_VAR, None)
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context) as executor:
+        yield executor
+
+
+if __name__ == "__main__":
+    main()
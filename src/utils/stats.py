@@ -0,0 +1,115 @@
+"""
+评估与一致性检查用的小型统计工具（不依赖scipy）
+"""
+
+import math
+from statistics import NormalDist
+from typing import Sequence, Tuple
+
+
+def _regularized_gamma_q(a: float, x: float) -> float:
+    """正则化上不完全伽马函数 Q(a, x)：x < a + 1 时用级数，否则用连分式"""
+    if x <= 0:
+        return 1.0
+    log_prefix = -x + a * math.log(x) - math.lgamma(a)
+    if x < a + 1:
+        term = total = 1.0 / a
+        n = a
+        for _ in range(1000):
+            n += 1
+            term *= x / n
+            total += term
+            if abs(term) < abs(total) * 1e-15:
+                break
+        return max(0.0, 1.0 - total * math.exp(log_prefix))
+
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return min(1.0, math.exp(log_prefix) * h)
+
+
+def chi_square_sf(statistic: float, dof: int) -> float:
+    """卡方分布的生存函数 P(X >= statistic)"""
+    if math.isinf(statistic):
+        return 0.0
+    if dof <= 0:
+        return 1.0
+    return _regularized_gamma_q(dof / 2.0, statistic / 2.0)
+
+
+def chi_square_statistic(observed: Sequence[int], probabilities: Sequence[float]) -> Tuple[float, int]:
+    """拟合优度卡方统计量及自由度（只计入期望概率大于0的格子）
+
+    观察到期望概率为0的取值时返回无穷大，表示支撑集不一致
+    """
+    total = sum(observed)
+    statistic, cells = 0.0, 0
+    for count, probability in zip(observed, probabilities):
+        if probability <= 0:
+            if count:
+                return math.inf, 0
+            continue
+        expected = total * probability
+        statistic += (count - expected) ** 2 / expected
+        cells += 1
+    return statistic, max(cells - 1, 0)
+
+
+def chi_square_test(observed: Sequence[int], probabilities: Sequence[float]) -> Tuple[float, int, float]:
+    """单个分布的拟合优度检验，返回 (统计量, 自由度, p值)"""
+    statistic, dof = chi_square_statistic(observed, probabilities)
+    return statistic, dof, chi_square_sf(statistic, dof)
+
+
+def normal_quantile(confidence: float) -> float:
+    """双侧置信水平对应的标准正态分位数（0.95 -> 1.96）"""
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def wilson_interval(successes: int, total: int, confidence: float = 0.95) -> Tuple[float, float]:
+    """二项比例的Wilson得分置信区间；样本少或准确率接近0/1时比正态近似可靠"""
+    if total <= 0:
+        return 0.0, 1.0
+    z = normal_quantile(confidence)
+    p = successes / total
+    denominator = 1 + z * z / total
+    center = (p + z * z / (2 * total)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+def paired_difference_interval(new_only: int, baseline_only: int, total: int,
+                               confidence: float = 0.95) -> Tuple[float, float, float]:
+    """配对比较两个模型准确率之差的Agresti-Min置信区间
+
+    Args:
+        new_only: 只有新模型答对的案例数
+        baseline_only: 只有基线模型答对的案例数
+        total: 配对案例总数
+
+    Returns:
+        (差值点估计, 下界, 上界)；每个格子加0.5的伪计数，案例少或双方几乎全部一致时区间仍然可用
+    """
+    if total <= 0:
+        return 0.0, -1.0, 1.0
+    z = normal_quantile(confidence)
+    b, c, n = new_only + 0.5, baseline_only + 0.5, total + 2
+    difference = (b - c) / n
+    half_width = z * math.sqrt(max((b + c) - (b - c) ** 2 / n, 0.0)) / n
+    estimate = (new_only - baseline_only) / total
+    return estimate, max(-1.0, difference - half_width), min(1.0, difference + half_width)
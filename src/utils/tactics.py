@@ -0,0 +1,133 @@
+"""
+井字棋战术查找表
+
+以 (己方位掩码, 对方位掩码) 为下标预先计算所有局面的战术信息，
+每个战术问题都变成一次数组读取：
+
+- WIN_SQUARES[idx]:    己方一步即可获胜的空位（位掩码）
+- THREAT_COUNT[idx]:   己方"两子一空"的线路数量
+- FORK_SQUARES[idx]:   落子后威胁线路数 >= 2 的空位（位掩码）
+- 阻挡对方获胜的空位 = 交换双方掩码后的 WIN_SQUARES
+
+下标 idx = own_mask << 9 | opp_mask，第i位对应棋盘第i格。
+表在导入时用numpy向量化生成（2^18项，毫秒级），无需缓存文件；
+父进程发布了共享表（utils.shared_tables）时直接映射，不再生成。
+
+按棋盘几何参数化的函数（geometry 为 utils.mnk.BoardGeometry）在非3x3棋盘上
+改用生成的线路掩码逐线计算。
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+
+from utils.board_utils import WINNING_LINES
+from utils.mnk import TICTACTOE
+from utils.shared_tables import shared_arrays
+
+LINE_MASKS = tuple(sum(1 << pos for pos in line) for line in WINNING_LINES)
+FULL_MASK = (1 << 9) - 1
+
+# 每个9位掩码对应的格子列表（升序）
+MASK_SQUARES: Tuple[Tuple[int, ...], ...] = tuple(
+    tuple(pos for pos in range(9) if mask >> pos & 1) for mask in range(1 << 9)
+)
+
+
+def _build_tables():
+    popcount = np.array([bin(mask).count('1') for mask in range(1 << 9)], dtype=np.uint8)
+    idx = np.arange(1 << 18, dtype=np.int64)
+    own, opp = idx >> 9, idx & FULL_MASK
+    valid = (own & opp) == 0
+
+    win_squares = np.zeros(1 << 18, dtype=np.uint16)
+    threat_count = np.zeros(1 << 18, dtype=np.uint8)
+    for line in LINE_MASKS:
+        is_threat = valid & (popcount[own & line] == 2) & ((opp & line) == 0)
+        win_squares |= np.where(is_threat, line & ~own, 0).astype(np.uint16)
+        threat_count += is_threat
+
+    fork_squares = np.zeros(1 << 18, dtype=np.uint16)
+    for pos in range(9):
+        bit = 1 << pos
+        empty = valid & (((own | opp) & bit) == 0)
+        after = threat_count[((own | bit) << 9) | opp]
+        fork_squares |= np.where(empty & (after >= 2), bit, 0).astype(np.uint16)
+
+    for table in (win_squares, threat_count, fork_squares):
+        table.setflags(write=False)
+    return win_squares, threat_count, fork_squares
+
+
+WIN_SQUARES, THREAT_COUNT, FORK_SQUARES = (shared_arrays("tactics.win_squares", "tactics.threat_count", "tactics.fork_squares")
+                                           or _build_tables())
+
+
+def _shared_arrays():
+    return {"tactics.win_squares": WIN_SQUARES, "tactics.threat_count": THREAT_COUNT, "tactics.fork_squares": FORK_SQUARES}
+
+
+def board_masks(board: List[str], symbol: str) -> Tuple[int, int]:
+    """返回 (symbol方位掩码, 另一方位掩码)"""
+    own = opp = 0
+    for pos, cell in enumerate(board):
+        if cell == symbol:
+            own |= 1 << pos
+        elif cell != ' ':
+            opp |= 1 << pos
+    return own, opp
+
+
+def moves_to_mask(moves) -> int:
+    mask = 0
+    for pos in moves:
+        mask |= 1 << pos
+    return mask
+
+
+def lookup(own: int, opp: int) -> Tuple[int, int, int, int]:
+    """一次查询返回 (获胜空位, 阻挡空位, fork空位, 威胁线路数)"""
+    idx = own << 9 | opp
+    return int(WIN_SQUARES[idx]), int(WIN_SQUARES[opp << 9 | own]), int(FORK_SQUARES[idx]), int(THREAT_COUNT[idx])
+
+
+def _is_tictactoe(geometry) -> bool:
+    return geometry is None or geometry == TICTACTOE
+
+
+def winning_squares(board: List[str], symbol: str, available_moves=None, geometry=None) -> List[int]:
+    """symbol一步获胜的所有位置（升序，不重复）"""
+    if not _is_tictactoe(geometry):
+        own, opp = geometry.board_masks(board, symbol)
+        mask = geometry.win_squares(own, opp) & ~(own | opp)
+        if available_moves is not None:
+            mask &= moves_to_mask(available_moves)
+        return geometry.squares(mask)
+    own, opp = board_masks(board, symbol)
+    mask = int(WIN_SQUARES[own << 9 | opp])
+    if available_moves is not None:
+        mask &= moves_to_mask(available_moves)
+    return list(MASK_SQUARES[mask])
+
+
+def fork_squares(board: List[str], symbol: str, available_moves=None, geometry=None) -> List[int]:
+    """symbol落子后形成两条及以上威胁线路的位置（升序）"""
+    if not _is_tictactoe(geometry):
+        own, opp = geometry.board_masks(board, symbol)
+        mask = geometry.fork_squares(own, opp)
+        if available_moves is not None:
+            mask &= moves_to_mask(available_moves)
+        return geometry.squares(mask)
+    own, opp = board_masks(board, symbol)
+    mask = int(FORK_SQUARES[own << 9 | opp])
+    if available_moves is not None:
+        mask &= moves_to_mask(available_moves)
+    return list(MASK_SQUARES[mask])
+
+
+def threat_count(board: List[str], symbol: str, geometry=None) -> int:
+    """symbol"差一子连线"的线路数量（3x3上即"两子一空"）"""
+    if not _is_tictactoe(geometry):
+        return geometry.threat_count(*geometry.board_masks(board, symbol))
+    own, opp = board_masks(board, symbol)
+    return int(THREAT_COUNT[own << 9 | opp])
@@ -0,0 +1,341 @@
+"""
+井字棋完全求解器与状态空间枚举
+
+对所有合法局面做带记忆化的精确minimax（评分规则与
+evaluation/generate_multi_optimal_test_set.py 中的 minimax 一致：越快获胜分数越高），
+并枚举全部合法的非终局局面（4520个），为每个局面标注阶段、难度与移动类型，
+用于生成分层抽样、无重复的测试集。
+
+其他棋盘几何（utils.mnk.BoardGeometry）改用 MNKSolver 求解，评分规则相同。
+
+全部局面的求解结果也可以整理成以棋盘编码（x_mask | o_mask << 9）为下标的表，
+由 utils.shared_tables 发布给worker进程共享；映射了共享表的进程直接查表，不再各自递归求解和缓存。
+"""
+
+import random
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.board_utils import WINNING_LINES, canonical_board, side_to_move
+from utils.mnk import MNKSolver, resolve_geometry, TICTACTOE
+from utils.shared_tables import shared_arrays
+from utils.tactics import winning_squares
+
+STAGES = ("opening", "midgame", "endgame")
+DIFFICULTIES = ("easy", "medium", "hard")
+MOVE_TYPES = ("winning_move", "blocking_move", "winning_sequence", "draw_move", "best_defense")
+UNKNOWN_SCORE = -128  # 求解表中不可达局面的分数
+_TABLE_NAMES = ("oracle.scores", "oracle.optimal_moves", "oracle.move_types", "oracle.best_scores")
+
+
+def winner_of(board: str) -> Optional[str]:
+    """返回获胜方（'X'/'O'），没有则返回None"""
+    for a, b, c in WINNING_LINES:
+        if board[a] != ' ' and board[a] == board[b] == board[c]:
+            return board[a]
+    return None
+
+
+def _place(board: str, pos: int, mark: str) -> str:
+    return board[:pos] + mark + board[pos + 1:]
+
+
+@lru_cache(maxsize=None)
+def _negamax(board: str, mover: str) -> int:
+    """轮到mover时局面的精确分数（mover视角，深度从当前局面计）
+
+    对方刚刚获胜记为-10；每多一步，分数向0收缩1，与原minimax的 10-depth / depth-10 等价
+    """
+    if winner_of(board) is not None:
+        return -10
+    if ' ' not in board:
+        return 0
+    opponent = 'O' if mover == 'X' else 'X'
+    best = -float('inf')
+    for pos in range(9):
+        if board[pos] == ' ':
+            score = -_negamax(_place(board, pos, mover), opponent)
+            score -= (score > 0) - (score < 0)
+            best = max(best, score)
+    return best
+
+
+def move_scores(board: List[str], player: str) -> Dict[int, int]:
+    """每个空位落子后的minimax分数（等价于原实现中 minimax(board, 0, False, player, opponent)）"""
+    board_str = ''.join(board)
+    opponent = 'O' if player == 'X' else 'X'
+    if _SHARED is not None and _table_state(board_str, player) is not None:
+        scores = {pos: -int(_SHARED[0][_table_state(_place(board_str, pos, player), opponent)])
+                  for pos in range(9) if board_str[pos] == ' '}
+        if -UNKNOWN_SCORE not in scores.values():
+            return scores
+    return {pos: -_negamax(_place(board_str, pos, player), opponent)
+            for pos in range(9) if board_str[pos] == ' '}
+
+
+@lru_cache(maxsize=None)
+def _solve(board: str, player: str) -> Tuple[Tuple[int, ...], str, int]:
+    opponent = 'O' if player == 'X' else 'X'
+
+    winning_moves = tuple(winning_squares(list(board), player))
+    if winning_moves:
+        return winning_moves, "winning_move", 1000
+
+    blocking_moves = tuple(winning_squares(list(board), opponent))
+    if blocking_moves:
+        return blocking_moves, "blocking_move", 500
+
+    scores = move_scores(list(board), player)
+    best_score = max(scores.values())
+    optimal_moves = tuple(pos for pos, score in scores.items() if score == best_score)
+    if best_score > 0:
+        move_type = "winning_sequence"
+    elif best_score == 0:
+        move_type = "draw_move"
+    else:
+        move_type = "best_defense"
+    return optimal_moves, move_type, best_score
+
+
+_SOLVERS: Dict = {}
+
+
+def solver_for(geometry) -> MNKSolver:
+    """每种棋盘几何共用一个求解器（置换表在查询间复用）"""
+    geometry = resolve_geometry(geometry)
+    if geometry not in _SOLVERS:
+        _SOLVERS[geometry] = MNKSolver(geometry)
+    return _SOLVERS[geometry]
+
+
+def find_all_optimal_moves(board: List[str], player: str, geometry=None) -> Tuple[List[int], str, int]:
+    """与 TicTacToeMultiOptimalTestSetGenerator.find_all_optimal_moves 返回相同结果，但结果被缓存
+
+    geometry 不是3x3时用 MNKSolver 精确求解（只适合能完整搜索的棋盘大小）
+    """
+    geometry = resolve_geometry(geometry)
+    if geometry == TICTACTOE:
+        state = _table_state(board, player) if _SHARED is not None else None
+        if state is not None and _SHARED[2][state] >= 0:
+            mask = int(_SHARED[1][state])
+            return ([pos for pos in range(9) if mask >> pos & 1], MOVE_TYPES[_SHARED[2][state]],
+                    int(_SHARED[3][state]))
+        optimal_moves, move_type, score = _solve(''.join(board), player)
+        return list(optimal_moves), move_type, score
+
+    opponent = 'O' if player == 'X' else 'X'
+    winning_moves = winning_squares(board, player, geometry=geometry)
+    if winning_moves:
+        return winning_moves, "winning_move", 1000
+    blocking_moves = winning_squares(board, opponent, geometry=geometry)
+    if blocking_moves:
+        return blocking_moves, "blocking_move", 500
+    optimal_moves, best_score = solver_for(geometry).optimal_moves(board)
+    if best_score > 0:
+        move_type = "winning_sequence"
+    elif best_score == 0:
+        move_type = "draw_move"
+    else:
+        move_type = "best_defense"
+    return optimal_moves, move_type, best_score
+
+
+def stage_of(board: List[str]) -> str:
+    """按已落子比例划分阶段：3x3上为 0-2开局，3-5中局，6-8残局"""
+    size = len(board)
+    num_moves = size - list(board).count(' ')
+    if num_moves * 9 <= 2 * size:
+        return "opening"
+    if num_moves * 9 <= 5 * size:
+        return "midgame"
+    return "endgame"
+
+
+def difficulty_of(stage: str, move_type: str) -> str:
+    """沿用测试集生成器的难度规则"""
+    if stage == "opening":
+        return "easy"
+    if stage == "midgame":
+        if move_type == "winning_move":
+            return "easy"
+        if move_type in ("blocking_move", "winning_sequence"):
+            return "medium"
+        return "hard"
+    return "medium" if move_type in ("winning_move", "blocking_move") else "hard"
+
+
+@lru_cache(maxsize=None)
+def _enumerate() -> Tuple[str, ...]:
+    """从空棋盘出发遍历所有可达的非终局局面"""
+    seen = set()
+    stack = [' ' * 9]
+    while stack:
+        board = stack.pop()
+        if board in seen:
+            continue
+        seen.add(board)
+        mover = side_to_move(board)
+        for pos in range(9):
+            if board[pos] == ' ':
+                child = _place(board, pos, mover)
+                if winner_of(child) is None and ' ' in child:
+                    stack.append(child)
+    return tuple(sorted(seen))
+
+
+def _table_state(board, player: str) -> Optional[int]:
+    """合法局面（双方子数匹配且轮到player）的棋盘编码，否则返回None"""
+    x_count, o_count = board.count('X'), board.count('O')
+    if not (x_count == o_count or x_count == o_count + 1) or player != ('X' if x_count == o_count else 'O'):
+        return None
+    state = 0
+    for pos, cell in enumerate(board):
+        if cell == 'X':
+            state |= 1 << pos
+        elif cell == 'O':
+            state |= 1 << (pos + 9)
+    return state
+
+
+def build_oracle_tables() -> Tuple[np.ndarray, ...]:
+    """以棋盘编码为下标的求解表
+
+    Returns:
+        (scores, optimal_moves, move_types, best_scores)
+        scores: 轮到执子方时的 _negamax 分数（含终局），不可达局面为 UNKNOWN_SCORE
+        optimal_moves / move_types / best_scores: 非终局局面 find_all_optimal_moves 的结果
+        （最优落子位掩码、MOVE_TYPES下标（-1为不可达）、分数）
+    """
+    scores = np.full(1 << 18, UNKNOWN_SCORE, dtype=np.int8)
+    optimal_moves = np.zeros(1 << 18, dtype=np.uint16)
+    move_types = np.full(1 << 18, -1, dtype=np.int8)
+    best_scores = np.zeros(1 << 18, dtype=np.int16)
+    for board in _enumerate():
+        player = side_to_move(board)
+        opponent = 'O' if player == 'X' else 'X'
+        state = _table_state(board, player)
+        scores[state] = _negamax(board, player)
+        for pos in range(9):
+            if board[pos] == ' ':
+                child = _place(board, pos, player)
+                scores[_table_state(child, opponent)] = _negamax(child, opponent)
+        moves, move_type, score = _solve(board, player)
+        optimal_moves[state] = sum(1 << pos for pos in moves)
+        move_types[state] = MOVE_TYPES.index(move_type)
+        best_scores[state] = score
+    for table in (scores, optimal_moves, move_types, best_scores):
+        table.setflags(write=False)
+    return scores, optimal_moves, move_types, best_scores
+
+
+# 父进程发布了共享表时直接查表；否则按需递归求解（lru_cache），不在导入时生成
+_SHARED = shared_arrays(*_TABLE_NAMES)
+
+
+def _shared_arrays():
+    return dict(zip(_TABLE_NAMES, _SHARED if _SHARED is not None else build_oracle_tables()))
+
+
+def enumerate_positions(symmetry_unique: bool = False) -> List[Dict]:
+    """枚举全部合法非终局局面并标注
+
+    Args:
+        symmetry_unique: 每个对称等价类只保留规范化表示
+
+    Returns:
+        [{"board", "player", "canonical", "stage", "difficulty", "move_type", "optimal_moves", "score"}]
+    """
+    positions = []
+    for board_str in _enumerate():
+        canonical, _ = canonical_board(board_str)
+        if symmetry_unique and board_str != canonical:
+            continue
+        board = list(board_str)
+        player = side_to_move(board)
+        optimal_moves, move_type, score = find_all_optimal_moves(board, player)
+        stage = stage_of(board)
+        positions.append({
+            "board": board,
+            "player": player,
+            "canonical": canonical,
+            "stage": stage,
+            "difficulty": difficulty_of(stage, move_type),
+            "move_type": move_type,
+            "optimal_moves": optimal_moves,
+            "score": score,
+        })
+    return positions
+
+
+def sample_positions(geometry, num_positions: int, seed: int = 42, max_attempts: int = None) -> List[Dict]:
+    """随机对弈采样互不相同的合法非终局局面（状态空间无法枚举的棋盘使用）
+
+    每个局面用 MNKSolver 精确求解并按与 enumerate_positions 相同的字段标注
+    """
+    geometry = resolve_geometry(geometry)
+    rng = random.Random(seed)
+    seen = set()
+    positions = []
+    attempts = 0
+    max_attempts = max_attempts or num_positions * 50
+    while len(positions) < num_positions and attempts < max_attempts:
+        attempts += 1
+        board = geometry.empty_board()
+        for _ in range(rng.randrange(geometry.size)):
+            mover = side_to_move(board)
+            board[rng.choice([i for i, cell in enumerate(board) if cell == ' '])] = mover
+            if geometry.winner(board) is not None:
+                break
+        board_str = ''.join(board)
+        if geometry.winner(board) is not None or ' ' not in board or board_str in seen:
+            continue
+        seen.add(board_str)
+        player = side_to_move(board)
+        optimal_moves, move_type, score = find_all_optimal_moves(board, player, geometry)
+        stage = stage_of(board)
+        positions.append({
+            "board": board,
+            "player": player,
+            "canonical": board_str,
+            "stage": stage,
+            "difficulty": difficulty_of(stage, move_type),
+            "move_type": move_type,
+            "optimal_moves": optimal_moves,
+            "score": score,
+        })
+    return positions
+
+
+def stratified_sample(positions: List[Dict], num_cases: int, seed: int = 42,
+                      strata: Tuple[str, ...] = ("stage", "difficulty")) -> List[Dict]:
+    """按 strata 字段分层、各层尽量均分地无放回抽样
+
+    层内样本不足时剩余名额依次分给其他层；请求数量超过总数时返回全部局面
+    """
+    rng = random.Random(seed)
+    groups = defaultdict(list)
+    for position in positions:
+        groups[tuple(position[field] for field in strata)].append(position)
+
+    keys = sorted(groups)
+    for key in keys:
+        rng.shuffle(groups[key])
+
+    quotas = {key: 0 for key in keys}
+    remaining = min(num_cases, len(positions))
+    while remaining > 0:
+        open_keys = [key for key in keys if quotas[key] < len(groups[key])]
+        share = max(1, remaining // len(open_keys))
+        for key in open_keys:
+            take = min(share, len(groups[key]) - quotas[key], remaining)
+            quotas[key] += take
+            remaining -= take
+            if remaining == 0:
+                break
+
+    sample = [position for key in keys for position in groups[key][:quotas[key]]]
+    rng.shuffle(sample)
+    return sample
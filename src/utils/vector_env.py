@@ -0,0 +1,107 @@
+"""
+向量化井字棋环境
+
+一次调用推进整批对局，配合 QwenAgent.act_batch 做大规模规则self-play。
+棋盘以编码形式存储（x_mask | o_mask << 9，见 agents.batch_policy），
+只有需要保存的对局才渲染为与 MockTicTacToeEnv 相同格式的观察文本。
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+
+from utils.board_utils import WINNING_LINES
+from utils.mock_env import board_to_string, render_observation
+
+FULL_MASK = (1 << 9) - 1
+# IS_WIN[mask]: 该方棋子是否已连成一线
+IS_WIN = np.zeros(1 << 9, dtype=bool)
+for _line in WINNING_LINES:
+    _line_mask = sum(1 << pos for pos in _line)
+    IS_WIN |= (np.arange(1 << 9) & _line_mask) == _line_mask
+
+
+def decode_board(state: int) -> List[str]:
+    """棋盘编码 -> ['X', 'O', ' ', ...]"""
+    return ['X' if state >> pos & 1 else 'O' if state >> (pos + 9) & 1 else ' ' for pos in range(9)]
+
+
+def encode_board(board: List[str]) -> int:
+    """['X', 'O', ' ', ...] -> 棋盘编码"""
+    state = 0
+    for pos, cell in enumerate(board):
+        if cell == 'X':
+            state |= 1 << pos
+        elif cell == 'O':
+            state |= 1 << (pos + 9)
+    return state
+
+
+class VectorTicTacToeEnv:
+    """num_envs 局同时进行的井字棋（规则与 MockTicTacToeEnv 相同）"""
+
+    def __init__(self, num_envs: int):
+        self.num_envs = num_envs
+        self.reset()
+
+    def reset(self, num_envs: int = None) -> np.ndarray:
+        """重置全部对局，返回棋盘编码数组"""
+        if num_envs is not None:
+            self.num_envs = num_envs
+        self.x_mask = np.zeros(self.num_envs, dtype=np.int64)
+        self.o_mask = np.zeros(self.num_envs, dtype=np.int64)
+        self.current_player = np.zeros(self.num_envs, dtype=np.int8)
+        self.done = np.zeros(self.num_envs, dtype=bool)
+        self.winner = np.full(self.num_envs, -1, dtype=np.int8)  # -1: 未结束或平局
+        self.turn_count = np.zeros(self.num_envs, dtype=np.int8)
+        return self.states
+
+    @property
+    def states(self) -> np.ndarray:
+        return self.x_mask | (self.o_mask << 9)
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """为所有未结束的对局执行一步，返回 (done, winner)
+
+        已结束的对局忽略对应的action；未结束对局的非法落子抛出ValueError
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        active = ~self.done
+        bits = np.where(active, np.left_shift(1, np.clip(actions, 0, 8)), 0)
+        occupied = self.x_mask | self.o_mask
+        illegal = active & ((actions < 0) | (actions > 8) | ((occupied & bits) != 0))
+        if illegal.any():
+            i = int(np.flatnonzero(illegal)[0])
+            raise ValueError(f"Illegal action {actions[i]} in env {i}")
+
+        x_turn = self.current_player == 0
+        self.x_mask |= np.where(x_turn, bits, 0)
+        self.o_mask |= np.where(x_turn, 0, bits)
+        self.turn_count += active
+
+        mover_mask = np.where(x_turn, self.x_mask, self.o_mask)
+        won = active & IS_WIN[mover_mask]
+        full = active & ((self.x_mask | self.o_mask) == FULL_MASK)
+        self.winner[won] = self.current_player[won]
+        self.done |= won | full
+        self.current_player = np.where(active & ~self.done, 1 - self.current_player, self.current_player).astype(np.int8)
+        return self.done.copy(), self.winner.copy()
+
+    def board(self, i: int) -> List[str]:
+        return decode_board(int(self.states[i]))
+
+    def get_observation(self, i: int) -> Tuple[int, str]:
+        """第i局当前执子方的观察文本（与 MockTicTacToeEnv.get_observation 格式相同）"""
+        player = int(self.current_player[i])
+        return player, render_observation(self.board(i), player)
+
+    def game_info(self, i: int) -> dict:
+        """第i局结束后的信息（与 MockTicTacToeEnv.close 的game_info格式相同）"""
+        winner = int(self.winner[i]) if self.winner[i] >= 0 else None
+        return {
+            "winner": winner,
+            "final_board": board_to_string(self.board(i)),
+            "game_over": bool(self.done[i]),
+            "total_turns": int(self.turn_count[i]),
+            "outcome": "draw" if winner is None else f"player_{winner}_wins"
+        }
@@ -0,0 +1,47 @@
+"""
+推理相关测试共用的fixture：字节级小词表tokenizer与随机初始化的小Qwen2模型（未安装torch/transformers时跳过）
+"""
+
+import pytest
+
+VOCAB_SIZE = 64
+
+
+class ByteTokenizer:
+    """UTF-8字节对词表大小取模；chr(64 + token) 编码回同一个token；decode返回token编号，便于与 model.generate 逐token比较"""
+
+    eos_token_id = None
+    vocab_size = VOCAB_SIZE
+
+    def __call__(self, text, return_tensors=None, truncation=False, add_special_tokens=True):
+        ids = [byte % VOCAB_SIZE for byte in text.encode('utf-8')]
+        if return_tensors == "pt":
+            import torch
+            return {"input_ids": torch.tensor([ids])}
+        return {"input_ids": ids}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return " ".join(str(int(token)) for token in ids)
+
+
+@pytest.fixture
+def byte_tokenizer():
+    pytest.importorskip("torch")
+    return ByteTokenizer()
+
+
+@pytest.fixture
+def tiny_qwen():
+    """tiny_qwen(hidden_size=32, intermediate_size=64, double=True)：固定随机种子的2层Qwen2模型（eval模式）"""
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+
+    def make(hidden_size: int = 32, intermediate_size: int = 64, double: bool = True):
+        torch.manual_seed(0)
+        config = transformers.Qwen2Config(vocab_size=VOCAB_SIZE, hidden_size=hidden_size,
+                                          intermediate_size=intermediate_size, num_hidden_layers=2,
+                                          num_attention_heads=4, num_key_value_heads=2)
+        model = transformers.Qwen2ForCausalLM(config)
+        return (model.double() if double else model).eval()
+
+    return make
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""
+Tests for learning CoT-length adapter routing tables from evaluation results
+"""
+
+import json
+import os
+import sys
+import zlib
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from models.adapter_router import AdapterRouter, learn_routing_table, position_class
+from utils.board_utils import parse_board_from_observation
+
+TEST_SET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'data', 'processed', 'tictactoe_test_set_100_multi_optimal.json')
+
+
+def _write_evaluation(tmp_path, name, cases, correct_fn, output_length):
+    path = tmp_path / f"evaluation_{name}_cuda_0_20250101_000000.json"
+    path.write_text(json.dumps({
+        "evaluation_info": {"model_path": f"/models/qwen_{name}_cot_lora"},
+        "detailed_results": [{
+            "board_state": case["board_state"],
+            "player": case["player"],
+            "model_output": "x" * output_length,
+            "is_correct": correct_fn(case),
+        } for case in cases],
+    }), encoding='utf-8')
+    return str(path)
+
+
+def test_routes_each_class_to_shortest_adapter_without_accuracy_loss(tmp_path):
+    with open(TEST_SET, 'r', encoding='utf-8') as f:
+        cases = json.load(f)
+    # tiny只会直接取胜，long在对局未定的局面上出错，ultra_long全对
+    files = [
+        _write_evaluation(tmp_path, "tiny", cases, lambda case: case["move_type"] == "winning_move", 60),
+        _write_evaluation(tmp_path, "long", cases, lambda case: case["move_type"] != "draw_move", 900),
+        _write_evaluation(tmp_path, "ultra_long", cases, lambda case: True, 3000),
+    ]
+
+    table = learn_routing_table(files, features=("move_type",), min_cases=3)
+
+    assert table["default"] == "ultra_long"
+    assert table["routes"]["move_type=winning_move"] == "tiny"
+    assert table["routes"]["move_type=blocking_move"] == "long"
+    assert table["routes"]["move_type=draw_move"] == "ultra_long"
+    estimate = table["estimate"]
+    assert estimate["routed_accuracy"] == estimate["default_accuracy"] == estimate["loo_routed_accuracy"] == 1.0
+    assert estimate["routed_mean_output_length"] < estimate["default_mean_output_length"] / 2
+
+    router = AdapterRouter(table)
+    case = next(case for case in cases if case["move_type"] == "winning_move")
+    observation = f"Game Board:\n{case['board_state']}"
+    board = parse_board_from_observation(observation)
+    assert position_class(board, case["player"], ("move_type",)) == "move_type=winning_move"
+    assert router.route(observation, case["player"]) == "tiny"
+
+
+def test_leave_one_out_estimate_exposes_selection_noise(tmp_path):
+    with open(TEST_SET, 'r', encoding='utf-8') as f:
+        cases = json.load(f)
+    # 两个adapter准确率相同（各自随机答错约20%），短的那个在样本内"不损失准确率"的类别上被选中
+    noisy = lambda salt: (lambda case: zlib.crc32(f"{case['board_state']}{case['player']}{salt}".encode()) % 5 != 0)
+    files = [
+        _write_evaluation(tmp_path, "tiny", cases, noisy("tiny"), 60),
+        _write_evaluation(tmp_path, "ultra_long", cases, noisy("ultra_long"), 3000),
+    ]
+    table = learn_routing_table(files, features=("stage", "move_type"), min_cases=3)
+    estimate = table["estimate"]
+    assert table["min_cases"] == 3
+    assert estimate["loo_routed_accuracy"] < estimate["routed_accuracy"]
+    assert learn_routing_table(files)["min_cases"] == 20
+
+
+def test_disjoint_evaluations_are_rejected(tmp_path):
+    with open(TEST_SET, 'r', encoding='utf-8') as f:
+        cases = json.load(f)
+    files = [
+        _write_evaluation(tmp_path, "tiny", cases[:50], lambda case: True, 60),
+        _write_evaluation(tmp_path, "long", cases[50:], lambda case: True, 900),
+    ]
+    with pytest.raises(ValueError, match=r"没有共同的局面（tiny: \d+, long: \d+）"):
+        learn_routing_table(files)
+
+
+def test_router_forwards_generation_kwargs():
+    class RecordingWrapper:
+        def __init__(self):
+            self.model = self
+            self.calls = []
+
+        def set_adapter(self, name):
+            self.adapter = name
+
+        def generate_move_with_cot(self, observation, player_mark="X", **kwargs):
+            self.calls.append((self.adapter, player_mark, kwargs))
+            return "", "[4]"
+
+    router = AdapterRouter({"features": ["move_type"], "routes": {}, "default": "long",
+                            "adapters": {"long": "/models/qwen_long_cot_lora"}})
+    router.wrapper, router._peft_names = RecordingWrapper(), {"long": "default"}
+    router.generate_move_with_cot("Game Board:\n", "O", draft_cot_length="long")
+    assert router.wrapper.calls == [("default", "O", {"draft_cot_length": "long"})]
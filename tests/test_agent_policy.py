@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+"""
+Tests for QwenAgent.policy with a loaded (stand-in) model: speculative draft parameters
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from agents.qwen_agent import GameContext, QwenAgent
+from models.template_drafts import render_draft
+from utils.mock_env import MockTicTacToeEnv
+
+
+def test_draft_uses_the_agents_move_count():
+    env = MockTicTacToeEnv()
+    env.reset()
+    for action in (4, 0, 8, 2):
+        env.step(f"[{action}]")
+    _, observation = env.get_observation()
+
+    class DraftingModel:
+        """记录草稿参数并按其渲染草稿的本地模型替身"""
+        is_loaded = True
+        speculator = object()
+
+        def generate_move_with_cot(self, observation, player_mark="X", **draft_kwargs):
+            self.draft_kwargs = draft_kwargs
+            self.draft = render_draft(observation, draft_kwargs["draft_cot_length"], draft_kwargs["draft_strategy"],
+                                      move_count=draft_kwargs["draft_move_count"], player_mark=player_mark)
+            return "", "[6]"
+
+    agent = QwenAgent()
+    agent.model = DraftingModel()
+    context = GameContext(strategy='balanced', cot_length='medium', seed=0)
+    context.move_count = 2  # X已经下过两步
+    agent.policy(observation, context)
+    assert agent.model.draft_kwargs["draft_move_count"] == 3
+    assert "第3步" in agent.model.draft and "第1步" not in agent.model.draft
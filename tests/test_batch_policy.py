@@ -0,0 +1,76 @@
+"""
+批量规则策略与标量实现的一致性测试
+"""
+
+import os
+import random
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from agents.batch_policy import (STRATEGY_CODES, STRATEGY_ORDER, BatchContext, decide_batch,
+                                 move_distributions, sample_moves)
+from agents.board_analysis import BoardAnalysis
+from agents.qwen_agent import QwenAgent
+from utils.cot_corpus import board_context
+from utils.stats import chi_square_sf, chi_square_statistic, chi_square_test
+from utils.tictactoe_oracle import _enumerate
+from utils.vector_env import encode_board
+
+
+def test_chi_square_sf_reference_values():
+    # scipy.stats.chi2.sf 的参考值
+    assert abs(chi_square_sf(3.841458820694124, 1) - 0.05) < 1e-9
+    assert abs(chi_square_sf(18.307038053275146, 10) - 0.05) < 1e-9
+    assert abs(chi_square_sf(2.0, 4) - 0.7357588823428847) < 1e-9
+    assert chi_square_test([5, 0], [1.0, 0.0])[2] == 1.0
+    assert chi_square_test([4, 1], [1.0, 0.0])[2] == 0.0
+
+
+def test_move_distributions_match_scalar_strategies():
+    """标量 _strategic_decision 的经验分布与 move_distributions 的卡方检验（合并所有局面）"""
+    agent = QwenAgent()
+    rng = random.Random(0)
+    boards = [list(board) for board in _enumerate()[::97]]
+    states = np.array([encode_board(board) for board in boards])
+
+    total_statistic, total_dof = 0.0, 0
+    for strategy in STRATEGY_ORDER:
+        distributions = move_distributions(states, np.full(len(states), STRATEGY_CODES[strategy], dtype=np.int8))
+        for board, probabilities in zip(boards, distributions):
+            my_symbol, opponent_symbol, move_count, game_phase = board_context(board)
+            available_moves = [i for i, cell in enumerate(board) if cell == ' ']
+            counts = [0] * 9
+            for _ in range(200):
+                analysis = BoardAnalysis(board, my_symbol, opponent_symbol, available_moves, game_phase, move_count,
+                                         evaluate_move=agent._evaluate_move, strategy=strategy, cot_length=None, rng=rng)
+                counts[agent._strategic_decision(analysis, available_moves)] += 1
+            statistic, dof = chi_square_statistic(counts, probabilities)
+            total_statistic += statistic
+            total_dof += dof
+
+    assert total_dof > 0
+    assert chi_square_sf(total_statistic, total_dof) > 1e-3
+
+
+def test_vectorized_sampling_follows_distributions():
+    states = np.array([encode_board(list(board)) for board in _enumerate()[::250]])
+    codes = np.arange(len(states), dtype=np.int8) % 4
+    distributions = move_distributions(states, codes)
+
+    draws = np.random.default_rng(1).random(len(states))
+    assert np.array_equal(sample_moves(distributions, draws), decide_batch(states, codes, draws))
+
+    # 每局独立的随机数流：结果与批大小无关，且服从给定分布
+    repeats = 2000
+    context = BatchContext(['balanced'] * repeats, ['tiny'] * repeats, seed=5, per_game_streams=True)
+    smaller = BatchContext(['balanced'] * 10, ['tiny'] * 10, seed=5, per_game_streams=True)
+    assert np.array_equal(context.draws(10), smaller.draws(10))
+
+    widest = int(np.argmax((distributions > 0).sum(axis=1)))
+    assert (distributions[widest] > 0).sum() > 2
+    moves = sample_moves(distributions[[widest] * repeats], context.draws(repeats))
+    _, _, p_value = chi_square_test(np.bincount(moves, minlength=9), distributions[widest])
+    assert p_value > 1e-3
@@ -0,0 +1,94 @@
+"""
+重力棋（四子棋）环境与规则智能体的测试
+"""
+
+import os
+import random
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from agents.connect_four_agent import ConnectFourAgent, play_matchup
+from agents.qwen_agent import GameContext
+from utils.board_utils import parse_board_from_observation
+from utils.connect_four import CONNECT_FOUR, VectorConnectFourEnv
+from utils.mock_env import make
+
+
+def test_vector_env_matches_scalar_env():
+    rng = random.Random(0)
+    num_games = 100
+    vector_env = VectorConnectFourEnv(num_games)
+    envs = [make("ConnectFour-v0") for _ in range(num_games)]
+
+    while not vector_env.done.all():
+        actions = []
+        for i, env in enumerate(envs):
+            if env.game_over:
+                actions.append(0)
+                continue
+            _, observation = env.get_observation()
+            assert vector_env.get_observation(i) == env.get_observation()
+            board = parse_board_from_observation(observation, CONNECT_FOUR.layout)
+            assert CONNECT_FOUR.from_board(board) == (env.masks[0], env.masks[1], env.col_heights)
+            actions.append(rng.choice(CONNECT_FOUR.legal_columns(env.col_heights)))
+            env.step(f"[{actions[-1]}]")
+            # 移位检测与逐条线路检测一致
+            assert (env.winner is not None) == (CONNECT_FOUR.layout.winner(env.board) is not None)
+        vector_env.step(np.array(actions))
+
+    for i, env in enumerate(envs):
+        assert vector_env.game_info(i) == env.close()[1]
+
+
+def test_agent_wins_and_blocks():
+    agent = ConnectFourAgent()
+    env = make("ConnectFour-v0")
+    env.reset()
+    for column in (3, 0, 3, 0, 3):
+        env.step(column)
+
+    # O 必须堵住第3列
+    _, observation = env.get_observation()
+    action, cot = agent.policy(observation, GameContext(strategy='opportunistic', cot_length='short', seed=0))
+    assert action == "[3]" and "阻挡" in cot
+
+    env.step(1)
+    _, observation = env.get_observation()
+    action, _ = agent.policy(observation, GameContext(strategy='aggressive', cot_length='tiny', seed=0))
+    assert action == "[3]"
+    done, info = env.step(action)
+    assert done and info["winner"] == 0
+
+    # 规则策略对随机性更强的 opportunistic 有明显优势：交换先后手，排除先手优势
+    as_x = play_matchup(agent, ('balanced', 'opportunistic'), 500, seed=1)
+    as_o = play_matchup(agent, ('opportunistic', 'balanced'), 500, seed=1)
+    assert as_x["x_wins"] > as_x["o_wins"] and as_o["o_wins"] > as_o["x_wins"]
+    assert as_x["x_wins"] + as_o["o_wins"] > 4 * (as_x["o_wins"] + as_o["x_wins"])
+
+
+def test_cot_lengths_strictly_increase():
+    from agents.qwen_agent import CoTLengthType
+
+    agent = ConnectFourAgent()
+    env = make("ConnectFour-v0")
+    env.reset()
+    for column in (3, 3, 2, 4, 4):
+        env.step(column)
+    _, observation = env.get_observation()
+    lengths = list(CoTLengthType)
+    context = GameContext(strategy='balanced', cot_length='ultra_long', seed=0, render_lengths=lengths)
+    _, cot = agent.policy(observation, context)
+    variants = [context.cot_variants[length.value] for length in lengths]
+    assert variants[-1] == cot and "向前一步推演" in cot
+    assert all(len(shorter) < len(longer) for shorter, longer in zip(variants, variants[1:]))
+
+    # 推演段落：X在底行占据2-4列，O只堵一侧时X仍可在另一侧获胜
+    env.reset()
+    for column in (2, 0, 3, 0, 4):
+        env.step(column)
+    _, observation = env.get_observation()
+    _, cot = agent.policy(observation, GameContext(strategy='balanced', cot_length='ultra_long', seed=0))
+    assert "- 落在第1列后：对手一步获胜的列 [5]" in cot and "- 落在第6列后：对手一步获胜的列 [1, 5]" in cot
@@ -0,0 +1,39 @@
+"""
+连续批处理调度器的测试（CPU上的随机初始化小模型；未安装torch/transformers时跳过）
+"""
+
+import os
+import sys
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from models.continuous_batching import ContinuousBatchingScheduler
+
+def test_matches_generate_with_mixed_lengths(tiny_qwen, byte_tokenizer):
+    model, tokenizer = tiny_qwen(), byte_tokenizer
+
+    prompts = ["X", "Available Moves: [0] [4]", "棋盘", "O | X |  ", "[8]"]
+    lengths = [3, 40, 7, 1, 12]
+    # 批大小上限小于请求数：短序列结束后，排队的请求在之后的解码步加入
+    scheduler = ContinuousBatchingScheduler(model, tokenizer, max_batch_size=2, eos_token_id=[])
+    try:
+        futures = [scheduler.submit(prompt, max_new_tokens=n, do_sample=False) for prompt, n in zip(prompts, lengths)]
+        results = [future.result(timeout=120) for future in futures]
+        stats = scheduler.stats()
+    finally:
+        scheduler.close()
+
+    for prompt, n, result in zip(prompts, lengths, results):
+        input_ids = tokenizer(prompt, return_tensors="pt")["input_ids"]
+        with torch.no_grad():
+            expected = model.generate(input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=n,
+                                      do_sample=False, pad_token_id=0)
+        assert result == tokenizer.decode(expected[0, input_ids.shape[1]:])
+
+    assert stats["admitted"] == stats["finished"] == len(prompts)
+    assert stats["max_running"] == 2 and stats["tokens"] == sum(lengths)
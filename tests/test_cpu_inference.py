@@ -0,0 +1,33 @@
+"""
+CPU int8 动态量化的测试（CPU上的随机初始化小模型；未安装torch/transformers时跳过）
+"""
+
+import os
+import sys
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from models.cpu_inference import configure_cpu_threads, model_size_mb, quantize_int8
+
+
+def test_quantized_model_generates_close_to_float32(tiny_qwen):
+    model = tiny_qwen(hidden_size=64, intermediate_size=128, double=False)
+    input_ids = torch.randint(0, 64, (2, 10))
+    with torch.no_grad():
+        reference = model(input_ids=input_ids).logits
+    float32_size = model_size_mb(model)
+
+    assert configure_cpu_threads(2) == 2
+    quantized = quantize_int8(model)
+    assert not any(type(module) is torch.nn.Linear for module in quantized.modules())
+    assert model_size_mb(quantized) < float32_size
+    with torch.no_grad():
+        logits = quantized(input_ids=input_ids).logits
+        generated = quantized.generate(input_ids, max_new_tokens=5, do_sample=False)
+    assert torch.allclose(logits, reference, atol=0.1)
+    assert generated.shape == (2, 15)
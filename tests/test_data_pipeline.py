@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the self-play data pipeline helpers (manifest, dedup, storage formats)
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from utils.board_utils import canonical_board
+from utils.columnar_store import ColumnarGameReader, read_columnar, write_columnar
+from utils.data_formatter import SelfPlayDataFormatter
+from utils.processing_manifest import ProcessingManifest, atomic_write_json
+from utils.sample_dedup import SampleDeduplicator
+
+
+def _make_game(first_move, strategies=('balanced', 'balanced')):
+    """X wins along the left column after opening in a corner"""
+    board = [' '] * 9
+    moves = []
+    for turn, (player, pos) in enumerate([(0, first_move), (1, 4), (0, 3), (1, 5), (0, 6 if first_move == 0 else 0)], 1):
+        board = board.copy()
+        board[pos] = 'X' if player == 0 else 'O'
+        moves.append({"player": player, "action": f"[{pos}]", "turn": turn, "cot": "思考", "info": {"board": board}})
+    return {"moves": moves, "result": {"winner": 0}, "strategies": list(strategies), "cot_lengths": ["tiny", "tiny"]}
+
+
+def test_canonical_board_symmetry():
+    corner_a = ['X', ' ', ' ', ' ', ' ', ' ', ' ', ' ', ' ']
+    corner_b = [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' ', 'X']
+    assert canonical_board(corner_a)[0] == canonical_board(corner_b)[0]
+
+
+def test_dedup_caps_symmetric_duplicates():
+    formatter = SelfPlayDataFormatter()
+    games = [_make_game(0), _make_game(0), _make_game(6)]
+    plain = formatter.format_for_sft(games)
+    deduped = formatter.format_for_sft(games, deduplicator=SampleDeduplicator(max_per_state=1, assign_weights=True))
+    assert len(plain) == 9
+    assert len(deduped) < len(plain)
+    assert formatter.last_dedup_stats['kept_samples'] == len(deduped)
+    assert sum(sample['weight'] for sample in deduped) == len(plain)
+
+
+def test_manifest_tracks_changes(tmp_path):
+    raw_file = tmp_path / "self_play_data_1.json"
+    atomic_write_json(str(raw_file), {"games": []})
+    manifest = ProcessingManifest(str(tmp_path))
+
+    assert len(manifest.pending_files([str(raw_file)], "sft")) == 1
+    shard = tmp_path / "shard.json"
+    atomic_write_json(str(shard), [])
+    manifest.register_outputs(str(raw_file), {"sft": str(shard)})
+    assert manifest.pending_files([str(raw_file)], "sft") == []
+
+    atomic_write_json(str(raw_file), {"games": [{}]})
+    assert len(manifest.pending_files([str(raw_file)], "sft")) == 1
+
+
+def test_columnar_round_trip(tmp_path):
+    from agents.qwen_agent import QwenAgent
+    from data_generation.selfplay_runner import SelfPlayRunner
+    from utils.board_utils import parse_board_from_observation
+    from utils.mock_env import MockTicTacToeEnv
+
+    runner = SelfPlayRunner(MockTicTacToeEnv(), {0: QwenAgent(), 1: QwenAgent()}, enable_test_avoidance=False)
+    games = [runner._run_single_game() for _ in range(3)]
+    games[0]['moves'][0]['extra'] = {"note": "non-standard move goes to overflow"}
+    data = {"generation_info": {"total_games": 3}, "games": games}
+
+    path = str(tmp_path / "self_play_data_test.colz")
+    write_columnar(data, path)
+    assert read_columnar(path) == data
+
+    # 4x4棋盘（对局超过9步、动作为两位数）与3x3对局混在同一文件中，都按列存储而不进入overflow
+    def first_empty(observation):
+        return f"[{parse_board_from_observation(observation, '4x4k4').index(' ')}]"
+
+    runner = SelfPlayRunner(MockTicTacToeEnv('4x4k4'), {0: first_empty, 1: first_empty}, enable_test_avoidance=False)
+    mnk_games = [runner._run_single_game() for _ in range(2)]
+    assert len(mnk_games[0]['moves']) == 13 and mnk_games[0]['moves'][-1]['action'] == "[12]"
+    mnk_games[1]['moves'][0]['action'] = "[00]"  # 非规范写法进入overflow
+    data = {"generation_info": {"total_games": 4}, "games": mnk_games + games[1:]}
+    write_columnar(data, path)
+    assert read_columnar(path) == data
+
+    reader = ColumnarGameReader(path)
+    overflow, obs_index = reader.column('overflow'), reader.column('obs_index')
+    assert list(reader.column('board_sizes')) == [16, 16, 9, 9]
+    assert (overflow >= 0).sum() == 1 and overflow[len(mnk_games[0]['moves'])] >= 0
+    assert (overflow[:13] == -1).all() and (obs_index[:13] == -1).all()  # 观察文本由4x4棋盘重新渲染
+
+    # 多长度fan-out的对局：cot_variants 按长度字典编码，不进入overflow
+    from agents.qwen_agent import GameContext
+
+    runner = SelfPlayRunner(MockTicTacToeEnv(), {0: QwenAgent(), 1: QwenAgent()}, enable_test_avoidance=False)
+    fanout_games = []
+    for seed in range(3):
+        contexts = {pid: GameContext(strategy='balanced', cot_length='medium', seed=seed * 2 + pid,
+                                     render_lengths=['tiny', 'medium', 'long']) for pid in (0, 1)}
+        game = runner._run_single_game(contexts)
+        game['cot_lengths'] = ['medium', 'medium']
+        fanout_games.append(game)
+    assert all('cot_variants' in move for move in fanout_games[0]['moves'])
+    write_columnar(fanout_games, path)
+    assert read_columnar(path) == fanout_games
+    reader = ColumnarGameReader(path)
+    assert (reader.column('overflow') == -1).all()
+    assert reader.column('cot_family_names') == ['medium', 'tiny', 'long']
+
+
+def test_indexed_sft_dataset_random_access(tmp_path):
+    from utils.sft_index import IndexedSFTDataset, build_index, write_indexed_jsonl
+
+    samples = [{"conversations": [{"from": "human", "value": "棋盘"}, {"from": "gpt", "value": "思" * i}]}
+               for i in range(1, 21)]
+    path = write_indexed_jsonl(samples, str(tmp_path / "long_cot_sft_data_tiny.jsonl"))
+
+    with IndexedSFTDataset(path) as dataset:
+        assert len(dataset) == 20
+        assert dataset[7] == samples[7]
+        assert dataset[-1] == samples[-1]
+        assert dataset.cot_lengths([0, 19]) == [1, 20]
+        assert len(dataset.sample(5, seed=1)) == 5
+
+    os.remove(path + ".idx")
+    build_index(path)
+    with IndexedSFTDataset(path) as dataset:
+        assert dataset[:3] == samples[:3]
+
+    # 文件中间和末尾的空行不算作记录
+    lines = [json.dumps(sample, ensure_ascii=False) for sample in samples[:3]]
+    blank_path = str(tmp_path / "blank_lines.jsonl")
+    with open(blank_path, 'w', encoding='utf-8') as f:
+        f.write("\n" + lines[0] + "\n\n" + lines[1] + "\n   \n" + lines[2] + "\n\n")
+    build_index(blank_path)
+    with IndexedSFTDataset(blank_path) as dataset:
+        assert list(dataset) == samples[:3]
+
+
+def test_shared_agent_policy_matches_separate_agents():
+    from agents.qwen_agent import GameContext, QwenAgent
+    from utils.mock_env import render_observation
+
+    board = ['X', ' ', ' ', ' ', 'O', ' ', ' ', ' ', ' ']
+    observation = render_observation(board, 0)
+    shared = QwenAgent(strategy='balanced', cot_length='tiny')
+
+    contexts = [GameContext(strategy=s, cot_length=c, seed=7) for s, c in [('aggressive', 'short'), ('conservative', 'long')]]
+    interleaved = [shared.policy(observation, ctx) for ctx in contexts for _ in range(2)]
+    separate = []
+    for s, c in [('aggressive', 'short'), ('conservative', 'long')]:
+        ctx = GameContext(strategy=s, cot_length=c, seed=7)
+        separate.extend(QwenAgent().policy(observation, ctx) for _ in range(2))
+
+    assert interleaved == separate
+    assert shared.strategy.value == 'balanced' and shared.move_count == 0
+
+
+def test_vector_self_play_replays_in_mock_env():
+    from agents.batch_policy import BatchContext
+    from agents.qwen_agent import QwenAgent
+    from data_generation.vector_selfplay_runner import VectorSelfPlayRunner
+    from utils.mock_env import MockTicTacToeEnv
+
+    runner = VectorSelfPlayRunner(QwenAgent(), batch_size=64, enable_test_avoidance=False, cot_for="all", seed=0)
+    n = 64
+    strategies = ['aggressive', 'conservative', 'balanced', 'opportunistic'] * 16
+    contexts = [BatchContext(strategies, ['tiny'] * n, seed=1), BatchContext(strategies[::-1], ['tiny'] * n, seed=2)]
+    states, actions, active = runner._play_batch(n, contexts)
+
+    for i in range(n):
+        game = runner._build_game_record(i, states[:, i], actions[:, i], active[:, i], contexts)
+        env = MockTicTacToeEnv()
+        env.reset()
+        for move in game['moves']:
+            assert env.get_observation()[1] == move['observation']
+            assert 'cot' in move and move['cot'].strip().endswith(move['action'])
+            done, info = env.step(move['action'])
+            assert info == move['info']
+        assert done and env.close()[1] == game['result']
+
+
+def test_cot_fanout_and_offline_rerender(tmp_path):
+    from agents.qwen_agent import GameContext, QwenAgent
+    from utils.cot_rerender import rerender_games, write_sft_variants
+    from utils.mock_env import render_observation
+
+    agent = QwenAgent()
+    board = ['X', ' ', ' ', ' ', 'O', ' ', ' ', ' ', ' ']
+    context = GameContext(strategy='aggressive', cot_length='medium', seed=3, render_lengths=['tiny', 'medium', 'long'])
+    _, cot = agent.policy(render_observation(board, 0), context)
+    assert set(context.cot_variants) == {'tiny', 'medium', 'long'}
+    assert context.cot_variants['medium'] == cot
+    assert len(context.cot_variants['tiny']) < len(context.cot_variants['long'])
+
+    games = [_make_game(0)]
+    assert rerender_games(games, ['short', 'ultra_long'], agent=agent, seed=0) == 3
+    formatter = SelfPlayDataFormatter()
+    for cot_length in ('short', 'ultra_long'):
+        samples = formatter.format_for_sft(games, cot_variant=cot_length)
+        assert len(samples) == 3
+        assert samples[0]['output'].startswith(games[0]['moves'][0]['cot_variants'][cot_length])
+    assert formatter.format_for_sft(games, cot_variant='tiny') == []
+
+    # 每个长度的输出带有该长度自己的去重统计
+    del games[0]['moves'][0]['cot_variants']['ultra_long']
+    outputs = write_sft_variants(games, ['short', 'ultra_long'], str(tmp_path), 'test', 'jsonl', formatter,
+                                 make_deduplicator=SampleDeduplicator)
+    for cot_length, count in (('short', 3), ('ultra_long', 2)):
+        assert outputs[cot_length]['samples'] == count and os.path.exists(outputs[cot_length]['path'])
+        stats = outputs[cot_length]['dedup_stats']
+        assert stats['total_samples'] == count
+        assert {item['cot_length'] for item in stats['most_repeated_states']} == {cot_length}
+    assert write_sft_variants(games, ['short'], str(tmp_path), 'plain')['short']['dedup_stats'] is None
+
+
+
+def _textarena_observation(board):
+    """TextArena格式的观察文本（QwenAgent按 "Current Board:" 解析棋盘）"""
+    mover = 'X' if board.count('X') == board.count('O') else 'O'
+    cells = [cell if cell != ' ' else str(i) for i, cell in enumerate(board)]
+    rows = [f" {cells[i]} | {cells[i + 1]} | {cells[i + 2]} " for i in (0, 3, 6)]
+    available = ', '.join(f'[{i}]' for i, cell in enumerate(board) if cell == ' ')
+    return (f"[GAME] You are Player {0 if mover == 'X' else 1} in Tic Tac Toe. you will be '{mover}'.\n"
+            f"Current Board:\n\n{rows[0]}\n---+---+---\n{rows[1]}\n---+---+---\n{rows[2]}\n\n"
+            f"Player {mover}'s turn. Available Moves: {available}")
+
+
+def test_cot_corpus_matches_on_the_fly_generation(tmp_path):
+    import random
+
+    from agents.qwen_agent import GameContext, QwenAgent
+    from utils.cot_corpus import CoTCorpus, board_context, build_corpus
+    from utils.vector_env import encode_board
+
+    boards = [[' '] * 9, ['X', ' ', ' ', ' ', 'O', ' ', ' ', ' ', ' '], ['X', 'X', ' ', ' ', 'O', ' ', ' ', ' ', ' ']]
+    states = [encode_board(board) for board in boards]
+    build_corpus(str(tmp_path), workers=1, states=states)
+
+    plain = QwenAgent()
+    with CoTCorpus(str(tmp_path)) as corpus:
+        fast = QwenAgent(corpus=corpus)
+        for board, state in zip(boards, states):
+            move_count = board_context(board)[2]
+            for strategy in ('aggressive', 'conservative', 'balanced', 'opportunistic'):
+                for seed in range(3):
+                    results = []
+                    for agent in (plain, fast):
+                        context = GameContext(strategy=strategy, cot_length='short', seed=seed)
+                        context.move_count = move_count - 1
+                        action, cot = agent.policy(_textarena_observation(board), context)
+                        rendered = agent.render_cot(state, 2, strategy, 'long', move_count, random.Random(seed))
+                        results.append((action, cot, rendered, context.rng.random()))
+                    assert results[0] == results[1]
+        assert corpus.leaf_range(states[0], 'balanced', 'tiny') is not None
+        assert abs(sum(output['probability'] for output in corpus.outputs(states[1], 'balanced', 'medium')) - 1.0) < 1e-9
@@ -0,0 +1,91 @@
+"""
+本地微批推理服务的端到端测试（CPU上使用替身模型）
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from agents.qwen_agent import GameContext, QwenAgent
+from data_generation.async_selfplay_runner import AsyncSelfPlayRunner, JsonlGameSink
+from models.inference_client import InferenceClient
+from models.inference_server import InferenceService, StandInModel, start_server, stop_server
+from utils.data_formatter import SelfPlayDataFormatter
+from utils.mock_env import MockTicTacToeEnv
+
+
+def test_agents_share_batched_server(tmp_path):
+    stand_in = StandInModel(latency_ms=20)
+    service = InferenceService({"stand_in": stand_in}, max_batch_size=8, max_wait_ms=50)
+    server, address = start_server(service, port=0)
+    try:
+        # 多个self-play客户端同时请求，服务端合并成批次
+        agent = QwenAgent(inference_server=address)
+        results = []
+
+        def play_one_game():
+            env = MockTicTacToeEnv()
+            env.reset()
+            context = GameContext(strategy='balanced', cot_length='tiny', seed=0)
+            done = False
+            while not done:
+                _, observation = env.get_observation()
+                action, cot = agent.policy(observation, context)
+                done, _ = env.step(action)
+                results.append(("替身模型" in cot, action))
+
+        threads = [threading.Thread(target=play_one_game) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results and all(from_model for from_model, _ in results)
+        stats = InferenceClient(address).metrics()["models"]["stand_in"]
+        assert stats["requests"] == len(results) and stats["errors"] == 0
+        assert stats["batches"] < stats["requests"] and max(stand_in.batch_sizes) > 1
+        assert stats["latency_ms"]["p95"] >= stats["generate_ms"]["p50"] > 0
+    finally:
+        stop_server(server)
+
+    # Unix socket；生成参数不同的请求不进入同一批
+    service = InferenceService({"stand_in": StandInModel()}, max_batch_size=4, max_wait_ms=5)
+    socket_path = str(tmp_path / "inference.sock")
+    server, address = start_server(service, socket_path=socket_path)
+    try:
+        client = InferenceClient(address)
+        prompts = ["Available Moves: ['[2]']", "Available Moves: ['[7]']"]
+        assert [r[-3:] for r in client.generate(prompts, temperature=0.1)] == ["[2]", "[7]"]
+        assert client.generate(prompts[:1], max_new_tokens=10)[0].endswith("[2]")
+        assert client.metrics()["models"]["stand_in"]["requests"] == 3
+    finally:
+        stop_server(server)
+    assert not os.path.exists(socket_path)
+
+
+def test_async_runner_keeps_server_batches_full(tmp_path):
+    stand_in = StandInModel(latency_ms=20)
+    service = InferenceService({"stand_in": stand_in}, max_batch_size=16, max_wait_ms=20)
+    server, address = start_server(service, port=0)
+    try:
+        agent = QwenAgent(inference_server=address)
+        sink = JsonlGameSink(str(tmp_path / "self_play_data_async.jsonl"))
+        runner = AsyncSelfPlayRunner(MockTicTacToeEnv, {0: agent, 1: agent}, concurrency=16,
+                                     enable_test_avoidance=False, sink=sink)
+        history = runner.run_self_play(32, fixed_cot_length='short')
+        stats = InferenceClient(address).metrics()["models"]["stand_in"]
+    finally:
+        stop_server(server)
+
+    # 所有落子都来自服务端，并发对局的请求被合并成批
+    moves = [move for game in history for move in game["moves"]]
+    assert len(history) == 32 and all("替身模型" in move["cot"] for move in moves)
+    assert stats["requests"] == len(moves) and max(stand_in.batch_sizes) > 8
+
+    # 流式写入的文件与 _run_single_game 的记录格式相同，可直接交给格式化流程
+    assert runner.last_saved_file == sink.path and not os.path.exists(sink.path + ".partial")
+    saved = SelfPlayDataFormatter().load_self_play_data(sink.path)
+    assert len(saved) == 32 and set(saved[0]) == {"moves", "result", "rewards", "strategies", "cot_lengths"}
+    assert list(saved[0]["moves"][0]) == ["player", "observation", "action", "turn", "info", "cot"]
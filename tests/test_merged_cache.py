@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""
+Tests for merged LoRA checkpoint cache keys and lookup (no model loading)
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from models.merged_cache import (INFO_FILE, adapter_fingerprint, cached_merged_path, list_cached,
+                                 merged_checkpoint_dir)
+
+
+def _make_models(tmp_path):
+    adapter = tmp_path / "qwen_tiny_cot_lora"
+    adapter.mkdir()
+    (adapter / "adapter_config.json").write_text('{"r": 8}')
+    (adapter / "adapter_model.safetensors").write_bytes(b"\x00" * 64)
+    base = tmp_path / "qwen"
+    base.mkdir()
+    (base / "config.json").write_text('{"hidden_size": 896}')
+    (base / "model.safetensors").write_bytes(b"\x01" * 128)
+    return str(adapter), str(base)
+
+
+def _fake_export(adapter, base, cache_dir):
+    """只写出 merge_info.json，模拟 export_merged 完成后的缓存目录"""
+    target = merged_checkpoint_dir(adapter, base, cache_dir)
+    os.makedirs(target)
+    with open(os.path.join(target, INFO_FILE), 'w', encoding='utf-8') as f:
+        json.dump({"adapter_path": adapter, "base_model_path": base,
+                   "fingerprint": adapter_fingerprint(adapter, base), "exported_at": "2025-01-01T00:00:00"}, f)
+    return target
+
+
+def test_fingerprint_changes_with_adapter_and_base(tmp_path):
+    adapter, base = _make_models(tmp_path)
+    fingerprint = adapter_fingerprint(adapter, base)
+    assert adapter_fingerprint(adapter, base) == fingerprint
+
+    with open(os.path.join(adapter, "adapter_model.safetensors"), 'wb') as f:
+        f.write(b"\x02" * 64)
+    changed = adapter_fingerprint(adapter, base)
+    assert changed != fingerprint
+
+    with open(os.path.join(base, "config.json"), 'w') as f:
+        f.write('{"hidden_size": 1024}')
+    assert adapter_fingerprint(adapter, base) != changed
+
+
+def test_cached_path_requires_merge_info(tmp_path):
+    adapter, base = _make_models(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    assert cached_merged_path(adapter, base, cache_dir) is None
+
+    # 导出中断：目录存在但没有 merge_info.json
+    target = merged_checkpoint_dir(adapter, base, cache_dir)
+    os.makedirs(target)
+    assert cached_merged_path(adapter, base, cache_dir) is None
+
+    os.rmdir(target)
+    exported = _fake_export(adapter, base, cache_dir)
+    assert cached_merged_path(adapter, base, cache_dir) == exported
+    assert cached_merged_path(base, base, cache_dir) is None  # 不是adapter
+
+
+def test_list_cached_marks_changed_adapters_stale(tmp_path):
+    adapter, base = _make_models(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    _fake_export(adapter, base, cache_dir)
+    assert [entry["stale"] for entry in list_cached(cache_dir)] == [False]
+
+    with open(os.path.join(adapter, "adapter_config.json"), 'w') as f:
+        f.write('{"r": 16}')
+    assert [entry["stale"] for entry in list_cached(cache_dir)] == [True]
+    assert cached_merged_path(adapter, base, cache_dir) is None
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+"""
+Tests for evaluator scoring, full state-space and sequential evaluation, confidence intervals and the response cache
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'evaluation'))
+
+from multi_optimal_evaluator import (MultiOptimalEvaluator, breakdown_by, look_schedule, state_space_cases,
+                                     stratified_order)
+from utils.board_utils import parse_board_from_observation
+from utils.response_cache import ResponseCache
+from utils.stats import paired_difference_interval, wilson_interval
+
+
+def test_state_space_cases_cover_every_position():
+    cases = state_space_cases()
+    assert len(cases) == 4520
+    assert {case["stage"] for case in cases} == {"opening", "midgame", "endgame"}
+    symmetry_cases = state_space_cases(symmetry_unique=True)
+    assert len(symmetry_cases) == 627
+    assert sum(case["weight"] for case in symmetry_cases) == 4520
+
+    case = cases[100]
+    board = parse_board_from_observation(f"Game Board:\n{case['board_state']}")
+    assert [f"[{i}]" for i, cell in enumerate(board) if cell == ' '] == case["available_moves"]
+    assert set(case["optimal_moves"]) <= set(case["available_moves"])
+
+
+def test_symmetry_breakdown_weights_by_orbit_size():
+    cases = state_space_cases()
+    symmetry_cases = state_space_cases(symmetry_unique=True)
+    correct = lambda case: case["move_type"] != "draw_move"  # 只答错对局未定的局面
+    results = [dict(case, is_correct=correct(case)) for case in symmetry_cases]
+
+    per_class = breakdown_by(results, "stage")
+    assert "state_weighted_accuracy" not in per_class["opening"]
+    weighted = breakdown_by(results, "stage", weighted=True)
+    for stage, stats in weighted.items():
+        assert stats["total"] == per_class[stage]["total"] and stats["interval_unit"] == "symmetry_class"
+        # 加权计数与逐个评估全部局面一致
+        full = [case for case in cases if case["stage"] == stage]
+        assert stats["positions"] == len(full)
+        assert stats["correct_positions"] == sum(correct(case) for case in full)
+    assert sum(stats["positions"] for stats in weighted.values()) == 4520
+
+
+def test_wilson_interval():
+    low, high = wilson_interval(50, 100)
+    assert round(low, 3) == 0.404 and round(high, 3) == 0.596
+    low, high = wilson_interval(10, 10)
+    assert high == 1.0 and 0.7 < low < 0.75
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+
+
+def test_response_cache_is_keyed_by_model_and_config(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    with ResponseCache(path, "model-a", {"do_sample": False}) as cache:
+        assert cache.get_many(["p1", "p2"]) == [None, None]
+        cache.put_many(["p1"], ["答案: [4]"])
+    with ResponseCache(path, "model-a", {"do_sample": False}) as cache:
+        assert cache.get_many(["p1", "p2"]) == ["答案: [4]", None]
+        assert cache.stats()["hits"] == 1
+    with ResponseCache(path, "model-b", {"do_sample": False}) as cache:
+        assert cache.get_many(["p1"]) == [None]
+
+
+class ScriptedEvaluator(MultiOptimalEvaluator):
+    """按固定规则作答的评估器（不加载模型）：accuracy比例的局面给出最优解，其余给出非最优的空位"""
+
+    def __init__(self, cases, accuracy):
+        self.cases = {str(case["id"]): case for case in cases}
+        self.accuracy = accuracy
+        self.generated = 0
+
+    def create_prompt(self, case):
+        return str(case["id"])
+
+    def generate_cached(self, prompts, chunk_size=256):
+        self.generated += len(prompts)
+        responses = []
+        for prompt in prompts:
+            case = self.cases[prompt]
+            wrong = [move for move in case["available_moves"] if move not in case["optimal_moves"]]
+            correct = (case["id"] * 0.618) % 1 < self.accuracy or not wrong
+            responses.append(f"答案: {case['optimal_moves'][0] if correct else wrong[0]}")
+        return responses
+
+
+def test_stratified_order_keeps_prefixes_balanced():
+    cases = state_space_cases()
+    ordered = stratified_order(cases, seed=1)
+    assert sorted(case["id"] for case in ordered) == list(range(1, 4521))
+    share = sum(case["stage"] == "opening" for case in cases) / len(cases)
+    prefix = ordered[:200]
+    assert abs(sum(case["stage"] == "opening" for case in prefix) / len(prefix) - share) < 0.02
+
+
+def test_sequential_paired_comparison_stops_early():
+    cases = state_space_cases()
+    new, baseline = ScriptedEvaluator(cases, 0.9), ScriptedEvaluator(cases, 0.5)
+    summary, results = new.evaluate_sequential(cases, baseline, min_cases=50)
+    assert len(summary["planned_looks"]) <= 15
+    assert summary["confidence_per_look"] == pytest.approx(1 - 0.05 / len(summary["planned_looks"]))
+    assert summary["decision"] == "better_than_baseline"
+    assert summary["cases_used"] == len(results) == new.generated == baseline.generated
+    assert summary["fraction_used"] < 0.1
+    assert summary["difference_ci"][0] > 0
+
+    low, high = paired_difference_interval(0, 0, 100)[1:]
+    assert low < 0 < high
+
+    with pytest.raises(ValueError):
+        new.evaluate_sequential([], baseline)
+
+
+def test_sequential_symmetry_pool_reports_weighted_accuracy():
+    cases = state_space_cases(symmetry_unique=True)
+    new, baseline = ScriptedEvaluator(cases, 0.9), ScriptedEvaluator(cases, 0.5)
+    summary, results = new.evaluate_sequential(cases, baseline, min_cases=50)
+    assert summary["interval_unit"] == "symmetry_class"
+    weight = sum(result["weight"] for result in results)
+    assert summary["accuracy"] == sum(result["is_correct"] for result in results) / len(results)
+    assert summary["state_weighted_accuracy"] == pytest.approx(
+        sum(result["weight"] for result in results if result["is_correct"]) / weight)
+    assert summary["state_weighted_difference"] == pytest.approx(
+        summary["state_weighted_accuracy"] - summary["baseline_state_weighted_accuracy"])
+
+    full = state_space_cases()
+    summary, results = ScriptedEvaluator(full, 0.9).evaluate_sequential(full, min_cases=50)
+    assert "state_weighted_accuracy" not in summary and "weight" not in results[0]
+
+
+def test_look_schedule_grows_geometrically():
+    looks = look_schedule(4520, min_cases=40, growth=1.5)
+    assert looks[0] == 40 and looks[-1] == 4520 and len(looks) == 13
+    assert looks == sorted(set(looks))
+    capped = look_schedule(4520, min_cases=40, growth=1.5, max_looks=5)
+    assert capped == looks[:4] + [4520]
+    assert look_schedule(30, min_cases=40) == [30]
+
+
+def test_score_samples_majority_vote_and_pass_at_k():
+    evaluator = MultiOptimalEvaluator.__new__(MultiOptimalEvaluator)  # 打分不需要模型
+    case = {"optimal_moves": ["[4]", "[0]"]}
+    samples = ["思考…\n\n答案: [4]", "答案: [2]", "答案: [2]", "选择位置 0", "没有给出答案"]
+
+    scores = evaluator.score_samples(samples, case)
+    assert scores["sample_moves"] == ["[4]", "[2]", "[2]", "[0]", None]
+    assert scores["sample_correct"] == [True, False, False, True, False]
+    assert scores["majority_move"] == "[2]" and not scores["majority_correct"]
+    assert scores["pass_at_k"]
+    assert scores["agreement_rate"] == 2 / 5
+    assert scores["sample_accuracy"] == 2 / 5
+
+    scores = evaluator.score_samples(["答案: [0]", "答案: [0]", "答案: [8]"], case)
+    assert scores["majority_move"] == "[0]" and scores["majority_correct"]
+    assert not evaluator.score_samples(["无", "无"], case)["pass_at_k"]
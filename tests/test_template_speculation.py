@@ -0,0 +1,38 @@
+"""
+模板草稿推测解码的测试（CPU上的随机初始化小模型；未安装torch/transformers时跳过）
+"""
+
+import os
+import sys
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from models.template_speculation import TemplateDraftDecoder
+
+def test_greedy_speculation_matches_generate(tiny_qwen, byte_tokenizer):
+    model, tokenizer = tiny_qwen(), byte_tokenizer
+
+    prompt = "Available Moves: ['[0]', '[4]']"
+    input_ids = tokenizer(prompt, return_tensors="pt")["input_ids"]
+    with torch.no_grad():
+        expected = model.generate(input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=48,
+                                  do_sample=False, pad_token_id=0)[0, input_ids.shape[1]:].tolist()
+
+    # 草稿与模型输出只在一处不同：失配处回退、逐token解码后重新对齐，输出仍与逐token贪心解码一致
+    draft_ids = list(expected)
+    draft_ids[12] = (draft_ids[12] + 1) % tokenizer.vocab_size
+    draft = "".join(chr(64 + token) for token in draft_ids)
+
+    decoder = TemplateDraftDecoder(model, tokenizer, chunk_size=8, eos_token_id=[])
+    response = decoder.generate(prompt, draft, max_new_tokens=48, do_sample=False, label="tiny")
+    assert response == tokenizer.decode(expected)
+
+    stats = decoder.report()["tiny"]
+    assert stats["generated"] == 48 and stats["accepted"] > 0
+    assert stats["forward_passes"] < 48 / 2 and stats["tokens_per_forward"] > 2
+
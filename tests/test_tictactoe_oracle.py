@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the exact TicTacToe solver and state-space enumeration
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from utils.tictactoe_oracle import enumerate_positions, find_all_optimal_moves, stratified_sample
+
+
+def test_state_space_counts():
+    assert len(enumerate_positions()) == 4520
+    assert len(enumerate_positions(symmetry_unique=True)) == 627
+
+
+def test_solver_matches_known_positions():
+    empty = [' '] * 9
+    assert find_all_optimal_moves(empty, 'X') == ([0, 1, 2, 3, 4, 5, 6, 7, 8], "draw_move", 0)
+    # X corner, O edge: X has a forced win
+    board = ['X', 'O', ' ', ' ', ' ', ' ', ' ', ' ', ' ']
+    _, move_type, score = find_all_optimal_moves(board, 'X')
+    assert move_type == "winning_sequence" and score > 0
+
+
+def test_stratified_sample_is_unique_and_deterministic():
+    positions = enumerate_positions(symmetry_unique=True)
+    sample = stratified_sample(positions, 200, seed=3)
+    assert len(sample) == 200
+    assert len({p["canonical"] for p in sample}) == 200
+    assert sample == stratified_sample(positions, 200, seed=3)
+    assert len(stratified_sample(positions, 10000)) == len(positions)
+
+
+def test_tactics_tables():
+    from utils.tactics import fork_squares, lookup, threat_count, winning_squares
+
+    board = ['X', ' ', ' ',
+             ' ', 'O', ' ',
+             ' ', ' ', 'X']
+    assert winning_squares(board, 'X') == []
+    assert fork_squares(board, 'X') == [2, 6]
+    board[2] = 'X'
+    assert winning_squares(board, 'X') == [1, 5]
+    assert threat_count(board, 'X') == 2
+    win, block, fork, threats = lookup(0b100000101, 0b000010000)
+    assert (win, block, threats) == (0b000100010, 0, 2)
+
+
+def test_mnk_solver_matches_oracle_and_scales():
+    from utils.board_utils import WINNING_LINES, parse_board_from_observation, side_to_move
+    from utils.mnk import TICTACTOE, BoardGeometry, MNKSolver
+    from utils.mock_env import MockTicTacToeEnv
+    from utils.tictactoe_oracle import _enumerate, move_scores
+
+    assert list(TICTACTOE.lines) == WINNING_LINES
+    solver = MNKSolver(TICTACTOE)
+    for board in _enumerate()[::11]:
+        board = list(board)
+        assert solver.move_scores(board) == move_scores(board, side_to_move(board))
+
+    # 4x4 k=3: 先手必胜；4x4 k=4: 和棋
+    geometry = BoardGeometry.parse('4x4k3')
+    assert len(geometry.lines) == 24
+    result = MNKSolver(geometry).solve(geometry.empty_board())
+    assert result.exact and result.value > 0
+    geometry_k4 = BoardGeometry.parse('4x4k4')
+    result = MNKSolver(geometry_k4).solve(geometry_k4.empty_board())
+    assert result.exact and result.value == 0
+
+    env = MockTicTacToeEnv(geometry)
+    assert env.max_turns == 16
+    env.reset()
+    for action in (5, 0, 6):
+        done, info = env.step(f"[{action}]")
+    _, observation = env.get_observation()
+    assert parse_board_from_observation(observation, geometry) == env.board
+    optimal_moves, move_type, _ = find_all_optimal_moves(env.board, 'O', geometry)
+    assert move_type == "blocking_move" and optimal_moves == [4, 7]
+    done, info = env.step("[7]")
+    done, info = env.step("[4]")
+    assert done and info["winner"] == 0
+
+
+def test_shared_tables_are_mapped_by_spawned_workers(tmp_path):
+    import multiprocessing
+
+    import numpy as np
+
+    from utils.shared_tables import ENV_VAR, SharedTables, _probe, collect_tables, shared_table_pool
+    from utils.tictactoe_oracle import build_oracle_tables
+
+    local = collect_tables()
+    assert np.array_equal(local["oracle.optimal_moves"], build_oracle_tables()[1])
+    with SharedTables.publish(local, directory=str(tmp_path / "tables"), export_env=False) as published:
+        attached = SharedTables.attach(published.manifest_path)
+        for name, array in local.items():
+            assert np.array_equal(attached.arrays[name], array)
+            assert not attached.arrays[name].flags.writeable
+    assert not (tmp_path / "tables").exists()
+
+    with shared_table_pool(max_workers=2, mp_context=multiprocessing.get_context('spawn')) as executor:
+        directory = os.path.dirname(os.environ[ENV_VAR])
+        reports = list(executor.map(_probe, range(2)))
+    assert all(report["shared"] for report in reports)
+    assert not os.path.exists(directory) and ENV_VAR not in os.environ